@@ -0,0 +1,468 @@
+"""Ralph Memory Tree binary index -- compact, mmap-able alternative to index.json.
+
+``index.json`` is pretty-printed JSON holding every fat entry and postings as
+lists of full ``node_...`` ids, and a reader has to ``json.loads`` all of it
+to look at any of it. ``index.bin`` stores the same index so that a reader
+can ``mmap`` it and touch only the pages a query needs:
+
+    header      magic, version, generation, counts, section offsets
+    meta        every top-level key except nodes/postings, as a u32-prefixed
+                compact-JSON directory {key: [offset, length]} followed by one
+                compact-JSON blob per key
+    strings     string table: node ids and compact-JSON entries, back to back
+    docs        one fixed-width record per doc id (``node_id`` order):
+                node id and entry as (offset, length) into ``strings``
+    terms       the sorted term dictionary: one fixed-width record per term,
+                (offset, length) into ``termtext`` + (offset, length, df)
+                into ``postings``
+    termtext    "\\n" + every term + "\\n", in dictionary order
+    postings    per term, its doc ids as varint-coded ascending deltas
+    grams       the sorted trigram dictionary: one fixed-width record per
+                trigram, (offset, length, count) into ``gramposts``
+    gramposts   per trigram, the term ids containing it, as varint deltas
+    trailer     magic again, so a torn or foreign file is detected in O(1)
+
+Doc ids are positions in ``node_id`` order, so every posting list is
+ascending and its deltas are small. Exact term lookups binary-search the
+term records; substring lookups (recall matches a search term anywhere
+inside a token) intersect the term lists of the needle's trigrams and
+verify each survivor, so they touch the rarest trigram's terms rather than
+the whole dictionary (see ``tree_index.match_tokens``). Needles shorter than
+a trigram fall back to ``mmap.find`` over ``termtext`` -- tokens never
+contain "\\n", so a match cannot straddle two terms. Only the entries of the
+matching docs are decoded, and only the meta keys a query reads (the branch
+view's partitions, say, not the path trie or the bounds).
+
+The file is written whole by ``encode_index`` (commit / compaction) and read
+by ``BinaryIndex``; pending deltas stay in ``index-journal.jsonl`` exactly as
+for ``index.json``.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+import sys
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+if __package__:
+    from .tree_index import GRAM, token_grams
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_index import GRAM, token_grams
+
+MAGIC = b"RMTX"
+TRAILER = b"RMTX-END"
+VERSION = 3
+# Version 2 kept the meta section as one JSON object; it is still readable.
+READABLE_VERSIONS = (2, 3)
+SUFFIX = ".bin"
+# magic, version, flags, generation, docs, terms, grams, offsets of
+# meta, strings, docs, terms, termtext, postings, grams, gramposts, trailer
+_HEADER = struct.Struct("<4sHHQIII9Q")
+_DOC = struct.Struct("<IIII")  # id offset, id length, entry offset, entry length
+_TERM = struct.Struct("<IIIII")  # text offset, text length, postings offset, length, df
+_GRAM = struct.Struct(f"<{GRAM}sxIII")  # trigram, gramposts offset, length, count
+_META_DIR = struct.Struct("<I")  # length of the meta key directory
+
+
+class BinaryIndexError(ValueError):
+    """``index.bin`` is truncated, foreign or internally inconsistent."""
+
+
+# --- varints ----------------------------------------------------------------
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_deltas(data: bytes | memoryview, count: int) -> list[int]:
+    """Decode *count* varint deltas back into absolute, ascending doc ids."""
+    ids: list[int] = []
+    value = shift = last = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        last += value
+        ids.append(last)
+        value = shift = 0
+    if len(ids) != count:
+        raise BinaryIndexError("posting list length does not match its df")
+    return ids
+
+
+def _encode_ids(ids: list[int], out: bytearray) -> None:
+    last = 0
+    for value in ids:
+        encode_varint(value - last, out)
+        last = value
+
+
+def _compact(value: object) -> bytes:
+    return json.dumps(value, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode()
+
+
+# --- writing -----------------------------------------------------------------
+
+
+def encode_index(index: dict[str, Any]) -> bytes:
+    """Serialise a (normalised) index dict into the binary layout."""
+    nodes = sorted(
+        (e for e in index.get("nodes", []) if isinstance(e, dict) and e.get("node_id")),
+        key=lambda e: str(e["node_id"]),
+    )
+    doc_of = {str(e["node_id"]): doc for doc, e in enumerate(nodes)}
+    meta = {
+        k: v for k, v in index.items() if k not in ("nodes", "postings", "trigrams", "generation")
+    }
+
+    strings = bytearray()
+    docs = bytearray()
+    for entry in nodes:
+        node_id = str(entry["node_id"]).encode()
+        blob = _compact(entry)
+        docs += _DOC.pack(len(strings), len(node_id), len(strings) + len(node_id), len(blob))
+        strings += node_id + blob
+
+    terms = bytearray()
+    termtext = bytearray(b"\n")
+    postings = bytearray()
+    term_ids: dict[bytes, list[int]] = {}
+    for token in sorted(index.get("postings", {})):
+        ids = sorted({doc_of[nid] for nid in index["postings"][token] if nid in doc_of})
+        if not ids or "\n" in token:
+            continue
+        text = token.encode()
+        start = len(postings)
+        _encode_ids(ids, postings)
+        for gram in token_grams(token):
+            encoded = gram.encode()
+            if len(encoded) == GRAM:  # multi-byte grams are left to the scan
+                term_ids.setdefault(encoded, []).append(len(terms) // _TERM.size)
+        terms += _TERM.pack(len(termtext), len(text), start, len(postings) - start, len(ids))
+        termtext += text + b"\n"
+
+    grams = bytearray()
+    gramposts = bytearray()
+    for gram in sorted(term_ids):
+        start = len(gramposts)
+        _encode_ids(term_ids[gram], gramposts)
+        grams += _GRAM.pack(gram, start, len(gramposts) - start, len(term_ids[gram]))
+
+    sections = [
+        _encode_meta(meta),
+        bytes(strings),
+        bytes(docs),
+        bytes(terms),
+        bytes(termtext),
+        bytes(postings),
+        bytes(grams),
+        bytes(gramposts),
+    ]
+    offsets: list[int] = []
+    position = _HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+    offsets.append(position)  # trailer
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        0,
+        int(index.get("generation", 0)),
+        len(nodes),
+        len(terms) // _TERM.size,
+        len(grams) // _GRAM.size,
+        *offsets,
+    )
+    return header + b"".join(sections) + TRAILER
+
+
+def _encode_meta(meta: dict[str, Any]) -> bytes:
+    directory: dict[str, list[int]] = {}
+    blobs = bytearray()
+    for key in sorted(meta):
+        blob = _compact(meta[key])
+        directory[key] = [len(blobs), len(blob)]
+        blobs += blob
+    head = _compact(directory)
+    return _META_DIR.pack(len(head)) + head + bytes(blobs)
+
+
+def intact(path: Path) -> bool:
+    """O(1) check that *path* is a complete binary index (header + trailer)."""
+    try:
+        with path.open("rb") as handle:
+            head = handle.read(_HEADER.size)
+            if len(head) < _HEADER.size or head[:4] != MAGIC:
+                return False
+            trailer_at = _HEADER.unpack(head)[-1]
+            handle.seek(0, 2)
+            if handle.tell() != trailer_at + len(TRAILER):
+                return False
+            handle.seek(trailer_at)
+            return handle.read() == TRAILER
+    except OSError:
+        return False
+
+
+def _has(ids: list[int], value: int) -> bool:
+    pos = bisect_left(ids, value)
+    return pos < len(ids) and ids[pos] == value
+
+
+# --- reading -----------------------------------------------------------------
+
+
+class BinaryIndex:
+    """Read-only, memory-mapped view of one ``index.bin``.
+
+    Opening reads the header only; everything else is decoded on demand from
+    the mapping, so a query costs pages proportional to its matches. The
+    mapping pins the file it was opened on: an ``os.replace`` by a later
+    commit does not disturb an open reader.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as handle:
+            size = handle.seek(0, 2)
+            if size < _HEADER.size + len(TRAILER):
+                raise BinaryIndexError(f"{path} is too short to be a binary index")
+            self._mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fields = _HEADER.unpack_from(self._mm, 0)
+            magic, version = fields[0], fields[1]
+            if magic != MAGIC or version not in READABLE_VERSIONS:
+                raise BinaryIndexError(f"{path} is not a version {VERSION} binary index")
+            self.version: int = version
+            self.generation: int = fields[3]
+            self.doc_count: int = fields[4]
+            self.term_count: int = fields[5]
+            self.gram_count: int = fields[6]
+            (
+                self._meta,
+                self._strings,
+                self._docs,
+                self._terms,
+                self._termtext,
+                self._postings,
+                self._grams,
+                self._gramposts,
+                trailer,
+            ) = fields[7:]
+            if (
+                self._mm[trailer:] != TRAILER
+                or self._docs + self.doc_count * _DOC.size != self._terms
+                or self._grams + self.gram_count * _GRAM.size != self._gramposts
+            ):
+                raise BinaryIndexError(f"{path} is truncated or inconsistent")
+        except (struct.error, BinaryIndexError):
+            self._mm.close()
+            raise
+        # Meta key -> (start, end) in the mapping, and the keys decoded so far.
+        self._meta_spans: dict[str, tuple[int, int]] | None = None
+        self._meta_values: dict[str, Any] = {}
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self) -> "BinaryIndex":
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    # --- docs ------------------------------------------------------------
+
+    def _doc(self, doc: int) -> tuple[int, int, int, int]:
+        if not 0 <= doc < self.doc_count:
+            raise BinaryIndexError(f"doc id {doc} out of range")
+        return _DOC.unpack_from(self._mm, self._docs + doc * _DOC.size)
+
+    def node_id(self, doc: int) -> str:
+        id_off, id_len, _, _ = self._doc(doc)
+        start = self._strings + id_off
+        return self._mm[start : start + id_len].decode()
+
+    def entry(self, doc: int) -> dict[str, Any]:
+        _, _, entry_off, entry_len = self._doc(doc)
+        start = self._strings + entry_off
+        entry = json.loads(self._mm[start : start + entry_len])
+        if not isinstance(entry, dict):
+            raise BinaryIndexError(f"doc {doc} entry is not an object")
+        return entry
+
+    def find_doc(self, node_id: str) -> int | None:
+        """Doc id of *node_id* (binary search over the sorted id table)."""
+        low, high = 0, self.doc_count
+        while low < high:
+            mid = (low + high) // 2
+            current = self.node_id(mid)
+            if current == node_id:
+                return mid
+            if current < node_id:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    # --- terms -----------------------------------------------------------
+
+    def _term(self, term: int) -> tuple[int, int, int, int, int]:
+        return _TERM.unpack_from(self._mm, self._terms + term * _TERM.size)
+
+    def term(self, term: int) -> str:
+        text_off, text_len, _, _, _ = self._term(term)
+        start = self._termtext + text_off
+        return self._mm[start : start + text_len].decode()
+
+    def postings(self, term: int) -> list[int]:
+        _, _, post_off, post_len, df = self._term(term)
+        start = self._postings + post_off
+        return decode_deltas(self._mm[start : start + post_len], df)
+
+    def lookup(self, token: str) -> list[int]:
+        """Doc ids of one exact token (binary search in the term dictionary)."""
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            current = self.term(mid)
+            if current == token:
+                return self.postings(mid)
+            if current < token:
+                low = mid + 1
+            else:
+                high = mid
+        return []
+
+    def _term_at(self, text_offset: int) -> int:
+        """The term whose text contains byte *text_offset* of ``termtext``."""
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._term(mid)[0] <= text_offset:
+                low = mid + 1
+            else:
+                high = mid
+        return low - 1
+
+    def gram_terms(self, gram: bytes) -> list[int]:
+        """Term ids containing one trigram (binary search over the gram table)."""
+        low, high = 0, self.gram_count
+        while low < high:
+            mid = (low + high) // 2
+            record = self._grams + mid * _GRAM.size
+            current, post_off, post_len, count = _GRAM.unpack_from(self._mm, record)
+            if current == gram:
+                start = self._gramposts + post_off
+                return decode_deltas(self._mm[start : start + post_len], count)
+            if current < gram:
+                low = mid + 1
+            else:
+                high = mid
+        return []
+
+    def matching_terms(self, needle: str) -> Iterator[int]:
+        """Every term containing *needle* as a substring, each once, in order."""
+        encoded = needle.encode()
+        if not encoded or b"\n" in encoded:
+            return
+        grams = [gram.encode() for gram in token_grams(needle)]
+        if grams and all(len(gram) == GRAM for gram in grams):
+            lists = sorted((self.gram_terms(gram) for gram in grams), key=len)
+            for term in lists[0]:
+                if all(_has(ids, term) for ids in lists[1:]) and needle in self.term(term):
+                    yield term
+            return
+        yield from self._scan_terms(encoded)
+
+    def _scan_terms(self, encoded: bytes) -> Iterator[int]:
+        end = self._postings
+        position = self._mm.find(encoded, self._termtext, end)
+        while position != -1:
+            term = self._term_at(position - self._termtext)
+            yield term
+            text_off, text_len, _, _, _ = self._term(term)
+            # Resume after this term: one hit per term is enough.
+            position = self._mm.find(encoded, self._termtext + text_off + text_len, end)
+
+    def candidate_docs(self, needles: Iterable[str]) -> set[int]:
+        docs: set[int] = set()
+        for needle in needles:
+            for term in self.matching_terms(needle):
+                docs.update(self.postings(term))
+        return docs
+
+    # --- whole index -----------------------------------------------------
+
+    def _spans(self) -> dict[str, tuple[int, int]]:
+        if self._meta_spans is not None:
+            return self._meta_spans
+        if self.version == 2:
+            meta = json.loads(self._mm[self._meta : self._strings])
+            self._meta_values = meta if isinstance(meta, dict) else {}
+            self._meta_spans = {key: (0, 0) for key in self._meta_values}
+            return self._meta_spans
+        try:
+            (length,) = _META_DIR.unpack_from(self._mm, self._meta)
+        except struct.error as exc:
+            raise BinaryIndexError("meta section is truncated") from exc
+        blobs = self._meta + _META_DIR.size + length
+        directory = json.loads(self._mm[self._meta + _META_DIR.size : blobs])
+        if not isinstance(directory, dict):
+            raise BinaryIndexError("meta directory is not an object")
+        spans: dict[str, tuple[int, int]] = {}
+        for key, span in directory.items():
+            if (
+                not isinstance(span, list)
+                or len(span) != 2
+                or not all(isinstance(v, int) and v >= 0 for v in span)
+                or blobs + span[0] + span[1] > self._strings
+            ):
+                raise BinaryIndexError(f"meta key {key!r} points outside its section")
+            spans[key] = (blobs + span[0], blobs + span[0] + span[1])
+        self._meta_spans = spans
+        return spans
+
+    def meta_view(self, keys: Iterable[str]) -> dict[str, Any]:
+        """The meta *keys* present in the index, decoding only those.
+
+        Decoded values are kept for the reader's lifetime and shared between
+        callers, who must treat them as read-only.
+        """
+        spans = self._spans()
+        view: dict[str, Any] = {}
+        for key in keys:
+            if key not in spans:
+                continue
+            if key not in self._meta_values:
+                start, end = spans[key]
+                self._meta_values[key] = json.loads(self._mm[start:end])
+            view[key] = self._meta_values[key]
+        return view
+
+    def meta(self) -> dict[str, Any]:
+        return dict(self.meta_view(list(self._spans())))
+
+    def to_index(self) -> dict[str, Any]:
+        """Decode everything back into the ``index.json`` dict shape."""
+        ids = [self.node_id(doc) for doc in range(self.doc_count)]
+        postings = {
+            self.term(term): [ids[doc] for doc in self.postings(term)]
+            for term in range(self.term_count)
+        }
+        return {
+            **self.meta(),
+            "generation": self.generation,
+            "nodes": [self.entry(doc) for doc in range(self.doc_count)],
+            "postings": postings,
+        }
@@ -17,7 +17,7 @@ they are appended to ``~/.ralph/cache/migration-rejects.jsonl`` with the reason.
 By default this runs in ``--dry-run`` mode: it reports how many rules would
 pass / fail / are RED, WITHOUT writing any nodes. Pass ``--apply`` to actually
 persist nodes into the real per-project memory tree via
-``tree_store.TreeStore.create_node``.
+``tree_store.TreeStore.upsert_nodes`` (one bulk ingest for the whole run).
 
 Persistence (``--apply``) targets the real tree for the current worktree,
 keyed by ``tree_store.compute_project_id(repo_root)`` so the migrated nodes are
@@ -52,8 +52,8 @@ from memory_node import (  # noqa: E402
 )
 from sensitive_content import classify_text  # noqa: E402
 from tree_store import (  # noqa: E402
+    DURABILITY_MODES,
     TreeStore,
-    TreeStoreError,
     compute_project_id,
     repo_remote_hash,
     workspace_instance_id,
@@ -156,24 +156,6 @@ def _tree_provenance(repo_root: Path) -> dict[str, str]:
     }
 
 
-def _persist_node(
-    store: TreeStore, node: MemoryNode, stats: dict[str, int]
-) -> None:
-    """Idempotently write *node* into the tree: create, or update if it exists.
-
-    The node_id is deterministic (sanitized rule id or content hash), so a
-    re-run never duplicates: an existing node is updated in place.
-    """
-    payload = node.to_dict()
-    try:
-        store.create_node(payload)
-        stats["created"] += 1
-    except TreeStoreError:
-        # Already present -> update in place (idempotent re-run).
-        store.update_node(node.project_id, node.node_id, payload)
-        stats["updated"] += 1
-
-
 def migrate(
     rules_path: Path,
     rejects_path: Path,
@@ -196,6 +178,9 @@ def migrate(
     }
     rejects: list[dict[str, Any]] = []
     nodes_out: list[dict[str, Any]] = []
+    # (rule index, rule_id, node) for every rule that passed, persisted in
+    # one bulk ``upsert_nodes`` call after classification.
+    to_persist: list[tuple[int, object, MemoryNode]] = []
 
     overrides: dict[str, str] = {}
     if apply and store is not None and repo_root is not None:
@@ -261,36 +246,36 @@ def migrate(
             return
 
         stats["passed"] += 1
-        if not apply:
-            return
-
-        if store is not None:
-            try:
-                _persist_node(store, node, stats)
-            except (MemoryNodeValidationError, TreeStoreError, OSError) as exc:
+        if apply:
+            to_persist.append((index, rule.get("rule_id") or rule.get("id"), node))
+
+    for index, rule in enumerate(rules):
+        process_rule(index, rule)
+
+    # Bulk-write performance: one ``upsert_nodes`` call validates every node
+    # once, resolves create-vs-update against the index id set (the node_id
+    # is deterministic, so a re-run updates in place) and flushes the index
+    # and usage log once. It runs as one write-ahead group (a no-op unless
+    # the store is in ``batched`` durability, which main() selects).
+    if store is not None and to_persist:
+        outcomes = store.upsert_nodes(node.to_dict() for _, _, node in to_persist)
+        for (index, rule_id, node), outcome in zip(to_persist, outcomes):
+            if outcome["status"] == "rejected":
                 stats["passed"] -= 1
                 stats["failed"] += 1
                 rejects.append(
                     {
                         "index": index,
-                        "rule_id": rule.get("rule_id") or rule.get("id"),
+                        "rule_id": rule_id,
                         "reason": "persist_error",
-                        "error": str(exc),
+                        "error": outcome.get("error", ""),
                     }
                 )
-                return
-        nodes_out.append(node.to_dict())
-
-    # Bulk-write performance: defer the aggregate index.json rebuild to a single
-    # pass at the end instead of rewriting it per node (O(n^2) -> O(n)). The
-    # context manager is a no-op when not persisting to a tree.
-    if apply and store is not None:
-        with store.deferred_index():
-            for index, rule in enumerate(rules):
-                process_rule(index, rule)
-    else:
-        for index, rule in enumerate(rules):
-            process_rule(index, rule)
+                continue
+            stats[outcome["status"]] += 1
+            nodes_out.append(node.to_dict())
+    elif apply:
+        nodes_out.extend(node.to_dict() for _, _, node in to_persist)
 
     # Always write rejects (even on dry-run) so they are never lost silently.
     if rejects:
@@ -329,6 +314,12 @@ def main(argv: list[str] | None = None) -> int:
         default=None,
         help="Override the ~/.ralph home for the tree store (testing).",
     )
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        default="batched",
+        help="TreeStore durability for --apply (default: batched group commit).",
+    )
     parser.add_argument(
         "--jsonl-only",
         action="store_true",
@@ -356,7 +347,7 @@ def main(argv: list[str] | None = None) -> int:
     store: TreeStore | None = None
     repo_root: Path | None = None
     if apply and not args.jsonl_only:
-        store = TreeStore(args.ralph_home) if args.ralph_home else TreeStore()
+        store = TreeStore(args.ralph_home, durability=args.durability)
         repo_root = args.repo_root
 
     stats = migrate(
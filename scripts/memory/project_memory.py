@@ -51,9 +51,11 @@ from pathlib import Path
 from typing import Any
 
 if __package__:
+    from .tree_index import stale_entry
     from .tree_store import TreeStore, compute_project_id, resolve_main_repo_root
 else:  # pragma: no cover - script-style import support.
     sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_index import stale_entry
     from tree_store import TreeStore, compute_project_id, resolve_main_repo_root
 
 BLOCK_START = "<!-- ralph-green-nodes:start (auto-generated, do not edit) -->"
@@ -133,33 +135,54 @@ def green_node_score(node: dict[str, Any]) -> float:
     return round(_confidence(node) + min(_salience(node), 1.0) * 0.5, 4)
 
 
+def _projectable(node: dict[str, Any]) -> bool:
+    """GREEN and not deprecated -- the only nodes native memory may hold."""
+    if node.get("sensitivity") != "GREEN":
+        return False
+    quality = _as_dict(node.get("quality"))
+    if quality.get("deprecated") is True:
+        return False
+    return str(quality.get("status", "")).lower() != "deprecated"
+
+
 def select_green_nodes(
     store: TreeStore, project_id: str, top_n: int
 ) -> list[dict[str, Any]]:
     """Return up to *top_n* GREEN, non-deprecated nodes, ranked by score.
 
     Only ``sensitivity == "GREEN"`` nodes are projected (YELLOW/RED never reach
-    native memory). ``list_nodes`` already excludes raw bodies and corrupt
-    files, so this can never leak raw content.
+    native memory). Index entries and ``list_nodes`` exclude raw bodies and
+    corrupt files, so this can never leak raw content.
+
+    Perf: the sensitivity facet (``TreeStore.query``) narrows the index to
+    GREEN entries -- plus unset ones, which covers thin entries from older
+    builds -- and ranking reads the entries' quality/salience. Only the
+    *top_n* winners are loaded as full nodes, instead of every node in the
+    tree. Without an index this falls back to ``list_nodes``. The loaded node
+    is checked again, so an index entry that lags its node file can never
+    project a node that has since turned YELLOW or deprecated.
     """
+    entries = store.query(project_id, sensitivity=["GREEN", ""])
+    if entries is None:
+        entries = store.list_nodes(project_id)
     candidates: list[tuple[float, str, dict[str, Any]]] = []
-    for entry in store.list_nodes(project_id):
-        # list_nodes entries omit raw bodies and sensitivity; load the full
-        # node to read sensitivity/quality (still no raw content is exposed).
-        full = store.load_node(project_id, str(entry.get("node_id", "")))
-        if full is None:
-            continue
-        if full.get("sensitivity") != "GREEN":
-            continue
-        quality = _as_dict(full.get("quality"))
-        if quality.get("deprecated") is True:
-            continue
-        if str(quality.get("status", "")).lower() == "deprecated":
+    for entry in entries:
+        node_id = str(entry.get("node_id", ""))
+        if stale_entry(entry):
+            # Thin entries may lack sensitivity/quality; read the node itself.
+            entry = store.load_node(project_id, node_id) or {}
+        if not _projectable(entry):
             continue
-        score = green_node_score(full)
-        candidates.append((score, str(full.get("node_id", "")), full))
+        candidates.append((green_node_score(entry), node_id, entry))
     candidates.sort(key=lambda item: (-item[0], item[1]))
-    return [node for _score, _nid, node in candidates[: max(0, top_n)]]
+    selected: list[dict[str, Any]] = []
+    for _score, node_id, entry in candidates:
+        if len(selected) >= max(0, top_n):
+            break
+        full = entry if "detailed_summary" in entry else store.load_node(project_id, node_id)
+        if full is not None and _projectable(full):
+            selected.append(full)
+    return selected
 
 
 def _escape_inline(text: str) -> str:
@@ -0,0 +1,246 @@
+"""Ralph Memory Tree raw store -- compressed, chunk-deduplicated raw blobs.
+
+Raw transcripts used to be stored whole, as one uncompressed ``<sha>.txt``
+per blob, and ``save_raw`` needed the full text as one string. Raw blobs are
+now split into fixed-size text chunks; each chunk is compressed with a stdlib
+codec and stored ONCE under the sha256 of its UTF-8 bytes, and a small
+manifest lists the chunks that make up a blob:
+
+    {project_tree}/raw/
+        <sha>.manifest          (sharded: raw/ab/<sha>.manifest)
+        chunks/ab/<chunk>.zz    zlib-compressed chunk (``.xz`` for lzma)
+        <sha>.txt               legacy whole blob; still readable
+
+The blob digest stays the sha256 of the whole text, so ``raw_ref`` values
+are unchanged. Chunk boundaries fall at fixed character offsets, so two
+transcripts that share a prefix (a resumed session, a re-saved log) share
+every chunk of that prefix.
+
+Streaming: writers feed any iterable of text pieces through ``chunk_text``
+and ``red_gated``, so at most two chunks are held in memory. The RED gate
+scans every chunk plus a window straddling each boundary, and tracks PEM
+private-key markers across the whole stream (a key may span any number of
+chunks, which are held back from its BEGIN marker on). A chunk is released
+for writing only once the boundary after it has been scanned too -- no
+fragment of a secret split across two chunks ever reaches disk. The clean
+chunks a rejected stream already wrote are left to ``tree_gc``.
+Readers verify every chunk against its hash before yielding it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import lzma
+import os
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+if __package__:
+    from .memory_node import MemoryNodeValidationError, contains_red_material
+    from .sensitive_content import PRIVATE_KEY_BEGIN, PRIVATE_KEY_END
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from memory_node import MemoryNodeValidationError, contains_red_material
+    from sensitive_content import PRIVATE_KEY_BEGIN, PRIVATE_KEY_END
+
+MANIFEST_SCHEMA_VERSION = "ralph_raw_manifest_v1"
+MANIFEST_SUFFIX = ".manifest"
+LEGACY_SUFFIX = ".txt"
+CHUNKS_DIR = "chunks"
+CHUNK_SHARD_LEVELS = 1
+# Characters per chunk. Large enough that compression has context to work
+# with, small enough that a streaming write holds very little in memory
+# (``red_gated`` holds more only after an unclosed private-key marker).
+CHUNK_CHARS = 64 * 1024
+# Characters on each side of a chunk boundary re-scanned for RED material.
+# Covers the RED patterns that match a bounded stretch of text; a PEM
+# private key spans any length and is caught by its markers instead.
+RED_OVERLAP_CHARS = 4 * 1024
+
+# Codec name -> (chunk file suffix, compress, decompress).
+CODECS: dict[str, tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (".zz", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+}
+DEFAULT_CODEC = "zlib"
+
+# Errors a damaged chunk or manifest can raise while being read.
+READ_ERRORS = (OSError, ValueError, zlib.error, lzma.LZMAError)
+
+
+def default_codec() -> str:
+    """Codec for new chunks: ``RALPH_MEMORY_RAW_CODEC`` if known, else zlib."""
+    codec = os.environ.get("RALPH_MEMORY_RAW_CODEC", "").strip().lower()
+    return codec if codec in CODECS else DEFAULT_CODEC
+
+
+# --- streaming input -------------------------------------------------------
+
+
+def iter_text_pieces(content: object) -> Iterator[str]:
+    """Normalise ``save_raw`` input: a str, a text file object, or an
+    iterable of str. File objects are read ``CHUNK_CHARS`` at a time."""
+    if isinstance(content, str):
+        yield content
+        return
+    read = getattr(content, "read", None)
+    pieces: Iterable[object] = (
+        iter(lambda: read(CHUNK_CHARS), "") if callable(read) else content  # type: ignore[arg-type]
+    )
+    for piece in pieces:
+        if not isinstance(piece, str):
+            raise MemoryNodeValidationError("raw content must be text")
+        yield piece
+
+
+def chunk_text(pieces: Iterable[str], size: int | None = None) -> Iterator[str]:
+    """Re-cut *pieces* into chunks of exactly *size* (``CHUNK_CHARS``)
+    characters -- the last one may be shorter -- independent of how the
+    input happened to be split."""
+    size = size or CHUNK_CHARS
+    buffer: list[str] = []
+    buffered = 0
+    for piece in pieces:
+        while piece:
+            take = piece[: size - buffered]
+            piece = piece[len(take) :]
+            buffer.append(take)
+            buffered += len(take)
+            if buffered == size:
+                yield "".join(buffer)
+                buffer, buffered = [], 0
+    if buffered:
+        yield "".join(buffer)
+
+
+def red_gated(chunks: Iterable[str]) -> Iterator[str]:
+    """Yield *chunks* unchanged, raising ``MemoryNodeValidationError`` as soon
+    as a chunk or a chunk boundary contains RED material.
+
+    Each chunk is held back until the boundary after it has been scanned, so
+    a consumer never sees a chunk that is adjacent to a RED match. A PEM
+    private key matches whenever an END marker follows a BEGIN marker, however
+    far apart, so the end offset of the first BEGIN seen is carried across
+    chunks and any later END marker rejects the stream. Markers are short, so
+    each one lies whole inside a chunk or a boundary window. From an open
+    BEGIN on, every chunk is held until the stream ends: none of a key's
+    fragments is released before its END could still turn up.
+    """
+    key_open: list[int | None] = [None]  # stream offset where the first BEGIN ends
+
+    def scan(text: str, base: int) -> None:
+        if contains_red_material(text):
+            raise MemoryNodeValidationError("raw content contains RED material")
+        opened = key_open[0]
+        if opened is not None and any(
+            base + end.start() >= opened for end in PRIVATE_KEY_END.finditer(text)
+        ):
+            raise MemoryNodeValidationError("raw content contains RED material")
+        if opened is None:
+            begin = PRIVATE_KEY_BEGIN.search(text)
+            if begin is not None:
+                key_open[0] = base + begin.end()
+
+    held: list[str] = []  # scanned, not yet released
+    offset = 0  # stream offset of *chunk*
+    for chunk in chunks:
+        if held:
+            tail = held[-1][-RED_OVERLAP_CHARS:]
+            scan(tail + chunk[:RED_OVERLAP_CHARS], offset - len(tail))
+        scan(chunk, offset)
+        if key_open[0] is None:
+            yield from held
+            held.clear()
+        held.append(chunk)
+        offset += len(chunk)
+    yield from held
+
+
+# --- chunks and manifests --------------------------------------------------
+
+
+def chunk_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress_chunk(data: bytes, codec: str) -> bytes:
+    return CODECS[codec][1](data)
+
+
+def decode_chunk(payload: bytes, codec: str, expected_id: str) -> str:
+    """Decompress a stored chunk, refusing one whose hash does not match."""
+    data = CODECS[codec][2](payload)
+    if chunk_id(data) != expected_id:
+        raise ValueError(f"raw chunk {expected_id} failed verification")
+    return data.decode("utf-8")
+
+
+def write_chunk_file(path: Path, payload: bytes, *, fsync: bool) -> None:
+    """mkstemp + (fsync) + os.replace. The caller fsyncs the directory once
+    per batch of chunks instead of once per chunk."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(payload)
+            handle.flush()
+            if fsync:
+                os.fsync(handle.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def build_manifest(
+    digest: str, codec: str, chunks: list[str], chars: int, size: int, stored: int
+) -> dict[str, Any]:
+    return {
+        "schema_version": MANIFEST_SCHEMA_VERSION,
+        "sha256": digest,
+        "codec": codec,
+        "chunks": chunks,
+        "chars": chars,
+        "bytes": size,
+        "stored_bytes": stored,
+    }
+
+
+def load_manifest(path: Path, digest: str) -> dict[str, Any]:
+    """Parse and sanity-check a manifest; raises ``ValueError`` when bad."""
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if (
+        not isinstance(manifest, dict)
+        or manifest.get("schema_version") != MANIFEST_SCHEMA_VERSION
+        or manifest.get("sha256") != digest
+        or manifest.get("codec") not in CODECS
+        or not isinstance(manifest.get("chunks"), list)
+        or not all(isinstance(c, str) and len(c) == 64 for c in manifest["chunks"])
+    ):
+        raise ValueError(f"raw manifest for {digest} is invalid")
+    return manifest
+
+
+class ChunkReader:
+    """Re-iterable view of one blob's chunks.
+
+    The chunk list is fixed when the reader is built, and every chunk is
+    verified against its content hash as it is read, so iterating twice
+    yields identical text (``TreeStore.iter_raw`` verifies on the first pass
+    and streams on the second).
+    """
+
+    def __init__(self, codec: str, paths: list[tuple[str, Path]]) -> None:
+        self.codec = codec
+        self.paths = paths
+
+    def __iter__(self) -> Iterator[str]:
+        for expected_id, path in self.paths:
+            yield decode_chunk(path.read_bytes(), self.codec, expected_id)
@@ -0,0 +1,135 @@
+"""Ralph Memory Tree recall cache -- recall results shared across processes.
+
+With agent teams up to six teammates recall against the same project tree,
+often with the same (or a near-identical) query within seconds. Each recall
+result is kept on disk so the second teammate reads it instead of recalling:
+
+    {project_tree}/cache/
+        {sha256}.json    {"created": epoch, "report": {...}}
+
+The key (``cache_key``) is everything that decides a result: the normalized
+``analyze_query`` output (so queries differing only in case, stopwords or
+punctuation share an entry), limit, budget, include_deprecated, the filters,
+the branch view and the backend's ``index_signature`` -- which moves with
+every index generation, so a tree change invalidates every entry without a
+sweep. Superseded entries simply age out.
+
+Eviction is LRU by file mtime (a hit touches its file) once the directory
+holds more than ``max_entries``. Entries also expire after ``ttl_seconds``:
+recency scoring depends on the clock, so a result is not served forever even
+when the tree never changes. The cache is best effort: a read-only tree, a
+torn file or a lost race is a miss, never an error.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+if __package__:
+    from .tree_store import TreeStore, atomic_write_text
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_store import TreeStore, atomic_write_text
+
+CACHE_DIR = "cache"
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 600
+
+
+def cache_enabled() -> bool:
+    """False when ``RALPH_RECALL_CACHE`` turns the cache off."""
+    value = os.environ.get("RALPH_RECALL_CACHE", "1").strip().lower()
+    return value not in {"0", "false", "no", "off"}
+
+
+def normalized_analysis(analysis: dict[str, Any]) -> dict[str, Any]:
+    """*analysis* with its term lists de-duplicated and sorted: term order
+    never changes which nodes recall selects."""
+    return {
+        key: sorted(set(value)) if key.endswith("_terms") and isinstance(value, list) else value
+        for key, value in analysis.items()
+    }
+
+
+def cache_key(signature: Any, analysis: dict[str, Any], **options: Any) -> str:
+    material = json.dumps(
+        {"signature": signature, "analysis": normalized_analysis(analysis), "options": options},
+        ensure_ascii=True,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("ascii")).hexdigest()
+
+
+class RecallCache:
+    """The on-disk result cache of ONE project tree."""
+
+    def __init__(
+        self,
+        store: TreeStore,
+        project_id: str,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+    ) -> None:
+        self.store = store
+        self.project_id = project_id
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def root(self) -> Path:
+        return self.store.project_tree(self.project_id) / CACHE_DIR
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        path = self.root / f"{key}.json"
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        report = data.get("report") if isinstance(data, dict) else None
+        created = data.get("created") if isinstance(data, dict) else None
+        if not isinstance(report, dict) or not isinstance(created, (int, float)):
+            return None
+        if time.time() - created > self.ttl_seconds:
+            return None
+        try:
+            os.utime(path)  # LRU: a hit is a use
+        except OSError:
+            pass
+        return report
+
+    def put(self, key: str, report: dict[str, Any]) -> None:
+        text = json.dumps({"created": time.time(), "report": report}, ensure_ascii=True)
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(self.root / f"{key}.json", text + "\n", fsync=False)
+            self._evict()
+        except OSError:
+            pass  # read-only tree: recall still works, uncached
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.root.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime_ns, path))
+            except OSError:
+                continue  # evicted by another process
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _mtime, path in entries[:excess]:
+            path.unlink(missing_ok=True)
+
+    def clear(self) -> int:
+        removed = 0
+        for path in self.root.glob("*.json"):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
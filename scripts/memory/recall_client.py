@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Ralph Memory Tree recall client -- hook-time recall through the daemon.
+
+A drop-in for ``recall_v2.py``: same arguments, same output, same exit code.
+When a recall daemon (``recall_daemon.py serve``) listens for the tree's
+``--ralph-home`` the query is answered there from hot indexes; when none is
+running, or it answers with an error, recall runs in-process instead. Until
+it has to fall back this module imports only the standard library, which is
+what keeps a hook-time lookup cheap.
+
+    python3 scripts/memory/recall_client.py --project-root . --query "..." --json
+
+Environment:
+    RALPH_RECALL_DAEMON=0   never try the daemon
+    RALPH_RECALL_SOCKET     socket path (default {ralph_home}/memory_tree/recall.sock)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Any, Mapping
+
+SOCKET_NAME = "recall.sock"
+# Hook budgets are ~5 s; a daemon slower than this loses to the fallback.
+TIMEOUT_SECONDS = 3.0
+# Environment the daemon needs to parse the CLI exactly as we would.
+FORWARDED_ENV_PREFIX = "RALPH_"
+
+
+def socket_path(ralph_home: str | Path) -> Path:
+    override = os.environ.get("RALPH_RECALL_SOCKET", "").strip()
+    if override:
+        return Path(override).expanduser()
+    return Path(ralph_home).expanduser() / "memory_tree" / SOCKET_NAME
+
+
+def daemon_enabled(environ: Mapping[str, str] | None = None) -> bool:
+    env = os.environ if environ is None else environ
+    return env.get("RALPH_RECALL_DAEMON", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def ralph_home_from(argv: list[str], environ: Mapping[str, str] | None = None) -> str:
+    """The ``--ralph-home`` recall_v2 would use for *argv* (the socket lives there)."""
+    env = os.environ if environ is None else environ
+    home = env.get("RALPH_HOME", "~/.ralph")
+    for i, arg in enumerate(argv):
+        if arg == "--ralph-home" and i + 1 < len(argv):
+            home = argv[i + 1]
+        elif arg.startswith("--ralph-home="):
+            home = arg.split("=", 1)[1]
+    return home
+
+
+def request(
+    path: Path, payload: dict[str, Any], timeout: float = TIMEOUT_SECONDS
+) -> dict[str, Any] | None:
+    """Send one JSON request line; the reply, or None when no daemon answered."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(str(path))
+            conn.sendall(json.dumps(payload, ensure_ascii=True).encode("ascii") + b"\n")
+            with conn.makefile("rb") as handle:
+                line = handle.readline()
+    except OSError:  # no socket, nobody listening, or too slow
+        return None
+    try:
+        reply = json.loads(line)
+    except ValueError:
+        return None
+    return reply if isinstance(reply, dict) else None
+
+
+def recall_request(argv: list[str], environ: Mapping[str, str] | None = None) -> dict[str, Any]:
+    env = os.environ if environ is None else environ
+    return {
+        "op": "recall",
+        "argv": list(argv),
+        "cwd": os.getcwd(),
+        "env": {k: v for k, v in env.items() if k.startswith(FORWARDED_ENV_PREFIX)},
+    }
+
+
+def _in_process(argv: list[str]) -> int:
+    # Imported here: the daemon path must not pay for recall_v2's imports.
+    if __package__:
+        from .recall_v2 import main as recall_main
+    else:  # pragma: no cover - script-style import support.
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        from recall_v2 import main as recall_main
+    return recall_main(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if daemon_enabled():
+        reply = request(socket_path(ralph_home_from(argv)), recall_request(argv))
+        if reply is not None and reply.get("ok"):
+            sys.stdout.write(str(reply.get("stdout", "")))
+            sys.stderr.write(str(reply.get("stderr", "")))
+            return int(reply.get("code", 0))
+    return _in_process(argv)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
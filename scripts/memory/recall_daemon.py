@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Ralph Memory Tree recall daemon -- hot indexes for hook-time recall.
+
+Every hook-time lookup used to start ``recall_v2.py`` from scratch: the
+interpreter, the imports (compiling every RED pattern), ``git`` forks in
+``context_for`` and a full parse of the project index. The daemon is an
+opt-in, long-lived process that pays all of that once:
+
+    python3 scripts/memory/recall_daemon.py serve [--idle-timeout 1800]
+    python3 scripts/memory/recall_daemon.py status
+    python3 scripts/memory/recall_daemon.py stop
+
+It serves ONE ralph home on ``recall_client.socket_path`` (mode 0600) and
+keeps a ``RecallEngine`` per project over one shared ``TreeStore``: parsed
+indexes and per-node scoring state, re-read only when the index changes.
+Resolved contexts are cached per (root, project id, branch, instance id), and
+a tree converted to another backend by some other process is picked up from
+its layout.json.
+
+Protocol: one JSON request line in, one JSON reply line out.
+    {"op": "recall", "argv": [...], "cwd": "...", "env": {...}}
+        -> {"ok": true, "code": 0, "stdout": "...", "stderr": "..."}
+    {"op": "ping"} -> {"ok": true, "pid": ..., "served": n, "projects": [...]}
+    {"op": "stop"} -> {"ok": true}
+``argv`` is a ``recall_v2`` command line, answered exactly as that CLI would.
+Any failure replies ``{"ok": false, "error": ...}`` and ``recall_client``
+falls back to in-process recall.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+if __package__:
+    from .recall_client import request, socket_path
+    from .recall_v2 import Context, RecallEngine, context_for, execute, parse_args
+    from .tree_store import TreeStore
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from recall_client import request, socket_path
+    from recall_v2 import Context, RecallEngine, context_for, execute, parse_args
+    from tree_store import TreeStore
+
+IDLE_TIMEOUT_SECONDS = 1800.0
+# How often the serve loop wakes to check for ``stop`` and the idle timeout.
+POLL_SECONDS = 0.25
+MAX_REQUEST_BYTES = 1 << 20
+CONTEXT_CACHE_SIZE = 256
+
+
+class RecallDaemon:
+    """Request handling, independent of the socket (see ``serve``)."""
+
+    def __init__(self, ralph_home: Path) -> None:
+        self.ralph_home = Path(ralph_home).expanduser().resolve()
+        self.store = TreeStore(self.ralph_home)
+        self.served = 0
+        self.stopping = False
+        self.last_request = time.monotonic()
+        # Recall shares the store's backends (and their mapped index files)
+        # across requests, so requests run one at a time.
+        self._lock = threading.Lock()
+        self._contexts: dict[tuple[str, str, str, str], Context] = {}
+        self._layouts: dict[str, Any] = {}
+        self._engines: dict[str, RecallEngine] = {}
+
+    def handle(self, message: object) -> dict[str, Any]:
+        self.last_request = time.monotonic()
+        op = message.get("op") if isinstance(message, dict) else None
+        if op == "ping":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "ralph_home": str(self.ralph_home),
+                "served": self.served,
+                "projects": sorted(self._layouts),
+            }
+        if op == "stop":
+            self.stopping = True
+            return {"ok": True}
+        if op != "recall":
+            return {"ok": False, "error": f"unknown op: {op!r}"}
+        assert isinstance(message, dict)
+        try:
+            return self._recall(message)
+        except SystemExit:  # argparse rejected the command line
+            return {"ok": False, "error": "invalid arguments"}
+        except Exception as exc:  # noqa: BLE001 - the client falls back in-process
+            return {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+
+    def _recall(self, message: dict[str, Any]) -> dict[str, Any]:
+        argv = message.get("argv")
+        env = message.get("env")
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return {"ok": False, "error": "argv must be a list of strings"}
+        env = {str(k): str(v) for k, v in env.items()} if isinstance(env, dict) else {}
+        cwd = Path(str(message.get("cwd") or "."))
+        args = parse_args(argv, env)
+        home = (cwd / Path(args.ralph_home).expanduser()).resolve()
+        if home != self.ralph_home:
+            return {"ok": False, "error": f"this daemon serves {self.ralph_home}"}
+        args.ralph_home = str(home)
+        context = self._context(
+            cwd / Path(args.project_root).expanduser(),
+            args.project_id,
+            args.branch,
+            args.workspace_instance_id,
+        )
+        with self._lock:
+            self._refresh_layout(context.project_id)
+            code, out, err = execute(args, context, self._engine(context.project_id))
+            self.served += 1
+        return {"ok": True, "code": code, "stdout": out, "stderr": err}
+
+    def _context(self, root: Path, project_id: str, branch: str, instance_id: str) -> Context:
+        """``context_for``, memoised: it may fork ``git`` for the id and instance."""
+        key = (str(root), project_id, branch, instance_id)
+        cached = self._contexts.get(key)
+        if cached is None:
+            if len(self._contexts) >= CONTEXT_CACHE_SIZE:
+                self._contexts.clear()
+            cached = self._contexts[key] = context_for(root, project_id, branch, instance_id)
+        return cached
+
+    def _engine(self, project_id: str) -> RecallEngine:
+        engine = self._engines.get(project_id)
+        if engine is None:
+            engine = RecallEngine(project_id, self.ralph_home, store=self.store)
+            self._engines[project_id] = engine
+        return engine
+
+    def _refresh_layout(self, project_id: str) -> None:
+        """Drop the cached backend when layout.json changed under us."""
+        try:
+            stat = self.store.layout_path(project_id).stat()
+            key: Any = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            key = None
+        if project_id in self._layouts and self._layouts[project_id] != key:
+            self.store.forget_backend(project_id)
+        self._layouts[project_id] = key
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            message = json.loads(line)
+        except ValueError:
+            message = None
+        reply = self.server.recall.handle(message)  # type: ignore[attr-defined]
+        self.wfile.write(json.dumps(reply, ensure_ascii=True).encode("ascii") + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    recall: RecallDaemon
+
+
+def serve(
+    ralph_home: Path,
+    path: Path | None = None,
+    idle_timeout: float = IDLE_TIMEOUT_SECONDS,
+    ready: threading.Event | None = None,
+) -> dict[str, Any]:
+    """Serve recall requests until ``stop`` or *idle_timeout* seconds without one.
+
+    Refuses to start when another daemon already answers on the socket; a
+    stale socket file left by a killed daemon is replaced. *ready* is set
+    once the socket accepts connections.
+    """
+    recall = RecallDaemon(ralph_home)
+    path = path or socket_path(recall.ralph_home)
+    if request(path, {"op": "ping"}, timeout=1.0) is not None:
+        return {"status": "already_running", "socket": str(path)}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    previous = os.umask(0o177)  # the socket is created 0600: owner-only
+    try:
+        server = _Server(str(path), _Handler)
+    finally:
+        os.umask(previous)
+    server.recall = recall
+    server.timeout = POLL_SECONDS
+    if ready is not None:
+        ready.set()
+    try:
+        while not recall.stopping:
+            server.handle_request()
+            if idle_timeout and time.monotonic() - recall.last_request > idle_timeout:
+                break
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+    return {"status": "stopped", "socket": str(path), "served": recall.served}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Ralph Memory Tree recall daemon.")
+    parser.add_argument("--ralph-home", default=os.environ.get("RALPH_HOME", "~/.ralph"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="answer recall requests (blocks)")
+    serve_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=IDLE_TIMEOUT_SECONDS,
+        help="exit after this many seconds without a request (0: never)",
+    )
+    sub.add_parser("status", help="ping the running daemon")
+    sub.add_parser("stop", help="ask the running daemon to exit")
+    args = parser.parse_args(argv)
+    home = Path(args.ralph_home).expanduser()
+
+    if args.command == "serve":
+        result = serve(home, idle_timeout=max(0.0, args.idle_timeout))
+        print(json.dumps(result, ensure_ascii=True, sort_keys=True))
+        return 0 if result["status"] == "stopped" else 1
+    reply = request(socket_path(home), {"op": "ping" if args.command == "status" else "stop"})
+    reply_text = json.dumps(reply or {"ok": False, "error": "not running"}, sort_keys=True)
+    print(reply_text)
+    return 0 if reply is not None else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
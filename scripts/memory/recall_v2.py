@@ -38,10 +38,11 @@ import os
 import re
 import sys
 import time
+from bisect import insort
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Mapping
 
 if __package__:
     from .memory_node import (
@@ -49,7 +50,25 @@ if __package__:
         MemoryNodeValidationError,
         contains_red_material,
     )
-    from .tree_store import TreeStore, compute_project_id, workspace_instance_id
+    from .recall_cache import RecallCache, cache_enabled, cache_key
+    from .tree_index import (
+        ALL_FIELDS,
+        ANY_TOKEN,
+        DETAIL_FIELDS,
+        FACETS,
+        FIELD_WEIGHTS,
+        EntryFilter,
+        entry_epoch,
+        entry_features,
+        term_bound,
+    )
+    from .tree_store import (
+        TreeStore,
+        TreeStorePathError,
+        compute_project_id,
+        entry_filter,
+        workspace_instance_id,
+    )
 else:  # pragma: no cover - script-style import support.
     sys.path.insert(0, str(Path(__file__).resolve().parent))
     from memory_node import (
@@ -57,7 +76,25 @@ else:  # pragma: no cover - script-style import support.
         MemoryNodeValidationError,
         contains_red_material,
     )
-    from tree_store import TreeStore, compute_project_id, workspace_instance_id
+    from recall_cache import RecallCache, cache_enabled, cache_key
+    from tree_index import (
+        ALL_FIELDS,
+        ANY_TOKEN,
+        DETAIL_FIELDS,
+        FACETS,
+        FIELD_WEIGHTS,
+        EntryFilter,
+        entry_epoch,
+        entry_features,
+        term_bound,
+    )
+    from tree_store import (
+        TreeStore,
+        TreeStorePathError,
+        compute_project_id,
+        entry_filter,
+        workspace_instance_id,
+    )
 
 STOPWORDS = {
     "the", "and", "for", "with", "from", "that", "this", "what", "when",
@@ -72,6 +109,8 @@ MEDIUM_RISK = {
     "why", "how", "risk", "validate", "compare", "should", "migration",
     "debug", "failure",
 }
+# Float headroom on top-k pruning bounds (scores are sums of floats).
+_BOUND_SLACK = 1e-6
 NEGATIVE_QUERY_TERMS = {"avoid", "repeat", "mistake", "risk", "unsafe", "shortcut"}
 EXACT_PATTERNS = (
     r"\bexact\s+(?:command|file\s+path|path|function|class|metric|date|version|number)\b",
@@ -146,110 +185,193 @@ def analyze_query(query: str) -> dict[str, Any]:
         "search_terms": search_terms,
         "intent_terms": intent,
         "temporal_terms": temporal,
+        "time_range": time_range(temporal),
         "risk_level": risk,
         "exact_fact_mode": exact_fact,
     }
 
 
+_RELATIVE_DAYS = {"yesterday": -1, "today": 0, "tomorrow": 1}
+
+
+def time_range(temporal_terms: list[str], now: datetime | None = None) -> list[int] | None:
+    """``[since, until)`` epoch seconds spanned by *temporal_terms*, or None.
+
+    A date covers that UTC day, a year the whole year, and today / yesterday /
+    tomorrow the matching day relative to *now*. Several terms widen the
+    range to cover all of them; unparseable terms are ignored.
+    """
+    today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+    spans: list[tuple[datetime, datetime]] = []
+    for term in temporal_terms:
+        try:
+            if term in _RELATIVE_DAYS:
+                day = today + timedelta(days=_RELATIVE_DAYS[term])
+                start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+                spans.append((start, start + timedelta(days=1)))
+            elif len(term) == 4:
+                year = int(term)
+                spans.append((
+                    datetime(year, 1, 1, tzinfo=timezone.utc),
+                    datetime(year + 1, 1, 1, tzinfo=timezone.utc),
+                ))
+            else:
+                start = datetime.fromisoformat(term).replace(tzinfo=timezone.utc)
+                spans.append((start, start + timedelta(days=1)))
+        except ValueError:
+            continue
+    if not spans:
+        return None
+    return [
+        int(min(start for start, _end in spans).timestamp()),
+        int(max(end for _start, end in spans).timestamp()),
+    ]
+
+
+def parse_bound(value: str, end: bool = False) -> int:
+    """Epoch seconds of an ISO date or timestamp given as a --since/--until bound.
+
+    A bare date as an *end* bound means the end of that day, so
+    ``--until 2026-06-17`` still includes the 17th.
+    """
+    parsed = parse_time(value)
+    if parsed is None:
+        raise ValueError(f"not an ISO date or timestamp: {value!r}")
+    if end and re.fullmatch(r"\d{4}-\d\d-\d\d", value.strip()):
+        parsed += timedelta(days=1)
+    return int(parsed.timestamp())
+
+
 # ---------------------------------------------------------------------------
 # Node iteration + hard rejection.
 # ---------------------------------------------------------------------------
 
-def node_id_for(payload: object, path: Path) -> str:
+def node_id_for(payload: object, fallback: str) -> str:
     if isinstance(payload, dict):
         node_id = payload.get("node_id")
         if isinstance(node_id, str) and node_id:
             return node_id
-    return path.stem
+    return fallback
 
 
-# Perf (Addendum 5): an index entry that carries these keys is a COMPLETE recall
-# payload (scoring + hard-reject + render), so recall scores it without opening
-# the node file. Older "thin" entries lack them and are lazily loaded per-node.
+# Perf (Addendum 5): an index entry that carries these keys is a COMPLETE
+# scoring payload (scoring + hard-reject), so recall scores it without opening
+# the node file; ``with_details`` adds the detail tier for rendered nodes only.
+# Older "thin" entries lack them and are lazily loaded per-node.
 _FAT_INDEX_KEYS = ("authority", "sensitivity", "project_id")
 
 
-def iter_node_payloads(store: TreeStore, project_id: str) -> list[tuple[Path, Any]]:
-    """Yield (path, payload) for every node, reading index.json ONCE when present.
+def _resolve_entry(store: TreeStore, project_id: str, entry: dict[str, Any]) -> Any:
+    """A fat index entry as-is; a thin one via the authoritative node."""
+    if _is_fat(entry):
+        return entry
+    return store.load_node(project_id, str(entry["node_id"]))
+
 
-    Perf: the fat ``index.json`` (Addendum 5) lets recall score+reject all nodes
-    from a single file read — O(1) instead of O(n) node-file opens. Entries that
-    predate the fat index (``thin``) are lazily loaded so mixed trees, and trees
-    written by an older codex/claude build, stay correct. Falls back to scanning
-    node files when no index exists.
+def _is_fat(entry: dict[str, Any]) -> bool:
+    return all(key in entry for key in _FAT_INDEX_KEYS)
+
+
+def _resolve_entries(
+    store: TreeStore, project_id: str, entries: list[Any]
+) -> list[tuple[str, Any]]:
+    """(node_id, payload) per entry; thin entries are noted for upgrade so the
+    store rebuilds them (``TreeStore.note_stale_entries``) and later recalls
+    stop paying a node read for each."""
+    payloads: list[tuple[str, Any]] = []
+    thin: list[str] = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("node_id"):
+            continue
+        if not _is_fat(entry):
+            thin.append(str(entry["node_id"]))
+        payloads.append((str(entry["node_id"]), _resolve_entry(store, project_id, entry)))
+    if thin:
+        store.note_stale_entries(project_id, thin)
+    return payloads
+
+
+def with_details(store: TreeStore, project_id: str, node: dict[str, Any]) -> dict[str, Any]:
+    """*node* plus its detail-tier fields (``tree_index.DETAIL_FIELDS``).
+
+    Perf: lean index entries leave the detail fields in the node itself, so
+    they are read here, once per node ``render_context`` is about to render,
+    instead of being parsed for every node on every recall. Payloads that
+    already carry them (node files, older index entries) are returned as-is;
+    a node that cannot be loaded renders from its entry alone.
+    """
+    if "detailed_summary" in node:
+        return node
+    stored = store.load_node(project_id, str(node["node_id"]))
+    if stored is None:
+        return node
+    return {**node, **{key: stored.get(key, "") for key in DETAIL_FIELDS}}
+
+
+def iter_node_payloads(store: TreeStore, project_id: str) -> list[tuple[str, Any]]:
+    """Return (node_id, payload) for every node, reading the index ONCE when present.
+
+    Perf: the fat index (Addendum 5) lets recall score+reject all nodes from a
+    single index read — O(1) instead of O(n) node reads. Entries that predate
+    the fat index (``thin``) are lazily loaded so mixed trees, and trees
+    written by an older codex/claude build, stay correct. Falls back to reading
+    every stored node when no index exists. Works on any storage backend.
     """
-    directory = store.nodes_dir(project_id)
     index = store.load_index(project_id)
     entries = index.get("nodes") if isinstance(index, dict) else None
     if entries:
-        payloads: list[tuple[Path, Any]] = []
-        for entry in entries:
-            if not isinstance(entry, dict):
-                continue
-            node_id = entry.get("node_id")
-            if not node_id:
-                continue
-            path = directory / f"{node_id}.json"
-            if all(key in entry for key in _FAT_INDEX_KEYS):
-                payloads.append((path, entry))
-            else:  # thin entry: fall back to the authoritative node file
-                payloads.append((path, store.load_node(project_id, node_id)))
-        return payloads
+        return _resolve_entries(store, project_id, entries)
 
-    # No index (or empty "nodes"): scan node files (legacy / un-indexed tree).
-    if not directory.exists():
-        return []
-    payloads = []
-    for path in sorted(directory.glob("*.json")):
-        if path.name.startswith("."):
-            continue
-        try:
-            payloads.append((path, json.loads(path.read_text(encoding="utf-8"))))
-        except (OSError, json.JSONDecodeError, ValueError):
-            payloads.append((path, None))
-    return payloads
+    # No index (or empty "nodes"): read stored nodes (legacy / un-indexed tree).
+    # Payloads are NOT validated here; hard_reject_reason does that per node.
+    backend = store.backend(project_id)
+    return [(node_id, backend.read_node(node_id)) for node_id in backend.node_ids()]
 
 
 def candidate_payloads(
-    store: TreeStore, project_id: str, analysis: dict[str, Any]
-) -> list[tuple[Path, Any]]:
+    store: TreeStore,
+    project_id: str,
+    analysis: dict[str, Any],
+    where: EntryFilter | None = None,
+) -> list[tuple[str, Any]]:
     """Return only the nodes that could score > 0, via the inverted index.
 
     Perf (Addendum 5): ``score_node`` returns 0 unless a query search term is a
     SUBSTRING of the node's summary/trigger/entities/paths/tags/links, and recall
     drops score<=0 nodes. So the candidate set = nodes whose posting tokens
     contain a search term. This is LOSSLESS (same ranked results) but scores only
-    a handful of nodes instead of all N. Falls back to the full scan when the
-    index has no ``postings`` (older tree) so behaviour is never worse.
+    a handful of nodes instead of all N. The lookup is the backend's
+    (``TreeStore.candidate_entries``): trigram lists intersected over the
+    postings vocabulary for the files layout, an indexed query for SQLite, and
+    for a binary ``index.bin`` the same trigram search over its memory-mapped
+    term dictionary, decoding only the matching entries. Falls back to the full
+    scan when the index is unusable or has no postings (older tree) so
+    behaviour is never worse.
+
+    *where* (facets, time range, paths, entities) narrows the candidates
+    through the index's derived structures before anything is resolved or
+    scored; the full-scan fallback applies the same filter to each payload.
     """
-    index = store.load_index(project_id)
-    postings = index.get("postings") if isinstance(index, dict) else None
-    entries = index.get("nodes") if isinstance(index, dict) else None
-    if not isinstance(postings, dict) or not isinstance(entries, list):
-        return iter_node_payloads(store, project_id)
-
     search_terms = [s for s in analysis.get("search_terms", []) if s]
-    if not search_terms:
-        return []  # nothing can score > 0 without a search term
-
-    candidate_ids: set[str] = set()
-    for token, ids in postings.items():
-        if isinstance(ids, list) and any(s in token for s in search_terms):
-            candidate_ids.update(ids)
-    if not candidate_ids:
-        return []
-
-    directory = store.nodes_dir(project_id)
-    by_id = {e.get("node_id"): e for e in entries if isinstance(e, dict)}
-    out: list[tuple[Path, Any]] = []
-    for nid in candidate_ids:
-        entry = by_id.get(nid)
-        path = directory / f"{nid}.json"
-        if isinstance(entry, dict) and all(key in entry for key in _FAT_INDEX_KEYS):
-            out.append((path, entry))
-        else:  # thin / missing entry: authoritative node file
-            out.append((path, store.load_node(project_id, nid)))
-    return out
+    entries = store.candidate_entries(project_id, search_terms, where=where)
+    if entries is not None:
+        resolved = _resolve_entries(store, project_id, entries)
+        if not where:
+            return resolved
+        # Thin entries were only placed once their node was read.
+        return [
+            (node_id, payload)
+            for node_id, payload in resolved
+            if not isinstance(payload, dict) or where.matches(payload)
+        ]
+    payloads = iter_node_payloads(store, project_id)
+    if not where:
+        return payloads
+    return [
+        (node_id, payload)
+        for node_id, payload in payloads
+        if isinstance(payload, dict) and where.matches(payload)
+    ]
 
 
 def _as_dict(value: object) -> dict[str, Any]:
@@ -278,14 +400,30 @@ def safe_fields(node: dict[str, Any]) -> dict[str, Any]:
     return {key: node.get(key) for key in keys}
 
 
+def static_checks(node: dict[str, Any]) -> tuple[bool, bool]:
+    """``(red, valid)`` for *node*: the context-free, expensive reject checks."""
+    red = node.get("sensitivity") == "RED" or contains_red_material(safe_fields(node))
+    try:
+        MemoryNode.from_dict(node)
+    except MemoryNodeValidationError:
+        return red, False
+    return red, True
+
+
 def hard_reject_reason(
-    node: object, context: Context, include_deprecated: bool
+    node: object,
+    context: Context,
+    include_deprecated: bool,
+    checks: tuple[bool, bool] | None = None,
 ) -> str:
+    """Why *node* may not be recalled, or "". *checks* are the node's
+    ``static_checks`` when the caller has them cached."""
     if not isinstance(node, dict):
         return "invalid_node"
     if node.get("project_id") != context.project_id:
         return "wrong_project"
-    if node.get("sensitivity") == "RED" or contains_red_material(safe_fields(node)):
+    red, valid = static_checks(node) if checks is None else checks
+    if red:
         return "red"
     if str(node.get("visibility") or "branch_local") == "conflict":
         return "conflict"
@@ -295,11 +433,7 @@ def hard_reject_reason(
         return "missing_provenance"
     if node.get("authority") != "non_authoritative":
         return "authority"
-    try:
-        MemoryNode.from_dict(node)
-    except MemoryNodeValidationError:
-        return "invalid_node"
-    return ""
+    return "" if valid else "invalid_node"
 
 
 # ---------------------------------------------------------------------------
@@ -307,7 +441,10 @@ def hard_reject_reason(
 # ---------------------------------------------------------------------------
 
 def text_score(query_terms: list[str], text: object, weight: int) -> int:
-    haystack = compact_space(text).lower()
+    return _hits(query_terms, compact_space(text).lower(), weight)
+
+
+def _hits(query_terms: list[str], haystack: str, weight: int) -> int:
     return sum(weight for item in query_terms if item and item in haystack)
 
 
@@ -321,89 +458,108 @@ def parse_time(value: object) -> datetime | None:
     return parsed
 
 
-def score_node(
-    node: dict[str, Any], analysis: dict[str, Any]
-) -> tuple[float, dict[str, float]]:
+def node_features(node: dict[str, Any]) -> dict[str, Any]:
+    """The query-independent inputs of ``score_node``: the entry's
+    precomputed ``features`` (``tree_index.scoring_features``, computed for
+    full nodes and older entries) plus its epoch."""
+    return {**entry_features(node), "epoch": entry_epoch(node)}
+
+
+def scoring_terms(analysis: dict[str, Any]) -> list[str]:
+    """The query terms ``score_node`` matches: all of them for a high-risk
+    query, otherwise only the strong (not LOW_SIGNAL) ones."""
     raw_terms = analysis.get("search_terms")
     query_terms: list[str] = list(raw_terms) if isinstance(raw_terms, list) else []
-    strong_terms = [item for item in query_terms if item not in LOW_SIGNAL_TERMS]
-    scoring_terms = query_terms if analysis.get("risk_level") == "high" else strong_terms
-
-    trigger = _as_dict(node.get("trigger"))
-    summary_score = float(text_score(scoring_terms, node.get("summary"), 5))
-    trigger_score = float(text_score(scoring_terms, trigger, 8))
-    entity_path_score = float(
-        text_score(
-            scoring_terms,
-            {
-                "entities": node.get("entities"),
-                "paths": node.get("source_paths"),
-                "tags": node.get("topic_tags"),
-                "links": node.get("links"),
-            },
-            6,
-        )
-    )
+    if analysis.get("risk_level") == "high":
+        return query_terms
+    return [item for item in query_terms if item not in LOW_SIGNAL_TERMS]
 
-    if summary_score + trigger_score + entity_path_score <= 0:
-        return 0.0, {
-            "summary_score": summary_score,
-            "trigger_score": trigger_score,
-            "entity_path_score": entity_path_score,
-        }
 
-    updated = parse_time(node.get("updated_at")) or parse_time(node.get("created_at"))
+def static_parts(
+    node: dict[str, Any], analysis: dict[str, Any], features: dict[str, Any]
+) -> dict[str, float]:
+    """The bonuses and penalties of ``score_node``: everything but the text
+    match, so known before a single query term is looked up."""
+    updated = features["epoch"]
     if updated is None:
         recency_score = 0.0
-    elif (datetime.now(timezone.utc) - updated).days <= 30:
+    elif (int(time.time()) - updated) // 86400 <= 30:
         recency_score = 2.0
     else:
         recency_score = 0.5
 
-    salience = _as_dict(node.get("salience"))
-    salience_score = round(
-        sum(float(v) for v in salience.values() if isinstance(v, (int, float))) * 2, 2
+    semantic_terms = analysis.get("semantic_terms")
+    semantic_set = set(semantic_terms) if isinstance(semantic_terms, list) else set()
+    quality = _as_dict(node.get("quality"))
+    return {
+        "recency_score": recency_score,
+        "salience_score": round(features["salience_total"] * 2, 2),
+        "graph_bonus": float(min(features["link_count"], 3)),
+        "negative_bonus": (
+            6.0 if features["negative_rule"] and (semantic_set & NEGATIVE_QUERY_TERMS) else 0.0
+        ),
+        "stale_penalty": 12.0 if quality.get("stale") is True else 0.0,
+        "deprecated_penalty": 25.0 if deprecated(node) else 0.0,
+        "merge_candidate_penalty": 8.0 if node.get("visibility") == "merge_candidate" else 0.0,
+    }
+
+
+def static_score(parts: dict[str, float]) -> float:
+    return (
+        parts["recency_score"]
+        + parts["salience_score"]
+        + parts["graph_bonus"]
+        + parts["negative_bonus"]
+        - parts["stale_penalty"]
+        - parts["deprecated_penalty"]
+        - parts["merge_candidate_penalty"]
     )
 
-    links = node.get("links")
-    graph_bonus = float(min(len(links) if isinstance(links, list) else 0, 3))
 
-    semantic_terms = analysis.get("semantic_terms")
-    semantic_set = set(semantic_terms) if isinstance(semantic_terms, list) else set()
-    negative_bonus = (
-        6.0
-        if node.get("memory_type") == "negative_rule"
-        and (semantic_set & NEGATIVE_QUERY_TERMS)
-        else 0.0
+def score_node(
+    node: dict[str, Any],
+    analysis: dict[str, Any],
+    features: dict[str, Any] | None = None,
+) -> tuple[float, dict[str, float]]:
+    """Score *node* for *analysis*; *features* are its ``node_features`` when
+    the caller has them cached."""
+    query_terms = scoring_terms(analysis)
+    if features is None:
+        features = node_features(node)
+    summary_score = float(_hits(query_terms, features["summary_text"], FIELD_WEIGHTS["summary"]))
+    trigger_score = float(_hits(query_terms, features["trigger_text"], FIELD_WEIGHTS["trigger"]))
+    entity_path_score = float(
+        _hits(query_terms, features["entity_path_text"], FIELD_WEIGHTS["entity_path"])
     )
 
-    quality = _as_dict(node.get("quality"))
-    stale_penalty = 12.0 if quality.get("stale") is True else 0.0
-    deprecated_penalty = 25.0 if deprecated(node) else 0.0
-    merge_penalty = 8.0 if node.get("visibility") == "merge_candidate" else 0.0
+    if summary_score + trigger_score + entity_path_score <= 0:
+        return 0.0, {
+            "summary_score": summary_score,
+            "trigger_score": trigger_score,
+            "entity_path_score": entity_path_score,
+        }
 
     parts: dict[str, float] = {
         "summary_score": summary_score,
         "trigger_score": trigger_score,
         "entity_path_score": entity_path_score,
-        "recency_score": recency_score,
-        "salience_score": salience_score,
-        "graph_bonus": graph_bonus,
-        "negative_bonus": negative_bonus,
-        "stale_penalty": stale_penalty,
-        "deprecated_penalty": deprecated_penalty,
-        "merge_candidate_penalty": merge_penalty,
+        **static_parts(node, analysis, features),
     }
     base_score = (
         summary_score
         + trigger_score
         + entity_path_score
-        + recency_score
-        + salience_score
-        + graph_bonus
-        + negative_bonus
+        + parts["recency_score"]
+        + parts["salience_score"]
+        + parts["graph_bonus"]
+        + parts["negative_bonus"]
+    )
+    final = (
+        base_score
+        - parts["stale_penalty"]
+        - parts["deprecated_penalty"]
+        - parts["merge_candidate_penalty"]
     )
-    final = base_score - stale_penalty - deprecated_penalty - merge_penalty
     return final, parts
 
 
@@ -457,52 +613,414 @@ def recall(
     limit: int = 5,
     budget_limit: int = 1200,
     include_deprecated: bool = False,
+    facets: dict[str, str | list[str]] | None = None,
+    exclude_facets: dict[str, str | list[str]] | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    paths: list[str] | None = None,
+    entities: list[str] | None = None,
+    all_branches: bool = False,
+    store: TreeStore | None = None,
 ) -> dict[str, Any]:
-    started = time.perf_counter()
-    store = TreeStore(ralph_home)
-    analysis = analyze_query(query)
-    risk = str(analysis["risk_level"])
-    rejected: list[dict[str, str]] = []
-    scored: list[tuple[float, dict[str, Any], dict[str, float]]] = []
-
-    for path, payload in candidate_payloads(store, context.project_id, analysis):
-        node_id = node_id_for(payload, path)
-        reason = hard_reject_reason(payload, context, include_deprecated)
-        if reason:
-            rejected.append({"node_id": node_id, "reason": reason})
-            continue
-        assert isinstance(payload, dict)  # narrowed by hard_reject_reason
-        score, parts = score_node(payload, analysis)
-        if score <= 0:
-            rejected.append({"node_id": node_id, "reason": "no_match"})
-            continue
-        scored.append((score, payload, parts))
+    """Score, filter and render the memories relevant to *query*.
+
+    *since* / *until* are ISO dates or timestamps bounding when a node last
+    changed; without them a date-scoped query (``temporal_terms``) bounds it.
+    *paths* keeps nodes with a source path at or under a file or directory and
+    *entities* nodes naming an entity.
+
+    On a known ``context.branch`` recall considers only that branch's view:
+    main_promoted nodes plus the branch's own branch_local and
+    merge_candidate nodes (``EntryFilter.branch``); *all_branches* lifts it.
+
+    A long-lived caller keeps a ``RecallEngine`` per project instead; *store*
+    (rooted at *ralph_home*) lets it share one ``TreeStore``.
+    """
+    engine = RecallEngine(context.project_id, ralph_home, store=store)
+    return engine.recall(
+        query,
+        context,
+        limit,
+        budget_limit,
+        include_deprecated,
+        facets,
+        exclude_facets,
+        since,
+        until,
+        paths,
+        entities,
+        all_branches,
+    )
+
+
+class RecallEngine:
+    """Recall over ONE project tree, keeping its state between queries.
 
-    scored.sort(key=lambda item: (-item[0], str(item[1].get("node_id", ""))))
+    Perf: the store's backend holds the parsed index, postings and trigrams
+    (``StorageBackend.hot_index``, re-read only when the index files change)
+    and the engine caches each node's ``static_checks`` and
+    ``node_features``, so a long-running caller (orchestrator scripts, dream,
+    the harness, the recall daemon) pays the index load and the per-node
+    validation once per tree change instead of once per query. Cached state
+    is reused only for a payload equal to the one it was derived from, and
+    ``refresh`` drops it all when the index signature moves.
+
+    Whole results also go through the project's on-disk ``RecallCache``
+    (shared with other processes) unless *cache* -- by default
+    ``RALPH_RECALL_CACHE`` -- turns it off; ``MEMORY_TRACE["cache"]`` says
+    ``hit``, ``miss`` or ``off``.
+    """
 
+    def __init__(
+        self,
+        project_id: str,
+        ralph_home: Path,
+        store: TreeStore | None = None,
+        cache: bool | None = None,
+    ) -> None:
+        self.project_id = project_id
+        self.ralph_home = Path(ralph_home)
+        self.store = TreeStore(self.ralph_home) if store is None else store
+        if cache is None:
+            cache = cache_enabled()
+        self.cache = RecallCache(self.store, project_id) if cache else None
+        self._signature: Any = None
+        # node_id -> [payload, static_checks | None, node_features | None]
+        self._nodes: dict[str, list[Any]] = {}
+        # Per-term weights read from the index's term bounds.
+        self._weights: dict[str, int] = {}
+
+    def refresh(self) -> bool:
+        """Drop cached node state if the tree changed (or cannot tell); True
+        when it was dropped."""
+        try:
+            signature = self.store.backend(self.project_id).index_signature()
+        except TreeStorePathError:
+            signature = None
+        if signature is not None and signature == self._signature:
+            return False
+        self._signature = signature
+        self._nodes.clear()
+        self._weights.clear()
+        return True
+
+    def _cached(self, node_id: str, payload: object) -> list[Any] | None:
+        if not isinstance(payload, dict):
+            return None
+        cached = self._nodes.get(node_id)
+        if cached is None or (cached[0] is not payload and cached[0] != payload):
+            cached = self._nodes[node_id] = [payload, None, None]
+        return cached
+
+    def _term_weights(self, terms: list[str]) -> list[int]:
+        """``tree_index.term_bound`` of each of *terms*, memoised until
+        ``refresh``. Only unseen terms go to the backend, in one call, so
+        SQLite reads just the bounds rows that contain them."""
+        missing = [term for term in dict.fromkeys(terms) if term not in self._weights]
+        if missing:
+            bounds = self.store.term_bounds(self.project_id, missing) or {ANY_TOKEN: ALL_FIELDS}
+            for term in missing:
+                self._weights[term] = term_bound(bounds, term)
+        return [self._weights[term] for term in terms]
+
+    def _rank(
+        self,
+        candidates: list[tuple[str, Any]],
+        analysis: dict[str, Any],
+        context: Context,
+        include_deprecated: bool,
+        top_k: int | None = None,
+    ) -> tuple[list[tuple[float, dict[str, Any], dict[str, float]]], list[dict[str, str]], int]:
+        """``(ranked, rejected, pruned)``: the scoring candidates best first,
+        the rejections met on the way, and how many were pruned unexamined.
+
+        Without *top_k* every candidate is hard-reject checked and scored.
+        With it the loop is MaxScore-style: a candidate's upper bound is its
+        exact bonuses and penalties (``static_parts``) plus every scoring
+        term's ``term_bound`` from the index. Candidates are visited best
+        bound first; once the *top_k*-th accepted score beats a bound, that
+        candidate and all after it are skipped, unscored and unvalidated, and
+        one whose exact score cannot enter the top list skips its hard-reject
+        checks. The top *top_k* is exactly the exhaustive ranking's; pruned
+        candidates are only missing from *rejected*.
+        """
+        if top_k is None or top_k <= 0 or len(candidates) <= top_k:
+            return self._rank_all(candidates, analysis, context, include_deprecated)
+        term_total = sum(self._term_weights(scoring_terms(analysis)))
+        rejected_at: dict[int, dict[str, str]] = {}
+        bounded: list[tuple[float, int, str, dict[str, Any], list[Any]]] = []
+        for pos, (fallback_id, payload) in enumerate(candidates):
+            node_id = node_id_for(payload, fallback_id)
+            cached = self._cached(node_id, payload)
+            if cached is None:  # not a payload at all
+                reason = hard_reject_reason(payload, context, include_deprecated)
+                rejected_at[pos] = {"node_id": node_id, "reason": reason}
+                continue
+            if cached[2] is None:
+                cached[2] = node_features(payload)
+            upper = term_total + static_score(static_parts(payload, analysis, cached[2]))
+            bounded.append((upper, pos, node_id, payload, cached))
+        bounded.sort(key=lambda item: -item[0])
+
+        # (-score, node_id, position, payload, parts), best first, <= top_k long.
+        top: list[tuple[float, str, int, dict[str, Any], dict[str, float]]] = []
+        pruned = 0
+        for seen, (upper, pos, node_id, payload, cached) in enumerate(bounded):
+            if len(top) == top_k and upper < -top[-1][0] - _BOUND_SLACK:
+                pruned += len(bounded) - seen
+                break
+            score, parts = score_node(payload, analysis, cached[2])
+            rank_key = (-score, str(payload.get("node_id", "")))
+            if score <= 0 or (len(top) == top_k and rank_key > top[-1][:2]):
+                pruned += 1
+                continue
+            if cached[1] is None:
+                cached[1] = static_checks(payload)
+            reason = hard_reject_reason(payload, context, include_deprecated, cached[1])
+            if reason:
+                rejected_at[pos] = {"node_id": node_id, "reason": reason}
+                continue
+            insort(top, (*rank_key, pos, payload, parts))
+            if len(top) > top_k:
+                top.pop()
+        ranked = [(-neg_score, payload, parts) for neg_score, _id, _pos, payload, parts in top]
+        return ranked, [rejected_at[pos] for pos in sorted(rejected_at)], pruned
+
+    def _rank_all(
+        self,
+        candidates: list[tuple[str, Any]],
+        analysis: dict[str, Any],
+        context: Context,
+        include_deprecated: bool,
+    ) -> tuple[list[tuple[float, dict[str, Any], dict[str, float]]], list[dict[str, str]], int]:
+        rejected: list[dict[str, str]] = []
+        scored: list[tuple[float, dict[str, Any], dict[str, float]]] = []
+        for fallback_id, payload in candidates:
+            node_id = node_id_for(payload, fallback_id)
+            cached = self._cached(node_id, payload)
+            if cached is not None and cached[1] is None:
+                cached[1] = static_checks(payload)
+            checks = None if cached is None else cached[1]
+            reason = hard_reject_reason(payload, context, include_deprecated, checks)
+            if reason:
+                rejected.append({"node_id": node_id, "reason": reason})
+                continue
+            assert isinstance(payload, dict) and cached is not None  # narrowed above
+            if cached[2] is None:
+                cached[2] = node_features(payload)
+            score, parts = score_node(payload, analysis, cached[2])
+            if score <= 0:
+                rejected.append({"node_id": node_id, "reason": "no_match"})
+                continue
+            scored.append((score, payload, parts))
+        scored.sort(key=lambda item: (-item[0], str(item[1].get("node_id", ""))))
+        return scored, rejected, 0
+
+    def context(self, branch: str = "") -> Context:
+        """A context for this engine's project when the caller has none."""
+        return Context(
+            project_root=Path("."),
+            project_id=self.project_id,
+            workspace_instance_id="",
+            branch=branch or "unknown",
+        )
+
+    def recall_many(
+        self, queries: list[str], context: Context | None = None, **options: Any
+    ) -> list[dict[str, Any]]:
+        """``recall`` for each query in turn, against one refreshed state."""
+        self.refresh()
+        return [self._recall(query, context, **options) for query in queries]
+
+    def recall(
+        self,
+        query: str,
+        context: Context | None = None,
+        limit: int = 5,
+        budget_limit: int = 1200,
+        include_deprecated: bool = False,
+        facets: dict[str, str | list[str]] | None = None,
+        exclude_facets: dict[str, str | list[str]] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        paths: list[str] | None = None,
+        entities: list[str] | None = None,
+        all_branches: bool = False,
+    ) -> dict[str, Any]:
+        """As the module-level ``recall``; *context* defaults to ``context()``."""
+        self.refresh()
+        return self._recall(
+            query,
+            context,
+            limit,
+            budget_limit,
+            include_deprecated,
+            facets,
+            exclude_facets,
+            since,
+            until,
+            paths,
+            entities,
+            all_branches,
+        )
+
+    def _recall(
+        self,
+        query: str,
+        context: Context | None = None,
+        limit: int = 5,
+        budget_limit: int = 1200,
+        include_deprecated: bool = False,
+        facets: dict[str, str | list[str]] | None = None,
+        exclude_facets: dict[str, str | list[str]] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        paths: list[str] | None = None,
+        entities: list[str] | None = None,
+        all_branches: bool = False,
+    ) -> dict[str, Any]:
+        if context is None:
+            context = self.context()
+        elif context.project_id != self.project_id:
+            raise ValueError(
+                f"context is for project {context.project_id!r}, not {self.project_id!r}"
+            )
+        started = time.perf_counter()
+        store = self.store
+        analysis = analyze_query(query)
+        if since or until:
+            window = [
+                parse_bound(since) if since else None,
+                parse_bound(until, end=True) if until else None,
+            ]
+        else:
+            window = analysis["time_range"]
+        risk = str(analysis["risk_level"])
+        branch = "" if all_branches or context.branch in ("", "unknown") else context.branch
+
+        key = None
+        if self.cache is not None and self._signature is not None:
+            key = cache_key(
+                self._signature,
+                analysis,
+                project_id=context.project_id,
+                limit=limit,
+                budget=budget_limit,
+                include_deprecated=include_deprecated,
+                facets=facets,
+                exclude=exclude_facets,
+                window=window,
+                paths=paths,
+                entities=entities,
+                branch=branch,
+            )
+            hit = self.cache.get(key)
+            if hit is not None:
+                latency_ms = max(0, int((time.perf_counter() - started) * 1000))
+                trace = {**hit["MEMORY_TRACE"], "cache": "hit", "latency_ms": latency_ms}
+                return {**hit, "analysis": analysis, "MEMORY_TRACE": trace}
+
+        parse_started = time.perf_counter()
+        since_epoch, until_epoch = window or (None, None)
+        where = entry_filter(
+            facets, exclude_facets, since_epoch, until_epoch, paths or (), entities or (), branch
+        )
+        # Path-like query terms match as substrings, like every other term: a
+        # node naming the path in its entities or summary may outrank one
+        # that only lists it in source_paths. Only explicit *paths* scope.
+        path_scope = list(where.paths)
+        candidates = candidate_payloads(store, context.project_id, analysis, where)
+        parse_ms = (time.perf_counter() - parse_started) * 1000
+        detail_bytes = sum(
+            int(payload.get("detail_bytes") or 0)
+            for _node_id, payload in candidates
+            if isinstance(payload, dict)
+        )
+
+        ranked, rejected, pruned = self._rank(
+            candidates, analysis, context, include_deprecated, limit
+        )
+        selection = _select(store, context.project_id, ranked, risk, limit, budget_limit)
+        if pruned and selection[2] and len(selection[0]) < limit:
+            # Budget skips reached past the top ``limit``: rank every candidate.
+            ranked, rejected, pruned = self._rank(candidates, analysis, context, include_deprecated)
+            selection = _select(store, context.project_id, ranked, risk, limit, budget_limit)
+        selected, used, over_budget, detail_reads, detail_loaded = selection
+        rejected.extend(
+            {"node_id": node_id, "reason": "budget_exceeded"} for node_id in over_budget
+        )
+        detail_bytes -= detail_loaded
+
+        latency_ms = max(0, int((time.perf_counter() - started) * 1000))
+        trace = {
+            "engine": "tree",
+            "selected_memory_ids": [item["node_id"] for item in selected],
+            "rejected": rejected,
+            "token_budget": {"limit": budget_limit, "used": used},
+            "risk_level": risk,
+            "time_range": _window_trace(window),
+            "path_scope": path_scope,
+            "branch_view": branch or None,
+            "cache": "off" if key is None else "miss",
+            "latency_ms": latency_ms,
+            # Two-tier index: time to read + parse the scoring tier, and the
+            # detail-tier bytes this recall never had to load.
+            "index_tiers": {
+                "parse_ms": round(parse_ms, 3),
+                "scored_entries": len(candidates),
+                # Candidates the top-k loop proved could not make the cut.
+                "pruned": pruned,
+                "detail_reads": detail_reads,
+                "detail_bytes_saved": max(0, detail_bytes),
+            },
+        }
+        report = {"analysis": analysis, "memory_context": selected, "MEMORY_TRACE": trace}
+        if key is not None and self.cache is not None:
+            self.cache.put(key, report)
+        return report
+
+
+def _select(
+    store: TreeStore,
+    project_id: str,
+    ranked: list[tuple[float, dict[str, Any], dict[str, float]]],
+    risk: str,
+    limit: int,
+    budget_limit: int,
+) -> tuple[list[dict[str, Any]], int, list[str], int, int]:
+    """Render *ranked* nodes, best first, until *limit* fit *budget_limit*.
+
+    Returns ``(selected, used, over_budget_ids, detail_reads, detail_bytes)``;
+    the last two count the detail-tier reads this needed.
+    """
     selected: list[dict[str, Any]] = []
-    used = 0
-    for score, node, _parts in scored:
+    over_budget: list[str] = []
+    used = detail_reads = detail_bytes = 0
+    for score, node, _parts in ranked:
         if len(selected) >= limit:
             break
+        if risk != "low":  # only medium/high render the detail tier
+            detail_reads += "detailed_summary" not in node
+            node = with_details(store, project_id, node)
+            detail_bytes += int(node.get("detail_bytes") or 0)
         item = render_context(node, risk, score)
         needed = estimate_units(item)
         if used + needed > budget_limit:
-            rejected.append({"node_id": str(node["node_id"]), "reason": "budget_exceeded"})
+            over_budget.append(str(node["node_id"]))
             continue
         used += needed
         selected.append(item)
+    return selected, used, over_budget, detail_reads, detail_bytes
 
-    latency_ms = max(0, int((time.perf_counter() - started) * 1000))
-    trace = {
-        "engine": "tree",
-        "selected_memory_ids": [item["node_id"] for item in selected],
-        "rejected": rejected,
-        "token_budget": {"limit": budget_limit, "used": used},
-        "risk_level": risk,
-        "latency_ms": latency_ms,
-    }
-    return {"analysis": analysis, "memory_context": selected, "MEMORY_TRACE": trace}
+
+def _window_trace(window: list[int | None] | None) -> dict[str, str | None] | None:
+    if window is None:
+        return None
+    iso = [
+        None if bound is None else datetime.fromtimestamp(bound, timezone.utc).isoformat()
+        for bound in window
+    ]
+    return {"since": iso[0], "until": iso[1]}
 
 
 # ---------------------------------------------------------------------------
@@ -536,17 +1054,18 @@ def render_markdown(report: dict[str, Any]) -> str:
     return "\n".join(lines) + "\n"
 
 
-def main() -> int:
+def build_parser(environ: Mapping[str, str] | None = None) -> argparse.ArgumentParser:
+    """The recall CLI; *environ* supplies the env-var defaults (the recall
+    daemon passes its client's environment)."""
+    env = os.environ if environ is None else environ
     parser = argparse.ArgumentParser(
         description="Recall from the Ralph Memory Tree v2 (library + CLI; no hook glue)."
     )
     parser.add_argument("--project-root", default=".")
     parser.add_argument("--query", default="")
     parser.add_argument("--json", action="store_true")
-    parser.add_argument("--project-id", default=os.environ.get("RALPH_MEMORY_PROJECT_ID", ""))
-    parser.add_argument(
-        "--ralph-home", default=os.environ.get("RALPH_HOME", "~/.ralph")
-    )
+    parser.add_argument("--project-id", default=env.get("RALPH_MEMORY_PROJECT_ID", ""))
+    parser.add_argument("--ralph-home", default=env.get("RALPH_HOME", "~/.ralph"))
     parser.add_argument("--branch", default="")
     parser.add_argument("--workspace-instance-id", default="")
     parser.add_argument("--limit", type=int, default=5)
@@ -554,46 +1073,116 @@ def main() -> int:
     parser.add_argument("--include-deprecated", action="store_true")
     parser.add_argument("--read-raw", action="store_true")
     parser.add_argument("--node-id", default="")
-    args = parser.parse_args()
-
-    context = context_for(
-        Path(args.project_root),
-        args.project_id,
-        args.branch,
-        args.workspace_instance_id,
+    for facet in FACETS:
+        parser.add_argument(
+            "--" + facet.replace("_", "-"),
+            action="append",
+            default=[],
+            metavar="VALUE",
+            help=f"only recall nodes whose {facet} is VALUE (repeat for any-of)",
+        )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="FACET=VALUE",
+        help="skip nodes with this facet value (repeatable)",
     )
-
+    parser.add_argument("--since", default="", help="ISO date/time: nodes changed at or after")
+    parser.add_argument(
+        "--until", default="", help="ISO date/time: nodes changed before (a bare date: through)"
+    )
+    parser.add_argument(
+        "--path",
+        action="append",
+        default=[],
+        help="only nodes with a source path at or under this file/directory (repeatable)",
+    )
+    parser.add_argument(
+        "--entity", action="append", default=[], help="only nodes naming this entity (repeatable)"
+    )
+    parser.add_argument(
+        "--all-branches",
+        action="store_true",
+        help="score branch_local nodes of every branch, not just --branch's view",
+    )
+    return parser
+
+
+def parse_args(
+    argv: list[str] | None = None, environ: Mapping[str, str] | None = None
+) -> argparse.Namespace:
+    """Parse and validate the CLI; adds ``facets`` / ``exclude_facets`` dicts."""
+    parser = build_parser(environ)
+    args = parser.parse_args(argv)
+    for bound in (args.since, args.until):
+        if bound and parse_time(bound) is None:
+            parser.error(f"not an ISO date or timestamp: {bound!r}")
+    args.facets = {facet: getattr(args, facet) for facet in FACETS if getattr(args, facet)}
+    args.exclude_facets = {}
+    for item in args.exclude:
+        facet, sep, value = item.partition("=")
+        facet = facet.strip().replace("-", "_")
+        if not sep or facet not in FACETS:
+            parser.error(f"--exclude expects FACET=VALUE with FACET in {', '.join(FACETS)}")
+        args.exclude_facets.setdefault(facet, []).append(value.strip())
+    return args
+
+
+def execute(
+    args: argparse.Namespace, context: Context, engine: RecallEngine | None = None
+) -> tuple[int, str, str]:
+    """Run parsed CLI *args*; returns ``(exit_code, stdout, stderr)`` text.
+    A long-lived caller passes its *engine* for ``context.project_id``."""
+    if engine is None:
+        engine = RecallEngine(context.project_id, Path(args.ralph_home))
+    store = engine.store
     if args.read_raw:
-        store = TreeStore(Path(args.ralph_home))
         node = store.load_node(context.project_id, args.node_id)
         if node is None:
-            print("node not found", file=sys.stderr)
-            return 1
+            return 1, "", "node not found\n"
         raw_ref = node.get("raw_ref") if isinstance(node.get("raw_ref"), dict) else None
         digest = raw_ref.get("sha256") if raw_ref else None
         if not digest:
-            print("node has no raw_ref", file=sys.stderr)
-            return 1
+            return 1, "", "node has no raw_ref\n"
         content = store.read_raw(context.project_id, str(digest))
         if content is None:
-            print("raw unavailable or RED", file=sys.stderr)
-            return 1
-        print(content, end="")
-        return 0
+            return 1, "", "raw unavailable or RED\n"
+        return 0, content, ""
 
-    report = recall(
+    report = engine.recall(
         args.query,
         context,
-        Path(args.ralph_home),
         max(0, args.limit),
         max(0, args.budget),
         args.include_deprecated,
+        args.facets,
+        args.exclude_facets,
+        args.since or None,
+        args.until or None,
+        args.path,
+        args.entity,
+        args.all_branches,
     )
     if args.json:
-        print(json.dumps(report, ensure_ascii=True, indent=2, sort_keys=True))
-    else:
-        print(render_markdown(report), end="")
-    return 0
+        return 0, json.dumps(report, ensure_ascii=True, indent=2, sort_keys=True) + "\n", ""
+    return 0, render_markdown(report), ""
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    context = context_for(
+        Path(args.project_root),
+        args.project_id,
+        args.branch,
+        args.workspace_instance_id,
+    )
+    code, out, err = execute(args, context)
+    if out:
+        print(out, end="")
+    if err:
+        print(err, end="", file=sys.stderr)
+    return code
 
 
 if __name__ == "__main__":
@@ -0,0 +1,342 @@
+"""Ralph Memory Tree segment backend -- log-structured node storage.
+
+The ``files`` layout writes one ``nodes/<id>.json`` per node, each through a
+tmp file, a file fsync, a rename and a directory fsync. A migration of a few
+thousand rules therefore creates thousands of tiny files and spends most of
+its time on metadata I/O. This layout appends nodes to a handful of segment
+files instead; raw blobs, the index and the usage log keep the ``files``
+layout unchanged:
+
+    {project_tree}/
+        segments/
+            seg-000001.log   closed segment (immutable)
+            seg-000002.log   active segment (appends only)
+            .segments.lock   flock target serialising appends and compaction
+        raw/  index.json  index-journal.jsonl  usage.jsonl   (as ``files``)
+
+Record format (little endian)::
+
+    b"RMN1" | u32 payload length | u32 crc32(payload) | payload
+
+where the payload is compact JSON: ``{"op": "put", "node_id", "node"}`` or a
+``{"op": "del", "node_id"}`` tombstone. The newest record for a node wins.
+
+Readers keep an in-memory offset map (node_id -> segment, offset, length). It
+is built by scanning the segments once per process and then refreshed
+incrementally: closed segments never change, so only the active segment's
+new bytes are scanned; a changed segment set (another process compacted)
+triggers a rebuild.
+
+Compaction rewrites every live record into one new segment (tmp file + fsync
++ rename), then unlinks the old segments. Hooks are short-lived processes, so
+instead of a background thread (which would die with the hook) compaction is
+opportunistic: it runs at the end of a write batch once the segments hold at
+least ``COMPACT_MIN_BYTES`` and more than half of it is superseded records,
+and on demand through ``tree_admin compact``.
+
+Crash safety: a record is only visible once its whole frame is on disk and
+its CRC matches, so a torn tail is ignored by readers and truncated by the
+next writer (under the lock, nobody else can be mid-append). A crash between
+the compaction rename and the unlinks leaves duplicate records in older
+segments; the compacted segment has the highest sequence number, so replay
+order still yields the right versions.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import struct
+import sys
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
+
+if __package__:
+    from .tree_store import FileBackend, ensure_within, fsync_dir, safe_segment
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_store import FileBackend, ensure_within, fsync_dir, safe_segment
+
+SEGMENTS_DIR = "segments"
+LOCK_NAME = ".segments.lock"
+SEGMENT_RE = re.compile(r"^seg-(\d{6})\.log$")
+RECORD_MAGIC = b"RMN1"
+_HEADER = struct.Struct("<4sII")
+# Start a new segment once the active one passes this size.
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Never compact less than this much segment data (keeps small trees quiet).
+COMPACT_MIN_BYTES = 1024 * 1024
+
+
+def encode_record(record: dict[str, Any]) -> bytes:
+    payload = json.dumps(record, ensure_ascii=True, sort_keys=True, separators=(",", ":"))
+    data = payload.encode("utf-8")
+    return _HEADER.pack(RECORD_MAGIC, len(data), zlib.crc32(data)) + data
+
+
+def iter_records(data: bytes, start: int = 0) -> Iterator[tuple[int, int, dict[str, Any]]]:
+    """Yield ``(offset, frame_length, record)`` for each intact record.
+
+    Stops at the first incomplete or corrupt frame: everything after a torn
+    write is unreachable until a writer truncates it away.
+    """
+    offset = start
+    while offset + _HEADER.size <= len(data):
+        magic, length, crc = _HEADER.unpack_from(data, offset)
+        end = offset + _HEADER.size + length
+        if magic != RECORD_MAGIC or end > len(data):
+            return
+        payload = data[offset + _HEADER.size : end]
+        if zlib.crc32(payload) != crc:
+            return
+        try:
+            record = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(record, dict):
+            return
+        yield offset, end - offset, record
+        offset = end
+
+
+class SegmentBackend(FileBackend):
+    """Nodes in append-only segment files; everything else as ``files``."""
+
+    name = "segments"
+    node_dir = SEGMENTS_DIR
+
+    def __init__(self, store: Any, project_id: str) -> None:
+        super().__init__(store, project_id)
+        # node_id -> (segment sequence, offset, frame length); tombstones drop
+        # the id. _scanned maps each segment to the end of its last intact
+        # record, which is where incremental refreshes resume.
+        self._offsets: dict[str, tuple[int, int, int]] = {}
+        self._scanned: dict[int, int] = {}
+        self._live_bytes = 0
+        self._lock_fd: int | None = None
+        self._batch_depth = 0
+        self._dirty: set[int] = set()
+
+    @property
+    def segments_dir(self) -> Path:
+        return ensure_within(self.root, self.root / SEGMENTS_DIR)
+
+    def segment_path(self, sequence: int) -> Path:
+        return self.segments_dir / f"seg-{sequence:06d}.log"
+
+    def segment_numbers(self) -> list[int]:
+        directory = self.segments_dir
+        if not directory.exists():
+            return []
+        found = (SEGMENT_RE.match(name) for name in os.listdir(directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    # --- locking / batching -----------------------------------------------
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Hold the segment lock for the block; fsync touched segments once.
+
+        Re-entrant within one backend, so a node write that triggers an index
+        rebuild (which reads nodes back) does not deadlock on its own lock.
+        """
+        if self._batch_depth == 0:
+            self.segments_dir.mkdir(parents=True, exist_ok=True)
+            self._lock_fd = os.open(self.segments_dir / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                try:
+                    self._sync_dirty()
+                    self._maybe_compact()
+                finally:
+                    assert self._lock_fd is not None
+                    os.close(self._lock_fd)  # closing the descriptor releases the flock
+                    self._lock_fd = None
+
+    def _sync_dirty(self) -> None:
+        if not self.store.fsync_data:
+            self._dirty.clear()  # batched / relaxed: the write-ahead log covers it
+            return
+        for sequence in sorted(self._dirty):
+            try:
+                fd = os.open(self.segment_path(sequence), os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if self._dirty:
+            fsync_dir(self.segments_dir)
+        self._dirty.clear()
+
+    # --- offset map -------------------------------------------------------
+
+    def _reset_map(self) -> None:
+        self._offsets.clear()
+        self._scanned.clear()
+        self._live_bytes = 0
+
+    def _refresh(self) -> None:
+        """Bring the offset map up to date with what is on disk."""
+        numbers = self.segment_numbers()
+        if not set(self._scanned) <= set(numbers):
+            self._reset_map()  # segments vanished: another process compacted
+        for sequence in numbers:
+            start = self._scanned.get(sequence, 0)
+            path = self.segment_path(sequence)
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                continue
+            if sequence in self._scanned and size == start:
+                continue
+            with path.open("rb") as handle:
+                handle.seek(start)
+                data = handle.read()
+            end = start
+            for offset, length, record in iter_records(data):
+                self._apply_record(sequence, start + offset, length, record)
+                end = start + offset + length
+            self._scanned[sequence] = end
+
+    def _apply_record(self, sequence: int, offset: int, length: int, record: dict[str, Any]) -> None:
+        node_id = record.get("node_id")
+        if not isinstance(node_id, str):
+            return
+        previous = self._offsets.pop(node_id, None)
+        if previous is not None:
+            self._live_bytes -= previous[2]
+        if record.get("op") == "put" and isinstance(record.get("node"), dict):
+            self._offsets[node_id] = (sequence, offset, length)
+            self._live_bytes += length
+
+    def _read_frame(self, location: tuple[int, int, int]) -> dict[str, Any] | None:
+        sequence, offset, length = location
+        with self.segment_path(sequence).open("rb") as handle:
+            handle.seek(offset)
+            frame = handle.read(length)
+        for _, _, record in iter_records(frame):
+            return record
+        return None
+
+    # --- nodes ------------------------------------------------------------
+
+    def read_node(self, node_id: str) -> dict[str, Any] | None:
+        safe_segment(node_id, "node_id")
+        for _ in range(2):
+            self._refresh()
+            location = self._offsets.get(node_id)
+            if location is None:
+                return None
+            try:
+                record = self._read_frame(location)
+            except FileNotFoundError:
+                self._reset_map()  # compacted underneath us; rescan once
+                continue
+            node = record.get("node") if record else None
+            return node if isinstance(node, dict) else None
+        return None
+
+    def write_node(self, node_id: str, payload: dict[str, Any]) -> None:
+        self._append({"op": "put", "node_id": safe_segment(node_id, "node_id"), "node": payload})
+
+    def delete_node(self, node_id: str) -> None:
+        self._refresh()
+        if node_id in self._offsets:
+            self._append({"op": "del", "node_id": safe_segment(node_id, "node_id")})
+
+    def node_ids(self) -> list[str]:
+        self._refresh()
+        return sorted(self._offsets)
+
+    def _append(self, record: dict[str, Any]) -> None:
+        with self.batch():
+            self._refresh()
+            numbers = self.segment_numbers()
+            sequence = numbers[-1] if numbers else 1
+            path = self.segment_path(sequence)
+            if path.exists():
+                size = path.stat().st_size
+                if size > self._scanned.get(sequence, 0):
+                    # Torn tail from a crashed writer: nobody else can be
+                    # mid-append while we hold the lock, so drop it.
+                    os.truncate(path, self._scanned.get(sequence, 0))
+                if self._scanned.get(sequence, 0) >= SEGMENT_MAX_BYTES:
+                    sequence += 1
+                    path = self.segment_path(sequence)
+            frame = encode_record(record)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                offset = os.lseek(fd, 0, os.SEEK_END)
+                os.write(fd, frame)
+            finally:
+                os.close(fd)
+            self._dirty.add(sequence)
+            self._apply_record(sequence, offset, len(frame), record)
+            self._scanned[sequence] = offset + len(frame)
+
+    # --- compaction -------------------------------------------------------
+
+    def segment_stats(self) -> dict[str, int]:
+        self._refresh()
+        total = sum(self._scanned.values())
+        return {
+            "segments": len(self._scanned),
+            "nodes": len(self._offsets),
+            "total_bytes": total,
+            "live_bytes": self._live_bytes,
+        }
+
+    def _maybe_compact(self) -> None:
+        stats = self.segment_stats()
+        if stats["total_bytes"] >= COMPACT_MIN_BYTES and stats["live_bytes"] * 2 < stats["total_bytes"]:
+            self._compact_locked()
+
+    def compact_storage(self) -> dict[str, Any]:
+        """Rewrite live records into one segment and drop superseded ones."""
+        with self.batch():
+            return self._compact_locked()
+
+    def _compact_locked(self) -> dict[str, Any]:
+        before = self.segment_stats()
+        old = self.segment_numbers()
+        if not old:
+            return {"compacted": False, **before}
+        sequence = old[-1] + 1
+        target = self.segment_path(sequence)
+        tmp = target.with_name(f".{target.name}.tmp")
+        with tmp.open("wb") as handle:
+            for node_id in sorted(self._offsets):
+                record = self._read_frame(self._offsets[node_id])
+                if record is not None:
+                    handle.write(encode_record(record))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, target)
+        fsync_dir(self.segments_dir)
+        for number in old:
+            self.segment_path(number).unlink(missing_ok=True)
+        fsync_dir(self.segments_dir)
+        self._dirty.clear()
+        self._reset_map()
+        after = self.segment_stats()
+        return {
+            "compacted": True,
+            "reclaimed_bytes": before["total_bytes"] - after["total_bytes"],
+            **after,
+        }
@@ -11,6 +11,7 @@ Public API:
     scan_text(text) -> tuple[SensitiveFinding, ...]
     redact_text(text) -> tuple[str, bool]
     classify_text(text, requested) -> SensitiveReport
+    PRIVATE_KEY_BEGIN / PRIVATE_KEY_END  # the PEM markers, for streaming scans
 
 Eight RED pattern families are covered:
     1. Known API-key prefixes (sk-, AIza, ghp_, github_pat_, glpat-, xox*, SG.)
@@ -64,11 +65,13 @@ def _known_prefix(*parts: str) -> str:
     return "".join(parts)
 
 
-_PRIVATE_KEY_PEM = (
-    r"-{5}" + "BEGIN" + r"\s+[A-Z0-9 ]{0,32}" + "PRIVATE" + r"\s+KEY-{5}"
-    r".*?"
-    r"-{5}" + "END" + r"\s+[A-Z0-9 ]{0,32}" + "PRIVATE" + r"\s+KEY-{5}"
-)
+_PEM_BEGIN = r"-{5}" + "BEGIN" + r"\s+[A-Z0-9 ]{0,32}" + "PRIVATE" + r"\s+KEY-{5}"
+_PEM_END = r"-{5}" + "END" + r"\s+[A-Z0-9 ]{0,32}" + "PRIVATE" + r"\s+KEY-{5}"
+_PRIVATE_KEY_PEM = _PEM_BEGIN + r".*?" + _PEM_END
+# The only RED pattern with no length bound: a key body of any size sits
+# between these. Streaming scanners (raw_store.red_gated) track them apart.
+PRIVATE_KEY_BEGIN = re.compile(_PEM_BEGIN, re.IGNORECASE)
+PRIVATE_KEY_END = re.compile(_PEM_END, re.IGNORECASE)
 
 _DB_SCHEMES = r"(?:postgres(?:ql)?|mysql|mariadb|mongodb(?:\+srv)?|redis|rediss)"
 _WORD = r"[a-z]{3,12}"
@@ -0,0 +1,412 @@
+"""Ralph Memory Tree SQLite backend -- one WAL-mode database per project tree.
+
+Alternative to the one-JSON-file-per-node ``files`` layout for large or busy
+trees. Everything a project owns lives in ``{project_tree}/tree.sqlite3``:
+
+    nodes(node_id, payload)           node JSON, exactly as the files layout
+    raw(digest, content)              raw bodies keyed by sha256
+    entries(node_id, entry)           index entries (tree_index.index_entry)
+    tokens(id, token) + postings      inverted index, token -> node_ids
+    vocab                             FTS5 trigram table over tokens (optional)
+    bounds(token, mask)               per-token scored-field masks (term_bounds)
+    usage(seq, event)                 append-only usage events
+    meta(key, value)                  index generation
+
+Writes inside ``batch()`` share one transaction, so a node write, its index
+delta and its usage event commit (or roll back) together. Recall does not need
+to materialise the whole index: ``candidate_entries`` resolves substring
+matches through the trigram ``vocab`` table (or an ``instr`` scan of the token
+table when the SQLite build lacks FTS5) and fetches only the matching entries,
+and ``term_bounds`` reads only the ``bounds`` rows containing a query term.
+``bounds`` is kept in the same transaction as ``entries``; like the files
+index's bounds it only grows between rebuilds. A database from before it
+existed has none until its next reindex / compaction, and recall then ranks
+without pruning rather than loading the whole index.
+
+Validation, the RED gate and index construction are NOT reimplemented here;
+``TreeStore`` applies them before anything reaches this backend.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+if __package__:
+    from .tree_index import (
+        ANY_TOKEN,
+        INDEX_SCHEMA_VERSION,
+        EntryFilter,
+        entry_bounds,
+        entry_tokens,
+    )
+    from .tree_store import StorageBackend, ensure_within, now_iso
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_index import (
+        ANY_TOKEN,
+        INDEX_SCHEMA_VERSION,
+        EntryFilter,
+        entry_bounds,
+        entry_tokens,
+    )
+    from tree_store import StorageBackend, ensure_within, now_iso
+
+DB_NAME = "tree.sqlite3"
+_SQL_CHUNK = 500
+# TreeStore durability -> SQLite's own WAL sync level (SQLite provides the
+# group commit itself, so this backend never uses TreeStore's write-ahead log).
+_SYNCHRONOUS = {"strict": "FULL", "batched": "NORMAL", "relaxed": "OFF"}
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, payload TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS raw (digest TEXT PRIMARY KEY, content TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS entries (node_id TEXT PRIMARY KEY, entry TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tokens (id INTEGER PRIMARY KEY, token TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS postings ("
+    " token_id INTEGER NOT NULL, node_id TEXT NOT NULL,"
+    " PRIMARY KEY (token_id, node_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS postings_by_node ON postings (node_id)",
+    "CREATE TABLE IF NOT EXISTS usage (seq INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS bounds (token TEXT PRIMARY KEY, mask INTEGER NOT NULL)"
+    " WITHOUT ROWID",
+)
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, store: Any, project_id: str) -> None:
+        super().__init__(store, project_id)
+        self._conn: sqlite3.Connection | None = None
+        self._batch_depth = 0
+        self._has_vocab = False
+
+    @property
+    def db_path(self) -> Path:
+        root = self.store.project_tree(self.project_id)
+        return ensure_within(root, root / DB_NAME)
+
+    # --- connection -------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={_SYNCHRONOUS[self.store.durability]}")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS vocab USING fts5(token, tokenize='trigram')"
+            )
+            self._has_vocab = True
+        except sqlite3.OperationalError:
+            self._has_vocab = False  # no FTS5 / trigram tokenizer in this build
+        # An empty index keeps ``bounds`` complete from its first entry on.
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value)"
+            " SELECT 'bounds', '1' WHERE NOT EXISTS (SELECT 1 FROM entries)"
+        )
+        self._conn = conn
+        return conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        conn = self._connect()
+        if self._batch_depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def index_lock(self, exclusive: bool = True) -> Iterator[None]:
+        # A write transaction already serialises writers across processes.
+        if not exclusive:
+            yield
+            return
+        with self.batch():
+            yield
+
+    def ensure_layout(self) -> Path:
+        self._connect()
+        return self.store.project_tree(self.project_id)
+
+    def destroy(self) -> None:
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            path = self.db_path.with_name(DB_NAME + suffix)
+            if path.exists():
+                path.unlink()
+
+    # --- nodes ------------------------------------------------------------
+
+    def read_node(self, node_id: str) -> dict[str, Any] | None:
+        row = self._connect().execute(
+            "SELECT payload FROM nodes WHERE node_id = ?", (node_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            payload = json.loads(row[0])
+        except ValueError:
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def write_node(self, node_id: str, payload: dict[str, Any]) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO nodes (node_id, payload) VALUES (?, ?)",
+            (node_id, json.dumps(payload, ensure_ascii=True, sort_keys=True)),
+        )
+
+    def delete_node(self, node_id: str) -> None:
+        self._connect().execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def node_ids(self) -> list[str]:
+        rows = self._connect().execute("SELECT node_id FROM nodes ORDER BY node_id")
+        return [row[0] for row in rows]
+
+    # --- raw --------------------------------------------------------------
+
+    def write_raw(self, digest: str, content: str) -> str:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO raw (digest, content) VALUES (?, ?)", (digest, content)
+        )
+        return f"{self.db_path}#raw/{digest}"
+
+    def read_raw(self, digest: str) -> str | None:
+        row = self._connect().execute(
+            "SELECT content FROM raw WHERE digest = ?", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete_raw(self, digest: str) -> None:
+        self._connect().execute("DELETE FROM raw WHERE digest = ?", (digest,))
+
+    def raw_digests(self) -> list[str]:
+        return [row[0] for row in self._connect().execute("SELECT digest FROM raw ORDER BY digest")]
+
+    # --- index ------------------------------------------------------------
+
+    def _generation(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else -1
+
+    def _set_generation(self, conn: sqlite3.Connection, generation: int) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)",
+            (str(generation),),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (now_iso(),)
+        )
+
+    def last_generation(self) -> int:
+        return self._generation(self._connect())
+
+    def index_signature(self) -> Any:
+        # Every index write bumps the stored generation in its transaction.
+        return self.last_generation()
+
+    def load_index(self) -> dict[str, Any] | None:
+        conn = self._connect()
+        try:
+            nodes = [
+                json.loads(row[0])
+                for row in conn.execute("SELECT entry FROM entries ORDER BY node_id")
+            ]
+            postings: dict[str, list[str]] = {}
+            for token, node_id in conn.execute(
+                "SELECT t.token, p.node_id FROM postings p JOIN tokens t ON t.id = p.token_id"
+                " ORDER BY t.token, p.node_id"
+            ):
+                postings.setdefault(token, []).append(node_id)
+        except (sqlite3.Error, ValueError):
+            return None
+        return {
+            "schema_version": INDEX_SCHEMA_VERSION,
+            "project_id": self.project_id,
+            "generation": max(self._generation(conn), 0),
+            "nodes": nodes,
+            "postings": postings,
+        }
+
+    def _token_id(self, conn: sqlite3.Connection, token: str) -> int:
+        row = conn.execute("SELECT id FROM tokens WHERE token = ?", (token,)).fetchone()
+        if row:
+            return int(row[0])
+        cursor = conn.execute("INSERT INTO tokens (token) VALUES (?)", (token,))
+        token_id = int(cursor.lastrowid or 0)
+        if self._has_vocab:
+            conn.execute("INSERT INTO vocab (rowid, token) VALUES (?, ?)", (token_id, token))
+        return token_id
+
+    def _drop_entry(self, conn: sqlite3.Connection, node_id: str) -> None:
+        token_ids = [
+            row[0]
+            for row in conn.execute("SELECT token_id FROM postings WHERE node_id = ?", (node_id,))
+        ]
+        conn.execute("DELETE FROM postings WHERE node_id = ?", (node_id,))
+        conn.execute("DELETE FROM entries WHERE node_id = ?", (node_id,))
+        for token_id in token_ids:
+            if conn.execute(
+                "SELECT 1 FROM postings WHERE token_id = ? LIMIT 1", (token_id,)
+            ).fetchone() is None:
+                conn.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
+                if self._has_vocab:
+                    conn.execute("DELETE FROM vocab WHERE rowid = ?", (token_id,))
+
+    def _add_entry(self, conn: sqlite3.Connection, entry: dict[str, Any]) -> None:
+        node_id = str(entry["node_id"])
+        conn.execute(
+            "INSERT INTO entries (node_id, entry) VALUES (?, ?)",
+            (node_id, json.dumps(entry, ensure_ascii=True, sort_keys=True)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO postings (token_id, node_id) VALUES (?, ?)",
+            [(self._token_id(conn, tok), node_id) for tok in sorted(entry_tokens(entry))],
+        )
+        conn.executemany(
+            "INSERT INTO bounds (token, mask) VALUES (?, ?)"
+            " ON CONFLICT (token) DO UPDATE SET mask = mask | excluded.mask",
+            sorted(entry_bounds(entry).items()),
+        )
+
+    def append_index_deltas(self, deltas: list[dict[str, Any]]) -> None:
+        """Apply *deltas* as row-level updates in one transaction."""
+        conn = self._connect()
+        with self.batch():
+            generation = max(self._generation(conn), 0)
+            for delta in deltas:
+                op = delta.get("op")
+                if op == "upsert":
+                    entry = delta["entry"]
+                    self._drop_entry(conn, str(entry["node_id"]))
+                    self._add_entry(conn, entry)
+                elif op == "delete":
+                    self._drop_entry(conn, str(delta["node_id"]))
+                else:
+                    raise ValueError(f"unknown index delta op: {op!r}")
+                generation += 1
+            self._set_generation(conn, generation)
+
+    def commit_index(self, index: dict[str, Any]) -> None:
+        conn = self._connect()
+        with self.batch():
+            for table in ("entries", "postings", "tokens", "bounds"):
+                conn.execute(f"DELETE FROM {table}")
+            if self._has_vocab:
+                conn.execute("DELETE FROM vocab")
+            for entry in index.get("nodes", []):
+                if isinstance(entry, dict) and entry.get("node_id"):
+                    self._add_entry(conn, entry)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bounds', '1')")
+            self._set_generation(conn, int(index.get("generation", 0)))
+
+    def term_bounds(self, terms: list[str] | None = None) -> dict[str, int] | None:
+        """The ``bounds`` rows whose token contains one of *terms* (every row
+        without *terms*), plus ``ANY_TOKEN``; None when the database predates
+        the table and has not been rebuilt since.
+        """
+        conn = self._connect()
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'bounds'").fetchone() is None:
+                return None
+            if terms is None:
+                rows = conn.execute("SELECT token, mask FROM bounds").fetchall()
+            else:
+                rows = []
+                for term in dict.fromkeys(terms):
+                    rows += conn.execute(
+                        "SELECT token, mask FROM bounds WHERE instr(token, ?) > 0"
+                        " OR token = ?",
+                        (term, ANY_TOKEN),
+                    ).fetchall()
+        except sqlite3.Error:
+            return None
+        return {str(token): int(mask) for token, mask in rows}
+
+    def candidate_entries(
+        self, search_terms: list[str], where: EntryFilter | None = None
+    ) -> list[dict[str, Any]] | None:
+        """Substring candidate selection as indexed SQL (same set as the scan).
+
+        Search terms are ``[A-Za-z0-9_./-]`` runs of >= 3 chars, so they never
+        contain a GLOB metacharacter and always satisfy the trigram index's
+        minimum pattern length. *where* filters the fetched entries.
+        """
+        terms = [s for s in search_terms if s]
+        if not terms:
+            return []
+        conn = self._connect()
+        if self._has_vocab:
+            sql = (
+                "SELECT DISTINCT p.node_id FROM vocab v"
+                " JOIN postings p ON p.token_id = v.rowid WHERE v.token GLOB ?"
+            )
+            params = [f"*{term}*" for term in terms]
+        else:
+            sql = (
+                "SELECT DISTINCT p.node_id FROM tokens t"
+                " JOIN postings p ON p.token_id = t.id WHERE instr(t.token, ?) > 0"
+            )
+            params = list(terms)
+        try:
+            candidate_ids: set[str] = set()
+            for param in params:
+                candidate_ids.update(row[0] for row in conn.execute(sql, (param,)))
+            ordered = sorted(candidate_ids)
+            found: dict[str, dict[str, Any]] = {}
+            for start in range(0, len(ordered), _SQL_CHUNK):
+                chunk = ordered[start : start + _SQL_CHUNK]
+                marks = ",".join("?" for _ in chunk)
+                for node_id, entry in conn.execute(
+                    f"SELECT node_id, entry FROM entries WHERE node_id IN ({marks})", chunk
+                ):
+                    found[node_id] = json.loads(entry)
+        except (sqlite3.Error, ValueError):
+            return None
+        entries = [found.get(nid) or {"node_id": nid} for nid in ordered]
+        if where:
+            entries = [e for e in entries if where.matches(e)]
+        return entries
+
+    # --- usage ------------------------------------------------------------
+
+    def append_usage(self, event: dict[str, Any]) -> None:
+        self._connect().execute(
+            "INSERT INTO usage (event) VALUES (?)",
+            (json.dumps(event, ensure_ascii=True, sort_keys=True),),
+        )
+
+    def iter_usage(self) -> Iterator[dict[str, Any]]:
+        for (event,) in self._connect().execute("SELECT event FROM usage ORDER BY seq"):
+            try:
+                parsed = json.loads(event)
+            except ValueError:
+                continue
+            if isinstance(parsed, dict):
+                yield parsed
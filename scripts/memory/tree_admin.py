@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Ralph Memory Tree maintenance CLI -- explicit, operator-run tree operations.
+
+Normal writes keep a tree healthy on their own; these subcommands are for
+operators and bulk tools:
+
+    convert   move a project tree to another storage backend
+    reindex   rebuild the index from the stored nodes (O(n), explicit only)
+    compact   fold pending index deltas into the base index and reclaim
+              space held by superseded node versions (segments layout)
+    reshard   move a file-layout tree to the nodes/ab/cd fan-out (or back
+              with --flat), online and in place
+    export    stream the tree (nodes, raw blobs, usage) into one JSONL
+              archive, optionally only what changed --since a timestamp
+    import    stream an archive back in through the bulk-ingest path
+    gc        sweep orphaned raw blobs/chunks and tmp debris, optionally
+              archiving long-deprecated nodes; resumable under a time budget
+    index-format  switch the base index between index.json and the
+                  compact, mmap-able index.bin
+    dump-index    write the current index as pretty JSON (a debug export;
+                  binary-index trees keep no index.json otherwise)
+    upgrade-index migrate an older index schema and rebuild stale (thin)
+                  entries; safe to run in the background from a hook
+    snapshot  freeze the tree as a copy-on-write view of a --branch or
+              --commit (--delete drops the ref, --list shows every ref)
+
+Every subcommand targets ONE project tree, resolved like recall_v2 resolves it
+(``--project-id`` or ``compute_project_id(--project-root)``), and prints a JSON
+result object.
+
+Examples:
+    python3 scripts/memory/tree_admin.py convert --to sqlite
+    python3 scripts/memory/tree_admin.py reindex --project-id 1a2b_repo
+    python3 scripts/memory/tree_admin.py export --out tree.jsonl.gz --since 2026-10-01
+    python3 scripts/memory/tree_admin.py import tree.jsonl.gz
+    python3 scripts/memory/tree_admin.py gc --budget-seconds 2 --archive-deprecated-days 90
+    python3 scripts/memory/tree_admin.py snapshot --branch feature/login
+    python3 scripts/memory/tree_admin.py index-format --to binary
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+if __package__:
+    from .tree_archive import export_tree, import_tree, open_archive
+    from .tree_snapshot import delete_snapshot, list_snapshots
+    from .tree_store import (
+        BACKENDS,
+        INDEX_FORMATS,
+        TreeStore,
+        TreeStoreError,
+        atomic_write_json,
+        compute_project_id,
+    )
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from tree_archive import export_tree, import_tree, open_archive
+    from tree_snapshot import delete_snapshot, list_snapshots
+    from tree_store import (
+        BACKENDS,
+        INDEX_FORMATS,
+        TreeStore,
+        TreeStoreError,
+        atomic_write_json,
+        compute_project_id,
+    )
+
+
+def _index_summary(index: dict[str, Any]) -> dict[str, Any]:
+    return {"generation": index.get("generation"), "nodes": len(index.get("nodes", []))}
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    store = TreeStore(Path(args.ralph_home).expanduser() if args.ralph_home else None)
+    project_id = args.project_id or compute_project_id(Path(args.project_root))
+    if args.command == "convert":
+        return store.convert_backend(project_id, args.to)
+    if args.command == "reindex":
+        return {"project_id": project_id, **_index_summary(store.reindex(project_id))}
+    if args.command == "compact":
+        index = store.compact_index(project_id)
+        storage = store.backend(project_id).compact_storage()
+        return {"project_id": project_id, **_index_summary(index), "storage": storage}
+    if args.command == "reshard":
+        return store.reshard(project_id, shard=not args.flat)
+    if args.command == "export":
+        with open_archive(Path(args.out), "w") as out:
+            stats = export_tree(
+                store, project_id, out, since=args.since or None, include_usage=not args.no_usage
+            )
+        return {**stats, "archive": args.out}
+    if args.command == "import":
+        with open_archive(Path(args.archive), "r") as source:
+            return import_tree(store, project_id, source, include_usage=not args.no_usage)
+    if args.command == "gc":
+        return store.gc(
+            project_id,
+            budget_seconds=args.budget_seconds,
+            archive_deprecated_days=args.archive_deprecated_days,
+        )
+    if args.command == "index-format":
+        return store.set_index_format(project_id, args.to)
+    if args.command == "dump-index":
+        index = store.load_index(project_id)
+        if index is None:
+            raise TreeStoreError(f"no readable index for project {project_id}")
+        out = Path(args.out) if args.out else store.index_path(project_id)
+        atomic_write_json(out, index)
+        return {"project_id": project_id, **_index_summary(index), "out": str(out)}
+    if args.command == "upgrade-index":
+        return store.upgrade_index(project_id)
+    if args.command == "snapshot":
+        if args.list:
+            return {"project_id": project_id, "snapshots": list_snapshots(store, project_id)}
+        ref = {"branch": args.branch, "commit": args.commit}
+        if args.delete:
+            return {"project_id": project_id, "deleted": delete_snapshot(store, project_id, **ref)}
+        return store.snapshot(project_id, **ref)
+    raise TreeStoreError(f"unknown command: {args.command}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Ralph Memory Tree maintenance.")
+    parser.add_argument("--project-root", default=".")
+    parser.add_argument("--project-id", default=os.environ.get("RALPH_MEMORY_PROJECT_ID", ""))
+    parser.add_argument(
+        "--ralph-home",
+        default="",
+        help="Memory tree home (default: RALPH_MEMORY_HOME or ~/.ralph).",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Move the tree to another backend.")
+    convert.add_argument("--to", required=True, choices=sorted(BACKENDS))
+    commands.add_parser("reindex", help="Rebuild the index from the stored nodes.")
+    commands.add_parser("compact", help="Fold index deltas and compact node storage.")
+    reshard = commands.add_parser("reshard", help="Move to (or from) the sharded layout.")
+    reshard.add_argument("--flat", action="store_true", help="Undo sharding.")
+    export = commands.add_parser("export", help="Stream the tree into a JSONL archive.")
+    export.add_argument("--out", required=True, help="Archive path (*.gz is compressed).")
+    export.add_argument("--since", default="", help="Only nodes updated at/after this ISO time.")
+    export.add_argument("--no-usage", action="store_true", help="Leave usage events out.")
+    import_ = commands.add_parser("import", help="Stream a JSONL archive into the tree.")
+    import_.add_argument("archive", help="Archive written by export.")
+    import_.add_argument("--no-usage", action="store_true", help="Skip the usage events.")
+    gc = commands.add_parser("gc", help="Mark-and-sweep unreferenced data.")
+    gc.add_argument(
+        "--budget-seconds", type=float, default=None, help="Stop after this long; resume next run."
+    )
+    gc.add_argument(
+        "--archive-deprecated-days",
+        type=int,
+        default=None,
+        help="Move nodes deprecated longer than this into cold/ archives.",
+    )
+    index_format = commands.add_parser("index-format", help="Switch the base index format.")
+    index_format.add_argument("--to", required=True, choices=INDEX_FORMATS)
+    dump = commands.add_parser("dump-index", help="Export the index as JSON for debugging.")
+    dump.add_argument("--out", default="", help="Output path (default: the tree's index.json).")
+    commands.add_parser("upgrade-index", help="Migrate the index schema and stale entries.")
+    snapshot = commands.add_parser("snapshot", help="Copy-on-write view of a branch or commit.")
+    ref = snapshot.add_mutually_exclusive_group()
+    ref.add_argument("--branch", default=None)
+    ref.add_argument("--commit", default=None)
+    snapshot.add_argument("--delete", action="store_true", help="Drop the ref instead.")
+    snapshot.add_argument("--list", action="store_true", help="List every snapshot ref.")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        result = run(args)
+    except (TreeStoreError, OSError, EOFError) as exc:
+        print(json.dumps({"status": "error", "reason": str(exc)}))
+        return 1
+    print(json.dumps(result, ensure_ascii=True, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,362 @@
+"""Ralph Memory Tree archives -- streaming JSONL export / import of a project.
+
+Backing up a tree, moving it to another machine or seeding CI used to mean
+copying thousands of node files. ``export_tree`` streams one project -- nodes,
+raw blobs and usage events -- into a single JSONL file (gzip-compressed when
+the name ends in ``.gz``), and ``import_tree`` streams it back:
+
+    {"kind": "header", "schema": "ralph_tree_archive_v1", "project_id", ...}
+    {"kind": "node", "node": {...}}                    one per node
+    {"kind": "raw", "digest", "seq", "text"}           one per raw chunk
+    {"kind": "raw_end", "digest", "chunks"}            closes a raw blob
+    {"kind": "usage", "event": {...}}                  one per usage event
+    {"kind": "footer", "nodes", "raw", "usage_events"}
+
+Every record carries ``sha256``: the digest of its own canonical JSON without
+that key. A record that fails the check is skipped (a raw blob is dropped
+whole), and a missing footer marks the archive as truncated.
+
+``since`` exports only nodes updated at or after a timestamp, plus the raw
+blobs those nodes reference and the usage events from then on, so periodic
+incremental exports stay small.
+
+Import goes through the same gates as any other write: nodes through
+``TreeStore.upsert_nodes`` (validation + RED gate, in batches of
+``IMPORT_BATCH``; a stored node that is at least as new wins), raw blobs
+through the streaming ``save_raw`` RED gate, and usage events are refused if
+they carry RED material. Both directions hold at most one batch of nodes or
+one raw chunk in memory, whatever the size of the tree.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+if __package__:
+    from .memory_node import MemoryNodeValidationError, contains_red_material, sha256_text
+    from .raw_store import READ_ERRORS, chunk_text
+    from .tree_store import TreeStore, TreeStoreError, now_iso
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from memory_node import MemoryNodeValidationError, contains_red_material, sha256_text
+    from raw_store import READ_ERRORS, chunk_text
+    from tree_store import TreeStore, TreeStoreError, now_iso
+
+ARCHIVE_SCHEMA = "ralph_tree_archive_v1"
+# Nodes handed to ``upsert_nodes`` (and usage events appended) per batch.
+IMPORT_BATCH = 500
+
+
+class TreeArchiveError(TreeStoreError):
+    """The archive is not a readable Ralph tree archive."""
+
+
+def open_archive(path: Path, mode: str) -> IO[str]:
+    """Open *path* for text ``"r"`` / ``"w"``; ``*.gz`` is gzip-compressed."""
+    if path.suffix == ".gz":
+        return gzip.open(path, f"{mode}t", encoding="utf-8")  # type: ignore[return-value]
+    return path.open(mode, encoding="utf-8")
+
+
+def record_digest(record: dict[str, Any]) -> str:
+    body = {key: value for key, value in record.items() if key != "sha256"}
+    return sha256_text(json.dumps(body, ensure_ascii=True, sort_keys=True, separators=(",", ":")))
+
+
+def _line(record: dict[str, Any]) -> str:
+    record["sha256"] = record_digest(record)
+    return json.dumps(record, ensure_ascii=True, sort_keys=True, separators=(",", ":")) + "\n"
+
+
+def parse_since(value: str | None) -> datetime | None:
+    """``--since`` value -> aware datetime (a bare date means midnight UTC)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError as exc:
+        raise TreeArchiveError(f"invalid --since timestamp: {value!r}") from exc
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _at_or_after(value: object, cutoff: datetime | None) -> bool:
+    if cutoff is None:
+        return True
+    try:
+        stamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return (stamp if stamp.tzinfo else stamp.replace(tzinfo=timezone.utc)) >= cutoff
+
+
+# --- export ----------------------------------------------------------------
+
+
+def _export_node_ids(store: TreeStore, project_id: str, cutoff: datetime | None) -> list[str]:
+    # With --since the index (already one parsed file) pre-filters on
+    # updated_at, so unchanged nodes are never opened.
+    index = store.load_index(project_id) if cutoff is not None else None
+    if index is None:
+        return store.backend(project_id).node_ids()
+    return sorted(
+        str(entry["node_id"])
+        for entry in index.get("nodes", [])
+        if _at_or_after(entry.get("updated_at"), cutoff)
+    )
+
+
+def _write_header(out: IO[str], project_id: str, since: str | None, **extra: Any) -> None:
+    out.write(
+        _line(
+            {
+                "kind": "header",
+                "schema": ARCHIVE_SCHEMA,
+                "project_id": project_id,
+                "exported_at": now_iso(),
+                "since": since,
+                **extra,
+            }
+        )
+    )
+
+
+def _write_footer(out: IO[str], stats: dict[str, Any]) -> None:
+    out.write(
+        _line(
+            {
+                "kind": "footer",
+                "nodes": stats["nodes"],
+                "raw": stats["raw"],
+                "usage_events": stats.get("usage_events", 0),
+            }
+        )
+    )
+
+
+def _write_node(out: IO[str], node: dict[str, Any], referenced: set[str]) -> None:
+    out.write(_line({"kind": "node", "node": node}))
+    raw_ref = node.get("raw_ref")
+    if isinstance(raw_ref, dict) and isinstance(raw_ref.get("sha256"), str):
+        referenced.add(raw_ref["sha256"])
+
+
+def _write_raw(store: TreeStore, project_id: str, digest: str, out: IO[str]) -> bool:
+    """Stream one verified raw blob as ``raw`` records; False if unavailable."""
+    try:
+        chunks = store.iter_raw(project_id, digest)
+    except TreeStoreError:
+        chunks = None
+    if chunks is None:
+        return False
+    seq = 0
+    try:
+        for text in chunk_text(chunks):
+            out.write(_line({"kind": "raw", "digest": digest, "seq": seq, "text": text}))
+            seq += 1
+    except READ_ERRORS:
+        return False  # no raw_end: the importer drops the partial blob
+    out.write(_line({"kind": "raw_end", "digest": digest, "chunks": seq}))
+    return True
+
+
+def export_tree(
+    store: TreeStore,
+    project_id: str,
+    out: IO[str],
+    *,
+    since: str | None = None,
+    include_usage: bool = True,
+) -> dict[str, Any]:
+    """Stream *project_id* into *out* as archive records; return counts."""
+    cutoff = parse_since(since)
+    stats: dict[str, Any] = {
+        "project_id": project_id,
+        "since": cutoff.isoformat() if cutoff else None,
+        "nodes": 0,
+        "raw": 0,
+        "skipped_raw": 0,
+        "usage_events": 0,
+    }
+    _write_header(out, project_id, stats["since"])
+    referenced: set[str] = set()
+    for node_id in _export_node_ids(store, project_id, cutoff):
+        node = store.load_node(project_id, node_id)
+        if node is None or not _at_or_after(node.get("updated_at"), cutoff):
+            continue
+        _write_node(out, node, referenced)
+        stats["nodes"] += 1
+
+    digests = sorted(referenced) if cutoff else store.backend(project_id).raw_digests()
+    for digest in digests:
+        stats["raw" if _write_raw(store, project_id, digest, out) else "skipped_raw"] += 1
+
+    if include_usage:
+        for event in store.iter_usage(project_id):
+            if _at_or_after(event.get("at"), cutoff):
+                out.write(_line({"kind": "usage", "event": event}))
+                stats["usage_events"] += 1
+
+    _write_footer(out, stats)
+    return stats
+
+
+def export_nodes(
+    store: TreeStore, project_id: str, nodes: list[dict[str, Any]], out: IO[str], **header: Any
+) -> dict[str, Any]:
+    """Write an archive of just *nodes* and the raw blobs they reference
+    (``tree_gc``'s cold archive); *header* adds fields to the header record."""
+    stats: dict[str, Any] = {"nodes": 0, "raw": 0, "skipped_raw": 0}
+    _write_header(out, project_id, None, **header)
+    referenced: set[str] = set()
+    for node in nodes:
+        _write_node(out, node, referenced)
+        stats["nodes"] += 1
+    for digest in sorted(referenced):
+        stats["raw" if _write_raw(store, project_id, digest, out) else "skipped_raw"] += 1
+    _write_footer(out, stats)
+    return stats
+
+
+# --- import ----------------------------------------------------------------
+
+
+class _Records:
+    """Checked archive records from a line stream, with one-record push-back."""
+
+    def __init__(self, lines: IO[str]) -> None:
+        self._lines = lines
+        self._pushed: dict[str, Any] | None = None
+        self.corrupt = 0
+
+    def __iter__(self) -> "_Records":
+        return self
+
+    def __next__(self) -> dict[str, Any]:
+        if self._pushed is not None:
+            record, self._pushed = self._pushed, None
+            return record
+        for line in self._lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.corrupt += 1  # torn line
+                continue
+            if not isinstance(record, dict) or record.get("sha256") != record_digest(record):
+                self.corrupt += 1
+                continue
+            return record
+        raise StopIteration
+
+    def push_back(self, record: dict[str, Any]) -> None:
+        self._pushed = record
+
+
+def _raw_pieces(first: dict[str, Any], records: _Records) -> Iterator[str]:
+    """Yield one blob's chunk texts from *records*, checking chunk order and
+    count and the whole-blob digest; raise ``TreeArchiveError`` when any is
+    off (the ``save_raw`` consuming this then leaves nothing behind)."""
+    digest = first.get("digest")
+    running = hashlib.sha256()
+    expected = 0
+    record: dict[str, Any] | None = first
+    while record is not None:
+        if record.get("digest") != digest:
+            records.push_back(record)
+            break
+        if record.get("kind") == "raw_end":
+            if record.get("chunks") == expected and running.hexdigest() == digest:
+                return
+            break
+        text = record.get("text")
+        if record.get("kind") != "raw" or record.get("seq") != expected or not isinstance(text, str):
+            break
+        running.update(text.encode("utf-8"))
+        expected += 1
+        yield text
+        record = next(records, None)
+    raise TreeArchiveError(f"raw blob {digest} is incomplete or corrupt in the archive")
+
+
+def import_tree(
+    store: TreeStore,
+    project_id: str,
+    source: IO[str],
+    *,
+    include_usage: bool = True,
+) -> dict[str, Any]:
+    """Stream an archive from *source* into *project_id*; return counts.
+
+    Nodes are re-homed to *project_id* (an archive may come from a checkout
+    with a different project id). Re-importing an archive is idempotent for
+    nodes and raw blobs; usage events are appended again.
+    """
+    records = _Records(source)
+    header = next(records, None)
+    if header is None or header.get("kind") != "header" or header.get("schema") != ARCHIVE_SCHEMA:
+        raise TreeArchiveError("not a Ralph tree archive (missing or unknown header)")
+    stats: dict[str, Any] = {
+        "project_id": project_id,
+        "source_project_id": header.get("project_id"),
+        "created": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "rejected": 0,
+        "raw": 0,
+        "rejected_raw": 0,
+        "usage_events": 0,
+        "rejected_usage": 0,
+        "corrupt_records": 0,
+        "complete": False,
+    }
+    nodes: list[dict[str, Any]] = []
+    events: list[dict[str, Any]] = []
+
+    def flush_nodes() -> None:
+        if not nodes:
+            return
+        for outcome in store.upsert_nodes(nodes, preserve_updated_at=True):
+            stats[outcome["status"]] += 1
+        nodes.clear()
+
+    def flush_events() -> None:
+        if events:
+            store.backend(project_id).append_usage_many(list(events))
+            stats["usage_events"] += len(events)
+            events.clear()
+
+    store.ensure_layout(project_id)
+    with store.group_commit():
+        for record in records:
+            kind = record.get("kind")
+            if kind == "node" and isinstance(record.get("node"), dict):
+                nodes.append({**record["node"], "project_id": project_id})
+                if len(nodes) >= IMPORT_BATCH:
+                    flush_nodes()
+            elif kind == "raw" and record.get("seq") == 0:
+                try:
+                    saved = store.save_raw(project_id, _raw_pieces(record, records))
+                except (TreeArchiveError, MemoryNodeValidationError):
+                    stats["rejected_raw"] += 1
+                    continue
+                stats["raw" if saved["sha256"] == record.get("digest") else "rejected_raw"] += 1
+            elif kind == "usage" and include_usage and isinstance(record.get("event"), dict):
+                if contains_red_material(record["event"]):
+                    stats["rejected_usage"] += 1
+                    continue
+                events.append(record["event"])
+                if len(events) >= IMPORT_BATCH:
+                    flush_events()
+            elif kind == "footer":
+                stats["complete"] = True
+            # Anything else -- the tail of a raw blob already rejected, an
+            # unknown kind from a newer writer -- is skipped.
+        flush_nodes()
+        flush_events()
+    stats["corrupt_records"] = records.corrupt
+    return stats
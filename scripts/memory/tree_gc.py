@@ -0,0 +1,434 @@
+"""Ralph Memory Tree garbage collector -- incremental mark-and-sweep.
+
+Nothing else ever removes data from a project tree, so without this trees
+only grow and every scan gets slower. A collection reclaims:
+
+  * raw blobs no node references any more -- mark: the ``raw_ref`` of every
+    index entry; sweep: every other manifest (or legacy ``<sha>.txt``);
+  * raw chunks that no remaining manifest lists (``files`` layouts);
+  * ``.*.tmp`` debris left behind by interrupted atomic writes;
+  * optionally, nodes deprecated for more than N days: they are first
+    written to a cold archive, ``cold/archive-<stamp>-<n>.jsonl.gz`` in the
+    ``tree_archive`` format (``tree_admin import`` restores them), and only
+    then deleted. Their raw blobs go to the archive too and are swept with
+    the other orphans in the same cycle;
+  * snapshot views no ref points at any more, and snapshot objects no
+    remaining view lists (see ``tree_snapshot``). The ``raw_ref`` of every
+    remaining view counts as reachable in the raw sweep.
+
+Incremental: a cycle runs the phases
+``archive -> snapshots -> raw -> chunks -> tmp``.
+``collect`` works until its time budget is spent and records the phase, a
+cursor and the phase's mark set in ``gc-state.json``; the next call resumes
+there without marking again. A SessionEnd hook can therefore run
+``tree_admin gc --budget-seconds 2`` every time and a large tree is still
+swept completely over a few sessions. The budget is checked between units of
+work (loading the index for a mark, reading one manifest, one blob, one
+chunk, one directory, one archive batch, the whole snapshot sweep), so a
+single unit may overrun it slightly, and every call completes at least one
+unit.
+
+Safety with concurrent writers: ``save_raw`` writes chunks, then the
+manifest, then the node that references it, so nothing written within the
+last ``GRACE_SECONDS`` is ever swept (a reused chunk is touched on write for
+the same reason). Blobs whose age a backend cannot report are never swept.
+The same holds for a mark set carried across calls: a blob or chunk that
+gains a reference after it was marked is rewritten or touched by that
+``save_raw`` and so is inside the grace period. Archive candidates are
+re-checked on the loaded node before they are moved.
+Only one collector runs per tree: a busy ``.gc.lock`` returns ``"busy"``.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
+
+if __package__:
+    from .recall_v2 import deprecated
+    from .tree_archive import export_nodes
+    from .tree_snapshot import (
+        live_views,
+        load_view,
+        snapshot_lock,
+        snapshots_root,
+        view_raw_refs,
+    )
+    from .tree_store import FileBackend, TreeStore, atomic_write_json, fsync_dir, now_iso
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from recall_v2 import deprecated
+    from tree_archive import export_nodes
+    from tree_snapshot import (
+        live_views,
+        load_view,
+        snapshot_lock,
+        snapshots_root,
+        view_raw_refs,
+    )
+    from tree_store import FileBackend, TreeStore, atomic_write_json, fsync_dir, now_iso
+
+PHASES = ("archive", "snapshots", "raw", "chunks", "tmp")
+STATE_NAME = "gc-state.json"
+LOCK_NAME = ".gc.lock"
+COLD_DIR = "cold"
+# Never sweep anything written more recently than this.
+GRACE_SECONDS = 3600
+# Deprecated nodes moved per cold-archive file.
+ARCHIVE_BATCH = 200
+
+
+@contextmanager
+def _gc_lock(root: Path) -> Iterator[bool]:
+    fd = os.open(root / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        acquired = True
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                acquired = False
+        yield acquired
+    finally:
+        os.close(fd)  # closing the descriptor releases the flock
+
+
+def _load_state(root: Path) -> dict[str, Any]:
+    try:
+        state = json.loads((root / STATE_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        state = None
+    if not isinstance(state, dict) or state.get("phase") not in PHASES:
+        return {"phase": PHASES[0], "cursor": None, "cycle_started_at": now_iso()}
+    return state
+
+
+def _next_phase(state: dict[str, Any], phase: str) -> None:
+    state.update(phase=phase, cursor=None)
+    state.pop("mark", None)
+    state.pop("mark_cursor", None)
+
+
+def _epoch(value: object) -> float | None:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class _Run:
+    """One ``collect`` call: budget, grace period, counters and phase state."""
+
+    def __init__(
+        self,
+        store: TreeStore,
+        project_id: str,
+        *,
+        budget_seconds: float | None,
+        grace_seconds: float,
+        archive_deprecated_days: int | None,
+        state: dict[str, Any],
+        stats: dict[str, Any],
+    ) -> None:
+        self.store = store
+        self.project_id = project_id
+        self.root = store.project_tree(project_id)
+        self.backend = store.backend(project_id)
+        self.deadline = None if budget_seconds is None else time.monotonic() + budget_seconds
+        self.grace_seconds = grace_seconds
+        self.archive_days = archive_deprecated_days
+        self.state = state
+        self.stats = stats
+        self.now = time.time()
+        self.started = False
+
+    def expired(self) -> bool:
+        # The first unit of every call runs regardless, so even a budget too
+        # small for any real work still moves the cycle forward.
+        if not self.started:
+            self.started = True
+            return False
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def settled(self, mtime: float | None) -> bool:
+        """Old enough to sweep: written before the grace period."""
+        return mtime is not None and self.now - mtime >= self.grace_seconds
+
+    def unlink(self, path: Path, counter: str) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        self.stats[counter] += 1
+        self.stats["bytes_reclaimed"] += size
+
+    def index_entries(self) -> list[dict[str, Any]]:
+        index = self.store.load_index(self.project_id) or self.store.reindex(self.project_id)
+        return list(index.get("nodes", []))
+
+    def archivable(self, node: dict[str, Any], cutoff: float) -> bool:
+        return (deprecated(node) or node.get("visibility") == "deprecated_on_merge") and (
+            _epoch(node.get("updated_at")) or self.now
+        ) < cutoff
+
+    # --- phases: each returns False when the budget ran out mid-phase ------
+
+    def archive(self) -> bool:
+        if self.archive_days is None:
+            return True
+        cutoff = self.now - self.archive_days * 86400
+        candidates = self.state.get("mark")
+        if candidates is None:
+            if self.expired():
+                return False
+            candidates = self.state["mark"] = sorted(
+                str(entry["node_id"])
+                for entry in self.index_entries()
+                if self.archivable(entry, cutoff)
+            )
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        while candidates:
+            if self.expired():
+                return False
+            batch_ids = candidates[:ARCHIVE_BATCH]
+            # The mark may be several calls old: archive only nodes that are
+            # still deprecated (and still exist) now.
+            batch = [
+                node
+                for node in (self.store.load_node(self.project_id, n) for n in batch_ids)
+                if node is not None and self.archivable(node, cutoff)
+            ]
+            if batch:
+                cold = self.root / COLD_DIR
+                cold.mkdir(parents=True, exist_ok=True)
+                sequence = len(self.stats["cold_archives"])
+                path = cold / f"archive-{stamp}-{sequence:04d}.jsonl.gz"
+                while path.exists():  # an earlier call within the same second
+                    sequence += 1
+                    path = cold / f"archive-{stamp}-{sequence:04d}.jsonl.gz"
+                tmp = path.with_name(f".{path.name}.tmp")
+                with gzip.open(tmp, "wt", encoding="utf-8") as out:
+                    export_nodes(self.store, self.project_id, batch, out, reason="gc_deprecated")
+                with tmp.open("rb") as handle:
+                    os.fsync(handle.fileno())
+                os.replace(tmp, path)
+                fsync_dir(cold)
+                # The cold archive is durable before anything is deleted.
+                removed = self.store.delete_nodes(self.project_id, [n["node_id"] for n in batch])
+                self.stats["archived_nodes"] += len(removed)
+                self.stats["cold_archives"].append(path.name)
+            candidates = self.state["mark"] = candidates[ARCHIVE_BATCH:]
+        return True
+
+    def snapshots(self) -> bool:
+        root = snapshots_root(self.store, self.project_id)
+        if not (root / "views").exists():
+            return True
+        if self.expired():
+            return False
+        with snapshot_lock(root):
+            live = live_views(root)
+            views = root / "views"
+            kept: list[str] = []
+            for directory in sorted(views.iterdir()):
+                view_id = directory.name
+                staged = view_id.startswith(".")  # debris of an interrupted snapshot
+                if not staged and view_id in live:
+                    kept.append(view_id)
+                    continue
+                if not self.settled(directory.stat().st_mtime):
+                    if not staged:
+                        kept.append(view_id)
+                    continue
+                size = sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+                shutil.rmtree(directory)
+                self.stats["snapshot_views_removed"] += 1
+                self.stats["bytes_reclaimed"] += size
+            referenced: set[str] = set()
+            for view_id in kept:
+                loaded = load_view(root, view_id)
+                if loaded is None:
+                    return True  # cannot tell what a damaged view uses; keep every object
+                referenced.update(str(digest) for digest in loaded[0]["objects"].values())
+            for path in sorted((root / "objects").rglob("*.json")):
+                if path.stem not in referenced and self.settled(path.stat().st_mtime):
+                    self.unlink(path, "snapshot_objects_removed")
+        return True
+
+    def raw(self) -> bool:
+        if "mark" not in self.state:
+            if self.expired():
+                return False
+            self.state["mark"] = sorted(
+                {
+                    entry["raw_ref"]["sha256"]
+                    for entry in self.index_entries()
+                    if isinstance(entry.get("raw_ref"), dict) and entry["raw_ref"].get("sha256")
+                }
+                | view_raw_refs(self.store, self.project_id)
+            )
+        reachable = set(self.state["mark"])
+        cursor = self.state.get("cursor") or ""
+        for digest in self.backend.raw_digests():
+            if digest <= cursor:
+                continue
+            if self.expired():
+                self.state["cursor"] = cursor or None
+                return False
+            cursor = digest
+            if digest in reachable or not self.settled(self.backend.raw_mtime(digest)):
+                continue
+            self.backend.delete_raw(digest)
+            self.stats["raw_removed"] += 1
+        return True
+
+    def chunks(self) -> bool:
+        if not isinstance(self.backend, FileBackend):
+            return True  # chunked raw storage is a files-layout feature
+        # Mark one manifest per unit. The set is carried in the state, with a
+        # ``mark_cursor`` that is present until every manifest has been read.
+        if "mark" not in self.state or "mark_cursor" in self.state:
+            mark_cursor = self.state.get("mark_cursor", "")
+            referenced = set(self.state.get("mark", []))
+            for digest in self.backend.raw_digests():
+                if digest <= mark_cursor:
+                    continue
+                if self.expired():
+                    self.state.update(mark=sorted(referenced), mark_cursor=mark_cursor)
+                    return False
+                mark_cursor = digest
+                referenced.update(self.backend.manifest_chunks(digest))
+            self.state["mark"] = sorted(referenced)
+            self.state.pop("mark_cursor", None)
+        referenced = set(self.state["mark"])
+        cursor = self.state.get("cursor") or ""
+        for path in self.backend.chunk_files():
+            key = path.relative_to(self.root).as_posix()
+            if key <= cursor:
+                continue
+            if self.expired():
+                self.state["cursor"] = cursor or None
+                return False
+            cursor = key
+            if path.name.split(".", 1)[0] in referenced:
+                continue
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if self.settled(mtime):
+                self.unlink(path, "chunks_removed")
+        return True
+
+    def tmp(self) -> bool:
+        # The cursor is the last directory swept, as a list of path parts ([]
+        # for the tree root), so a one-unit call still moves past the root.
+        saved = self.state.get("cursor")
+        cursor = tuple(saved) if isinstance(saved, list) else None
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()  # deterministic pre-order, so a cursor can resume it
+            key = Path(directory).relative_to(self.root).parts
+            if cursor is not None and key <= cursor:
+                continue
+            if self.expired():
+                return False
+            for name in sorted(filenames):
+                if not (name.startswith(".") and name.endswith(".tmp")):
+                    continue
+                path = Path(directory) / name
+                try:
+                    mtime = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if self.settled(mtime):
+                    self.unlink(path, "tmp_removed")
+            self.state["cursor"] = list(key)
+        return True
+
+
+def collect(
+    store: TreeStore,
+    project_id: str,
+    *,
+    budget_seconds: float | None = None,
+    archive_deprecated_days: int | None = None,
+    grace_seconds: float | None = None,
+) -> dict[str, Any]:
+    """Run (or resume) a collection cycle for *project_id*; return counts.
+
+    ``complete`` is True once the cycle finished; with a budget it may take
+    several calls. ``budget_seconds=None`` runs the whole cycle.
+    """
+    stats: dict[str, Any] = {
+        "project_id": project_id,
+        "status": "ok",
+        "phases": [],
+        "complete": False,
+        "archived_nodes": 0,
+        "cold_archives": [],
+        "raw_removed": 0,
+        "chunks_removed": 0,
+        "tmp_removed": 0,
+        "snapshot_views_removed": 0,
+        "snapshot_objects_removed": 0,
+        "bytes_reclaimed": 0,
+    }
+    root = store.project_tree(project_id)
+    if not root.exists():
+        stats["complete"] = True
+        return stats
+    with _gc_lock(root) as acquired:
+        if not acquired:
+            stats["status"] = "busy"
+            return stats
+        state = _load_state(root)
+        run = _Run(
+            store,
+            project_id,
+            budget_seconds=budget_seconds,
+            grace_seconds=GRACE_SECONDS if grace_seconds is None else grace_seconds,
+            archive_deprecated_days=archive_deprecated_days,
+            state=state,
+            stats=stats,
+        )
+        phases: dict[str, Callable[[], bool]] = {
+            "archive": run.archive,
+            "snapshots": run.snapshots,
+            "raw": run.raw,
+            "chunks": run.chunks,
+            "tmp": run.tmp,
+        }
+        while True:
+            phase = state["phase"]
+            if not phases[phase]():
+                break
+            stats["phases"].append(phase)
+            position = PHASES.index(phase) + 1
+            if position == len(PHASES):
+                stats["complete"] = True
+                state = {
+                    "phase": PHASES[0],
+                    "cursor": None,
+                    "cycle_started_at": now_iso(),
+                    "last_completed_at": now_iso(),
+                }
+                break
+            _next_phase(state, PHASES[position])
+        stats["resume_phase"] = state["phase"]
+        atomic_write_json(root / STATE_NAME, state, fsync=False)
+    return stats
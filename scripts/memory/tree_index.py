@@ -0,0 +1,1084 @@
+"""Ralph Memory Tree index -- entry building and incremental index deltas.
+
+The per-project ``index.json`` is a derived structure: every field in it can be
+recomputed from the node files. Rebuilding it from scratch means re-reading and
+re-validating every node, which is O(n) per write. This module keeps the index
+construction pure (no I/O) so ``TreeStore`` can maintain it incrementally:
+
+  * ``index_entry(node)``      node payload -> lean index entry (scoring payload)
+  * ``entry_tokens(entry)``    posting tokens of an entry
+  * ``match_tokens(grams, s)`` posting tokens containing ``s``, via trigrams
+  * ``facet_ids(index, ...)``  node ids by closed-vocabulary facets
+  * ``window_ids(index, ...)`` node ids whose epoch falls in a time range
+  * ``path_ids(index, paths)`` node ids with a source path at/under a path
+  * ``branch_ids(index, b)``   node ids recall on branch ``b`` may consider
+  * ``EntryFilter``            facet/time/path/entity restrictions, as one
+  * ``build_index(...)``       full index from a list of entries (reindex path)
+  * ``apply_delta(index, d)``  patch ONE entry + its posting-list delta in place
+  * ``check_index(index)``     structural corruption check ("" when healthy)
+  * ``migrate_index(i, load)`` bring an older ``schema_version`` up to date
+
+A delta is a small JSON object, ``{"op": "upsert", "entry": {...}}`` or
+``{"op": "delete", "node_id": "..."}``. ``TreeStore`` appends deltas to an
+index journal and folds them into ``index.json`` at compaction; readers replay
+the journal on top of the base. Every applied delta bumps ``generation`` so
+callers can tell two index states apart without diffing them.
+
+Index layout changes bump ``INDEX_SCHEMA_VERSION`` and register a step in
+``INDEX_MIGRATIONS``; an older index stays readable (``check_index`` accepts
+every version with a migration path) and is migrated when it is next
+compacted or by ``TreeStore.upgrade_index``, so no layout change can leave
+recall on a slow path.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable
+
+# v2: lean entries (detail tier in the node) + trigram lists. v3: facets.
+# v4: per-entry epoch + the sorted timeline. v5: entity index + path trie.
+# v6: branch partitions. v7: per-token scored-field bounds.
+# v8: per-entry precomputed scoring features.
+INDEX_SCHEMA_VERSION = "ralph_memory_tree_index_v8"
+DELTA_OPS = ("upsert", "delete")
+# Perf: the detail tier. Recall never scores or hard-rejects on these, and
+# render_context needs them only for the few nodes it emits, so they stay out
+# of the index (every recall parses every entry) and are read from the node
+# itself -- the backend's keyed node store -- per emitted node.
+# ``detail_bytes`` on each entry records what the index no longer carries.
+DETAIL_FIELDS = ("detailed_summary", "source_description", "workspace_instance_id", "repo_remote_hash")
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_./-]+")
+GRAM = 3
+# Closed-vocabulary entry fields with a value -> sorted node_ids index each.
+FACETS = ("domain", "memory_type", "visibility", "sensitivity")
+# Branch partitions: main_promoted nodes are shared by every branch; entries
+# that predate the visibility field cannot be placed until their node is read.
+MAIN_PARTITION = "*"
+UNKNOWN_PARTITION = "?"
+BRANCH_VISIBILITY = ("branch_local", "merge_candidate")
+# The fields recall_v2.score_node matches query terms in, with the weight each
+# term found there adds and the bit it sets in a token's ``bounds`` mask.
+FIELD_WEIGHTS = {"summary": 5, "trigger": 8, "entity_path": 6}
+FIELD_BITS = {"summary": 1, "trigger": 2, "entity_path": 4}
+ALL_FIELDS = 7
+# ``bounds`` key of entries too thin to tokenize: any term may match anywhere.
+ANY_TOKEN = "*"
+_SCORED_KEYS = ("summary", "trigger", "entities", "source_paths", "topic_tags", "links")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def timestamp_epoch(node: dict[str, Any]) -> int | None:
+    """Epoch seconds of ``updated_at`` (else ``created_at``); None if neither parses."""
+    for key in ("updated_at", "created_at"):
+        try:
+            parsed = datetime.fromisoformat(str(node.get(key)).replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    return None
+
+
+def compact_text(value: object) -> str:
+    return _SPACE_RE.sub(" ", "" if value is None else str(value)).strip().lower()
+
+
+def scoring_haystacks(node: dict[str, Any]) -> dict[str, str]:
+    """Per scored field, the lowercase, whitespace-compacted text
+    ``recall_v2.score_node`` looks query terms up in (dict reprs included)."""
+    trigger = node.get("trigger")
+    entity_path = {
+        "entities": node.get("entities"),
+        "paths": node.get("source_paths"),
+        "tags": node.get("topic_tags"),
+        "links": node.get("links"),
+    }
+    return {
+        "summary": compact_text(node.get("summary")),
+        "trigger": compact_text(trigger if isinstance(trigger, dict) else {}),
+        "entity_path": compact_text(entity_path),
+    }
+
+
+def scoring_features(node: dict[str, Any]) -> dict[str, Any]:
+    """The query-independent inputs of ``recall_v2.score_node`` but the
+    epoch: the ``scoring_haystacks``, the salience total, the link count and
+    the negative_rule flag."""
+    haystacks = scoring_haystacks(node)
+    salience = node.get("salience")
+    links = node.get("links")
+    return {
+        "summary_text": haystacks["summary"],
+        "trigger_text": haystacks["trigger"],
+        "entity_path_text": haystacks["entity_path"],
+        "salience_total": sum(
+            float(v) for v in (salience.values() if isinstance(salience, dict) else ())
+            if isinstance(v, (int, float))
+        ),
+        "link_count": len(links) if isinstance(links, list) else 0,
+        "negative_rule": node.get("memory_type") == "negative_rule",
+    }
+
+
+FEATURE_KEYS = frozenset(scoring_features({}))
+
+
+def entry_epoch(entry: dict[str, Any]) -> int | None:
+    """The precomputed ``epoch`` of an entry; computed for nodes and older entries."""
+    if "epoch" in entry:
+        epoch = entry["epoch"]
+        return epoch if isinstance(epoch, int) and not isinstance(epoch, bool) else None
+    return timestamp_epoch(entry)
+
+
+def entry_features(entry: dict[str, Any]) -> dict[str, Any]:
+    """The precomputed ``features`` of an entry; computed for nodes and older entries."""
+    features = entry.get("features")
+    if isinstance(features, dict) and FEATURE_KEYS <= features.keys():
+        return features
+    return scoring_features(entry)
+
+
+def index_entry(node: dict[str, Any]) -> dict[str, Any]:
+    """Lean scoring entry of *node* (see ``DETAIL_FIELDS`` for what it omits)."""
+    raw_ref = node.get("raw_ref") if isinstance(node.get("raw_ref"), dict) else None
+    ref = {"sha256": raw_ref.get("sha256")} if raw_ref else None
+    entry = {
+        "node_id": node["node_id"],
+        "memory_type": node.get("memory_type", ""),
+        "domain": node.get("domain", "general"),
+        "branch": node.get("branch", ""),
+        "created_on_branch": node.get("created_on_branch", node.get("branch", "")),
+        "visibility": node.get("visibility", "branch_local"),
+        "promotion_status": node.get("promotion_status", "not_promoted"),
+        "summary": node.get("summary", ""),
+        "trigger": node.get("trigger", {}),
+        "topic_tags": node.get("topic_tags", []),
+        "entities": node.get("entities", []),
+        "source_paths": node.get("source_paths", []),
+        "links": node.get("links", []),
+        "quality": node.get("quality", {}),
+        "raw_ref": ref,
+        "updated_at": node.get("updated_at", ""),
+        "created_at": node.get("created_at", ""),
+        # Perf (Addendum 5): the index entry carries EVERY field recall_v2
+        # scores + hard-rejects on, so recall reads index.json once (O(1))
+        # instead of opening all N node files (O(n)). RED never reaches
+        # disk, so none of this leaks secret material.
+        "salience": node.get("salience", {}),
+        "sensitivity": node.get("sensitivity", ""),
+        "authority": node.get("authority", ""),
+        "project_id": node.get("project_id", ""),
+        "commit": node.get("commit", ""),
+        "session_id": node.get("session_id", ""),
+        # Perf: recency scoring and time-range filters read this instead of
+        # parsing the ISO timestamps on every query.
+        "epoch": timestamp_epoch(node),
+    }
+    if not entry["source_paths"] and node.get("source_description"):
+        # Without paths the description IS the provenance hard_reject checks.
+        entry["source_description"] = node["source_description"]
+    # Perf: everything score_node reads besides the query, derived once per
+    # write instead of per query (regexes over the haystacks, salience sums).
+    # Taken from the entry, not the node, so defaults score as they always did.
+    entry["features"] = scoring_features(entry)
+    entry["detail_bytes"] = len(
+        json.dumps([node.get(key, "") for key in DETAIL_FIELDS], ensure_ascii=True)
+    )
+    return entry
+
+
+# Keys every current-layout entry carries (source_description is conditional).
+ENTRY_KEYS = frozenset(index_entry({"node_id": "-"})) - {"source_description"}
+
+
+def stale_entry(entry: dict[str, Any]) -> bool:
+    """True when *entry* predates the current entry layout.
+
+    Thin entries (older builds) lack scoring fields, so recall has to open
+    and validate their node on every query; pre-detail-tier fat entries still
+    carry the detail fields every recall then parses for nothing.
+    """
+    return not ENTRY_KEYS <= entry.keys() or "detailed_summary" in entry
+
+
+def entry_tokens(entry: dict[str, Any]) -> set[str]:
+    """Maximal ``[A-Za-z0-9_./-]`` runs (len>=3) of an entry's searchable text.
+
+    Perf (Addendum 5): these are the posting tokens. They are deliberately
+    NOT stopword/length-filtered the way ``recall_v2.terms`` filters QUERY
+    terms -- recall matches a query term as a SUBSTRING of the node text, and
+    a non-stopword query term can sit inside a stopword run (e.g. ``her`` in
+    ``where``). Indexing every run keeps candidate selection LOSSLESS: any
+    node that ``score_node`` would rank > 0 shares a token here. Runs shorter
+    than 3 chars cannot contain a (>=3 char) query term, so they are skipped.
+    """
+    trigger = entry.get("trigger")
+    trigger_text = " ".join(str(v) for v in trigger.values()) if isinstance(trigger, dict) else str(trigger or "")
+    parts = [
+        str(entry.get("summary", "")),
+        trigger_text,
+        " ".join(str(x) for x in entry.get("entities", []) or []),
+        " ".join(str(x) for x in entry.get("source_paths", []) or []),
+        " ".join(str(x) for x in entry.get("topic_tags", []) or []),
+        " ".join(str(x) for x in entry.get("links", []) or []),
+    ]
+    blob = " ".join(parts).lower()
+    return {tok for tok in _TOKEN_RE.findall(blob) if len(tok) >= 3}
+
+
+def entry_bounds(entry: dict[str, Any]) -> dict[str, int]:
+    """Token -> mask of the scored fields it occurs in, for one entry.
+
+    Tokens are the maximal ``[A-Za-z0-9_./-]`` runs of the haystacks
+    themselves, dict keys and reprs included, so every place a query term can
+    match lies inside one of them. Entries without the scored fields (thin
+    entries, scored from their node) mark every field for every term.
+    """
+    if not all(key in entry for key in _SCORED_KEYS):
+        return {ANY_TOKEN: ALL_FIELDS}
+    bounds: dict[str, int] = {}
+    features = entry_features(entry)
+    for name in FIELD_WEIGHTS:
+        for token in _TOKEN_RE.findall(features[f"{name}_text"]):
+            if len(token) >= GRAM:
+                bounds[token] = bounds.get(token, 0) | FIELD_BITS[name]
+    return bounds
+
+
+def build_bounds(entries: Iterable[dict[str, Any]]) -> dict[str, int]:
+    bounds: dict[str, int] = {}
+    for entry in entries:
+        _add_bounds(bounds, entry)
+    return bounds
+
+
+def term_bound(bounds: dict[str, int], term: str) -> int:
+    """The most *term* can add to ANY node's text score: the weights of every
+    field some token containing it occurs in.
+
+    A per-term upper bound for top-k pruning (recall_v2's MaxScore loop). It
+    never undershoots; after deletes (bounds only grow between rebuilds) it
+    may overshoot, which only prunes less. A term that is not one token of
+    ``GRAM`` or more characters (never one from ``recall_v2.terms``) could
+    hide in text the bounds skip, so it gets every field's weight.
+    """
+    if len(term) < GRAM or not _TOKEN_RE.fullmatch(term):
+        return sum(FIELD_WEIGHTS.values())
+    mask = bounds.get(ANY_TOKEN, 0)
+    for token, bits in bounds.items():
+        if mask == ALL_FIELDS:
+            break
+        if term in token:
+            mask |= bits
+    return sum(weight for name, weight in FIELD_WEIGHTS.items() if mask & FIELD_BITS[name])
+
+
+def build_postings(entries: Iterable[dict[str, Any]]) -> dict[str, list[str]]:
+    postings: dict[str, list[str]] = {}
+    for entry in entries:
+        node_id = entry.get("node_id")
+        if not node_id:
+            continue
+        for tok in entry_tokens(entry):
+            postings.setdefault(tok, []).append(node_id)
+    for tok in postings:
+        postings[tok] = sorted(set(postings[tok]))
+    return postings
+
+
+def token_grams(token: str) -> set[str]:
+    return {token[i : i + GRAM] for i in range(len(token) - GRAM + 1)}
+
+
+def build_trigrams(tokens: Iterable[str]) -> dict[str, list[str]]:
+    """trigram -> sorted posting tokens containing it."""
+    grams: dict[str, list[str]] = {}
+    for tok in tokens:
+        for gram in token_grams(tok):
+            grams.setdefault(gram, []).append(tok)
+    for gram in grams:
+        grams[gram] = sorted(set(grams[gram]))
+    return grams
+
+
+def _contains(tokens: list[str], token: str) -> bool:
+    pos = bisect_left(tokens, token)
+    return pos < len(tokens) and tokens[pos] == token
+
+
+def match_tokens(trigrams: dict[str, list[str]], term: str) -> list[str] | None:
+    """Posting tokens containing *term* as a substring, or None for a term
+    shorter than a trigram (the caller then scans the vocabulary).
+
+    Perf: a token containing *term* contains every trigram of *term*, so the
+    candidates are the tokens of the rarest trigram that also appear in every
+    other trigram's list (bisected, never materialised as sets). The cost
+    follows the rarest trigram, not the vocabulary. Trigrams can co-occur
+    without the term itself (``abcd`` vs ``abc`` + ``bcd`` in ``abcxbcd``),
+    so every survivor is verified with ``in`` -- the result is exactly what a
+    full scan returns.
+    """
+    grams = token_grams(term)
+    if not grams:
+        return None
+    lists = [trigrams.get(gram) for gram in grams]
+    if not all(isinstance(tokens, list) and tokens for tokens in lists):
+        return []
+    lists.sort(key=len)
+    rarest, rest = lists[0], lists[1:]
+    return [
+        tok
+        for tok in rarest
+        if term in tok and all(_contains(tokens, tok) for tokens in rest)
+    ]
+
+
+def build_facets(entries: Iterable[dict[str, Any]]) -> dict[str, dict[str, list[str]]]:
+    facets: dict[str, dict[str, list[str]]] = {facet: {} for facet in FACETS}
+    for entry in entries:
+        node_id = entry.get("node_id")
+        if not node_id:
+            continue
+        for facet in FACETS:
+            facets[facet].setdefault(str(entry.get(facet, "")), []).append(str(node_id))
+    for values in facets.values():
+        for value in values:
+            values[value] = sorted(set(values[value]))
+    return facets
+
+
+def _union(lists: list[list[str]]) -> set[str]:
+    return set().union(*lists) if lists else set()
+
+
+def facet_ids(
+    index: dict[str, Any],
+    include: dict[str, Iterable[str]] | None = None,
+    exclude: dict[str, Iterable[str]] | None = None,
+    within: Iterable[str] | None = None,
+) -> list[str]:
+    """Sorted node ids matching every *include* facet (any of its values) and
+    none of the *exclude* values.
+
+    Perf: works on the per-facet id arrays alone -- the facets are
+    intersected smallest first, so no entry is looked at and nothing is
+    scored before the filter. The ids start as *within* (e.g. a candidate
+    set), else every indexed id.
+    """
+    facets = index.get("facets")
+    if not isinstance(facets, dict):
+        facets = build_facets(index["nodes"])
+    include = {facet: list(values) for facet, values in (include or {}).items()}
+    exclude = {facet: list(values) for facet, values in (exclude or {}).items()}
+    for facet in (*include, *exclude):
+        if facet not in FACETS:
+            raise ValueError(f"unknown facet: {facet!r}")
+    matched: set[str] | None = None if within is None else set(within)
+    groups = sorted(
+        (
+            [facets.get(facet, {}).get(value, []) for value in values]
+            for facet, values in include.items()
+        ),
+        key=lambda lists: sum(len(ids) for ids in lists),
+    )
+    for lists in groups:
+        ids = _union(lists)
+        matched = ids if matched is None else matched & ids
+        if not matched:
+            return []
+    if matched is None:
+        matched = {str(e["node_id"]) for e in index["nodes"]}
+    for facet, values in exclude.items():
+        matched -= _union([facets.get(facet, {}).get(value, []) for value in values])
+    return sorted(matched)
+
+
+def matches_facets(
+    entry: dict[str, Any],
+    include: dict[str, Iterable[str]] | None = None,
+    exclude: dict[str, Iterable[str]] | None = None,
+) -> bool:
+    """``facet_ids`` for one entry or node (the no-index fallback)."""
+    for facet, values in (include or {}).items():
+        if str(entry.get(facet, "")) not in set(values):
+            return False
+    for facet, values in (exclude or {}).items():
+        if str(entry.get(facet, "")) in set(values):
+            return False
+    return True
+
+
+def build_timeline(entries: Iterable[dict[str, Any]]) -> list[list[Any]]:
+    """Sorted ``[epoch, node_id]`` pairs of the entries that have an epoch."""
+    return sorted(
+        [epoch, str(entry["node_id"])]
+        for entry in entries
+        if entry.get("node_id") and (epoch := entry_epoch(entry)) is not None
+    )
+
+
+def window_ids(
+    index: dict[str, Any], since: int | None = None, until: int | None = None
+) -> list[str]:
+    """Sorted node ids whose epoch is in ``[since, until)`` (either end open).
+
+    Perf: two bisections into the timeline; only the ids in range are
+    touched, however many nodes the index holds.
+    """
+    timeline = index.get("timeline")
+    if not isinstance(timeline, list):
+        timeline = build_timeline(index["nodes"])
+    lo = 0 if since is None else bisect_left(timeline, [since])
+    hi = len(timeline) if until is None else bisect_left(timeline, [until])
+    return sorted(node_id for _epoch, node_id in timeline[lo:hi])
+
+
+def in_window(entry: dict[str, Any], since: int | None = None, until: int | None = None) -> bool:
+    """``window_ids`` for one entry or node (the no-index fallback)."""
+    epoch = entry_epoch(entry)
+    if epoch is None:
+        return since is None and until is None
+    return (since is None or epoch >= since) and (until is None or epoch < until)
+
+
+def entry_entities(entry: dict[str, Any]) -> set[str]:
+    entities = entry.get("entities")
+    if not isinstance(entities, list):
+        return set()
+    return {name for item in entities if (name := str(item).strip().lower())}
+
+
+def build_entities(entries: Iterable[dict[str, Any]]) -> dict[str, list[str]]:
+    """lowercased entity -> sorted node_ids naming it."""
+    entities: dict[str, list[str]] = {}
+    for entry in entries:
+        if entry.get("node_id"):
+            for name in entry_entities(entry):
+                entities.setdefault(name, []).append(str(entry["node_id"]))
+    for name in entities:
+        entities[name] = sorted(set(entities[name]))
+    return entities
+
+
+def entity_ids(index: dict[str, Any], names: Iterable[str]) -> list[str]:
+    """Sorted node ids naming any of *names* exactly (case-insensitive)."""
+    entities = index.get("entities")
+    if not isinstance(entities, dict):
+        entities = build_entities(index["nodes"])
+    return sorted(_union([entities.get(str(name).strip().lower(), []) for name in names]))
+
+
+def path_segments(path: object) -> tuple[str, ...]:
+    """Lowercased segments of a source path; ``./``, ``\\`` and repeated or
+    trailing slashes do not matter."""
+    text = str(path).replace("\\", "/").lower()
+    return tuple(seg for seg in text.split("/") if seg and seg != ".")
+
+
+def entry_paths(entry: dict[str, Any]) -> set[tuple[str, ...]]:
+    paths = entry.get("source_paths")
+    if not isinstance(paths, list):
+        return set()
+    return {segs for path in paths if (segs := path_segments(path))}
+
+
+def build_paths(entries: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """Trie over ``source_paths`` segments: ``{"ids": [...], "sub": {seg: node}}``.
+
+    A node's ``ids`` are the entries with exactly that path; a directory's
+    entries are the ids of its whole subtree.
+    """
+    trie: dict[str, Any] = {"ids": [], "sub": {}}
+    for entry in entries:
+        if entry.get("node_id"):
+            _add_paths(trie, entry)
+    return trie
+
+
+def path_ids(index: dict[str, Any], paths: Iterable[str]) -> list[str]:
+    """Sorted node ids with a source path equal to, or under, any of *paths*.
+
+    Perf: O(depth) to reach the file or directory in the trie, then only its
+    subtree is visited -- no entry is read and no path is substring-matched.
+    """
+    trie = index.get("paths")
+    if not isinstance(trie, dict):
+        trie = build_paths(index["nodes"])
+    found: set[str] = set()
+    for path in paths:
+        segs = path_segments(path)
+        node: Any = trie if segs else None
+        for seg in segs:
+            node = node.get("sub", {}).get(seg)
+            if not isinstance(node, dict):
+                break
+        if not isinstance(node, dict):
+            continue
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            found.update(current.get("ids", []))
+            stack.extend(current.get("sub", {}).values())
+    return sorted(found)
+
+
+def partition_of(entry: dict[str, Any]) -> str | None:
+    """The branch partition of *entry*: ``MAIN_PARTITION`` once promoted, its
+    ``branch`` while branch_local or a merge_candidate, None otherwise
+    (conflict / deprecated_on_merge nodes are in no branch's view)."""
+    if "visibility" not in entry:
+        return UNKNOWN_PARTITION
+    visibility = str(entry.get("visibility") or "branch_local")
+    if visibility == "main_promoted":
+        return MAIN_PARTITION
+    if visibility in BRANCH_VISIBILITY:
+        return str(entry.get("branch", ""))
+    return None
+
+
+def build_branches(entries: Iterable[dict[str, Any]]) -> dict[str, list[str]]:
+    """partition -> sorted node_ids (see ``partition_of``)."""
+    branches: dict[str, list[str]] = {}
+    for entry in entries:
+        key = partition_of(entry)
+        if entry.get("node_id") and key is not None:
+            branches.setdefault(key, []).append(str(entry["node_id"]))
+    for key in branches:
+        branches[key] = sorted(set(branches[key]))
+    return branches
+
+
+def branch_ids(index: dict[str, Any], branch: str) -> list[str]:
+    """Sorted node ids in *branch*'s view: main_promoted nodes plus the
+    branch's own branch_local and merge_candidate nodes.
+
+    Perf: a union of three id lists; other branches' nodes are never read.
+    """
+    branches = index.get("branches")
+    if not isinstance(branches, dict):
+        branches = build_branches(index["nodes"])
+    keys = {MAIN_PARTITION, UNKNOWN_PARTITION, branch}
+    return sorted(_union([branches.get(key, []) for key in keys]))
+
+
+def _under(segs: tuple[str, ...], prefixes: list[tuple[str, ...]]) -> bool:
+    return any(prefix and segs[: len(prefix)] == prefix for prefix in prefixes)
+
+
+def _narrow(ids: set[str] | None, found: list[str]) -> set[str]:
+    return set(found) if ids is None else ids & set(found)
+
+
+@dataclass(frozen=True)
+class EntryFilter:
+    """Restrictions on index entries besides the search terms.
+
+    *include* facet values are any-of within a facet and ANDed across facets;
+    *exclude* values drop an entry. *since* / *until* bound its epoch as
+    ``[since, until)``. *paths* keeps entries with a source path at or under
+    any of them (segment-wise); *entities* keeps entries naming any of them.
+    *branch* keeps the entries in that branch's view (``branch_ids``).
+    """
+
+    include: dict[str, list[str]] = field(default_factory=dict)
+    exclude: dict[str, list[str]] = field(default_factory=dict)
+    since: int | None = None
+    until: int | None = None
+    paths: tuple[str, ...] = ()
+    entities: tuple[str, ...] = ()
+    branch: str = ""
+
+    def __post_init__(self) -> None:
+        for facet in (*self.include, *self.exclude):
+            if facet not in FACETS:
+                raise ValueError(f"unknown facet: {facet!r}")
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.include or self.exclude or self.paths or self.entities or self.branch
+            or self.since is not None or self.until is not None
+        )
+
+    def structures(self) -> list[str]:
+        """The derived index keys ``ids`` reads."""
+        keys = []
+        if self.include or self.exclude:
+            keys.append("facets")
+        if self.since is not None or self.until is not None:
+            keys.append("timeline")
+        if self.paths:
+            keys.append("paths")
+        if self.entities:
+            keys.append("entities")
+        if self.branch:
+            keys.append("branches")
+        return keys
+
+    def ids(self, index: dict[str, Any], within: Iterable[str] | None = None) -> list[str]:
+        """Sorted ids passing the filter, out of *within* (default: every entry).
+
+        Perf: each restriction is answered from its derived structure --
+        timeline bisection, trie walk, entity and facet id lists -- so nothing
+        is scored or even read before the candidate set shrinks.
+        """
+        ids = None if within is None else set(within)
+        if self.since is not None or self.until is not None:
+            ids = _narrow(ids, window_ids(index, self.since, self.until))
+        if self.paths:
+            ids = _narrow(ids, path_ids(index, self.paths))
+        if self.entities:
+            ids = _narrow(ids, entity_ids(index, self.entities))
+        if self.branch:
+            ids = _narrow(ids, branch_ids(index, self.branch))
+        if self.include or self.exclude or ids is None:
+            return facet_ids(index, self.include, self.exclude, within=ids)
+        return sorted(ids)
+
+    def matches(self, entry: dict[str, Any]) -> bool:
+        """``ids`` for one entry or node (the no-index fallback)."""
+        if not matches_facets(entry, self.include, self.exclude):
+            return False
+        if (self.since is not None or self.until is not None) and not in_window(
+            entry, self.since, self.until
+        ):
+            return False
+        if self.paths:
+            prefixes = [path_segments(path) for path in self.paths]
+            if not any(_under(segs, prefixes) for segs in entry_paths(entry)):
+                return False
+        if self.entities:
+            wanted = {str(name).strip().lower() for name in self.entities}
+            if not entry_entities(entry) & wanted:
+                return False
+        if self.branch:
+            return partition_of(entry) in (MAIN_PARTITION, UNKNOWN_PARTITION, self.branch)
+        return True
+
+
+def select_entries(index: dict[str, Any], node_ids: Iterable[str]) -> list[dict[str, Any]]:
+    """The entries of *node_ids* (bisected; ids without an entry are skipped)."""
+    nodes: list[dict[str, Any]] = index["nodes"]
+    found: list[dict[str, Any]] = []
+    for node_id in node_ids:
+        pos = _entry_position(nodes, node_id)
+        if pos < len(nodes) and nodes[pos].get("node_id") == node_id:
+            found.append(nodes[pos])
+    return found
+
+
+def build_index(
+    project_id: str, entries: Iterable[dict[str, Any]], generation: int = 0
+) -> dict[str, Any]:
+    """Full index from *entries* (the explicit reindex / corruption path)."""
+    nodes = sorted(
+        (e for e in entries if isinstance(e, dict) and e.get("node_id")),
+        key=lambda e: str(e["node_id"]),
+    )
+    postings = build_postings(nodes)
+    return {
+        "schema_version": INDEX_SCHEMA_VERSION,
+        "project_id": project_id,
+        "generation": generation,
+        "nodes": nodes,
+        # Perf (Addendum 5): inverted index (token -> node_ids) so recall scores
+        # only candidate nodes that share a term with the query, not all N.
+        # Lossless: see entry_tokens. recall falls back to scoring all nodes
+        # when "postings" is absent (older index).
+        "postings": postings,
+        # Perf: trigram -> posting tokens, so a search term's tokens come from
+        # intersecting a few trigram lists (match_tokens) instead of a
+        # substring test against every token in the vocabulary.
+        "trigrams": build_trigrams(postings),
+        # Perf: facet -> value -> sorted node_ids (see facet_ids).
+        "facets": build_facets(nodes),
+        # Perf: [epoch, node_id] sorted by time (see window_ids).
+        "timeline": build_timeline(nodes),
+        # Perf: exact entity lookups and a source-path trie (see path_ids).
+        "entities": build_entities(nodes),
+        "paths": build_paths(nodes),
+        # Perf: branch partitions, so recall on a branch skips the others'.
+        "branches": build_branches(nodes),
+        # Perf: token -> scored-field mask, the per-term score upper bounds
+        # recall prunes its top-k loop with (see term_bound).
+        "bounds": build_bounds(nodes),
+    }
+
+
+def empty_index(project_id: str) -> dict[str, Any]:
+    return build_index(project_id, [], 0)
+
+
+def check_index(index: object) -> str:
+    """Return a corruption reason for *index*, or "" when it is usable.
+
+    Structural only (O(1) in the number of nodes): the expensive cross-check of
+    entries against node files is what ``TreeStore.reindex`` is for.
+    """
+    if not isinstance(index, dict):
+        return "not_an_object"
+    if index.get("schema_version") not in INDEX_SCHEMA_VERSIONS:
+        return "schema_version"
+    generation = index.get("generation", 0)
+    if not isinstance(generation, int) or isinstance(generation, bool) or generation < 0:
+        return "generation"
+    if not isinstance(index.get("nodes"), list):
+        return "nodes"
+    if not isinstance(index.get("postings"), dict):
+        return "postings"
+    for derived in ("trigrams", "facets", "entities", "paths", "branches", "bounds"):
+        if derived in index and not isinstance(index[derived], dict):
+            return derived
+    if "timeline" in index and not isinstance(index["timeline"], list):
+        return "timeline"
+    return ""
+
+
+def normalize_index(index: dict[str, Any]) -> dict[str, Any]:
+    """Make a structurally valid *index* safe for ``apply_delta``.
+
+    Indexes written before deltas existed carry no ``generation`` and list nodes
+    in filename order, which is not always ``node_id`` order. Deltas locate
+    entries by bisection, so malformed entries are dropped and the node list is
+    re-sorted here when needed. Indexes written before trigrams existed get
+    them built from the postings (once; the next commit persists them).
+    """
+    index.setdefault("generation", 0)
+    if not isinstance(index.get("trigrams"), dict):
+        index["trigrams"] = build_trigrams(index["postings"])
+    nodes = [e for e in index["nodes"] if isinstance(e, dict) and e.get("node_id")]
+    ids = [str(e["node_id"]) for e in nodes]
+    if any(a > b for a, b in zip(ids, ids[1:])):
+        nodes.sort(key=lambda e: str(e["node_id"]))
+    index["nodes"] = nodes
+    return index
+
+
+Resolver = Callable[[str], "dict[str, Any] | None"]
+
+
+def upgrade_entries(index: dict[str, Any], resolve: Resolver) -> list[str]:
+    """Rebuild every stale entry from its node; return the upgraded ids.
+
+    *resolve* loads a stored node (None when it cannot be read; that entry is
+    left as it is). Postings and trigrams are rebuilt when anything changed,
+    since a thin entry may never have contributed all of its tokens.
+    """
+    upgraded: list[str] = []
+    nodes: list[dict[str, Any]] = index["nodes"]
+    for pos, entry in enumerate(nodes):
+        if not stale_entry(entry):
+            continue
+        node = resolve(str(entry["node_id"]))
+        if node is not None:
+            nodes[pos] = index_entry(node)
+            upgraded.append(str(entry["node_id"]))
+    if upgraded:
+        index["postings"] = build_postings(nodes)
+        index["trigrams"] = build_trigrams(index["postings"])
+        index["facets"] = build_facets(nodes)
+        index["timeline"] = build_timeline(nodes)
+        index["entities"] = build_entities(nodes)
+        index["paths"] = build_paths(nodes)
+        index["branches"] = build_branches(nodes)
+        index["bounds"] = build_bounds(nodes)
+    return upgraded
+
+
+def _migrate_v1(index: dict[str, Any], resolve: Resolver) -> None:
+    upgrade_entries(index, resolve)
+
+
+def _migrate_v2(index: dict[str, Any], _resolve: Resolver) -> None:
+    index["facets"] = build_facets(index["nodes"])
+
+
+def _migrate_v3(index: dict[str, Any], _resolve: Resolver) -> None:
+    # The timestamps are already in each entry; only thin entries lack them
+    # and those are upgraded from their node anyway.
+    for entry in index["nodes"]:
+        if "updated_at" in entry or "created_at" in entry:
+            entry["epoch"] = timestamp_epoch(entry)
+    index["timeline"] = build_timeline(index["nodes"])
+
+
+def _migrate_v4(index: dict[str, Any], _resolve: Resolver) -> None:
+    index["entities"] = build_entities(index["nodes"])
+    index["paths"] = build_paths(index["nodes"])
+
+
+def _migrate_v5(index: dict[str, Any], _resolve: Resolver) -> None:
+    index["branches"] = build_branches(index["nodes"])
+
+
+def _migrate_v6(index: dict[str, Any], _resolve: Resolver) -> None:
+    index["bounds"] = build_bounds(index["nodes"])
+
+
+def _migrate_v7(index: dict[str, Any], _resolve: Resolver) -> None:
+    # Every scored field is already in each entry; thin entries lack them and
+    # are upgraded from their node anyway.
+    for entry in index["nodes"]:
+        if all(key in entry for key in _SCORED_KEYS):
+            entry["features"] = scoring_features(entry)
+
+
+# schema_version -> (next schema_version, step). A step rewrites a normalised
+# index of its version in place; *resolve* loads a stored node for steps that
+# need data the index does not hold.
+INDEX_MIGRATIONS: dict[str, tuple[str, Callable[[dict[str, Any], Resolver], None]]] = {
+    "ralph_memory_tree_index_v1": ("ralph_memory_tree_index_v2", _migrate_v1),
+    "ralph_memory_tree_index_v2": ("ralph_memory_tree_index_v3", _migrate_v2),
+    "ralph_memory_tree_index_v3": ("ralph_memory_tree_index_v4", _migrate_v3),
+    "ralph_memory_tree_index_v4": ("ralph_memory_tree_index_v5", _migrate_v4),
+    "ralph_memory_tree_index_v5": ("ralph_memory_tree_index_v6", _migrate_v5),
+    "ralph_memory_tree_index_v6": ("ralph_memory_tree_index_v7", _migrate_v6),
+    "ralph_memory_tree_index_v7": ("ralph_memory_tree_index_v8", _migrate_v7),
+}
+INDEX_SCHEMA_VERSIONS = frozenset({INDEX_SCHEMA_VERSION, *INDEX_MIGRATIONS})
+
+
+def migrate_index(index: dict[str, Any], resolve: Resolver) -> list[str]:
+    """Apply migration steps until *index* is at ``INDEX_SCHEMA_VERSION``.
+
+    Returns the versions stepped through (empty when already current).
+    """
+    applied: list[str] = []
+    while index.get("schema_version") != INDEX_SCHEMA_VERSION:
+        step = INDEX_MIGRATIONS.get(str(index.get("schema_version")))
+        if step is None:
+            raise ValueError(f"no index migration from {index.get('schema_version')!r}")
+        target, migrate = step
+        migrate(index, resolve)
+        index["schema_version"] = target
+        applied.append(target)
+    return applied
+
+
+def _entry_position(nodes: list[dict[str, Any]], node_id: str) -> int:
+    return bisect_left(nodes, node_id, key=lambda e: str(e.get("node_id", "")))
+
+
+def _drop_postings(
+    postings: dict[str, list[str]], trigrams: dict[str, list[str]] | None, entry: dict[str, Any]
+) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for tok in entry_tokens(entry):
+        ids = postings.get(tok)
+        if not isinstance(ids, list):
+            continue
+        pos = bisect_left(ids, node_id)
+        if pos < len(ids) and ids[pos] == node_id:
+            del ids[pos]
+        if not ids:
+            del postings[tok]
+            if trigrams is not None:
+                _drop_token(trigrams, tok)
+
+
+def _add_postings(
+    postings: dict[str, list[str]], trigrams: dict[str, list[str]] | None, entry: dict[str, Any]
+) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for tok in entry_tokens(entry):
+        if tok not in postings and trigrams is not None:
+            _add_token(trigrams, tok)
+        ids = postings.setdefault(tok, [])
+        pos = bisect_left(ids, node_id)
+        if pos == len(ids) or ids[pos] != node_id:
+            insort(ids, node_id)
+
+
+def _drop_token(trigrams: dict[str, list[str]], token: str) -> None:
+    for gram in token_grams(token):
+        tokens = trigrams.get(gram)
+        if not isinstance(tokens, list):
+            continue
+        pos = bisect_left(tokens, token)
+        if pos < len(tokens) and tokens[pos] == token:
+            del tokens[pos]
+        if not tokens:
+            del trigrams[gram]
+
+
+def _add_token(trigrams: dict[str, list[str]], token: str) -> None:
+    for gram in token_grams(token):
+        tokens = trigrams.setdefault(gram, [])
+        if not _contains(tokens, token):
+            insort(tokens, token)
+
+
+def _drop_facets(facets: dict[str, Any], entry: dict[str, Any]) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for facet in FACETS:
+        values = facets.get(facet)
+        ids = values.get(str(entry.get(facet, ""))) if isinstance(values, dict) else None
+        if not isinstance(ids, list):
+            continue
+        pos = bisect_left(ids, node_id)
+        if pos < len(ids) and ids[pos] == node_id:
+            del ids[pos]
+        if not ids:
+            del values[str(entry.get(facet, ""))]
+
+
+def _add_facets(facets: dict[str, Any], entry: dict[str, Any]) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for facet in FACETS:
+        ids = facets.setdefault(facet, {}).setdefault(str(entry.get(facet, "")), [])
+        if not _contains(ids, node_id):
+            insort(ids, node_id)
+
+
+def _drop_timeline(timeline: list[list[Any]], entry: dict[str, Any]) -> None:
+    epoch = entry_epoch(entry)
+    if epoch is None:
+        return
+    item = [epoch, str(entry.get("node_id", ""))]
+    pos = bisect_left(timeline, item)
+    if pos < len(timeline) and timeline[pos] == item:
+        del timeline[pos]
+
+
+def _add_timeline(timeline: list[list[Any]], entry: dict[str, Any]) -> None:
+    epoch = entry_epoch(entry)
+    if epoch is None:
+        return
+    item = [epoch, str(entry.get("node_id", ""))]
+    pos = bisect_left(timeline, item)
+    if pos == len(timeline) or timeline[pos] != item:
+        timeline.insert(pos, item)
+
+
+def _drop_keyed(mapping: dict[str, list[str]], keys: Iterable[str], node_id: str) -> None:
+    """Remove *node_id* from each key's sorted id list (dropping emptied keys)."""
+    for key in keys:
+        ids = mapping.get(key)
+        if not isinstance(ids, list):
+            continue
+        pos = bisect_left(ids, node_id)
+        if pos < len(ids) and ids[pos] == node_id:
+            del ids[pos]
+        if not ids:
+            del mapping[key]
+
+
+def _add_keyed(mapping: dict[str, list[str]], keys: Iterable[str], node_id: str) -> None:
+    for key in keys:
+        ids = mapping.setdefault(key, [])
+        if not _contains(ids, node_id):
+            insort(ids, node_id)
+
+
+def _partition_keys(entry: dict[str, Any]) -> list[str]:
+    key = partition_of(entry)
+    return [] if key is None else [key]
+
+
+def _add_bounds(bounds: dict[str, int], entry: dict[str, Any]) -> None:
+    for token, bits in entry_bounds(entry).items():
+        bounds[token] = bounds.get(token, 0) | bits
+
+
+def _add_paths(trie: dict[str, Any], entry: dict[str, Any]) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for segs in entry_paths(entry):
+        node = trie
+        for seg in segs:
+            node = node.setdefault("sub", {}).setdefault(seg, {"ids": [], "sub": {}})
+        ids = node.setdefault("ids", [])
+        if not _contains(ids, node_id):
+            insort(ids, node_id)
+
+
+def _drop_paths(trie: dict[str, Any], entry: dict[str, Any]) -> None:
+    node_id = str(entry.get("node_id", ""))
+    for segs in entry_paths(entry):
+        _drop_path(trie, segs, node_id)
+
+
+def _drop_path(node: dict[str, Any], segs: tuple[str, ...], node_id: str) -> bool:
+    """Remove *node_id* at *segs* below *node*; True when *node* is left empty
+    (the caller prunes it, so the trie never keeps dead branches)."""
+    if segs:
+        sub = node.get("sub", {})
+        child = sub.get(segs[0])
+        if isinstance(child, dict) and _drop_path(child, segs[1:], node_id):
+            del sub[segs[0]]
+    else:
+        ids = node.get("ids", [])
+        pos = bisect_left(ids, node_id)
+        if pos < len(ids) and ids[pos] == node_id:
+            del ids[pos]
+    return not node.get("ids") and not node.get("sub")
+
+
+def apply_delta(index: dict[str, Any], delta: dict[str, Any]) -> None:
+    """Patch *index* in place with one delta and bump its generation.
+
+    Only the touched entry and the tokens it gained or lost are visited, so the
+    cost is independent of how many nodes the project holds. Replaying the same
+    delta twice converges to the same state (an upsert of an identical entry is
+    a no-op on the postings; deleting an absent id does nothing), which lets a
+    compaction that crashed half-way be replayed safely.
+    """
+    op = delta.get("op")
+    if op not in DELTA_OPS:
+        raise ValueError(f"unknown index delta op: {op!r}")
+    nodes: list[dict[str, Any]] = index["nodes"]
+    postings: dict[str, list[str]] = index["postings"]
+    trigrams = index.get("trigrams") if isinstance(index.get("trigrams"), dict) else None
+    facets = index.get("facets") if isinstance(index.get("facets"), dict) else None
+    timeline = index.get("timeline") if isinstance(index.get("timeline"), list) else None
+    entities = index.get("entities") if isinstance(index.get("entities"), dict) else None
+    paths = index.get("paths") if isinstance(index.get("paths"), dict) else None
+    branches = index.get("branches") if isinstance(index.get("branches"), dict) else None
+    bounds = index.get("bounds") if isinstance(index.get("bounds"), dict) else None
+    if op == "upsert":
+        entry = delta.get("entry")
+        if not isinstance(entry, dict) or not entry.get("node_id"):
+            raise ValueError("upsert delta needs an entry with a node_id")
+        node_id = str(entry["node_id"])
+    else:
+        entry = None
+        node_id = str(delta.get("node_id") or "")
+        if not node_id:
+            raise ValueError("delete delta needs a node_id")
+
+    pos = _entry_position(nodes, node_id)
+    current = nodes[pos] if pos < len(nodes) and nodes[pos].get("node_id") == node_id else None
+    if current is not None:
+        _drop_postings(postings, trigrams, current)
+        if facets is not None:
+            _drop_facets(facets, current)
+        if timeline is not None:
+            _drop_timeline(timeline, current)
+        if entities is not None:
+            _drop_keyed(entities, entry_entities(current), node_id)
+        if paths is not None:
+            _drop_paths(paths, current)
+        if branches is not None:
+            _drop_keyed(branches, _partition_keys(current), node_id)
+        del nodes[pos]
+    if entry is not None:
+        nodes.insert(pos, entry)
+        _add_postings(postings, trigrams, entry)
+        if facets is not None:
+            _add_facets(facets, entry)
+        if timeline is not None:
+            _add_timeline(timeline, entry)
+        if entities is not None:
+            _add_keyed(entities, entry_entities(entry), node_id)
+        if paths is not None:
+            _add_paths(paths, entry)
+        if branches is not None:
+            _add_keyed(branches, _partition_keys(entry), node_id)
+        if bounds is not None:
+            _add_bounds(bounds, entry)  # never lowered: a stale bound only prunes less
+    index["generation"] = int(index.get("generation", 0)) + 1
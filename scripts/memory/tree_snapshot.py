@@ -0,0 +1,420 @@
+"""Ralph Memory Tree snapshots -- copy-on-write views keyed by branch or commit.
+
+A project tree is one mutable directory shared by every worktree. A snapshot
+freezes it: teammates on other worktrees read a consistent view (index and
+node bodies from the same moment) while the live tree keeps changing.
+
+    {project_tree}/snapshots/
+        refs/<kind>-<name>.json   current view of ``branch`` / ``commit`` <name>
+        views/<view_id>/
+            snapshot.json         metadata + node_id -> object digest map
+            index.json            the frozen index
+        objects/ab/<sha>.json     node bodies, hard-linked from nodes/
+        HEAD.json                 newest view; parent of the next snapshot
+
+Copy-on-write: node files are only ever replaced (mkstemp + os.replace),
+never rewritten in place, so a hard link keeps the version it was taken
+from. Objects are content addressed (sha256 of the file bytes) and shared by
+every view that contains that version.
+
+O(changed): a new view starts from the newest one. Only nodes whose index
+entry differs from the parent's (``updated_at`` is part of the entry) are
+linked and hashed; every other node reuses the parent's object, and the
+parent's index is patched with ``tree_index.apply_delta`` rather than
+rebuilt. The first snapshot of a tree links every node once. Backends that
+keep no per-node files (``segments``, ``sqlite``) get a copy of the node
+body instead of a link.
+
+Each view keeps the index generation it was frozen at; it never changes, so
+``(ref, generation)`` names a view exactly. A commit snapshot is immutable
+and taken once; a branch snapshot is re-taken on request and its ref moves
+to the new view. Superseded views, and objects no view lists, stay on disk
+until ``tree_gc`` sweeps them after its grace period, so a reader holding an
+old view is not cut off mid-read. Raw blobs are not copied: they are
+content addressed already, and ``tree_gc`` treats the ``raw_ref`` of every
+view as reachable.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
+
+if __package__:
+    from .memory_node import MemoryNode, MemoryNodeValidationError
+    from .tree_index import apply_delta, check_index, empty_index, index_entry, normalize_index
+    from .tree_store import (
+        TreeStore,
+        TreeStoreError,
+        atomic_write_json,
+        ensure_within,
+        fsync_dir,
+        now_iso,
+        shard_dirs,
+    )
+else:  # pragma: no cover - script-style import support.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from memory_node import MemoryNode, MemoryNodeValidationError
+    from tree_index import apply_delta, check_index, empty_index, index_entry, normalize_index
+    from tree_store import (
+        TreeStore,
+        TreeStoreError,
+        atomic_write_json,
+        ensure_within,
+        fsync_dir,
+        now_iso,
+        shard_dirs,
+    )
+
+SNAPSHOT_SCHEMA_VERSION = "ralph_tree_snapshot_v1"
+SNAPSHOTS_DIR = "snapshots"
+OBJECT_SHARD_LEVELS = 1
+LOCK_NAME = ".lock"
+
+
+# --- paths -----------------------------------------------------------------
+
+
+def snapshots_root(store: TreeStore, project_id: str) -> Path:
+    return store.project_tree(project_id) / SNAPSHOTS_DIR
+
+
+def _ref_key(branch: str | None, commit: str | None) -> tuple[str, str]:
+    if (branch is None) == (commit is None):
+        raise TreeStoreError("a snapshot is keyed by exactly one of branch or commit")
+    kind, name = ("branch", branch) if branch is not None else ("commit", commit)
+    if not isinstance(name, str) or not name.strip() or any(ord(c) < 32 for c in name):
+        raise TreeStoreError(f"invalid snapshot {kind} name: {name!r}")
+    return kind, name
+
+
+def _ref_path(root: Path, kind: str, name: str) -> Path:
+    # Branch names contain "/"; quoting keeps every ref one flat file.
+    return ensure_within(root / "refs", root / "refs" / f"{kind}-{quote(name, safe='')}.json")
+
+
+def _object_path(root: Path, digest: str) -> Path:
+    return root / "objects" / Path(*shard_dirs(digest, OBJECT_SHARD_LEVELS)) / f"{digest}.json"
+
+
+@contextmanager
+def snapshot_lock(root: Path) -> Iterator[None]:
+    """Exclusive lock over refs, views and objects (snapshot creation and the
+    ``tree_gc`` snapshot sweep)."""
+    root.mkdir(parents=True, exist_ok=True)
+    fd = os.open(root / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the flock
+
+
+def _read_json(path: Path) -> dict[str, Any] | None:
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def load_view(root: Path, view_id: object) -> tuple[dict[str, Any], dict[str, Any]] | None:
+    """``(metadata, index)`` of a view, or None when missing or damaged.
+    ``metadata["objects"]`` maps each node id to its object digest."""
+    if not isinstance(view_id, str) or not view_id or "/" in view_id or view_id.startswith("."):
+        return None
+    directory = root / "views" / view_id
+    meta = _read_json(directory / "snapshot.json")
+    index = _read_json(directory / "index.json")
+    if (
+        meta is None
+        or meta.get("schema_version") != SNAPSHOT_SCHEMA_VERSION
+        or not isinstance(meta.get("objects"), dict)
+        or index is None
+        or check_index(index)
+    ):
+        return None
+    return meta, normalize_index(index)
+
+
+def _superseded(root: Path, view_id: object) -> None:
+    """Start the ``tree_gc`` grace period of a view its ref just left: the
+    sweep ages views by mtime, and readers may still hold this one."""
+    if isinstance(view_id, str) and view_id and "/" not in view_id:
+        try:
+            os.utime(root / "views" / view_id)
+        except OSError:
+            pass
+
+
+# --- capture ---------------------------------------------------------------
+
+
+def _capture(
+    store: TreeStore, project_id: str, root: Path, node_id: str
+) -> tuple[str, dict[str, Any]] | None:
+    """Freeze the current version of one node as an object; return its digest
+    and validated payload, or None when the node is gone or invalid."""
+    backend = store.backend(project_id)
+    objects = root / "objects"
+    objects.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{node_id}.", suffix=".tmp", dir=objects)
+    os.close(fd)
+    tmp = Path(tmp_name)
+    try:
+        tmp.unlink()
+        if backend.link_node(node_id, tmp):
+            data = tmp.read_bytes()  # the link pins this version
+        else:
+            payload = backend.read_node(node_id)
+            if payload is None:
+                return None
+            data = (json.dumps(payload, ensure_ascii=True, indent=2, sort_keys=True) + "\n").encode()
+            tmp.write_bytes(data)
+        try:
+            node = MemoryNode.from_dict(json.loads(data)).to_dict()
+        except (ValueError, MemoryNodeValidationError):
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = _object_path(root, digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, path)
+        return digest, node
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def create_snapshot(
+    store: TreeStore,
+    project_id: str,
+    *,
+    branch: str | None = None,
+    commit: str | None = None,
+) -> dict[str, Any]:
+    """Snapshot the live tree under a branch or commit ref; return its metadata.
+
+    A commit that already has a snapshot returns the existing one
+    (``created`` is False). ``changed`` counts the nodes captured for this
+    view; the rest were shared with the parent view.
+    """
+    kind, name = _ref_key(branch, commit)
+    root = snapshots_root(store, project_id)
+    if not store.project_tree(project_id).exists():
+        raise TreeStoreError(f"no memory tree for project {project_id}")
+    with snapshot_lock(root):
+        ref_path = _ref_path(root, kind, name)
+        ref = _read_json(ref_path)
+        if kind == "commit" and ref is not None and load_view(root, ref.get("view")) is not None:
+            return {**ref, "created": False}
+        live = store.load_index(project_id) or store.reindex(project_id)
+        head = _read_json(root / "HEAD.json") or {}
+        parent = load_view(root, head.get("view"))
+        if parent is None:
+            parent_id, objects, index = None, {}, empty_index(project_id)
+        else:
+            parent_id = head["view"]
+            objects, index = dict(parent[0]["objects"]), parent[1]
+        parent_entries = {str(e["node_id"]): e for e in index["nodes"]}
+        current = {str(e["node_id"]): e for e in live.get("nodes", []) if e.get("node_id")}
+
+        changed = deleted = 0
+        for node_id in sorted(current):
+            if node_id in objects and parent_entries.get(node_id) == current[node_id]:
+                continue
+            captured = _capture(store, project_id, root, node_id)
+            if captured is None:
+                current.pop(node_id)
+                continue
+            objects[node_id], node = captured
+            # The entry comes from the captured body, so the view's index and
+            # its nodes agree even if the live node moved on meanwhile.
+            apply_delta(index, {"op": "upsert", "entry": index_entry(node)})
+            changed += 1
+        for node_id in sorted(set(objects) - set(current)):
+            objects.pop(node_id)
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            deleted += 1
+        fsync_dir(root / "objects")
+
+        generation = int(live.get("generation", 0))
+        index.update(project_id=project_id, generation=generation)
+        view_id = f"{generation:010d}-{os.urandom(4).hex()}"
+        meta = {
+            "schema_version": SNAPSHOT_SCHEMA_VERSION,
+            "project_id": project_id,
+            "kind": kind,
+            "name": name,
+            "view": view_id,
+            "parent": parent_id,
+            "generation": generation,
+            "created_at": now_iso(),
+            "nodes": len(objects),
+            "changed": changed,
+            "deleted": deleted,
+        }
+        # Build the view under a dot-name and publish it with one rename.
+        views = root / "views"
+        staging = views / f".{view_id}.tmp"
+        staging.mkdir(parents=True)
+        try:
+            atomic_write_json(staging / "index.json", index)
+            atomic_write_json(staging / "snapshot.json", {**meta, "objects": objects})
+            os.replace(staging, views / view_id)
+        finally:
+            if staging.exists():
+                shutil.rmtree(staging)
+        fsync_dir(views)
+        atomic_write_json(ref_path, meta)
+        atomic_write_json(root / "HEAD.json", {"view": view_id})
+        if ref is not None:
+            _superseded(root, ref.get("view"))
+    return {**meta, "created": True}
+
+
+# --- reading ---------------------------------------------------------------
+
+
+class SnapshotView:
+    """Read-only, consistent view of a project tree as of one snapshot.
+
+    Mirrors the read side of ``TreeStore`` for one project. The view never
+    changes after it is opened, even if its ref is re-taken meanwhile.
+    """
+
+    def __init__(
+        self, store: TreeStore, project_id: str, root: Path, meta: dict[str, Any], index: dict[str, Any]
+    ) -> None:
+        self.store = store
+        self.project_id = project_id
+        self.root = root
+        self.meta = {k: v for k, v in meta.items() if k != "objects"}
+        self._objects: dict[str, str] = meta["objects"]
+        self._index = index
+
+    @property
+    def generation(self) -> int:
+        return int(self.meta["generation"])
+
+    def load_index(self) -> dict[str, Any]:
+        return json.loads(json.dumps(self._index))  # callers may mutate their copy
+
+    def node_ids(self) -> list[str]:
+        return sorted(self._objects)
+
+    def load_node(self, node_id: str) -> dict[str, Any] | None:
+        digest = self._objects.get(node_id)
+        if digest is None:
+            return None
+        payload = _read_json(_object_path(self.root, digest))
+        if payload is None:
+            return None
+        try:
+            return MemoryNode.from_dict(payload).to_dict()
+        except MemoryNodeValidationError:
+            return None
+
+    def list_nodes(self) -> list[dict[str, Any]]:
+        nodes = (self.load_node(node_id) for node_id in self.node_ids())
+        return [index_entry(node) for node in nodes if node is not None]
+
+    def read_raw(self, digest: str) -> str | None:
+        return self.store.read_raw(self.project_id, digest)
+
+    def iter_raw(self, digest: str) -> Iterator[str] | None:
+        return self.store.iter_raw(self.project_id, digest)
+
+
+def open_snapshot(
+    store: TreeStore,
+    project_id: str,
+    *,
+    branch: str | None = None,
+    commit: str | None = None,
+) -> SnapshotView | None:
+    """The current view of a branch or commit ref, or None when there is none."""
+    kind, name = _ref_key(branch, commit)
+    root = snapshots_root(store, project_id)
+    ref = _read_json(_ref_path(root, kind, name))
+    loaded = None if ref is None else load_view(root, ref.get("view"))
+    if loaded is None:
+        return None
+    return SnapshotView(store, project_id, root, *loaded)
+
+
+def list_snapshots(store: TreeStore, project_id: str) -> list[dict[str, Any]]:
+    """Metadata of every ref, ordered by kind and name."""
+    refs = snapshots_root(store, project_id) / "refs"
+    if not refs.exists():
+        return []
+    found = (_read_json(path) for path in refs.glob("*.json") if not path.name.startswith("."))
+    return sorted(
+        (ref for ref in found if ref is not None), key=lambda r: (str(r.get("kind")), str(r.get("name")))
+    )
+
+
+def delete_snapshot(
+    store: TreeStore,
+    project_id: str,
+    *,
+    branch: str | None = None,
+    commit: str | None = None,
+) -> bool:
+    """Drop a ref. Its view and objects are reclaimed later by ``tree_gc``."""
+    kind, name = _ref_key(branch, commit)
+    root = snapshots_root(store, project_id)
+    with snapshot_lock(root):
+        path = _ref_path(root, kind, name)
+        if not path.exists():
+            return False
+        ref = _read_json(path)
+        path.unlink()
+        fsync_dir(path.parent)
+        if ref is not None:
+            _superseded(root, ref.get("view"))
+    return True
+
+
+# --- garbage collection support ------------------------------------------
+
+
+def live_views(root: Path) -> set[str]:
+    """Views a ref or HEAD still points at."""
+    pointers = [_read_json(path) for path in (root / "refs").glob("*.json")]
+    pointers.append(_read_json(root / "HEAD.json"))
+    return {str(p["view"]) for p in pointers if p is not None and p.get("view")}
+
+
+def view_ids(root: Path) -> list[str]:
+    views = root / "views"
+    if not views.exists():
+        return []
+    return sorted(p.name for p in views.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def view_raw_refs(store: TreeStore, project_id: str) -> set[str]:
+    """Raw digests referenced by any view still on disk."""
+    root = snapshots_root(store, project_id)
+    digests: set[str] = set()
+    for view_id in view_ids(root):
+        loaded = load_view(root, view_id)
+        if loaded is None:
+            continue
+        for entry in loaded[1]["nodes"]:
+            raw_ref = entry.get("raw_ref")
+            if isinstance(raw_ref, dict) and raw_ref.get("sha256"):
+                digests.add(str(raw_ref["sha256"]))
+    return digests
@@ -5,12 +5,29 @@ Ported and adapted from codex-ralph-vault-loop/scripts/memory/tree_store.py.
 Adaptation notes vs. the codex original:
   * Layout follows the Ralph B2 spec exactly:
         ~/.ralph/memory_tree/projects/{project_id}/
-            nodes/        one *.json per node
-            raw/          *.txt named by sha256 of content
-            index.json    node_id -> metadata (no raw bodies)
-            usage.jsonl   append-only event log
-    (codex nested ``memory_tree`` under each project and carried snapshot /
-    links machinery; those are out of B2 scope and were dropped.)
+            nodes/        one *.json per node (sharded: nodes/ab/cd/<id>.json)
+            raw/          <sha>.manifest per blob (sharded: raw/ab/) listing
+                          compressed, deduplicated chunks in raw/chunks/
+                          (see ``raw_store``; legacy <sha>.txt still read)
+            index.json    node_id -> metadata (no raw bodies); ``index.bin``
+                          instead when layout.json says ``"index": "binary"``
+                          (compact and mmap-able, see ``binary_index``)
+            index-journal.jsonl  index deltas not yet folded into index.json
+            index-upgrade.json   stale (thin) entries recall noticed; the
+                          next writes rebuild them in batches
+            usage.jsonl   append-only event log (active segment; closed
+                          segments rotate to usage-NNNNNN.jsonl[.gz])
+            snapshots/    copy-on-write views keyed by branch or commit
+                          (see ``tree_snapshot``)
+    (codex nested ``memory_tree`` under each project and carried links
+    machinery; that is out of B2 scope and was dropped. Its snapshots came
+    back as hard-linked copy-on-write views.)
+  * Storage is pluggable per project: ``layout.json`` names the backend
+    (``files`` above; ``segments`` -- nodes appended to log segments, see
+    ``segment_backend``; or ``sqlite`` -- one ``tree.sqlite3`` database, see
+    ``sqlite_backend``). Trees without the marker are ``files``. Callers only
+    ever talk to ``TreeStore``; ``convert_backend`` (``tree_admin convert``)
+    moves an existing tree between backends.
   * ``compute_project_id(repo_root)`` derives the project id from the git
     remote URL hash + the MAIN-REPO directory name. Worktrees are unwrapped to
     their main repository first (Addendum 2, 2026-06-17), so every worktree of
@@ -24,9 +41,20 @@ Adaptation notes vs. the codex original:
 
 Safety invariants:
   * Atomic writes: mkstemp + fsync + os.replace, with a directory fsync.
+    The index journal and the usage log are the append-only exceptions: each
+    append is a single fsynced write, and a torn index-journal tail forces a
+    full ``reindex``. That is ``strict`` durability (the default); bulk tools
+    opt into ``batched``, where files are still replaced atomically but the
+    fsyncs are traded for one group-committed write-ahead log
+    (``write_ahead``), checkpointed per group and at exit. A crashed
+    writer's log is replayed by the next writer, never by a reader.
+  * Multi-writer: every read-modify-write of the index (journal append,
+    compaction, reindex) holds an exclusive ``flock`` on ``.index.lock``;
+    index reads hold it shared. Any number of processes may share a tree.
   * ``safe_segment`` rejects ``/``, ``\\``, ``..``, and empty segments.
   * ``ensure_within`` proves every resolved path stays under the tree root.
-  * RED material can never be written to ``raw/`` (save_raw rejects it) and is
+  * RED material can never be written to ``raw/`` (save_raw rejects it, chunk
+    by chunk and across chunk boundaries, before the chunk is written) and is
     re-checked on read (read_raw returns None for tampered RED content).
   * ``load_node`` returns None for missing/corrupt/invalid files; never raises
     on a bad file.
@@ -34,19 +62,30 @@ Safety invariants:
 
 from __future__ import annotations
 
+import hashlib
+import importlib
+import itertools
 import json
 import os
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
+from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Iterator
+from typing import IO, Any, Iterable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
 
 # Make sibling modules importable both as a package and as loose scripts.
 if __package__:
+    from .binary_index import BinaryIndex, BinaryIndexError, encode_index, intact
     from .memory_node import (
         MemoryNode,
         MemoryNodeValidationError,
@@ -54,8 +93,48 @@ if __package__:
         sha256_text,
         validate_node,
     )
+    from .raw_store import (
+        CHUNK_SHARD_LEVELS,
+        CHUNKS_DIR,
+        CODECS,
+        LEGACY_SUFFIX,
+        MANIFEST_SUFFIX,
+        READ_ERRORS,
+        ChunkReader,
+        build_manifest,
+        chunk_id,
+        chunk_text,
+        compress_chunk,
+        default_codec,
+        iter_text_pieces,
+        load_manifest,
+        red_gated,
+        write_chunk_file,
+    )
+    from .tree_index import (
+        EntryFilter,
+        INDEX_SCHEMA_VERSION,
+        apply_delta,
+        build_bounds,
+        build_index,
+        build_trigrams,
+        check_index,
+        empty_index,
+        entry_bounds,
+        entry_tokens,
+        index_entry,
+        match_tokens,
+        migrate_index,
+        normalize_index,
+        select_entries,
+        stale_entry,
+        upgrade_entries,
+    )
+    from .usage_log import UsageLog
+    from .write_ahead import GROUP_MAX_RECORDS, WriteAheadLog
 else:  # pragma: no cover - script-style import support.
     sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from binary_index import BinaryIndex, BinaryIndexError, encode_index, intact
     from memory_node import (
         MemoryNode,
         MemoryNodeValidationError,
@@ -63,10 +142,65 @@ else:  # pragma: no cover - script-style import support.
         sha256_text,
         validate_node,
     )
+    from raw_store import (
+        CHUNK_SHARD_LEVELS,
+        CHUNKS_DIR,
+        CODECS,
+        LEGACY_SUFFIX,
+        MANIFEST_SUFFIX,
+        READ_ERRORS,
+        ChunkReader,
+        build_manifest,
+        chunk_id,
+        chunk_text,
+        compress_chunk,
+        default_codec,
+        iter_text_pieces,
+        load_manifest,
+        red_gated,
+        write_chunk_file,
+    )
+    from tree_index import (
+        EntryFilter,
+        INDEX_SCHEMA_VERSION,
+        apply_delta,
+        build_bounds,
+        build_index,
+        build_trigrams,
+        check_index,
+        empty_index,
+        entry_bounds,
+        entry_tokens,
+        index_entry,
+        match_tokens,
+        migrate_index,
+        normalize_index,
+        select_entries,
+        stale_entry,
+        upgrade_entries,
+    )
+    from usage_log import UsageLog
+    from write_ahead import GROUP_MAX_RECORDS, WriteAheadLog
 
 ALLOWED_RAW_SENSITIVITY = {"GREEN", "YELLOW"}
-INDEX_SCHEMA_VERSION = "ralph_memory_tree_index_v1"
+# The index journal is folded into index.json once it grows past this size, so
+# a reader never replays more than a bounded number of deltas.
+INDEX_JOURNAL_MAX_BYTES = 512 * 1024
+INDEX_LOCK_NAME = ".index.lock"
+# Stale index entries recall had to resolve from node files, and how many of
+# them each index write rebuilds on the side.
+UPGRADE_NAME = "index-upgrade.json"
+UPGRADE_BATCH = 200
+# On-disk format of the base index: ``index.json`` (the original) or the
+# mmap-able ``index.bin`` (see ``binary_index``). Recorded in layout.json.
+INDEX_FORMATS = ("json", "binary")
+DEFAULT_INDEX_FORMAT = "json"
 SHA256_RE = re.compile(r"[a-f0-9]{64}")
+# Sharded layout fan-out: nodes/ab/cd/<id>.json (ab/cd from sha256(node_id)),
+# raw/ab/<sha>.txt (ab from the digest itself).
+NODE_SHARD_LEVELS = 2
+RAW_SHARD_LEVELS = 1
+_SHARD_GLOB = "[0-9a-f][0-9a-f]"
 
 
 class TreeStoreError(ValueError):
@@ -241,18 +375,24 @@ def fsync_dir(path: Path) -> None:
         os.close(fd)
 
 
-def atomic_write_text(path: Path, text: str) -> None:
+def atomic_write_text(path: Path, text: str, *, fsync: bool = True) -> None:
+    atomic_write_bytes(path, text.encode("utf-8"), fsync=fsync)
+
+
+def atomic_write_bytes(path: Path, data: bytes, *, fsync: bool = True) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     ensure_within(path.parent, path)
     fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
     tmp_path = Path(tmp_name)
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as handle:
-            handle.write(text)
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
             handle.flush()
-            os.fsync(handle.fileno())
+            if fsync:
+                os.fsync(handle.fileno())
         os.replace(tmp_path, path)
-        fsync_dir(path.parent)
+        if fsync:
+            fsync_dir(path.parent)
     finally:
         try:
             tmp_path.unlink()
@@ -260,38 +400,921 @@ def atomic_write_text(path: Path, text: str) -> None:
             pass
 
 
-def atomic_write_json(path: Path, payload: dict[str, Any]) -> None:
+def append_text_durable(path: Path, text: str, *, fsync: bool = True) -> None:
+    """Append *text* with a single write and fsync it (the journal write path)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ensure_within(path.parent, path)
+    with path.open("a", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        if fsync:
+            os.fsync(handle.fileno())
+
+
+def _ends_with(path: Path, suffix: bytes) -> bool:
+    try:
+        with path.open("rb") as handle:
+            handle.seek(0, os.SEEK_END)
+            size = handle.tell()
+            if size < len(suffix):
+                return False
+            handle.seek(size - len(suffix))
+            return handle.read() == suffix
+    except OSError:
+        return False
+
+
+def shard_dirs(digest: str, levels: int) -> list[str]:
+    """Fan-out directory names for a hex *digest*: ``ab``, ``cd``, ..."""
+    return [digest[2 * level : 2 * level + 2] for level in range(levels)]
+
+
+def fanout_files(directory: Path, suffix: str, levels: int) -> list[Path]:
+    """Files named ``*suffix`` directly in *directory* AND *levels* fan-out
+    directories below it, so listings see both layouts mid-reshard.
+    Dot-files (in-flight ``atomic_write_text`` temporaries) are skipped."""
+    if not directory.exists():
+        return []
+    patterns = [f"*{suffix}", "/".join([_SHARD_GLOB] * levels + [f"*{suffix}"])]
+    found: list[Path] = []
+    for pattern in patterns:
+        for path in directory.glob(pattern):
+            if path.name.startswith("."):
+                continue
+            try:
+                ensure_within(directory, path)
+            except TreeStorePathError:
+                continue
+            found.append(path)
+    return found
+
+
+def atomic_write_json(path: Path, payload: dict[str, Any], *, fsync: bool = True) -> None:
     atomic_write_text(
-        path, json.dumps(payload, ensure_ascii=True, indent=2, sort_keys=True) + "\n"
+        path,
+        json.dumps(payload, ensure_ascii=True, indent=2, sort_keys=True) + "\n",
+        fsync=fsync,
     )
 
 
+# ---------------------------------------------------------------------------
+# Storage backends.
+# ---------------------------------------------------------------------------
+
+# Backend name -> (module, class). ``files`` lives here; the others are loaded on
+# first use so a files-only tree never imports sqlite3.
+BACKENDS: dict[str, tuple[str, str]] = {
+    "files": ("tree_store", "FileBackend"),
+    "segments": ("segment_backend", "SegmentBackend"),
+    "sqlite": ("sqlite_backend", "SqliteBackend"),
+}
+DEFAULT_BACKEND = "files"
+# strict: fsync every write. batched: skip data fsyncs and group-commit a
+# write-ahead log instead. relaxed: no fsyncs at all (rebuildable data only).
+DURABILITY_MODES = ("strict", "batched", "relaxed")
+DEFAULT_DURABILITY = "strict"
+
+
+class StorageBackend(ABC):
+    """Persistence for ONE project tree; ``TreeStore`` delegates all I/O here.
+
+    Backends store what they are given: validation, the RED gate and index
+    construction stay in ``TreeStore`` / ``tree_index`` so every layout
+    enforces the same invariants. ``read_node`` returns the parsed payload
+    WITHOUT validating it (``TreeStore.load_node`` does that).
+
+    ``write_ahead`` backends rely on ``TreeStore``'s write-ahead log for
+    ``batched`` durability; the others provide their own transaction log.
+    The abstract methods are the required interface: a backend missing one
+    cannot be instantiated. The rest have working defaults.
+    """
+
+    name = ""
+    write_ahead = False
+    # Set from layout.json by ``TreeStore.backend``; only file layouts use it.
+    sharded = False
+
+    def __init__(self, store: "TreeStore", project_id: str) -> None:
+        self.store = store
+        self.project_id = project_id
+        # (index_signature, index) of the last index ``hot_index`` parsed.
+        self._hot: tuple[Any, dict[str, Any]] | None = None
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Group several writes into one unit (a transaction where supported)."""
+        yield
+
+    @abstractmethod
+    def ensure_layout(self) -> Path:
+        raise NotImplementedError
+
+    @abstractmethod
+    def destroy(self) -> None:
+        """Remove this backend's data for the project (after a conversion)."""
+        raise NotImplementedError
+
+    # --- nodes ------------------------------------------------------------
+
+    @abstractmethod
+    def read_node(self, node_id: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_node(self, node_id: str, payload: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_node(self, node_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def node_ids(self) -> list[str]:
+        raise NotImplementedError
+
+    def link_node(self, node_id: str, dest: Path) -> bool:
+        """Hard-link the stored version of *node_id* to *dest* and return True,
+        or return False when the backend keeps no per-node file to link
+        (``tree_snapshot`` then copies the payload instead)."""
+        return False
+
+    def compact_storage(self) -> dict[str, Any]:
+        """Reclaim space held by superseded node versions; a no-op by default."""
+        return {"compacted": False}
+
+    # --- raw --------------------------------------------------------------
+
+    @abstractmethod
+    def write_raw(self, digest: str, content: str) -> str:
+        """Store *content* under *digest*; return a human-readable location."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_raw(self, digest: str) -> str | None:
+        raise NotImplementedError
+
+    def write_raw_stream(self, chunks: Iterable[str]) -> tuple[str, str]:
+        """Store text arriving as *chunks*; return ``(digest, location)``.
+
+        *chunks* is already RED-gated and raises mid-iteration on RED
+        material; a backend must then leave nothing of the blob behind. The
+        default joins the chunks and calls ``write_raw``.
+        """
+        content = "".join(chunks)
+        digest = sha256_text(content)
+        return digest, self.write_raw(digest, content)
+
+    @abstractmethod
+    def delete_raw(self, digest: str) -> None:
+        raise NotImplementedError
+
+    def raw_mtime(self, digest: str) -> float | None:
+        """When *digest* was last written, or None if the backend cannot tell
+        (``tree_gc`` never sweeps a blob whose age is unknown)."""
+        return None
+
+    def raw_reader(self, digest: str) -> Iterable[str] | None:
+        """A re-iterable source of the blob's text, or None when missing.
+
+        Iterating it twice must yield the same text; reads may raise any of
+        ``raw_store.READ_ERRORS`` for damaged data.
+        """
+        content = self.read_raw(digest)
+        return None if content is None else [content]
+
+    @abstractmethod
+    def raw_digests(self) -> list[str]:
+        raise NotImplementedError
+
+    # --- index ------------------------------------------------------------
+
+    @contextmanager
+    def index_lock(self, exclusive: bool = True) -> Iterator[None]:
+        """Serialise index mutation across processes (a no-op by default).
+
+        Every read-modify-write of the stored index (journal append, reindex,
+        compaction) runs under the exclusive lock; readers take it shared.
+        """
+        yield
+
+    @abstractmethod
+    def load_index(self) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_index_deltas(self, deltas: list[dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def commit_index(self, index: dict[str, Any]) -> None:
+        """Replace the stored index wholesale (reindex / compaction)."""
+        raise NotImplementedError
+
+    def last_generation(self) -> int:
+        """Highest generation this backend may have exposed; -1 if none."""
+        index = self.load_index()
+        return int(index["generation"]) if index else -1
+
+    def index_signature(self) -> Any:
+        """A cheap token that changes whenever the stored index does, or None
+        when the backend cannot tell (``hot_index`` then always reloads)."""
+        return None
+
+    def hot_index(self) -> dict[str, Any] | None:
+        """``load_index``, reused while ``index_signature`` is unchanged.
+
+        Perf: a long-lived reader (the recall daemon) parses the index once
+        per change instead of once per query. The dict is SHARED with later
+        callers -- treat it as read-only; ``load_index`` returns a private copy.
+        """
+        signature = self.index_signature()
+        if signature is None:
+            return self.load_index()
+        if self._hot is not None and self._hot[0] == signature:
+            return self._hot[1]
+        # Signed before reading: a write racing the load leaves a newer index
+        # under the older signature, which the next call replaces.
+        index = self.load_index()
+        self._hot = None if index is None else (signature, index)
+        return index
+
+    def candidate_entries(
+        self, search_terms: list[str], where: EntryFilter | None = None
+    ) -> list[dict[str, Any]] | None:
+        """Entries whose posting tokens contain a search term as a substring,
+        narrowed by *where* (facets, time range, paths, entities).
+
+        Perf (Addendum 5): ``score_node`` returns 0 unless a search term is a
+        substring of the node's scored text, so this candidate set is LOSSLESS.
+        The matching tokens come from the index's trigram lists
+        (``tree_index.match_tokens``), not a scan of the whole vocabulary.
+        Returns None when the index is missing/damaged or predates postings,
+        telling recall to fall back to scoring every node. Ids the postings
+        name but the entry list lacks come back as ``{"node_id": ...}`` stubs
+        that recall resolves from the node itself.
+        """
+        index = self.hot_index()
+        postings = index.get("postings") if isinstance(index, dict) else None
+        entries = index.get("nodes") if isinstance(index, dict) else None
+        if not isinstance(postings, dict) or not isinstance(entries, list):
+            return None
+        terms = [s for s in search_terms if s]
+        if not terms:
+            return []  # nothing can score > 0 without a search term
+        trigrams = index.get("trigrams")
+        if not isinstance(trigrams, dict):
+            trigrams = build_trigrams(postings)
+        candidate_ids: set[str] = set()
+        for term in terms:
+            tokens = match_tokens(trigrams, term)
+            if tokens is None:  # shorter than a trigram: scan the vocabulary
+                tokens = [token for token in postings if term in token]
+            for token in tokens:
+                ids = postings.get(token)
+                if isinstance(ids, list):
+                    candidate_ids.update(ids)
+        if where:
+            candidate_ids = set(where.ids(index, within=candidate_ids))
+        by_id = {e.get("node_id"): e for e in entries if isinstance(e, dict)}
+        return [by_id.get(nid) or {"node_id": nid} for nid in sorted(candidate_ids)]
+
+    def term_bounds(self, terms: list[str] | None = None) -> dict[str, int] | None:
+        """The index's token -> scored-field mask (``tree_index.term_bound``),
+        or None when there is no usable index.
+
+        With *terms* a backend may return only the tokens containing one of
+        them (plus ``ANY_TOKEN``); ``term_bound`` of those terms is the same
+        either way. This default returns every token: an index without
+        bounds gets them built from its entries once and kept with the hot
+        index until it changes.
+        """
+        index = self.hot_index()
+        if not isinstance(index, dict) or not isinstance(index.get("nodes"), list):
+            return None
+        bounds = index.get("bounds")
+        if not isinstance(bounds, dict):
+            bounds = index["bounds"] = build_bounds(index["nodes"])
+        return bounds
+
+    # --- usage ------------------------------------------------------------
+
+    @abstractmethod
+    def append_usage(self, event: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def append_usage_many(self, events: list[dict[str, Any]]) -> None:
+        for event in events:
+            self.append_usage(event)
+
+    @abstractmethod
+    def iter_usage(self) -> Iterator[dict[str, Any]]:
+        raise NotImplementedError
+
+
+class FileBackend(StorageBackend):
+    """The native layout: one JSON file per node, chunked raw/, index.json
+    (or index.bin when the layout's ``index`` is ``binary``)."""
+
+    name = "files"
+    node_dir = "nodes"
+    write_ahead = True
+    # Set from layout.json by ``TreeStore.backend``.
+    index_format = DEFAULT_INDEX_FORMAT
+
+    def __init__(self, store: "TreeStore", project_id: str) -> None:
+        super().__init__(store, project_id)
+        self._index_lock_depth = 0
+        self._index_lock_exclusive = False
+        # (stat identity, reader) of the last index.bin mapped by this backend.
+        self._binary: tuple[tuple[int, int, int], BinaryIndex] | None = None
+
+    @property
+    def root(self) -> Path:
+        return self.store.project_tree(self.project_id)
+
+    def ensure_layout(self) -> Path:
+        root = self.root
+        for directory in (root / self.node_dir, root / "raw"):
+            directory.mkdir(parents=True, exist_ok=True)
+            ensure_within(root, directory)
+        usage = ensure_within(root, root / "usage.jsonl")
+        if not usage.exists():
+            atomic_write_text(usage, "", fsync=self.store.fsync_data)
+        base = ensure_within(root, self.index_base_path())
+        if not base.exists():
+            placeholder = (
+                encode_index(empty_index(self.project_id))
+                if self.index_format == "binary"
+                else b"{}\n"
+            )
+            atomic_write_bytes(base, placeholder, fsync=self.store.fsync_data)
+        return root
+
+    def destroy(self) -> None:
+        root = self.root
+        self.destroy_nodes()
+        if (root / "raw").exists():
+            shutil.rmtree(root / "raw")
+        for path in list(root.glob("usage*.jsonl*")) + [
+            root / "index.json",
+            root / "index.bin",
+            root / "index-journal.jsonl",
+            root / ".usage.lock",
+            root / INDEX_LOCK_NAME,
+        ]:
+            if path.exists():
+                path.unlink()
+
+    def destroy_nodes(self) -> None:
+        """Remove only the node storage; raw, index and usage stay in place."""
+        directory = self.root / self.node_dir
+        if directory.exists():
+            shutil.rmtree(directory)
+
+    # --- nodes ------------------------------------------------------------
+
+    # Paths resolve through ``TreeStore.node_path`` / ``raw_path`` for the
+    # current layout first; the other layout (flat vs. sharded) is the
+    # fallback, so reads keep working while ``reshard`` moves files and when
+    # a writer still holds the previous layout. Every write removes the copy
+    # at the other location, so at most one version is ever live.
+
+    def _node_paths(self, node_id: str) -> tuple[Path, Path]:
+        return (
+            self.store.node_path(self.project_id, node_id, sharded=self.sharded),
+            self.store.node_path(self.project_id, node_id, sharded=not self.sharded),
+        )
+
+    def read_node(self, node_id: str) -> dict[str, Any] | None:
+        path = next((p for p in self._node_paths(node_id) if p.exists()), None)
+        if path is None:
+            return None
+        ensure_within(self.store.nodes_dir(self.project_id), path)
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError, ValueError):
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def write_node(self, node_id: str, payload: dict[str, Any]) -> None:
+        path, other = self._node_paths(node_id)
+        atomic_write_json(path, payload, fsync=self.store.fsync_data)
+        other.unlink(missing_ok=True)
+
+    def delete_node(self, node_id: str) -> None:
+        for path in self._node_paths(node_id):
+            if path.exists():
+                path.unlink()
+                if self.store.fsync_data:
+                    fsync_dir(path.parent)
+
+    def node_ids(self) -> list[str]:
+        directory = self.store.nodes_dir(self.project_id)
+        return sorted({p.stem for p in fanout_files(directory, ".json", NODE_SHARD_LEVELS)})
+
+    def link_node(self, node_id: str, dest: Path) -> bool:
+        # Node files are only ever replaced, never rewritten in place, so the
+        # link keeps this version whatever happens to the node afterwards.
+        for path in self._node_paths(node_id):
+            try:
+                os.link(path, dest)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                return False  # no hard links here (e.g. some network filesystems)
+            return True
+        return False
+
+    # --- raw --------------------------------------------------------------
+
+    def _raw_paths(self, digest: str) -> tuple[Path, Path]:
+        return (
+            self.store.raw_path(self.project_id, digest, sharded=self.sharded),
+            self.store.raw_path(self.project_id, digest, sharded=not self.sharded),
+        )
+
+    def _legacy_raw_paths(self, digest: str) -> tuple[Path, Path]:
+        return (
+            self.store.raw_path(self.project_id, digest, sharded=self.sharded, legacy=True),
+            self.store.raw_path(self.project_id, digest, sharded=not self.sharded, legacy=True),
+        )
+
+    def write_raw(self, digest: str, content: str) -> str:
+        written, location = self.write_raw_stream(chunk_text([content]))
+        if written != digest:
+            raise TreeStoreError("raw content does not match its digest")
+        return location
+
+    def write_raw_stream(self, chunks: Iterable[str]) -> tuple[str, str]:
+        # Perf: chunks already on disk (same content, any blob) are not
+        # re-compressed or re-written, and the chunk directories are fsynced
+        # once per blob rather than once per chunk. Raw blobs bypass the
+        # write-ahead log (it would need the whole text), so they are fsynced
+        # in ``batched`` mode too; only ``relaxed`` skips it.
+        codec = default_codec()
+        fsync = self.store.durability != "relaxed"
+        hasher = hashlib.sha256()
+        ids: list[str] = []
+        created: list[Path] = []
+        chars = size = stored = 0
+        # If the stream raises mid-way (RED material, a failing reader), the
+        # chunks this blob wrote are left for ``tree_gc``'s grace-period
+        # sweep: a concurrent save_raw may already have found one of them on
+        # disk and listed it in its own manifest. They hold no RED material --
+        # ``red_gated`` never releases a chunk next to (or inside) a match.
+        for text in chunks:
+            data = text.encode("utf-8")
+            hasher.update(data)
+            cid = chunk_id(data)
+            path = self.store.raw_chunk_path(self.project_id, cid, codec)
+            if path.exists():
+                # Touch a reused chunk so ``tree_gc``'s grace period
+                # protects it until this blob's manifest is on disk.
+                os.utime(path)
+                stored += path.stat().st_size
+            else:
+                payload = compress_chunk(data, codec)
+                write_chunk_file(path, payload, fsync=fsync)
+                created.append(path)
+                stored += len(payload)
+            ids.append(cid)
+            chars += len(text)
+            size += len(data)
+        if fsync:
+            for directory in sorted({p.parent for p in created}):
+                fsync_dir(directory)
+        digest = hasher.hexdigest()
+        path, other = self._raw_paths(digest)
+        manifest = build_manifest(digest, codec, ids, chars, size, stored)
+        atomic_write_json(path, manifest, fsync=fsync)
+        for stale in (other, *self._legacy_raw_paths(digest)):
+            stale.unlink(missing_ok=True)
+        return digest, str(path)
+
+    def raw_reader(self, digest: str) -> Iterable[str] | None:
+        path = next((p for p in self._raw_paths(digest) if p.exists()), None)
+        if path is not None:
+            manifest = load_manifest(path, digest)
+            codec = manifest["codec"]
+            return ChunkReader(
+                codec,
+                [
+                    (cid, self.store.raw_chunk_path(self.project_id, cid, codec))
+                    for cid in manifest["chunks"]
+                ],
+            )
+        legacy = next((p for p in self._legacy_raw_paths(digest) if p.exists()), None)
+        return None if legacy is None else [legacy.read_text(encoding="utf-8")]
+
+    def delete_raw(self, digest: str) -> None:
+        # Only the manifest (or legacy file) goes; chunks it used are swept
+        # by ``tree_gc`` once no manifest references them.
+        for path in (*self._raw_paths(digest), *self._legacy_raw_paths(digest)):
+            path.unlink(missing_ok=True)
+
+    def raw_mtime(self, digest: str) -> float | None:
+        for path in (*self._raw_paths(digest), *self._legacy_raw_paths(digest)):
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def manifest_chunks(self, digest: str) -> list[str]:
+        """Chunk ids *digest*'s manifest lists ([] for legacy / unreadable)."""
+        path = next((p for p in self._raw_paths(digest) if p.exists()), None)
+        if path is None:
+            return []
+        try:
+            return list(load_manifest(path, digest)["chunks"])
+        except READ_ERRORS:
+            return []
+
+    def chunk_files(self) -> list[Path]:
+        """Every stored raw chunk file, for ``tree_gc``'s sweep."""
+        directory = self.store.raw_dir(self.project_id) / CHUNKS_DIR
+        return sorted(
+            path
+            for suffix, _, _ in CODECS.values()
+            for path in fanout_files(directory, suffix, CHUNK_SHARD_LEVELS)
+        )
+
+    def read_raw(self, digest: str) -> str | None:
+        try:
+            reader = self.raw_reader(digest)
+            return None if reader is None else "".join(reader)
+        except READ_ERRORS:
+            return None
+
+    def raw_digests(self) -> list[str]:
+        directory = self.store.raw_dir(self.project_id)
+        return sorted(
+            {
+                path.stem
+                for suffix in (MANIFEST_SUFFIX, LEGACY_SUFFIX)
+                for path in fanout_files(directory, suffix, RAW_SHARD_LEVELS)
+                if SHA256_RE.fullmatch(path.stem)
+            }
+        )
+
+    # --- index ------------------------------------------------------------
+
+    @contextmanager
+    def index_lock(self, exclusive: bool = True) -> Iterator[None]:
+        """``flock`` on ``.index.lock``; re-entrant within one backend.
+
+        Without it two processes could both fold the journal into index.json
+        (or rebuild it) and the later commit would silently drop deltas the
+        other appended in between. Nested calls reuse the held lock, so a
+        journal append that escalates to ``reindex`` does not deadlock.
+        """
+        if self._index_lock_depth:
+            if exclusive and not self._index_lock_exclusive:
+                raise TreeStoreError("cannot upgrade a shared index lock")
+            self._index_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._index_lock_depth -= 1
+            return
+        root = self.root
+        root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(ensure_within(root, root / INDEX_LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._index_lock_depth, self._index_lock_exclusive = 1, exclusive
+            try:
+                yield
+            finally:
+                self._index_lock_depth, self._index_lock_exclusive = 0, False
+        finally:
+            os.close(fd)  # closing the descriptor releases the flock
+
+    def load_index(self) -> dict[str, Any] | None:
+        """``index.json`` with the index journal replayed on top (see TreeStore).
+
+        Read under the shared index lock so a concurrent compaction can never
+        pair an old base with an already-truncated journal.
+        """
+        if not self.root.exists():
+            return None
+        with self.index_lock(exclusive=False):
+            return self._load_index_locked()
+
+    def index_base_path(self) -> Path:
+        return self.root / ("index.bin" if self.index_format == "binary" else "index.json")
+
+    def index_signature(self) -> Any:
+        """Stat identity of the base index and its journal: both are replaced
+        atomically or appended to, so any committed index write changes it."""
+        signature = []
+        for path in (self.index_base_path(), self.root / "index-journal.jsonl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            except OSError:
+                return None
+            signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def _load_index_locked(self) -> dict[str, Any] | None:
+        root = self.root
+        index = self._read_base(self.index_base_path())
+        if index is None:
+            return None
+        journal = root / "index-journal.jsonl"
+        if not journal.exists():
+            return index
+        try:
+            with journal.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    if line.strip():
+                        apply_delta(index, json.loads(line))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return index
+
+    def _read_base(self, path: Path) -> dict[str, Any] | None:
+        if not path.exists():
+            return None
+        try:
+            if path.suffix == ".bin":
+                with BinaryIndex(path) as reader:
+                    data = reader.to_index()
+            else:
+                data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError, ValueError):
+            return None
+        if data == {}:  # fresh layout placeholder written by ensure_layout
+            return empty_index(self.project_id)
+        if check_index(data):
+            return None
+        return normalize_index(data)
+
+    def last_generation(self) -> int:
+        # Keep the generation monotonic even when the journal is damaged: count
+        # its lines on top of the base so a rebuilt index never reuses a value
+        # a reader may already have observed.
+        index = self.load_index()
+        if index is not None:
+            return int(index["generation"])
+        base = self._read_base(self.index_base_path())
+        if base is None:
+            return -1
+        journal = self.root / "index-journal.jsonl"
+        replayed = journal.read_bytes().count(b"\n") + 1 if journal.exists() else 0
+        return int(base["generation"]) + replayed
+
+    def commit_index(self, index: dict[str, Any]) -> None:
+        root = self.ensure_layout()
+        index["updated_at"] = now_iso()
+        fsync = self.store.fsync_data
+        if self.index_format == "binary":
+            atomic_write_bytes(root / "index.bin", encode_index(index), fsync=fsync)
+        else:
+            atomic_write_json(root / "index.json", index, fsync=fsync)
+        atomic_write_text(root / "index-journal.jsonl", "", fsync=fsync)
+
+    def append_index_deltas(self, deltas: list[dict[str, Any]]) -> None:
+        """Journal *deltas*: O(size of the deltas), not O(n).
+
+        Corruption check: a torn journal tail or a truncated base index
+        (both O(1) to detect) triggers a full ``reindex``, which already
+        covers the nodes these deltas describe. The whole check-append-compact
+        sequence holds the exclusive index lock, so a torn tail can only be
+        left by a writer that crashed, never by one still writing.
+        """
+        root = self.ensure_layout()
+        with self.index_lock():
+            self._append_index_deltas_locked(root, deltas)
+
+    def _append_index_deltas_locked(self, root: Path, deltas: list[dict[str, Any]]) -> None:
+        journal = root / "index-journal.jsonl"
+        journal_ok = (
+            not journal.exists()
+            or journal.stat().st_size == 0
+            or _ends_with(journal, b"\n")
+        )
+        base = self.index_base_path()
+        base_ok = intact(base) if self.index_format == "binary" else _ends_with(base, b"}\n")
+        if not journal_ok or not base_ok:
+            self.store.reindex(self.project_id)
+            return
+        append_text_durable(
+            journal,
+            "".join(
+                json.dumps(delta, ensure_ascii=True, sort_keys=True) + "\n"
+                for delta in deltas
+            ),
+            fsync=self.store.fsync_data,
+        )
+        if journal.stat().st_size > INDEX_JOURNAL_MAX_BYTES:
+            self.store.compact_index(self.project_id)
+
+    def candidate_entries(
+        self, search_terms: list[str], where: EntryFilter | None = None
+    ) -> list[dict[str, Any]] | None:
+        """As ``StorageBackend.candidate_entries``; a binary index answers it
+        from its memory map without decoding the whole index.
+
+        Perf: substring hits come from the trigram dictionary and only the
+        matching docs' entries are decoded -- after *where*, which decodes
+        just the meta keys it reads (``EntryFilter.structures``). Deltas
+        still in the journal overlay the mapped base: an id the journal
+        touched is taken from the journal (matched against its own tokens),
+        never the base.
+        """
+        if self.index_format != "binary":
+            return super().candidate_entries(search_terms, where)
+        if not self.root.exists():
+            return None
+        with self.index_lock(exclusive=False):
+            reader = self._binary_reader()
+            overlay = self._journal_overlay()
+        if reader is None or overlay is None:
+            return None
+        terms = [s for s in search_terms if s]
+        if not terms:
+            return []
+        found: dict[str, dict[str, Any]] = {}
+        try:
+            docs = {reader.node_id(doc): doc for doc in reader.candidate_docs(terms)}
+            base_ids = [node_id for node_id in docs if node_id not in overlay]
+            meta = reader.meta_view(where.structures()) if where else {}
+            if where and all(key in meta for key in where.structures()):
+                base_ids = where.ids(meta, within=base_ids)
+            for node_id in base_ids:
+                found[node_id] = reader.entry(docs[node_id])
+        except ValueError:  # BinaryIndexError, or a damaged entry
+            return None
+        for node_id, entry in overlay.items():
+            if entry is not None and any(s in tok for tok in entry_tokens(entry) for s in terms):
+                found[node_id] = entry
+        if where:
+            found = {k: e for k, e in found.items() if where.matches(e)}
+        return [found[node_id] for node_id in sorted(found)]
+
+    def term_bounds(self, terms: list[str] | None = None) -> dict[str, int] | None:
+        """As ``StorageBackend.term_bounds``; a binary index decodes only its
+        ``bounds`` meta key and ORs in the journaled entries' bounds."""
+        if self.index_format != "binary":
+            return super().term_bounds(terms)
+        if not self.root.exists():
+            return None
+        with self.index_lock(exclusive=False):
+            reader = self._binary_reader()
+            overlay = self._journal_overlay()
+        if reader is None or overlay is None:
+            return None
+        try:
+            bounds = reader.meta_view(["bounds"]).get("bounds")
+        except ValueError:
+            return None
+        if not isinstance(bounds, dict):
+            return None
+        if any(entry is not None for entry in overlay.values()):
+            bounds = dict(bounds)  # the reader's decoded copy is shared
+        for entry in overlay.values():
+            if entry is None:
+                continue  # a deleted node only leaves its bounds looser
+            for token, bits in entry_bounds(entry).items():
+                bounds[token] = bounds.get(token, 0) | bits
+        return bounds
+
+    def _binary_reader(self) -> BinaryIndex | None:
+        """The mapped ``index.bin``, reused while the file is unchanged."""
+        path = self.index_base_path()
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if self._binary is not None and self._binary[0] == key:
+            return self._binary[1]
+        try:
+            reader = BinaryIndex(path)
+        except (OSError, BinaryIndexError):
+            return None
+        if self._binary is not None:
+            self._binary[1].close()
+        self._binary = (key, reader)
+        return reader
+
+    def _journal_overlay(self) -> dict[str, dict[str, Any] | None] | None:
+        """node_id -> newest journaled entry (None once deleted); None when
+        the journal is damaged."""
+        journal = self.root / "index-journal.jsonl"
+        overlay: dict[str, dict[str, Any] | None] = {}
+        try:
+            with journal.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    delta = json.loads(line)
+                    if delta.get("op") == "upsert" and delta["entry"].get("node_id"):
+                        overlay[str(delta["entry"]["node_id"])] = delta["entry"]
+                    elif delta.get("op") == "delete" and delta.get("node_id"):
+                        overlay[str(delta["node_id"])] = None
+                    else:
+                        return None
+        except FileNotFoundError:
+            return overlay
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return overlay
+
+    # --- usage ------------------------------------------------------------
+
+    def append_usage(self, event: dict[str, Any]) -> None:
+        UsageLog(self.root, fsync=self.store.fsync_data).append(event)
+
+    def append_usage_many(self, events: list[dict[str, Any]]) -> None:
+        UsageLog(self.root, fsync=self.store.fsync_data).extend(events)
+
+    def iter_usage(self) -> Iterator[dict[str, Any]]:
+        return UsageLog(self.root).iter_events()
+
+
 # ---------------------------------------------------------------------------
 # Store.
 # ---------------------------------------------------------------------------
 
 class TreeStore:
-    """File-backed store for MemoryNode v2, isolated per project_id."""
+    """Store for MemoryNode v2, isolated per project_id.
+
+    Each project tree is persisted by a ``StorageBackend``. The backend of an
+    existing tree is recorded in its ``layout.json`` (trees without one are the
+    original ``files`` layout); new trees use *backend*, which defaults to
+    ``RALPH_MEMORY_BACKEND`` and then ``files``. ``convert_backend`` moves a
+    tree between layouts.
+
+    *durability* (default ``RALPH_MEMORY_DURABILITY``, then ``strict``) picks
+    how writes reach stable storage; see ``DURABILITY_MODES`` and
+    ``group_commit``. *shard* (default ``RALPH_MEMORY_SHARD``) gives NEW file
+    trees the two-level fan-out; ``reshard`` migrates an existing one.
+    *index_format* (default ``RALPH_MEMORY_INDEX_FORMAT``, then ``json``) picks
+    the base index file of NEW file trees; ``set_index_format`` switches an
+    existing one.
+    """
 
-    def __init__(self, ralph_home: Path | None = None) -> None:
+    def __init__(
+        self,
+        ralph_home: Path | None = None,
+        backend: str | None = None,
+        durability: str | None = None,
+        shard: bool | None = None,
+        index_format: str | None = None,
+    ) -> None:
         self.ralph_home = (ralph_home or default_ralph_home()).expanduser()
-        # Deferred-index batch state. When > 0 the index is NOT rewritten on
-        # every node write (which is O(n) per write -> O(n^2) for a bulk
-        # migration); instead dirty projects are tracked and flushed once.
+        name = backend or os.environ.get("RALPH_MEMORY_BACKEND", "").strip() or DEFAULT_BACKEND
+        if name not in BACKENDS:
+            raise TreeStoreError(f"unknown storage backend: {name}")
+        self.default_backend = name
+        mode = (
+            durability
+            or os.environ.get("RALPH_MEMORY_DURABILITY", "").strip()
+            or DEFAULT_DURABILITY
+        )
+        if mode not in DURABILITY_MODES:
+            raise TreeStoreError(f"unknown durability mode: {mode}")
+        self.durability = mode
+        if shard is None:
+            shard = os.environ.get("RALPH_MEMORY_SHARD", "").strip().lower() in {"1", "true", "yes"}
+        self.default_shard = shard
+        index_format = (
+            index_format
+            or os.environ.get("RALPH_MEMORY_INDEX_FORMAT", "").strip()
+            or DEFAULT_INDEX_FORMAT
+        )
+        if index_format not in INDEX_FORMATS:
+            raise TreeStoreError(f"unknown index format: {index_format}")
+        self.default_index_format = index_format
+        self._backends: dict[str, StorageBackend] = {}
+        # Group-commit state for ``batched`` durability: one write-ahead log
+        # per project, committed when the outermost ``group_commit`` exits
+        # and checkpointed then (ungrouped writes: see ``_log_write``).
+        self._group_depth = 0
+        self._write_ahead: dict[str, WriteAheadLog] = {}
+        # Deferred-index batch state. When > 0 index deltas are NOT journaled
+        # on every node write; they are buffered per project and appended in
+        # one write when the outermost ``deferred_index`` block exits.
         self._defer_index_depth = 0
-        self._dirty_projects: set[str] = set()
+        self._pending_deltas: dict[str, list[dict[str, Any]]] = {}
 
     # --- batch index (bulk-write performance) -----------------------------
 
     @contextmanager
     def deferred_index(self) -> "Iterator[TreeStore]":
-        """Batch index writes: skip per-node index rewrites, flush once on exit.
+        """Batch index writes: buffer per-node index deltas, flush once on exit.
 
-        Node JSON files are still written (and fsynced) immediately, so the
-        per-node duplicate check (``node_exists``) stays correct. Only the
-        aggregate ``index.json`` rebuild is deferred to the end, turning the
-        bulk-migration cost from O(n^2) into O(n). The flush runs even if the
-        body raises, so a partial migration still leaves a consistent index.
+        Node payloads are still written immediately, so the per-node duplicate
+        check (``node_exists``) stays correct. Only the index update is
+        deferred to the end, turning a bulk migration into one journal write
+        (plus at most one compaction). The flush runs even if the body raises,
+        so a partial migration still leaves a consistent index.
         """
         self._defer_index_depth += 1
         try:
@@ -299,10 +1322,100 @@ class TreeStore:
         finally:
             self._defer_index_depth -= 1
             if self._defer_index_depth == 0:
-                dirty = sorted(self._dirty_projects)
-                self._dirty_projects.clear()
-                for project_id in dirty:
-                    self._write_index(project_id)
+                pending = self._pending_deltas
+                self._pending_deltas = {}
+                for project_id in sorted(pending):
+                    self.backend(project_id).append_index_deltas(pending[project_id])
+                    self._upgrade_noted(project_id)
+
+    # --- durability -------------------------------------------------------
+
+    @property
+    def fsync_data(self) -> bool:
+        """Whether backends fsync data files themselves (``strict`` only)."""
+        return self.durability == "strict"
+
+    @contextmanager
+    def group_commit(self) -> "Iterator[TreeStore]":
+        """Share one write-ahead fsync across every write in the block.
+
+        Only meaningful in ``batched`` mode (a no-op otherwise). Writes land
+        in the data files immediately, so reads inside the block see them; the
+        block's records are committed to the write-ahead log on exit (or every
+        ``GROUP_MAX_RECORDS``), followed by a checkpoint that flushes the data
+        files and empties the log. A crash loses at most the uncommitted tail
+        of the current group.
+        """
+        self._group_depth += 1
+        try:
+            yield self
+        finally:
+            self._group_depth -= 1
+            if self._group_depth == 0:
+                for project_id in sorted(self._write_ahead):
+                    log = self._write_ahead[project_id]
+                    log.commit()
+                    if log.committed:
+                        log.checkpoint()
+
+    def _log_write(self, project_id: str, record: dict[str, Any]) -> None:
+        if self.durability != "batched" or not self.backend(project_id).write_ahead:
+            return
+        log = self._write_ahead.get(project_id)
+        if log is None:
+            log = self._write_ahead[project_id] = WriteAheadLog(self.project_tree(project_id))
+        log.record(record)
+        if self._group_depth == 0 or log.pending >= GROUP_MAX_RECORDS:
+            # Outside a group every write is its own group. Its checkpoint
+            # (a system-wide sync) is amortized: every GROUP_MAX_RECORDS
+            # commits, else at process exit.
+            log.commit()
+            if self._group_depth == 0 and log.committed >= GROUP_MAX_RECORDS:
+                log.checkpoint()
+
+    def _replay_write_ahead(self, project_id: str, backend: StorageBackend) -> None:
+        """Re-apply records a crashed ``batched`` writer committed but never
+        checkpointed. A stored node that is as new or newer is left alone.
+
+        Runs before a write, never on a read; a log whose writer is still
+        alive is left to that writer (see ``WriteAheadLog.replay``)."""
+        log = WriteAheadLog(self.project_tree(project_id))
+        if not log.has_records():
+            return
+
+        def apply(records: list[dict[str, Any]]) -> None:
+            deltas: list[dict[str, Any]] = []
+            for record in records:
+                if record.get("op") == "node" and isinstance(record.get("node"), dict):
+                    try:
+                        node = validate_node(MemoryNode.from_dict(record["node"]))
+                    except (MemoryNodeValidationError, ValueError, TypeError):
+                        continue
+                    stored = backend.read_node(node.node_id)
+                    if stored is not None and str(stored.get("updated_at", "")) >= node.updated_at:
+                        continue
+                    payload = node.to_dict()
+                    backend.write_node(node.node_id, payload)
+                    deltas.append({"op": "upsert", "entry": index_entry(payload)})
+                elif record.get("op") == "delete" and isinstance(record.get("node_id"), str):
+                    if backend.read_node(record["node_id"]) is not None:
+                        backend.delete_node(record["node_id"])
+                        deltas.append({"op": "delete", "node_id": record["node_id"]})
+                elif record.get("op") == "raw":
+                    digest, content = record.get("digest"), record.get("content")
+                    if (
+                        isinstance(digest, str)
+                        and SHA256_RE.fullmatch(digest)
+                        and isinstance(content, str)
+                        and sha256_text(content) == digest
+                        and not contains_red_material(content)
+                        and backend.read_raw(digest) is None
+                    ):
+                        backend.write_raw(digest, content)
+            if deltas:
+                backend.append_index_deltas(deltas)
+
+        log.replay(apply)
 
     # --- layout -----------------------------------------------------------
 
@@ -323,32 +1436,269 @@ class TreeStore:
     def index_path(self, project_id: str) -> Path:
         return self.project_tree(project_id) / "index.json"
 
+    def index_journal_path(self, project_id: str) -> Path:
+        return self.project_tree(project_id) / "index-journal.jsonl"
+
     def usage_path(self, project_id: str) -> Path:
         return self.project_tree(project_id) / "usage.jsonl"
 
-    def node_path(self, project_id: str, node_id: str) -> Path:
-        safe_node = safe_segment(node_id, "node_id")
-        path = self.nodes_dir(project_id) / f"{safe_node}.json"
-        return ensure_within(self.project_tree(project_id), path)
+    def layout_path(self, project_id: str) -> Path:
+        return self.project_tree(project_id) / "layout.json"
 
-    def raw_path(self, project_id: str, digest: str) -> Path:
+    def is_sharded(self, project_id: str) -> bool:
+        return self.backend(project_id).sharded
+
+    def node_path(
+        self, project_id: str, node_id: str, *, sharded: bool | None = None
+    ) -> Path:
+        """Where *node_id* lives: ``nodes/<id>.json`` or, sharded,
+        ``nodes/ab/cd/<id>.json``. *sharded* defaults to the tree's layout."""
+        safe_node = safe_segment(node_id, "node_id")
+        directory = self.nodes_dir(project_id)
+        if self.is_sharded(project_id) if sharded is None else sharded:
+            directory = directory.joinpath(*shard_dirs(sha256_text(safe_node), NODE_SHARD_LEVELS))
+        return ensure_within(self.project_tree(project_id), directory / f"{safe_node}.json")
+
+    def raw_path(
+        self,
+        project_id: str,
+        digest: str,
+        *,
+        sharded: bool | None = None,
+        legacy: bool = False,
+    ) -> Path:
+        """A raw blob's manifest, ``raw/<sha>.manifest`` (sharded:
+        ``raw/ab/<sha>.manifest``); *legacy* gives the old whole-blob
+        ``<sha>.txt`` location instead."""
         if not isinstance(digest, str) or not SHA256_RE.fullmatch(digest):
             raise TreeStorePathError("raw digest must be a sha256 hex digest")
-        path = self.raw_dir(project_id) / f"{digest}.txt"
-        return ensure_within(self.project_tree(project_id), path)
+        directory = self.raw_dir(project_id)
+        if self.is_sharded(project_id) if sharded is None else sharded:
+            directory = directory.joinpath(*shard_dirs(digest, RAW_SHARD_LEVELS))
+        suffix = LEGACY_SUFFIX if legacy else MANIFEST_SUFFIX
+        return ensure_within(self.project_tree(project_id), directory / f"{digest}{suffix}")
+
+    def raw_chunk_path(self, project_id: str, chunk: str, codec: str) -> Path:
+        """Where a compressed raw chunk lives: ``raw/chunks/ab/<chunk>.zz``.
+        Chunks always fan out; they are shared by every blob that uses them."""
+        if not isinstance(chunk, str) or not SHA256_RE.fullmatch(chunk):
+            raise TreeStorePathError("raw chunk id must be a sha256 hex digest")
+        if codec not in CODECS:
+            raise TreeStorePathError(f"unknown raw codec: {codec}")
+        directory = self.raw_dir(project_id).joinpath(
+            CHUNKS_DIR, *shard_dirs(chunk, CHUNK_SHARD_LEVELS)
+        )
+        return ensure_within(self.project_tree(project_id), directory / f"{chunk}{CODECS[codec][0]}")
+
+    def layout(self, project_id: str) -> dict[str, Any]:
+        """The project's ``layout.json``; trees without one use ``files``.
+
+        A tree that does not exist yet reports the store's default backend. An
+        unreadable marker falls back to whichever backend's data is present.
+        """
+        path = self.layout_path(project_id)
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError, ValueError):
+                data = None
+            if isinstance(data, dict) and data.get("backend") in BACKENDS:
+                return data
+            tree = self.project_tree(project_id)
+            if (tree / "tree.sqlite3").exists():
+                return {"backend": "sqlite"}
+            return {"backend": "segments" if (tree / "segments").is_dir() else "files"}
+        if self.project_tree(project_id).exists():
+            return {"backend": "files"}
+        layout: dict[str, Any] = {"backend": self.default_backend}
+        if self.default_shard:
+            layout["shard"] = True
+        if self.default_index_format != DEFAULT_INDEX_FORMAT:
+            layout["index"] = self.default_index_format
+        return layout
+
+    def set_layout(self, project_id: str, layout: dict[str, Any]) -> None:
+        atomic_write_json(self.layout_path(project_id), layout)
+        self._backends.pop(project_id, None)
+
+    def forget_backend(self, project_id: str) -> None:
+        """Drop the cached backend so the next access re-reads layout.json
+        (a long-lived reader after another process converted the tree)."""
+        self._backends.pop(project_id, None)
+
+    def backend(self, project_id: str) -> StorageBackend:
+        cached = self._backends.get(project_id)
+        if cached is not None:
+            return cached
+        layout = self.layout(project_id)
+        backend = _backend_class(str(layout["backend"]))(self, safe_segment(project_id, "project_id"))
+        _configure(backend, layout)
+        self._backends[project_id] = backend
+        return backend
 
     def ensure_layout(self, project_id: str) -> Path:
-        root = self.project_tree(project_id)
-        for directory in (root / "nodes", root / "raw"):
-            directory.mkdir(parents=True, exist_ok=True)
-            ensure_within(root, directory)
-        for filename, default in (("usage.jsonl", ""), ("index.json", "{}\n")):
-            path = root / filename
-            ensure_within(root, path)
-            if not path.exists():
-                atomic_write_text(path, default)
+        """Create the tree on disk; every write path starts here, so this is
+        also where a crashed writer's write-ahead log is replayed."""
+        backend = self.backend(project_id)
+        root = backend.ensure_layout()
+        if backend.write_ahead:
+            self._replay_write_ahead(project_id, backend)
+        if not self.layout_path(project_id).exists():
+            layout: dict[str, Any] = {"backend": backend.name}
+            if backend.sharded:
+                layout["shard"] = True
+            if isinstance(backend, FileBackend) and backend.index_format != DEFAULT_INDEX_FORMAT:
+                layout["index"] = backend.index_format
+            if layout != {"backend": "files"}:
+                atomic_write_json(self.layout_path(project_id), layout)
         return root
 
+    def convert_backend(self, project_id: str, target: str) -> dict[str, Any]:
+        """Move a project tree to the *target* backend; return counts.
+
+        Nodes are re-validated and raw blobs re-checked for RED on the way, so
+        a conversion never carries damaged or tampered data across. The
+        ``layout.json`` flip is the commit point: a conversion interrupted
+        before it leaves the source layout authoritative, and re-running it
+        overwrites the partial copy.
+        """
+        if target not in BACKENDS:
+            raise TreeStoreError(f"unknown storage backend: {target}")
+        source = self.backend(project_id)
+        stats: dict[str, Any] = {
+            "project_id": project_id,
+            "from": source.name,
+            "to": target,
+            "nodes": 0,
+            "skipped_nodes": 0,
+            "raw": 0,
+            "skipped_raw": 0,
+            "usage_events": 0,
+        }
+        if source.name == target:
+            return stats
+        dest = _backend_class(target)(self, safe_segment(project_id, "project_id"))
+        _configure(dest, self.layout(project_id))
+        dest.ensure_layout()
+        # File-based layouts differ only in how nodes are stored; raw blobs,
+        # the index files and the usage log are shared and stay where they are.
+        nodes_only = isinstance(source, FileBackend) and isinstance(dest, FileBackend)
+        entries: list[dict[str, Any]] = []
+        with dest.batch():
+            for node_id in source.node_ids():
+                node = self.load_node(project_id, node_id)
+                if node is None:
+                    stats["skipped_nodes"] += 1
+                    continue
+                dest.write_node(node["node_id"], node)
+                entries.append(index_entry(node))
+                stats["nodes"] += 1
+            for digest in [] if nodes_only else source.raw_digests():
+                reader = self._verified_raw(source, digest)
+                if reader is None:
+                    stats["skipped_raw"] += 1
+                    continue
+                dest.write_raw_stream(chunk_text(reader))
+                stats["raw"] += 1
+            for event in () if nodes_only else source.iter_usage():
+                dest.append_usage(event)
+                stats["usage_events"] += 1
+            generation = source.last_generation() + 1
+            with dest.index_lock():
+                dest.commit_index(build_index(project_id, entries, max(generation, 0)))
+        self.set_layout(project_id, {**self.layout(project_id), "backend": target})
+        if nodes_only:
+            assert isinstance(source, FileBackend)
+            source.destroy_nodes()
+        else:
+            source.destroy()
+        return stats
+
+    def reshard(self, project_id: str, shard: bool = True) -> dict[str, Any]:
+        """Move an existing file-layout tree to (or back from) the sharded
+        fan-out, in place and online; return counts.
+
+        The ``layout.json`` flip comes FIRST: from then on every write lands
+        at the new location, while reads fall back to the old one, so callers
+        keep working throughout. Each remaining file is then moved with
+        ``os.replace`` -- unless a newer write already created it at the new
+        location, in which case the stale copy is dropped. Every path is
+        proven inside the tree with ``ensure_within``. Re-running is safe.
+        """
+        backend = self.backend(project_id)
+        if not isinstance(backend, FileBackend):
+            raise TreeStoreError(f"backend {backend.name!r} has no file layout to reshard")
+        self.ensure_layout(project_id)
+        self.set_layout(project_id, {**self.layout(project_id), "shard": bool(shard)})
+        backend = self.backend(project_id)
+        assert isinstance(backend, FileBackend)
+        stats: dict[str, Any] = {"project_id": project_id, "shard": bool(shard), "nodes": 0, "raw": 0}
+        moves: list[tuple[str, Path, Path]] = []
+        if backend.node_dir == "nodes":
+            for node_id in backend.node_ids():
+                new, old = backend._node_paths(node_id)
+                moves.append(("nodes", old, new))
+        for digest in backend.raw_digests():
+            for new, old in (backend._raw_paths(digest), backend._legacy_raw_paths(digest)):
+                moves.append(("raw", old, new))
+        root = self.project_tree(project_id)
+        touched: set[Path] = set()
+        for kind, old, new in moves:
+            ensure_within(root, old)
+            ensure_within(root, new)
+            if not old.exists():
+                continue
+            if new.exists():
+                old.unlink(missing_ok=True)  # a newer write already landed
+            else:
+                new.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(old, new)
+                stats[kind] += 1
+            touched.update((old.parent, new.parent))
+        if self.fsync_data:
+            for directory in sorted(touched):
+                fsync_dir(directory)
+        if not shard:
+            for directory in (self.nodes_dir(project_id), self.raw_dir(project_id)):
+                _prune_empty_fanout(directory)
+        return stats
+
+    def set_index_format(self, project_id: str, index_format: str) -> dict[str, Any]:
+        """Switch a file-layout tree between ``index.json`` and ``index.bin``.
+
+        Runs under the exclusive index lock. The new base is committed (with
+        the journal folded in) BEFORE ``layout.json`` flips, so a crash at any
+        point leaves one complete base that the layout names.
+        """
+        if index_format not in INDEX_FORMATS:
+            raise TreeStoreError(f"unknown index format: {index_format}")
+        backend = self.backend(project_id)
+        if not isinstance(backend, FileBackend):
+            raise TreeStoreError(f"backend {backend.name!r} keeps its own index")
+        self.ensure_layout(project_id)
+        with backend.index_lock():
+            old = backend.index_base_path()
+            index = backend.load_index()
+            if index is None:
+                generation = backend.last_generation() + 1
+                index = build_index(project_id, self.list_nodes(project_id), max(generation, 0))
+            previous, backend.index_format = backend.index_format, index_format
+            try:
+                backend.commit_index(index)
+            except BaseException:
+                backend.index_format = previous
+                raise
+            atomic_write_json(self.layout_path(project_id), {**self.layout(project_id), "index": index_format})
+            if old != backend.index_base_path():
+                old.unlink(missing_ok=True)
+        return {
+            "project_id": project_id,
+            "index": index_format,
+            "generation": index["generation"],
+            "nodes": len(index["nodes"]),
+            "bytes": backend.index_base_path().stat().st_size,
+        }
+
     # --- node ops ---------------------------------------------------------
 
     def create_node(self, payload: dict[str, Any]) -> dict[str, Any]:
@@ -375,35 +1725,213 @@ class TreeStore:
 
     def _write_node(self, node: MemoryNode) -> dict[str, Any]:
         node = validate_node(node)
-        root = self.ensure_layout(node.project_id)
-        path = self.node_path(node.project_id, node.node_id)
+        self.ensure_layout(node.project_id)
+        backend = self.backend(node.project_id)
         payload = node.to_dict()
-        atomic_write_json(path, payload)
-        if self._defer_index_depth > 0:
-            self._dirty_projects.add(node.project_id)
-        else:
-            self._write_index(node.project_id)
-        self._append_usage(
-            root,
-            {"event": "node_written", "node_id": node.node_id, "at": now_iso()},
-        )
+        # The node file and its index delta change under one exclusive index
+        # lock: otherwise two processes writing the same node can interleave
+        # and leave the file at one version and the index at the other.
+        with backend.index_lock(), backend.batch():
+            backend.write_node(node.node_id, payload)
+            self._record_index_delta(
+                node.project_id, {"op": "upsert", "entry": index_entry(payload)}
+            )
+            backend.append_usage(
+                {"event": "node_written", "node_id": node.node_id, "at": now_iso()}
+            )
+        self._log_write(node.project_id, {"op": "node", "node": payload})
         return payload
 
+    # --- bulk ingest ------------------------------------------------------
+
+    def create_nodes(self, payloads: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Create many nodes in one pass; an existing node_id is rejected.
+
+        Same contract as ``upsert_nodes``, except that nothing is updated.
+        """
+        return self._ingest_nodes(payloads, upsert=False)
+
+    def upsert_nodes(
+        self, payloads: Iterable[dict[str, Any]], *, preserve_updated_at: bool = False
+    ) -> list[dict[str, Any]]:
+        """Create or update many nodes in one pass; return one outcome each.
+
+        Perf: every payload is validated once, existence is resolved against
+        the index's node-id set (one index load per project instead of a
+        load + validate per node), and all nodes of a project are written in
+        one backend batch followed by ONE index-delta flush and ONE usage-log
+        write. Only nodes being updated are read back, to merge the payload
+        onto them exactly as ``update_node`` does.
+
+        Outcomes follow input order: ``{"index", "node_id", "status"}`` with
+        status ``created`` / ``updated`` / ``rejected``; a rejection carries
+        ``"error"``. A bad payload is rejected on its own and never stops the
+        rest of the batch.
+
+        *preserve_updated_at* (archive import) keeps each payload's own
+        ``updated_at`` instead of stamping now, and leaves a stored node that
+        is at least as new untouched (status ``unchanged``).
+        """
+        return self._ingest_nodes(payloads, upsert=True, preserve=preserve_updated_at)
+
+    def _ingest_nodes(
+        self, payloads: Iterable[dict[str, Any]], *, upsert: bool, preserve: bool = False
+    ) -> list[dict[str, Any]]:
+        outcomes: list[dict[str, Any]] = []
+        by_project: dict[str, list[tuple[MemoryNode, dict[str, Any], dict[str, Any]]]] = {}
+        for position, payload in enumerate(payloads):
+            outcome: dict[str, Any] = {"index": position, "node_id": None, "status": "rejected"}
+            outcomes.append(outcome)
+            try:
+                node = validate_node(MemoryNode.from_dict(payload))
+            except (MemoryNodeValidationError, ValueError, TypeError, AttributeError) as exc:
+                outcome["node_id"] = payload.get("node_id") if isinstance(payload, dict) else None
+                outcome["error"] = str(exc)
+                continue
+            outcome["node_id"] = node.node_id
+            by_project.setdefault(node.project_id, []).append((node, payload, outcome))
+        with self.group_commit():
+            for project_id, items in by_project.items():
+                self._ingest_project(project_id, items, upsert=upsert, preserve=preserve)
+        return outcomes
+
+    def _node_id_set(self, project_id: str) -> set[str]:
+        """Ids of every stored node: the index (plus deltas still deferred),
+        or a directory listing when there is no usable index."""
+        index = self.load_index(project_id)
+        if index is None:
+            return set(self.backend(project_id).node_ids())
+        ids = {str(entry.get("node_id")) for entry in index.get("nodes", [])}
+        for delta in self._pending_deltas.get(project_id, []):
+            if delta.get("op") == "upsert":
+                ids.add(str(delta["entry"].get("node_id")))
+            elif delta.get("op") == "delete":
+                ids.discard(str(delta.get("node_id")))
+        return ids
+
+    def _ingest_project(
+        self,
+        project_id: str,
+        items: list[tuple[MemoryNode, dict[str, Any], dict[str, Any]]],
+        *,
+        upsert: bool,
+        preserve: bool,
+    ) -> None:
+        self.ensure_layout(project_id)
+        backend = self.backend(project_id)
+        existing = self._node_id_set(project_id)
+        written: list[dict[str, Any]] = []
+        with backend.index_lock(), backend.batch():  # as in ``_write_node``
+            for node, payload, outcome in items:
+                status = "created"
+                if node.node_id in existing:
+                    if not upsert:
+                        outcome["error"] = f"node already exists: {node.node_id}"
+                        continue
+                    current = backend.read_node(node.node_id)
+                    if current is not None:  # else a stale index entry: create
+                        if preserve and str(current.get("updated_at", "")) >= node.updated_at:
+                            outcome["status"] = "unchanged"
+                            continue
+                        status = "updated"
+                        merged = {
+                            **current,
+                            **payload,
+                            "node_id": node.node_id,
+                            "project_id": project_id,
+                            "updated_at": node.updated_at if preserve else now_iso(),
+                        }
+                        try:
+                            node = validate_node(MemoryNode.from_dict(merged))
+                        except (MemoryNodeValidationError, ValueError, TypeError) as exc:
+                            outcome["error"] = str(exc)
+                            continue
+                stored = node.to_dict()
+                try:
+                    backend.write_node(node.node_id, stored)
+                except (TreeStoreError, OSError) as exc:
+                    outcome["error"] = str(exc)
+                    continue
+                existing.add(node.node_id)
+                outcome["status"] = status
+                written.append(stored)
+            if written:
+                self._record_index_deltas(
+                    project_id, [{"op": "upsert", "entry": index_entry(p)} for p in written]
+                )
+                at = now_iso()
+                backend.append_usage_many(
+                    [{"event": "node_written", "node_id": p["node_id"], "at": at} for p in written]
+                )
+        for stored in written:
+            self._log_write(project_id, {"op": "node", "node": stored})
+
+    def delete_nodes(self, project_id: str, node_ids: Iterable[str]) -> list[str]:
+        """Remove nodes in one backend batch with one index-delta flush and one
+        usage-log write; return the ids actually removed (missing ones are
+        skipped). Used by ``tree_gc`` to retire archived nodes."""
+        self.ensure_layout(project_id)
+        backend = self.backend(project_id)
+        removed: list[str] = []
+        with backend.index_lock(), backend.batch():  # as in ``_write_node``
+            for node_id in node_ids:
+                safe_node = safe_segment(node_id, "node_id")
+                if backend.read_node(safe_node) is None:
+                    continue
+                backend.delete_node(safe_node)
+                removed.append(safe_node)
+            if removed:
+                self._record_index_deltas(
+                    project_id, [{"op": "delete", "node_id": n} for n in removed]
+                )
+                at = now_iso()
+                backend.append_usage_many(
+                    [{"event": "node_deleted", "node_id": n, "at": at} for n in removed]
+                )
+        for node_id in removed:
+            self._log_write(project_id, {"op": "delete", "node_id": node_id})
+        return removed
+
+    def gc(
+        self,
+        project_id: str,
+        *,
+        budget_seconds: float | None = None,
+        archive_deprecated_days: int | None = None,
+    ) -> dict[str, Any]:
+        """Mark-and-sweep garbage collection for one project tree; see ``tree_gc``."""
+        return _sibling("tree_gc").collect(
+            self,
+            project_id,
+            budget_seconds=budget_seconds,
+            archive_deprecated_days=archive_deprecated_days,
+        )
+
+    def snapshot(
+        self, project_id: str, *, branch: str | None = None, commit: str | None = None
+    ) -> dict[str, Any]:
+        """Freeze the tree as a copy-on-write view keyed by *branch* or
+        *commit*; see ``tree_snapshot``."""
+        return _sibling("tree_snapshot").create_snapshot(
+            self, project_id, branch=branch, commit=commit
+        )
+
+    def open_snapshot(
+        self, project_id: str, *, branch: str | None = None, commit: str | None = None
+    ) -> Any:
+        """The ``tree_snapshot.SnapshotView`` for a ref, or None."""
+        return _sibling("tree_snapshot").open_snapshot(
+            self, project_id, branch=branch, commit=commit
+        )
+
     def load_node(self, project_id: str, node_id: str) -> dict[str, Any] | None:
         """Return the node payload, or None if missing / corrupt / invalid.
 
         Never raises on a bad file: a corrupt JSON body or a node that fails
         schema validation yields None rather than propagating an exception.
         """
-        path = self.node_path(project_id, node_id)
-        if not path.exists():
-            return None
-        ensure_within(self.nodes_dir(project_id), path)
-        try:
-            payload = json.loads(path.read_text(encoding="utf-8"))
-        except (OSError, json.JSONDecodeError, ValueError):
-            return None
-        if not isinstance(payload, dict):
+        payload = self.backend(project_id).read_node(node_id)
+        if payload is None:
             return None
         try:
             return MemoryNode.from_dict(payload).to_dict()
@@ -416,20 +1944,11 @@ class TreeStore:
         Each entry carries only ``raw_ref`` (the sha256 reference), never the
         raw text itself, so listings cannot leak raw content.
         """
-        directory = self.nodes_dir(project_id)
-        if not directory.exists():
-            return []
         nodes: list[dict[str, Any]] = []
-        for path in sorted(directory.glob("*.json")):
-            if path.name.startswith("."):
-                continue
-            try:
-                ensure_within(directory, path)
-            except TreeStorePathError:
-                continue
-            node = self.load_node(project_id, path.stem)
+        for node_id in self.backend(project_id).node_ids():
+            node = self.load_node(project_id, node_id)
             if node is not None:
-                nodes.append(self._index_entry(node))
+                nodes.append(index_entry(node))
         return nodes
 
     def node_exists(self, project_id: str, node_id: str) -> bool:
@@ -438,17 +1957,30 @@ class TreeStore:
     # --- raw ops ----------------------------------------------------------
 
     def save_raw(
-        self, project_id: str, content: str, sensitivity: str = "YELLOW"
+        self,
+        project_id: str,
+        content: str | IO[str] | Iterable[str],
+        sensitivity: str = "YELLOW",
     ) -> dict[str, str]:
+        """Store a raw blob; return its sha256 reference.
+
+        *content* may be one string, a text file object or an iterable of
+        strings; it is streamed into compressed, deduplicated chunks (see
+        ``raw_store``) so a multi-MB transcript is never held in memory
+        whole. RED material anywhere -- inside a chunk or straddling two --
+        rejects the whole blob and leaves nothing of it on disk.
+        """
         if sensitivity not in ALLOWED_RAW_SENSITIVITY:
             raise MemoryNodeValidationError("raw sensitivity must be GREEN or YELLOW")
-        if contains_red_material(content):
-            raise MemoryNodeValidationError("raw content contains RED material")
+        chunks = red_gated(chunk_text(iter_text_pieces(content)))
+        # Pull the first chunk before touching the tree: RED at the start is
+        # rejected without creating anything.
+        first = next(chunks, None)
         self.ensure_layout(project_id)
-        digest = sha256_text(content)
-        path = self.raw_path(project_id, digest)
-        atomic_write_text(path, content)
-        return {"sha256": digest, "path": str(path), "sensitivity": sensitivity}
+        digest, location = self.backend(project_id).write_raw_stream(
+            itertools.chain(() if first is None else (first,), chunks)
+        )
+        return {"sha256": digest, "path": location, "sensitivity": sensitivity}
 
     def read_raw(self, project_id: str, digest: str) -> str | None:
         """Return raw content, or None if missing / unreadable / RED.
@@ -456,131 +1988,331 @@ class TreeStore:
         RED is re-checked at read time so on-disk tampering that injects secret
         material is never returned to a caller.
         """
-        path = self.raw_path(project_id, digest)
-        if not path.exists():
+        chunks = self.iter_raw(project_id, digest)
+        if chunks is None:
             return None
         try:
-            content = path.read_text(encoding="utf-8")
-        except OSError:
+            return "".join(chunks)
+        except READ_ERRORS:
+            return None  # tampered with between verification and read
+
+    def iter_raw(self, project_id: str, digest: str) -> Iterator[str] | None:
+        """Stream a raw blob back chunk by chunk; None if missing / damaged / RED.
+
+        The blob is verified in full before the first chunk is returned, so
+        RED material never reaches the caller. A chunk tampered with while
+        the stream is being consumed raises ``ValueError`` instead of being
+        yielded.
+        """
+        if not isinstance(digest, str) or not SHA256_RE.fullmatch(digest):
+            raise TreeStorePathError("raw digest must be a sha256 hex digest")
+        reader = self._verified_raw(self.backend(project_id), digest)
+        return None if reader is None else iter(reader)
+
+    def _verified_raw(self, backend: StorageBackend, digest: str) -> Iterable[str] | None:
+        """*backend*'s reader for *digest* once a first pass has checked every
+        chunk hash, the whole-blob digest and the RED gate (keeping no text)."""
+        try:
+            reader = backend.raw_reader(digest)
+            if reader is None:
+                return None
+            hasher = hashlib.sha256()
+            for chunk in red_gated(chunk_text(reader)):
+                hasher.update(chunk.encode("utf-8"))
+        except (MemoryNodeValidationError, *READ_ERRORS):
             return None
-        return None if contains_red_material(content) else content
+        return reader if hasher.hexdigest() == digest else None
 
     # --- index / usage ----------------------------------------------------
 
-    @staticmethod
-    def _index_entry(node: dict[str, Any]) -> dict[str, Any]:
-        raw_ref = node.get("raw_ref") if isinstance(node.get("raw_ref"), dict) else None
-        ref = {"sha256": raw_ref.get("sha256")} if raw_ref else None
-        return {
-            "node_id": node["node_id"],
-            "memory_type": node.get("memory_type", ""),
-            "domain": node.get("domain", "general"),
-            "branch": node.get("branch", ""),
-            "created_on_branch": node.get("created_on_branch", node.get("branch", "")),
-            "visibility": node.get("visibility", "branch_local"),
-            "promotion_status": node.get("promotion_status", "not_promoted"),
-            "summary": node.get("summary", ""),
-            "trigger": node.get("trigger", {}),
-            "topic_tags": node.get("topic_tags", []),
-            "entities": node.get("entities", []),
-            "source_paths": node.get("source_paths", []),
-            "links": node.get("links", []),
-            "quality": node.get("quality", {}),
-            "raw_ref": ref,
-            "updated_at": node.get("updated_at", ""),
-            "created_at": node.get("created_at", ""),
-            # Perf (Addendum 5): the index entry carries EVERY field recall_v2
-            # scores + hard-rejects + renders on, so recall reads index.json
-            # once (O(1)) instead of opening all N node files (O(n)). These
-            # fields make the entry a complete recall payload. RED never reaches
-            # disk, so none of this leaks secret material.
-            "salience": node.get("salience", {}),
-            "sensitivity": node.get("sensitivity", ""),
-            "authority": node.get("authority", ""),
-            "project_id": node.get("project_id", ""),
-            "workspace_instance_id": node.get("workspace_instance_id", ""),
-            "repo_remote_hash": node.get("repo_remote_hash", ""),
-            "commit": node.get("commit", ""),
-            "session_id": node.get("session_id", ""),
-            "detailed_summary": node.get("detailed_summary", ""),
-            "source_description": node.get("source_description", ""),
-        }
-
     def load_index(self, project_id: str) -> dict[str, Any] | None:
-        """Return the parsed index.json for a project, or None if absent/corrupt.
-
-        Perf (Addendum 5): recall reads this single file instead of opening every
-        node file. Each entry in ``nodes`` is a complete recall payload (see
-        ``_index_entry``). Returns None on any read/parse error so callers fall
-        back to the per-node scan and never crash on a damaged index.
+        """Return the current index for a project, or None if absent/corrupt.
+
+        Perf (Addendum 5): recall reads this instead of opening every node
+        file. Each entry in ``nodes`` is a complete recall payload (see
+        ``tree_index.index_entry``). For the files layout the result is the
+        ``index.json`` base with the index journal replayed on top, so it
+        reflects every committed node write. Returns None on any
+        read/parse/replay error so callers fall back to the per-node scan and
+        never crash on a damaged index.
         """
         try:
-            path = self.project_tree(project_id) / "index.json"
+            return self.backend(project_id).load_index()
         except TreeStorePathError:
             return None
-        if not path.exists():
+
+    def candidate_entries(
+        self,
+        project_id: str,
+        search_terms: list[str],
+        *,
+        where: EntryFilter | None = None,
+    ) -> list[dict[str, Any]] | None:
+        """Index entries that could score > 0 for *search_terms* (see backend),
+        optionally narrowed by *where* (see ``entry_filter``)."""
+        try:
+            return self.backend(project_id).candidate_entries(search_terms, where)
+        except TreeStorePathError:
             return None
+
+    def term_bounds(
+        self, project_id: str, terms: list[str] | None = None
+    ) -> dict[str, int] | None:
+        """Per-token scored-field masks for top-k pruning (see backend)."""
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-        except (OSError, json.JSONDecodeError, ValueError):
+            return self.backend(project_id).term_bounds(terms)
+        except TreeStorePathError:
             return None
-        return data if isinstance(data, dict) else None
-
-    @staticmethod
-    def _entry_tokens(entry: dict[str, Any]) -> set[str]:
-        """Maximal ``[A-Za-z0-9_./-]`` runs (len>=3) of an entry's searchable text.
-
-        Perf (Addendum 5): these are the posting tokens. They are deliberately
-        NOT stopword/length-filtered the way ``recall_v2.terms`` filters QUERY
-        terms -- recall matches a query term as a SUBSTRING of the node text, and
-        a non-stopword query term can sit inside a stopword run (e.g. ``her`` in
-        ``where``). Indexing every run keeps candidate selection LOSSLESS: any
-        node that ``score_node`` would rank > 0 shares a token here. Runs shorter
-        than 3 chars cannot contain a (>=3 char) query term, so they are skipped.
+
+    def query(
+        self,
+        project_id: str,
+        *,
+        exclude: dict[str, str | Iterable[str]] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        path: str | Iterable[str] = (),
+        entity: str | Iterable[str] = (),
+        branch: str = "",
+        **facets: str | Iterable[str],
+    ) -> list[dict[str, Any]] | None:
+        """Index entries filtered by facet, e.g.
+        ``query(pid, domain="hooks", sensitivity="GREEN", exclude={"visibility": "conflict"})``.
+
+        A facet takes one value or a list of alternatives; facets are ANDed.
+        Facets: ``tree_index.FACETS``. *since* / *until* (epoch seconds,
+        ``[since, until)``) keep entries last changed in that range; *path*
+        keeps entries with a source path at or under a file or directory
+        (``query(pid, path=".claude/hooks/")``); *entity* keeps entries naming
+        an entity exactly; *branch* keeps that branch's view (main_promoted
+        plus its own branch_local / merge_candidate nodes). The filter works
+        on the index's derived structures before any entry is touched;
+        entries come back in ``node_id`` order. Returns None when the index
+        is unusable.
         """
-        trigger = entry.get("trigger")
-        trigger_text = " ".join(str(v) for v in trigger.values()) if isinstance(trigger, dict) else str(trigger or "")
-        parts = [
-            str(entry.get("summary", "")),
-            trigger_text,
-            " ".join(str(x) for x in entry.get("entities", []) or []),
-            " ".join(str(x) for x in entry.get("source_paths", []) or []),
-            " ".join(str(x) for x in entry.get("topic_tags", []) or []),
-            " ".join(str(x) for x in entry.get("links", []) or []),
-        ]
-        blob = " ".join(parts).lower()
-        return {tok for tok in re.findall(r"[A-Za-z0-9_./-]+", blob) if len(tok) >= 3}
-
-    def _build_postings(self, nodes: list[dict[str, Any]]) -> dict[str, list[str]]:
-        postings: dict[str, list[str]] = {}
-        for entry in nodes:
-            node_id = entry.get("node_id")
-            if not node_id:
-                continue
-            for tok in self._entry_tokens(entry):
-                postings.setdefault(tok, []).append(node_id)
-        for tok in postings:
-            postings[tok] = sorted(set(postings[tok]))
-        return postings
-
-    def _write_index(self, project_id: str) -> None:
-        root = self.ensure_layout(project_id)
-        nodes = self.list_nodes(project_id)
-        index = {
-            "schema_version": INDEX_SCHEMA_VERSION,
+        where = entry_filter(facets, exclude, since, until, path, entity, branch)
+        index = self.load_index(project_id)
+        return None if index is None else select_entries(index, where.ids(index))
+
+    def query_ids(
+        self,
+        project_id: str,
+        *,
+        exclude: dict[str, str | Iterable[str]] | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        path: str | Iterable[str] = (),
+        entity: str | Iterable[str] = (),
+        branch: str = "",
+        **facets: str | Iterable[str],
+    ) -> list[str] | None:
+        """Sorted node ids matching ``query``'s filter, without the entries."""
+        where = entry_filter(facets, exclude, since, until, path, entity, branch)
+        index = self.load_index(project_id)
+        return None if index is None else where.ids(index)
+
+    def reindex(self, project_id: str) -> dict[str, Any]:
+        """Rebuild the index from the stored nodes (explicit / corruption path).
+
+        This is the only O(n) index operation: it re-reads and re-validates
+        every node. Normal writes never call it; it runs on demand or when a
+        write finds the index or its journal damaged.
+        """
+        backend = self.backend(project_id)
+        self.ensure_layout(project_id)
+        with backend.index_lock():
+            generation = backend.last_generation() + 1
+            index = build_index(project_id, self.list_nodes(project_id), max(generation, 0))
+            backend.commit_index(index)
+        return index
+
+    def compact_index(self, project_id: str) -> dict[str, Any]:
+        """Fold pending index deltas into the stored base index.
+
+        A crash between writing the base and truncating the journal leaves
+        deltas that are already in the base; replaying them again is a no-op
+        (see ``tree_index.apply_delta``).
+        """
+        self.ensure_layout(project_id)
+        backend = self.backend(project_id)
+        with backend.index_lock():
+            index = backend.load_index()
+            if index is None:
+                return self.reindex(project_id)
+            if migrate_index(index, lambda node_id: self.load_node(project_id, node_id)):
+                index["generation"] = int(index["generation"]) + 1
+            backend.commit_index(index)
+        return index
+
+    def note_stale_entries(self, project_id: str, node_ids: Iterable[str]) -> None:
+        """Remember index entries recall had to resolve from their node files.
+
+        A hint, not state: it is rewritten only when it gains ids, a lost
+        update merely waits for the next recall to note the ids again, and
+        ``_upgrade_noted`` drops ids whose node is gone.
+        """
+        noted = self._noted_upgrades(project_id)
+        merged = sorted(set(noted) | {str(node_id) for node_id in node_ids})
+        if merged == noted:
+            return
+        try:
+            atomic_write_json(
+                self.project_tree(project_id) / UPGRADE_NAME, {"node_ids": merged}, fsync=False
+            )
+        except OSError:
+            pass  # read-only tree: recall still works, just on the slow path
+
+    def _noted_upgrades(self, project_id: str) -> list[str]:
+        path = self.project_tree(project_id) / UPGRADE_NAME
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return []
+        ids = data.get("node_ids") if isinstance(data, dict) else None
+        return sorted(str(node_id) for node_id in ids) if isinstance(ids, list) else []
+
+    def _upgrade_noted(self, project_id: str) -> None:
+        """Rebuild up to ``UPGRADE_BATCH`` noted entries as plain upserts.
+
+        Runs after an index write, so an old tree converges to current entries
+        a batch per write instead of paying a node read per thin entry on
+        every recall forever.
+        """
+        path = self.project_tree(project_id) / UPGRADE_NAME
+        if not path.exists():
+            return
+        noted = self._noted_upgrades(project_id)
+        batch, rest = noted[:UPGRADE_BATCH], noted[UPGRADE_BATCH:]
+        if rest:
+            atomic_write_json(path, {"node_ids": rest}, fsync=False)
+        else:
+            path.unlink(missing_ok=True)
+        deltas = []
+        for node_id in batch:
+            node = self.load_node(project_id, node_id)
+            if node is not None:
+                deltas.append({"op": "upsert", "entry": index_entry(node)})
+        if deltas:
+            self.backend(project_id).append_index_deltas(deltas)
+
+    def upgrade_index(self, project_id: str) -> dict[str, Any]:
+        """Migrate the index to the current schema and rebuild stale entries.
+
+        The explicit (or background: ``tree_admin upgrade-index``) form of
+        what compaction and ``_upgrade_noted`` do piecemeal. O(stale entries)
+        node reads plus one index commit; a no-op on an up-to-date index.
+        """
+        self.ensure_layout(project_id)
+        backend = self.backend(project_id)
+
+        def resolve(node_id: str) -> dict[str, Any] | None:
+            return self.load_node(project_id, node_id)
+
+        with backend.index_lock():
+            index = backend.load_index()
+            if index is None:
+                index = self.reindex(project_id)
+                from_version, migrated, stale_before = None, [], len(index["nodes"])
+            else:
+                from_version = index.get("schema_version")
+                stale_before = sum(1 for e in index["nodes"] if stale_entry(e))
+                migrated = migrate_index(index, resolve)
+                if migrated or upgrade_entries(index, resolve):
+                    index["generation"] = int(index["generation"]) + 1
+                    backend.commit_index(index)
+        (self.project_tree(project_id) / UPGRADE_NAME).unlink(missing_ok=True)
+        stale = sum(1 for e in index["nodes"] if stale_entry(e))
+        return {
             "project_id": project_id,
-            "updated_at": now_iso(),
-            "nodes": nodes,
-            # Perf (Addendum 5): inverted index (token -> node_ids) so recall scores
-            # only candidate nodes that share a term with the query, not all N.
-            # Lossless: see _entry_tokens. recall falls back to scoring all nodes
-            # when "postings" is absent (older index).
-            "postings": self._build_postings(nodes),
+            "from_version": from_version,
+            "schema_version": index["schema_version"],
+            "migrated": migrated,
+            "upgraded": stale_before - stale,
+            "stale": stale,
+            "generation": index["generation"],
         }
-        atomic_write_json(root / "index.json", index)
 
-    def _append_usage(self, root: Path, event: dict[str, Any]) -> None:
-        path = root / "usage.jsonl"
-        line = json.dumps(event, ensure_ascii=True, sort_keys=True) + "\n"
-        existing = path.read_text(encoding="utf-8") if path.exists() else ""
-        atomic_write_text(path, existing + line)
+    def _record_index_delta(self, project_id: str, delta: dict[str, Any]) -> None:
+        self._record_index_deltas(project_id, [delta])
+
+    def _record_index_deltas(self, project_id: str, deltas: list[dict[str, Any]]) -> None:
+        if self._defer_index_depth > 0:
+            self._pending_deltas.setdefault(project_id, []).extend(deltas)
+        else:
+            self.backend(project_id).append_index_deltas(deltas)
+            self._upgrade_noted(project_id)
+
+    def usage_log(self, project_id: str) -> UsageLog:
+        return UsageLog(self.project_tree(project_id))
+
+    def iter_usage(self, project_id: str) -> Iterator[dict[str, Any]]:
+        """Stream usage events across every rotated segment, oldest first."""
+        return self.backend(project_id).iter_usage()
+
+
+def _prune_empty_fanout(directory: Path) -> None:
+    """Remove fan-out directories left empty after un-sharding."""
+    if not directory.exists():
+        return
+    for path in sorted(directory.glob(f"{_SHARD_GLOB}/**"), reverse=True):
+        if path.is_dir():
+            try:
+                path.rmdir()
+            except OSError:
+                pass  # not empty: a writer with the old layout is still active
+
+
+def _facet_values(facets: dict[str, str | Iterable[str]]) -> dict[str, list[str]]:
+    return {
+        facet: [values] if isinstance(values, str) else [str(v) for v in values]
+        for facet, values in facets.items()
+    }
+
+
+def entry_filter(
+    facets: dict[str, str | Iterable[str]] | None = None,
+    exclude: dict[str, str | Iterable[str]] | None = None,
+    since: int | None = None,
+    until: int | None = None,
+    path: str | Iterable[str] = (),
+    entity: str | Iterable[str] = (),
+    branch: str = "",
+) -> EntryFilter:
+    """An ``EntryFilter`` from loosely typed arguments (a str or a list each).
+
+    Raises TreeStoreError for an unknown facet.
+    """
+    try:
+        return EntryFilter(
+            include=_facet_values(facets or {}),
+            exclude=_facet_values(exclude or {}),
+            since=since,
+            until=until,
+            paths=(path,) if isinstance(path, str) else tuple(path),
+            entities=(entity,) if isinstance(entity, str) else tuple(entity),
+            branch=branch,
+        )
+    except ValueError as exc:
+        raise TreeStoreError(str(exc)) from exc
+
+
+def _configure(backend: StorageBackend, layout: dict[str, Any]) -> None:
+    """Apply the file-layout options of *layout* (sharding, index format)."""
+    if isinstance(backend, FileBackend):
+        backend.sharded = bool(layout.get("shard"))
+        index_format = layout.get("index", DEFAULT_INDEX_FORMAT)
+        backend.index_format = index_format if index_format in INDEX_FORMATS else DEFAULT_INDEX_FORMAT
+
+
+def _backend_class(name: str) -> type[StorageBackend]:
+    module_name, class_name = BACKENDS[name]
+    if module_name == "tree_store":
+        return globals()[class_name]
+    return getattr(_sibling(module_name), class_name)
+
+
+def _sibling(name: str) -> Any:
+    """Import a sibling module lazily (most of them import this one)."""
+    if __package__:
+        return importlib.import_module(f".{name}", __package__)
+    return importlib.import_module(name)  # pragma: no cover - script-style import support.
@@ -0,0 +1,229 @@
+"""Ralph Memory Tree usage log -- O(1) appends with segment rotation.
+
+The per-project ``usage.jsonl`` is an append-only event log. Rewriting the
+whole file on every event made each append O(n) and a project's lifetime
+O(n^2); this module appends for real instead:
+
+    {project_tree}/
+        usage.jsonl            active segment (O_APPEND writes)
+        usage-000001.jsonl.gz  closed segments, oldest first
+        usage-000002.jsonl     (uncompressed when compression is off)
+        .usage.lock            flock target serialising append vs. rotation
+
+Rotation closes the active segment once it passes ``max_bytes`` or once its
+first event is older than ``max_age_seconds`` (read once per segment and
+cached, not on every append). Closed segments are renamed to the next
+sequence number and, optionally, gzip-compressed. ``iter_events`` streams
+every event across closed segments and then the active one, one line at a
+time, so readers never hold a whole segment in memory.
+
+Safety: every append is a single ``os.write`` of one complete line on an
+``O_APPEND`` descriptor under an exclusive lock, so concurrent writers never
+interleave partial lines. A torn final line (crash mid-write) is closed with
+a newline by the next append, so it stays a line of its own: the reader
+skips just that fragment rather than raising, and no later event is lost. A crash between compressing a closed segment
+and unlinking its plain copy leaves both; the ``.gz`` (complete, since it is
+renamed into place) wins on read and the next rotation removes the copy.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
+
+ACTIVE_SEGMENT = "usage.jsonl"
+LOCK_NAME = ".usage.lock"
+SEGMENT_RE = re.compile(r"^usage-(\d{6})\.jsonl(\.gz)?$")
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+# First-event time of each active segment seen by this process, keyed by
+# (st_dev, st_ino) -> (size when read, time). An append-only segment never
+# shrinks, so a smaller size means the inode now belongs to a newer segment.
+_SEGMENT_STARTS: dict[tuple[int, int], tuple[int, datetime | None]] = {}
+
+
+def _parse_at(value: object) -> datetime | None:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class UsageLog:
+    """Append-only, segment-rotated usage log rooted at a project tree."""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS,
+        compress: bool = True,
+        fsync: bool = True,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.compress = compress
+        self.fsync = fsync
+
+    @property
+    def active_path(self) -> Path:
+        return self.root / ACTIVE_SEGMENT
+
+    # --- writing ----------------------------------------------------------
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.root / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # closing the descriptor releases the flock
+
+    def append(self, event: dict[str, Any]) -> None:
+        """Append one event: a single O_APPEND write, independent of log size."""
+        self.extend([event])
+
+    def extend(self, events: list[dict[str, Any]]) -> None:
+        """Append several events with one lock, one write and one fsync."""
+        if not events:
+            return
+        line = "".join(
+            json.dumps(event, ensure_ascii=True, sort_keys=True) + "\n" for event in events
+        ).encode("utf-8")
+        with self._locked():
+            if self._should_rotate():
+                self._rotate_locked()
+            fd = os.open(self.active_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                end = os.fstat(fd).st_size
+                if end and os.pread(fd, 1, end - 1) != b"\n":
+                    # A crash tore the last append: end that fragment on its
+                    # own line so it cannot swallow this event.
+                    line = b"\n" + line
+                os.write(fd, line)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def rotate(self) -> Path | None:
+        """Close the active segment now; return the closed segment path."""
+        with self._locked():
+            return self._rotate_locked()
+
+    def _should_rotate(self) -> bool:
+        try:
+            stat = self.active_path.stat()
+        except FileNotFoundError:
+            return False
+        size = stat.st_size
+        if size == 0:
+            return False
+        if size >= self.max_bytes:
+            return True
+        key = (stat.st_dev, stat.st_ino)
+        cached = _SEGMENT_STARTS.get(key)
+        if cached is not None and cached[0] <= size:
+            first = cached[1]
+        else:
+            first = self._first_event_time()
+            _SEGMENT_STARTS[key] = (size, first)
+        if first is None:
+            return False
+        age = (datetime.now(timezone.utc) - first).total_seconds()
+        return age >= self.max_age_seconds
+
+    def _first_event_time(self) -> datetime | None:
+        try:
+            with self.active_path.open("r", encoding="utf-8") as handle:
+                first_line = handle.readline()
+            event = json.loads(first_line)
+        except (OSError, ValueError):
+            return None
+        return _parse_at(event.get("at")) if isinstance(event, dict) else None
+
+    def _rotate_locked(self) -> Path | None:
+        active = self.active_path
+        if not active.exists() or active.stat().st_size == 0:
+            return None
+        matches = self._segment_matches()
+        for _, path in matches:
+            # Finish an unlink a crash interrupted: the plain copy of a
+            # segment whose .gz already landed.
+            if path.suffix != ".gz" and path.with_name(path.name + ".gz").exists():
+                path.unlink(missing_ok=True)
+        sequence = sorted(int(seq) for seq, _ in matches)
+        closed = self.root / f"usage-{(sequence[-1] if sequence else 0) + 1:06d}.jsonl"
+        stat = active.stat()
+        _SEGMENT_STARTS.pop((stat.st_dev, stat.st_ino), None)
+        os.replace(active, closed)
+        if not self.compress:
+            return closed
+        compressed = closed.with_name(closed.name + ".gz")
+        tmp = closed.with_name(f".{compressed.name}.tmp")
+        with closed.open("rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, compressed)
+        closed.unlink()
+        return compressed
+
+    # --- reading ----------------------------------------------------------
+
+    def _segment_matches(self) -> list[tuple[str, Path]]:
+        if not self.root.exists():
+            return []
+        found: list[tuple[str, Path]] = []
+        for path in self.root.iterdir():
+            match = SEGMENT_RE.match(path.name)
+            if match:
+                found.append((match.group(1), path))
+        return found
+
+    def segments(self) -> list[Path]:
+        """Closed segments, oldest first (the active segment is not included).
+
+        When a segment exists both plain and compressed, only the ``.gz`` is
+        listed, so no event is read twice.
+        """
+        by_sequence: dict[str, Path] = {}
+        for seq, path in self._segment_matches():
+            if seq not in by_sequence or path.suffix == ".gz":
+                by_sequence[seq] = path
+        return [by_sequence[seq] for seq in sorted(by_sequence)]
+
+    def iter_events(self) -> Iterator[dict[str, Any]]:
+        """Stream events from every closed segment, then the active one."""
+        for path in [*self.segments(), self.active_path]:
+            if not path.exists():
+                continue
+            opener = gzip.open if path.suffix == ".gz" else open
+            try:
+                with opener(path, "rt", encoding="utf-8") as handle:
+                    for line in handle:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            continue  # torn tail from an interrupted append
+                        if isinstance(event, dict):
+                            yield event
+            except (OSError, EOFError):
+                continue
@@ -0,0 +1,205 @@
+"""Ralph Memory Tree write-ahead log -- group commit for ``batched`` durability.
+
+In ``strict`` mode every node write fsyncs the node file, its directory, the
+index journal and the usage log. ``batched`` mode skips those fsyncs and
+instead records each write here; a burst of writes then shares one fsync of
+this log (group commit):
+
+    {project_tree}/
+        write-ahead.jsonl     committed records since the last checkpoint
+        .write-ahead.lock     flock: commits shared, checkpoint/replay exclusive
+        .write-ahead.writers  flock: shared by every writer with records
+                              not yet checkpointed, exclusive for replay
+
+Records are full, self-describing writes (``{"op": "node", "node": ...}`` or
+``{"op": "delete", "node_id"}``), so re-applying one is idempotent. Raw blobs are streamed and fsynced by the
+raw store instead; ``{"op": "raw", "digest", "content"}`` records left by
+older writers are still replayed.
+
+Checkpoint: once the data files themselves are flushed (``os.sync``) the log
+is truncated. It runs only under the exclusive lock, so it can never drop a
+record another process is in the middle of committing; when the lock is busy
+the checkpoint is simply skipped and left to whoever holds it.
+
+A writer checkpoints when its group ends, once ``GROUP_MAX_RECORDS`` writes
+are committed outside a group, and at process exit; until then it holds the
+writers lock shared.
+
+Replay: records left in the log while nobody holds the writers lock belong to
+a writer that died before checkpointing. ``TreeStore`` re-applies them (newer
+on-disk versions win) before its first write to the tree and then
+checkpoints; readers never replay, and a live writer's log is never touched.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms.
+    fcntl = None  # type: ignore[assignment]
+
+WRITE_AHEAD_NAME = "write-ahead.jsonl"
+LOCK_NAME = ".write-ahead.lock"
+WRITERS_LOCK_NAME = ".write-ahead.writers"
+# A group commits on its own once this many records are buffered, bounding
+# both memory and the window of work a crash can lose.
+GROUP_MAX_RECORDS = 256
+
+# Logs holding the writers lock, checkpointed at exit. A process that dies
+# without running this leaves its records for the next writer to replay.
+_HELD: "set[WriteAheadLog]" = set()
+
+
+@atexit.register
+def _checkpoint_held() -> None:
+    for log in list(_HELD):
+        if log.root.is_dir():
+            log.checkpoint()
+        else:  # the tree was removed; nothing left to flush
+            log._release_writer()
+
+
+class WriteAheadLog:
+    """Append-only, group-committed write-ahead log for one project tree."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._buffer: list[str] = []
+        self._writer_fd: int | None = None
+        # Records this log committed since its last checkpoint.
+        self.committed = 0
+
+    @property
+    def path(self) -> Path:
+        return self.root / WRITE_AHEAD_NAME
+
+    def _lock_fd(self, name: str, exclusive: bool, blocking: bool) -> tuple[int, bool]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.root / name, os.O_RDWR | os.O_CREAT, 0o600)
+        acquired = True
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            try:
+                fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+            except BlockingIOError:
+                acquired = False
+            except BaseException:
+                os.close(fd)
+                raise
+        return fd, acquired
+
+    @contextmanager
+    def _locked(
+        self, exclusive: bool, blocking: bool = True, name: str = LOCK_NAME
+    ) -> Iterator[bool]:
+        fd, acquired = self._lock_fd(name, exclusive, blocking)
+        try:
+            yield acquired
+        finally:
+            os.close(fd)  # closing the descriptor releases the flock
+
+    def _hold_writer(self) -> None:
+        if self._writer_fd is None:
+            self._writer_fd, _ = self._lock_fd(WRITERS_LOCK_NAME, exclusive=False, blocking=True)
+            _HELD.add(self)
+
+    def _release_writer(self) -> None:
+        if self._writer_fd is not None:
+            os.close(self._writer_fd)
+            self._writer_fd = None
+        _HELD.discard(self)
+
+    # --- writing ----------------------------------------------------------
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def record(self, record: dict[str, Any]) -> None:
+        """Buffer *record*; nothing reaches disk until ``commit``."""
+        self._buffer.append(json.dumps(record, ensure_ascii=True, sort_keys=True) + "\n")
+
+    def commit(self) -> None:
+        """Write every buffered record with one write and one fsync."""
+        if not self._buffer:
+            return
+        data = "".join(self._buffer).encode("utf-8")
+        self._hold_writer()
+        with self._locked(exclusive=False):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.committed += len(self._buffer)
+        self._buffer.clear()
+
+    def checkpoint(self) -> bool:
+        """Flush data files and truncate the log; False if the lock is busy.
+
+        Either way this writer's hold is released: a busy lock means another
+        writer is mid-commit and will checkpoint these records with its own.
+        """
+        try:
+            with self._locked(exclusive=True, blocking=False) as acquired:
+                if acquired:
+                    self._checkpoint_locked()
+                return acquired
+        finally:
+            self.committed = 0
+            self._release_writer()
+
+    def _checkpoint_locked(self) -> None:
+        if not self.path.exists():
+            return
+        sync = getattr(os, "sync", None)
+        if sync is not None:
+            sync()
+        os.truncate(self.path, 0)
+
+    # --- replay -----------------------------------------------------------
+
+    def has_records(self) -> bool:
+        try:
+            return self.path.stat().st_size > 0
+        except FileNotFoundError:
+            return False
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn tail: that group never committed
+                if isinstance(record, dict):
+                    yield record
+
+    def replay(self, apply: Callable[[list[dict[str, Any]]], None]) -> int:
+        """Hand every committed record to *apply*, then checkpoint.
+
+        Returns the number of records replayed; 0 when a live writer still
+        holds the writers lock (it will checkpoint itself) or the log lock.
+        """
+        self._release_writer()  # this log's own records are replayed too
+        with self._locked(exclusive=True, blocking=False, name=WRITERS_LOCK_NAME) as idle:
+            if not idle:
+                return 0
+            with self._locked(exclusive=True, blocking=False) as acquired:
+                if not acquired:
+                    return 0
+                records = list(self.iter_records())
+                if records:
+                    apply(records)
+                self._checkpoint_locked()
+                return len(records)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""tree_store_contention.py -- Memory tree write throughput under contention.
+
+Measures how many ``learn_capture`` writes per second ONE shared memory tree
+sustains as the number of concurrent writer processes grows (the
+codex/claude agents, worktrees and teammates all share
+``RALPH_MEMORY_HOME``). Each run uses a fresh temporary tree, so this is
+READ-ONLY with respect to the real ``~/.ralph``.
+
+After every run the index is checked against the stored nodes; a lost
+index entry is reported as ``"lost_index_entries"`` > 0.
+
+Usage:
+    python3 tests/benchmark/tree_store_contention.py
+    python3 tests/benchmark/tree_store_contention.py --writers 1,4,16 --captures 100
+    python3 tests/benchmark/tree_store_contention.py --durability batched --out results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+MEMORY_DIR = REPO_ROOT / "scripts" / "memory"
+sys.path.insert(0, str(MEMORY_DIR))
+
+from tree_store import DURABILITY_MODES, TreeStore  # noqa: E402
+
+PROJECT_ID = "benchContention"
+
+_WORKER = textwrap.dedent(
+    """
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import learn_capture
+    home, worker, count = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+    sys.stdin.readline()  # start barrier: every worker begins together
+    for i in range(count):
+        learn_capture.capture(
+            f"Decision: worker {worker} lesson {i} uses bcrypt cost 12.\\nValidated: passed.",
+            project_id=sys.argv[5],
+            project_root=".",
+            branch="main",
+            session_id=f"bench-{worker}",
+            ralph_home=learn_capture.Path(home),
+        )
+    """
+)
+
+
+def run_once(writers: int, captures: int, durability: str) -> dict[str, object]:
+    with tempfile.TemporaryDirectory(prefix="ralph-contention-") as tmp:
+        env = {**os.environ, "RALPH_MEMORY_DURABILITY": durability}
+        procs = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    _WORKER,
+                    str(MEMORY_DIR),
+                    tmp,
+                    str(worker),
+                    str(captures),
+                    PROJECT_ID,
+                ],
+                stdin=subprocess.PIPE,
+                env=env,
+                text=True,
+            )
+            for worker in range(writers)
+        ]
+        time.sleep(0.5)  # let every interpreter finish importing
+        started = time.perf_counter()
+        for proc in procs:
+            assert proc.stdin is not None
+            proc.stdin.write("go\n")
+            proc.stdin.close()
+        failed = sum(1 for proc in procs if proc.wait() != 0)
+        elapsed = time.perf_counter() - started
+
+        store = TreeStore(Path(tmp))
+        stored = {node["node_id"] for node in store.list_nodes(PROJECT_ID)}
+        index = store.load_index(PROJECT_ID) or {"nodes": []}
+        indexed = {entry["node_id"] for entry in index["nodes"]}
+        total = writers * captures
+        return {
+            "writers": writers,
+            "captures": total,
+            "failed_writers": failed,
+            "elapsed_s": round(elapsed, 3),
+            "writes_per_s": round(total / elapsed, 1) if elapsed else None,
+            "stored_nodes": len(stored),
+            "lost_index_entries": len(stored - indexed),
+        }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", default="1,2,4,8", help="Comma-separated writer counts.")
+    parser.add_argument("--captures", type=int, default=50, help="Writes per writer.")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="strict")
+    parser.add_argument("--out", type=Path, default=None, help="Also write the JSON here.")
+    args = parser.parse_args(argv)
+
+    runs = [
+        run_once(int(count), args.captures, args.durability)
+        for count in args.writers.split(",")
+        if count.strip()
+    ]
+    report = {
+        "benchmark": "tree_store_contention",
+        "generated_at": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "durability": args.durability,
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    return 1 if any(run["lost_index_entries"] for run in runs) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,241 @@
+"""Tests for the binary, mmap-able index format (index.bin).
+
+Covers: encode/decode round trips, varint delta postings, exact and substring
+term lookups (trigram intersection matching the ``termtext`` scan), meta keys
+decoded one at a time (version 2 files still read), binary trees answering
+candidate lookups exactly like the JSON scan (with and without a pending
+journal), a branch view and the term bounds decoding only their own meta
+keys, identical
+recall results, torn files forcing a reindex, switching formats in place,
+and the tree_admin ``index-format`` / ``dump-index`` commands.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import binary_index  # noqa: E402
+from binary_index import BinaryIndex, decode_deltas, encode_index, encode_varint  # noqa: E402
+from recall_v2 import Context, recall  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_index import EntryFilter, build_bounds, build_index, index_entry  # noqa: E402
+from tree_store import StorageBackend, TreeStore  # noqa: E402
+
+TERMS = [["sql"], ["parameterized"], ["ook"], ["cache", "stdin"], ["nothing-matches"], []]
+
+
+def _payload(project_id: str, **overrides):
+    payload = {
+        "project_id": project_id,
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "topic_tags": ["database", "sql"],
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+def _seed(store: TreeStore, project_id: str = "projA") -> list[str]:
+    summaries = [
+        "Use parameterized queries for all database operations.",
+        "Hooks read stdin json and emit json on stdout.",
+        "Cache the token lookup between hook invocations.",
+        "Prefer pytest fixtures over global sql state.",
+    ]
+    return [
+        store.create_node(_payload(project_id, summary=s, topic_tags=[f"tag{i}"]))["node_id"]
+        for i, s in enumerate(summaries)
+    ]
+
+
+@pytest.fixture()
+def binary_store(tmp_path) -> TreeStore:
+    return TreeStore(tmp_path / "ralph_home", index_format="binary")
+
+
+def _ctx(project_id: str) -> Context:
+    return Context(project_root=Path("."), project_id=project_id, workspace_instance_id="ws1", branch="main")
+
+
+def test_varint_deltas_round_trip():
+    ids = [0, 1, 5, 130, 20000, 20001, 3_000_000]
+    out = bytearray()
+    last = 0
+    for doc in ids:
+        encode_varint(doc - last, out)
+        last = doc
+    assert decode_deltas(bytes(out), len(ids)) == ids
+
+
+def test_encode_round_trips_the_index(tmp_path):
+    entries = [
+        index_entry(_payload("projA", node_id=f"node_{i:04d}", summary=f"rule {i} about sql"))
+        for i in range(30)
+    ]
+    index = build_index("projA", entries, generation=7)
+    path = tmp_path / "index.bin"
+    path.write_bytes(encode_index(index))
+    with BinaryIndex(path) as reader:
+        assert reader.generation == 7 and reader.doc_count == 30
+        decoded = reader.to_index()
+        assert reader.find_doc("node_0012") == 12 and reader.find_doc("node_9999") is None
+        assert [reader.node_id(d) for d in reader.lookup("sql")] == [e["node_id"] for e in entries]
+        assert reader.lookup("absent") == []
+        assert {reader.term(t) for t in reader.matching_terms("bou")} == {"about"}
+    assert decoded["nodes"] == index["nodes"] and decoded["postings"] == index["postings"]
+    assert decoded["schema_version"] == index["schema_version"]
+    assert path.stat().st_size < len(json.dumps(index, indent=2, sort_keys=True))
+
+
+def test_meta_keys_decode_one_at_a_time(tmp_path, monkeypatch):
+    entries = [
+        index_entry(_payload("projA", node_id=f"node_{i}", summary=f"sql {i}")) for i in range(5)
+    ]
+    index = build_index("projA", entries, generation=2)
+    path = tmp_path / "index.bin"
+    path.write_bytes(encode_index(index))
+    with BinaryIndex(path) as reader:
+        assert reader.meta_view(["branches", "absent"]) == {"branches": index["branches"]}
+        assert reader.meta()["paths"] == index["paths"] and "nodes" not in reader.meta()
+
+    # A version 2 file kept the whole meta as one object; it still reads.
+    monkeypatch.setattr(binary_index, "VERSION", 2)
+    monkeypatch.setattr(binary_index, "_encode_meta", binary_index._compact)
+    path.write_bytes(encode_index(index))
+    with BinaryIndex(path) as reader:
+        assert reader.version == 2 and reader.to_index()["nodes"] == index["nodes"]
+        assert reader.meta_view(["bounds"]) == {"bounds": index["bounds"]}
+
+
+def test_branch_view_decodes_only_the_branch_partitions(binary_store, monkeypatch):
+    _seed(binary_store)
+    binary_store.compact_index("projA")
+    read: list[str] = []
+    real = BinaryIndex.meta_view
+    monkeypatch.setattr(BinaryIndex, "meta", lambda self: pytest.fail("whole meta decoded"))
+    monkeypatch.setattr(
+        BinaryIndex, "meta_view", lambda self, keys: real(self, read.extend(keys) or keys)
+    )
+    found = binary_store.backend("projA").candidate_entries(["sql"], EntryFilter(branch="main"))
+    assert found and read == ["branches"]
+
+
+def test_term_bounds_decode_only_the_bounds(binary_store, monkeypatch):
+    _seed(binary_store)
+    binary_store.compact_index("projA")
+    backend = binary_store.backend("projA")
+    expected = build_bounds(binary_store.load_index("projA")["nodes"])
+    monkeypatch.setattr(BinaryIndex, "meta", lambda self: pytest.fail("whole meta decoded"))
+    base = backend.term_bounds()
+    assert base == expected
+    binary_store.create_node(_payload("projA", summary="Journaled zeppelins rule."))
+    assert backend.term_bounds()["zeppelins"] and "zeppelins" not in base  # base left as is
+
+
+def test_binary_tree_writes_index_bin(binary_store):
+    _seed(binary_store)
+    assert binary_store.layout("projA")["index"] == "binary"
+    assert (binary_store.project_tree("projA") / "index.bin").exists()
+    assert not binary_store.index_path("projA").exists()
+    assert len(binary_store.load_index("projA")["nodes"]) == 4
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_candidates_match_the_json_scan(binary_store, compacted):
+    ids = _seed(binary_store)
+    if compacted:
+        binary_store.compact_index("projA")
+    # Journal on top of the base: an update, a delete and a new node.
+    binary_store.update_node("projA", ids[0], {"summary": "Parameterized statements only."})
+    binary_store.delete_nodes("projA", [ids[1]])
+    binary_store.create_node(_payload("projA", summary="Cache stdin reads per session."))
+    backend = binary_store.backend("projA")
+    for terms in TERMS:
+        fast = backend.candidate_entries(terms)
+        scanned = StorageBackend.candidate_entries(backend, terms)
+        assert fast == scanned, terms
+
+
+def test_recall_is_identical_across_formats(tmp_path):
+    reports = []
+    for fmt in ("json", "binary"):
+        store = TreeStore(tmp_path / fmt, index_format=fmt)
+        _seed(store)
+        store.compact_index("projA")
+        reports.append(recall("sql hooks cache", _ctx("projA"), tmp_path / fmt))
+    assert reports[0]["memory_context"] == reports[1]["memory_context"]
+    assert reports[0]["MEMORY_TRACE"]["rejected"] == reports[1]["MEMORY_TRACE"]["rejected"]
+
+
+def test_torn_binary_index_forces_reindex(binary_store):
+    _seed(binary_store)
+    binary_store.compact_index("projA")
+    path = binary_store.project_tree("projA") / "index.bin"
+    path.write_bytes(path.read_bytes()[:-3])
+    assert binary_store.load_index("projA") is None
+    assert binary_store.candidate_entries("projA", ["sql"]) is None
+    binary_store.create_node(_payload("projA", summary="Another sql rule."))
+    assert len(binary_store.load_index("projA")["nodes"]) == 5
+
+
+def test_set_index_format_switches_in_place(tmp_path):
+    store = TreeStore(tmp_path / "home")
+    ids = _seed(store)
+    before = store.load_index("projA")
+    stats = store.set_index_format("projA", "binary")
+    assert stats["index"] == "binary" and stats["nodes"] == 4
+    assert not store.index_path("projA").exists()
+    after = store.load_index("projA")
+    assert after["nodes"] == before["nodes"] and after["postings"] == before["postings"]
+    store.update_node("projA", ids[2], {"summary": "Cache tokens per process."})
+    reopened = TreeStore(tmp_path / "home").candidate_entries("projA", ["process"])
+    assert [e["node_id"] for e in reopened] == [ids[2]]
+    store.set_index_format("projA", "json")
+    assert store.index_path("projA").exists()
+    assert not (store.project_tree("projA") / "index.bin").exists()
+    assert store.load_index("projA")["nodes"] == TreeStore(tmp_path / "home").reindex("projA")["nodes"]
+
+
+def test_admin_index_format_and_dump(tmp_path, capsys):
+    store = TreeStore(tmp_path / "home")
+    _seed(store)
+    base = ["--ralph-home", str(tmp_path / "home"), "--project-id", "projA"]
+    assert admin_main([*base, "index-format", "--to", "binary"]) == 0
+    assert json.loads(capsys.readouterr().out)["index"] == "binary"
+    out = tmp_path / "debug.json"
+    assert admin_main([*base, "dump-index", "--out", str(out)]) == 0
+    assert json.loads(capsys.readouterr().out)["nodes"] == 4
+    assert len(json.loads(out.read_text(encoding="utf-8"))["nodes"]) == 4
+
+
+def test_trigram_lookup_matches_the_termtext_scan(tmp_path):
+    rng = random.Random(13)
+    words = ["".join(rng.choice("abcd._") for _ in range(rng.randint(3, 8))) for _ in range(300)]
+    entries = [
+        index_entry(_payload("projA", node_id=f"node_{i:04d}", summary=" ".join(words[i::50])))
+        for i in range(50)
+    ]
+    path = tmp_path / "index.bin"
+    path.write_bytes(encode_index(build_index("projA", entries)))
+    with BinaryIndex(path) as reader:
+        assert reader.gram_count > 0
+        for needle in words[:80] + ["ab", "d.", "a", "abcdabcd"]:
+            fast = list(reader.matching_terms(needle))
+            assert fast == list(reader._scan_terms(needle.encode())), needle
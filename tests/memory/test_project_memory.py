@@ -4,12 +4,15 @@ Covers the safety contract that motivates the script:
   * The delimited block is inserted when absent.
   * Pre-existing user content OUTSIDE the block is preserved byte-for-byte.
   * Re-running is idempotent (no drift on a second pass).
-  * Only GREEN, non-deprecated nodes are projected (YELLOW excluded).
+  * Only GREEN, non-deprecated nodes are projected (YELLOW excluded), picked
+    through the sensitivity facet without loading every node, and re-checked
+    on the loaded node in case its index entry lags.
   * Native project id matches Claude's path->dashes mapping.
 """
 
 from __future__ import annotations
 
+import json
 import sys
 from pathlib import Path
 from typing import Any
@@ -123,6 +126,39 @@ def test_select_green_nodes_excludes_yellow_and_deprecated(store: TreeStore) ->
     assert len(selected) == 1  # only the live GREEN node
 
 
+def test_select_green_nodes_loads_only_the_winners(
+    store: TreeStore, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    pid = "projSelect"
+    for i in range(6):
+        store.create_node(_payload(pid, summary=f"Green rule {i}.", quality={"confidence": i / 10}))
+    store.create_node(_payload(pid, sensitivity="YELLOW", summary="Yellow rule."))
+    expected = [n["node_id"] for n in select_green_nodes(store, pid, top_n=2)]
+
+    loads: list[str] = []
+    original = TreeStore.load_node
+    monkeypatch.setattr(
+        TreeStore, "load_node", lambda self, p, n: loads.append(n) or original(self, p, n)
+    )
+    monkeypatch.setattr(TreeStore, "list_nodes", lambda *a: pytest.fail("list_nodes called"))
+    selected = select_green_nodes(store, pid, top_n=2)
+    assert [n["node_id"] for n in selected] == expected and sorted(loads) == sorted(expected)
+    assert [n["summary"] for n in selected] == ["Green rule 5.", "Green rule 4."]
+    assert all("detailed_summary" in n for n in selected)
+
+
+def test_select_green_nodes_rechecks_the_loaded_node(store: TreeStore) -> None:
+    pid = "projSelect"
+    top = store.create_node(_payload(pid, summary="Top rule.", quality={"confidence": 0.9}))
+    other = store.create_node(_payload(pid, summary="Other rule.", quality={"confidence": 0.5}))
+    # The node file moves on while its index entry still says GREEN.
+    path = store.node_path(pid, top["node_id"])
+    node = json.loads(path.read_text(encoding="utf-8"))
+    node["sensitivity"] = "YELLOW"
+    path.write_text(json.dumps(node), encoding="utf-8")
+    assert [n["node_id"] for n in select_green_nodes(store, pid, top_n=1)] == [other["node_id"]]
+
+
 # --- end-to-end projection ---------------------------------------------------
 
 def test_project_memory_inserts_block_and_is_idempotent(
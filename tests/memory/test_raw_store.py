@@ -0,0 +1,182 @@
+"""Tests for the compressed, chunk-deduplicated raw store.
+
+Covers: streaming saves from strings, file objects and generators, chunk
+dedup across blobs, compression, the lzma codec, RED straddling a chunk
+boundary storing no blob (its clean chunks left for gc, even those a
+concurrent blob reuses), private keys spanning several chunks, tampered
+chunks and manifests reading as None, and legacy ``<sha>.txt`` blobs
+staying readable.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import raw_store  # noqa: E402
+from memory_node import MemoryNodeValidationError, contains_red_material, sha256_text  # noqa: E402
+from raw_store import chunk_text, red_gated  # noqa: E402
+from tree_gc import collect  # noqa: E402
+from tree_store import TreeStore  # noqa: E402
+
+RED = "token = sk-DEADBEEF0123456789ABCDEF0123"
+
+
+@pytest.fixture()
+def store(tmp_path, monkeypatch) -> TreeStore:
+    monkeypatch.setattr(raw_store, "CHUNK_CHARS", 64)
+    return TreeStore(tmp_path / "ralph_home")
+
+
+def _chunk_files(store: TreeStore) -> list[Path]:
+    return sorted(p for p in (store.raw_dir("projA") / "chunks").rglob("*") if p.is_file())
+
+
+def _body(lines: int, tag: str = "") -> str:
+    return "".join(f"build step {i:04d} finished ok {tag}\n" for i in range(lines))
+
+
+def test_chunk_text_ignores_input_splitting():
+    text = _body(20)
+    assert list(chunk_text([text], 64)) == list(chunk_text(iter(text), 64))
+    assert "".join(chunk_text([text], 64)) == text
+
+
+def test_red_gate_catches_secret_across_boundary():
+    chunks = list(chunk_text(["x" * 50 + RED + "y" * 50], 64))
+    assert not any(RED in chunk for chunk in chunks)
+    with pytest.raises(MemoryNodeValidationError):
+        list(red_gated(chunks))
+
+
+def _pem(marker: str) -> str:
+    # Assembled so this file does not itself contain a key marker.
+    return "-" * 5 + marker + " RSA " + "PRIVATE" + " KEY" + "-" * 5
+
+
+def _private_key(body_chars: int) -> str:
+    body = "".join("MIIEowIBAAKCAQEA7x\n"[i % 19] for i in range(body_chars))
+    return _pem("BEGIN") + "\n" + body + "\n" + _pem("END") + "\n"
+
+
+def test_red_gate_tracks_private_keys_across_chunks(monkeypatch):
+    monkeypatch.setattr(raw_store, "RED_OVERLAP_CHARS", 32)  # > a marker
+    text = "x" * 200 + _private_key(500) + "y" * 40
+    released: list[str] = []
+    with pytest.raises(MemoryNodeValidationError):
+        released.extend(red_gated(chunk_text([text], 64)))
+    assert "".join(released) == "x" * 128  # nothing from the BEGIN marker on
+    # A lone marker, or END before BEGIN, is not a key.
+    for harmless in (_pem("BEGIN") + "z" * 300, _pem("END") + "z" * 300 + _pem("BEGIN")):
+        assert not contains_red_material(harmless)
+        assert "".join(red_gated(chunk_text([harmless], 64))) == harmless
+
+
+def test_private_key_straddling_a_real_chunk_boundary_leaves_nothing(store, monkeypatch):
+    monkeypatch.setattr(raw_store, "CHUNK_CHARS", 64 * 1024)
+    text = "x" * (64 * 1024 - 5000) + _private_key(6500) + "y" * 100
+    assert contains_red_material(text)
+    with pytest.raises(MemoryNodeValidationError):
+        store.save_raw("projA", text)
+    raw_dir = store.raw_dir("projA")
+    assert not raw_dir.exists() or not any(p.is_file() for p in raw_dir.rglob("*"))
+
+
+def test_streaming_inputs_store_the_same_blob(store):
+    text = _body(40)
+    from_str = store.save_raw("projA", text)
+    from_file = store.save_raw("projA", io.StringIO(text))
+    from_gen = store.save_raw("projA", (line + "\n" for line in text.splitlines()))
+    assert from_str["sha256"] == from_file["sha256"] == from_gen["sha256"] == sha256_text(text)
+    assert store.read_raw("projA", from_str["sha256"]) == text
+    streamed = store.iter_raw("projA", from_str["sha256"])
+    assert streamed is not None and "".join(streamed) == text
+
+
+def test_shared_prefix_shares_chunks(store):
+    prefix = _body(40)
+    store.save_raw("projA", prefix)
+    before = len(_chunk_files(store))
+    digest = store.save_raw("projA", prefix + _body(2, "resumed"))["sha256"]
+    assert len(_chunk_files(store)) - before <= 2
+    assert store.read_raw("projA", digest) == prefix + _body(2, "resumed")
+
+
+def test_chunks_are_compressed(store, monkeypatch):
+    monkeypatch.setattr(raw_store, "CHUNK_CHARS", 64 * 1024)
+    text = _body(5000)
+    saved = store.save_raw("projA", text)
+    manifest = json.loads(Path(saved["path"]).read_text(encoding="utf-8"))
+    assert manifest["bytes"] == len(text.encode("utf-8"))
+    assert manifest["stored_bytes"] * 4 < manifest["bytes"]
+    assert sum(p.stat().st_size for p in _chunk_files(store)) == manifest["stored_bytes"]
+
+
+def test_lzma_codec_from_env(store, monkeypatch):
+    monkeypatch.setenv("RALPH_MEMORY_RAW_CODEC", "lzma")
+    digest = store.save_raw("projA", _body(10))["sha256"]
+    assert {p.suffix for p in _chunk_files(store)} == {".xz"}
+    assert store.read_raw("projA", digest) == _body(10)
+
+
+def test_red_late_in_stream_stores_no_blob_and_no_red(store):
+    pieces = [_body(40), "x" * 30 + RED + "y" * 30]
+    with pytest.raises(MemoryNodeValidationError):
+        store.save_raw("projA", iter(pieces))
+    assert store.backend("projA").raw_digests() == []
+    leftovers = _chunk_files(store)  # clean chunks, left for tree_gc's sweep
+    texts = [zlib.decompress(p.read_bytes()).decode("utf-8") for p in leftovers]
+    assert texts and not any(RED[:12] in text for text in texts)
+    assert collect(store, "projA", grace_seconds=0)["chunks_removed"] == len(leftovers)
+
+
+def test_rejected_stream_keeps_chunks_a_concurrent_blob_reuses(store):
+    body = _body(40)
+    shared = body[: 64 * 10]
+    saved: list[dict] = []
+
+    def pieces():
+        yield body
+        saved.append(store.save_raw("projA", shared))  # finds this stream's chunks on disk
+        yield RED
+
+    with pytest.raises(MemoryNodeValidationError):
+        store.save_raw("projA", pieces())
+    assert store.read_raw("projA", saved[0]["sha256"]) == shared
+
+
+def test_tampered_chunk_reads_as_none(store):
+    saved = store.save_raw("projA", _body(10))
+    victim = _chunk_files(store)[0]
+    victim.write_bytes(zlib.compress(RED.encode("utf-8")))
+    assert store.read_raw("projA", saved["sha256"]) is None
+    assert store.iter_raw("projA", saved["sha256"]) is None
+
+
+def test_tampered_manifest_reads_as_none(store):
+    saved = store.save_raw("projA", _body(10))
+    path = Path(saved["path"])
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    manifest["chunks"] = manifest["chunks"][1:]
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert store.read_raw("projA", saved["sha256"]) is None
+
+
+def test_legacy_txt_blob_still_readable(store):
+    text = "a raw blob written before chunking"
+    store.ensure_layout("projA")
+    store.raw_path("projA", sha256_text(text), legacy=True).write_text(text, encoding="utf-8")
+    assert store.backend("projA").raw_digests() == [sha256_text(text)]
+    assert store.read_raw("projA", sha256_text(text)) == text
+    # Re-saving migrates it to the chunked format.
+    store.save_raw("projA", text)
+    assert not store.raw_path("projA", sha256_text(text), legacy=True).exists()
+    assert store.read_raw("projA", sha256_text(text)) == text
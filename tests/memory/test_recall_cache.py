@@ -0,0 +1,120 @@
+"""Tests for the on-disk recall result cache.
+
+Covers: a repeated (or near-identical) query from another process served
+from the cache with the same result, every key input (limit, branch view,
+filters) separating entries, a tree write invalidating them, LRU eviction by
+use, TTL expiry, and turning the cache off.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import recall_v2  # noqa: E402
+from recall_cache import RecallCache  # noqa: E402
+from recall_v2 import Context, RecallEngine, recall  # noqa: E402
+from tree_store import TreeStore  # noqa: E402
+
+
+def _payload(**overrides):
+    payload = {
+        "project_id": "projA",
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+def _ctx(branch: str = "main") -> Context:
+    return Context(
+        project_root=Path("."), project_id="projA", workspace_instance_id="ws1", branch=branch
+    )
+
+
+@pytest.fixture()
+def home(tmp_path) -> Path:
+    store = TreeStore(tmp_path / "ralph_home")
+    store.create_node(_payload())
+    store.create_node(_payload(summary="Cache sql connections between hook runs."))
+    return tmp_path / "ralph_home"
+
+
+def _cache_state(report: dict) -> str:
+    return report["MEMORY_TRACE"]["cache"]
+
+
+def test_repeated_queries_hit_across_processes(home, monkeypatch):
+    first = recall("sql queries", _ctx(), home)
+    assert _cache_state(first) == "miss"
+    monkeypatch.setattr(
+        recall_v2, "candidate_payloads", lambda *a, **k: pytest.fail("recomputed a cached query")
+    )
+    again = recall("SQL, queries!", _ctx(), home)  # same normalized analysis
+    assert _cache_state(again) == "hit"
+    assert again["memory_context"] == first["memory_context"]
+    assert again["MEMORY_TRACE"]["rejected"] == first["MEMORY_TRACE"]["rejected"]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"limit": 1}, {"budget_limit": 50}, {"include_deprecated": True}, {"all_branches": True},
+     {"facets": {"memory_type": "procedural_rule"}}, {"since": "2020-01-01"}],
+)
+def test_every_key_input_separates_entries(home, options):
+    assert _cache_state(recall("sql queries", _ctx(), home)) == "miss"
+    assert _cache_state(recall("sql queries", _ctx(), home, **options)) == "miss"
+    assert _cache_state(recall("sql queries", _ctx(), home, **options)) == "hit"
+    assert _cache_state(recall("sql queries", _ctx("feature/x"), home)) == "miss"
+
+
+def test_a_tree_write_invalidates(home):
+    engine = RecallEngine("projA", home)
+    engine.recall("pooling sql", _ctx())
+    assert _cache_state(engine.recall("pooling sql", _ctx())) == "hit"
+    TreeStore(home).create_node(_payload(summary="Enable connection pooling for sql."))
+    report = engine.recall("pooling sql", _ctx())
+    assert _cache_state(report) == "miss"
+    assert "Enable connection pooling for sql." in [i["summary"] for i in report["memory_context"]]
+
+
+def test_lru_eviction_keeps_recently_used_entries(home):
+    cache = RecallCache(TreeStore(home), "projA", max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, {"n": key})
+    old = time.time() - 100
+    os.utime(cache.root / "a.json", (old, old))
+    os.utime(cache.root / "b.json", (old - 10, old - 10))
+    assert cache.get("b") == {"n": "b"}  # a use: b is now the newest
+    cache.put("c", {"n": "c"})
+    assert sorted(p.stem for p in cache.root.glob("*.json")) == ["b", "c"]
+    assert cache.get("a") is None
+    assert cache.clear() == 2
+
+
+def test_entries_expire_and_the_cache_can_be_off(home, monkeypatch):
+    cache = RecallCache(TreeStore(home), "projA", ttl_seconds=0)
+    cache.put("k", {"n": 1})
+    time.sleep(0.01)
+    assert cache.get("k") is None
+    monkeypatch.setenv("RALPH_RECALL_CACHE", "0")
+    assert _cache_state(recall("sql queries", _ctx(), home)) == "off"
+    assert _cache_state(recall("sql queries", _ctx(), home)) == "off"
+    assert [p.name for p in cache.root.glob("*.json")] == ["k.json"]
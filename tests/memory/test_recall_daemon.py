@@ -0,0 +1,168 @@
+"""Tests for the recall daemon and its thin client.
+
+Covers: backends reusing their parsed index until the index files change,
+the daemon answering recall_v2 command lines exactly like the in-process CLI,
+reloading after a write, the client falling back in-process when no daemon
+runs (or it is disabled, or it serves another home), request validation,
+refusing a second daemon, and the ``status`` / ``stop`` commands.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import recall_client  # noqa: E402
+from recall_daemon import RecallDaemon, serve  # noqa: E402
+from recall_daemon import main as daemon_main  # noqa: E402
+from recall_v2 import main as recall_main  # noqa: E402
+from tree_store import TreeStore  # noqa: E402
+
+
+def _payload(**overrides):
+    payload = {
+        "project_id": "projA",
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def home(tmp_path) -> Path:
+    store = TreeStore(tmp_path / "ralph_home")
+    store.create_node(_payload())
+    store.create_node(_payload(summary="Cache sql connections between hook runs."))
+    return tmp_path / "ralph_home"
+
+
+@pytest.fixture()
+def sock(monkeypatch):
+    # AF_UNIX paths are limited to ~100 bytes; pytest's tmp_path can exceed it.
+    directory = tempfile.mkdtemp(prefix="rd", dir="/tmp")
+    path = Path(directory) / "recall.sock"
+    monkeypatch.setenv("RALPH_RECALL_SOCKET", str(path))
+    yield path
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture()
+def daemon(home, sock):
+    ready = threading.Event()
+    results: list[dict] = []
+    thread = threading.Thread(
+        target=lambda: results.append(serve(home, idle_timeout=0, ready=ready)), daemon=True
+    )
+    thread.start()
+    assert ready.wait(5)
+    yield results
+    recall_client.request(sock, {"op": "stop"})
+    thread.join(5)
+    assert not thread.is_alive() and not sock.exists()
+
+
+def _argv(home: Path, query: str = "sql queries") -> list[str]:
+    return [
+        "--ralph-home", str(home), "--project-id", "projA", "--branch", "main",
+        "--workspace-instance-id", "ws1", "--query", query, "--json",
+    ]
+
+
+def _client(argv, capsys) -> dict:
+    assert recall_client.main(argv) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_hot_index_is_reused_until_the_index_changes(home):
+    store = TreeStore(home)
+    backend = store.backend("projA")
+    first = backend.hot_index()
+    assert first is not None and backend.hot_index() is first
+    store.create_node(_payload(summary="A third rule about sql."))
+    second = backend.hot_index()
+    assert second is not first and len(second["nodes"]) == 3
+    store.compact_index("projA")
+    assert backend.hot_index()["nodes"] == second["nodes"]
+
+
+def test_daemon_answers_like_the_cli(home, daemon, sock, capsys):
+    served = _client(_argv(home), capsys)
+    assert recall_main(_argv(home)) == 0
+    direct = json.loads(capsys.readouterr().out)
+    assert served["memory_context"] == direct["memory_context"]
+    assert served["MEMORY_TRACE"]["rejected"] == direct["MEMORY_TRACE"]["rejected"]
+    assert recall_client.request(sock, {"op": "ping"})["served"] == 1
+
+
+def test_daemon_reloads_after_a_write(home, daemon, capsys):
+    before = _client(_argv(home, "pooling"), capsys)
+    assert before["memory_context"] == []
+    TreeStore(home).create_node(_payload(summary="Enable connection pooling for sql."))
+    after = _client(_argv(home, "pooling"), capsys)
+    assert [item["summary"] for item in after["memory_context"]] == [
+        "Enable connection pooling for sql."
+    ]
+
+
+def test_client_falls_back_without_a_daemon(home, sock, capsys, monkeypatch):
+    assert not sock.exists()
+    fallback = _client(_argv(home), capsys)
+    assert len(fallback["memory_context"]) == 2
+    monkeypatch.setenv("RALPH_RECALL_DAEMON", "0")
+    monkeypatch.setattr(recall_client, "request", lambda *a, **k: pytest.fail("daemon used"))
+    assert _client(_argv(home), capsys)["memory_context"] == fallback["memory_context"]
+
+
+def test_client_falls_back_for_another_home(home, daemon, sock, tmp_path, capsys):
+    other = TreeStore(tmp_path / "other")
+    other.create_node(_payload(summary="Only in the other home: sql migrations."))
+    reply = recall_client.request(sock, recall_client.recall_request(_argv(tmp_path / "other")))
+    assert reply["ok"] is False and "serves" in reply["error"]
+    result = _client(_argv(tmp_path / "other"), capsys)
+    assert [item["summary"] for item in result["memory_context"]] == [
+        "Only in the other home: sql migrations."
+    ]
+
+
+def test_daemon_validates_requests(home):
+    recall = RecallDaemon(home)
+    assert recall.handle({"op": "ping"})["ok"] is True
+    assert recall.handle({"op": "explode"})["ok"] is False
+    assert recall.handle("not a dict")["ok"] is False
+    assert recall.handle({"op": "recall", "argv": "--query sql"})["ok"] is False
+    bad = recall.handle({"op": "recall", "argv": ["--since", "yesterday-ish"], "cwd": "/"})
+    assert bad == {"ok": False, "error": "invalid arguments"}
+    assert recall.served == 0
+
+
+def test_second_daemon_refuses_and_cli_status_stop(home, daemon, sock, capsys):
+    assert serve(home)["status"] == "already_running"
+    assert daemon_main(["--ralph-home", str(home), "status"]) == 0
+    assert json.loads(capsys.readouterr().out)["ralph_home"] == str(home.resolve())
+    assert daemon_main(["--ralph-home", str(home), "stop"]) == 0
+    capsys.readouterr()
+    for _ in range(100):
+        if daemon:
+            break
+        threading.Event().wait(0.05)
+    assert daemon[0]["status"] == "stopped"
+    assert daemon_main(["--ralph-home", str(home), "status"]) == 1
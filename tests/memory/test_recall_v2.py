@@ -2,12 +2,25 @@
 
 Covers: query analysis + risk levels, hard-reject reasons, scoring order
 (trigger-match outranks summary-only-match), per-project isolation in recall,
-and a well-formed MEMORY_TRACE.
+a well-formed MEMORY_TRACE, trigram candidate selection ranking exactly
+like the postings scan it replaced, the lean scoring index fetching
+detail fields only for the nodes it renders, facet filters (API and CLI
+flags) narrowing candidates identically with and without an index, and time
+ranges from temporal terms or --since/--until doing the same through the
+epoch timeline, path-like terms matching as substrings (only --path scopes),
+branch-partitioned views, a RecallEngine answering like ``recall`` while
+reusing per-node state until the tree changes, and its bounded top-k loop
+selecting exactly what an exhaustive ranking selects, scoring from the
+features precomputed in each index entry.
 """
 
 from __future__ import annotations
 
+import json
+import random
 import sys
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
 import pytest
@@ -15,14 +28,19 @@ import pytest
 _MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
 sys.path.insert(0, str(_MEMORY_DIR))
 
+import recall_v2  # noqa: E402
+import tree_index  # noqa: E402
 from recall_v2 import (  # noqa: E402
     Context,
+    RecallEngine,
     analyze_query,
     hard_reject_reason,
+    main,
     recall,
     score_node,
+    time_range,
 )
-from tree_store import TreeStore  # noqa: E402
+from tree_store import StorageBackend, TreeStore  # noqa: E402
 
 
 def _payload(project_id: str, **overrides):
@@ -82,6 +100,18 @@ def test_analyze_query_plain_low():
 def test_analyze_query_temporal():
     a = analyze_query("what changed on 2026-06-17")
     assert "2026-06-17" in a["temporal_terms"]
+    day = int(datetime(2026, 6, 17, tzinfo=timezone.utc).timestamp())
+    assert a["time_range"] == [day, day + 86400]
+
+
+def test_time_range_spans_every_temporal_term():
+    now = datetime(2026, 6, 17, 15, 30, tzinfo=timezone.utc)
+    day = int(datetime(2026, 6, 17, tzinfo=timezone.utc).timestamp())
+    assert time_range(["yesterday"], now) == [day - 86400, day]
+    assert time_range(["today", "tomorrow"], now) == [day, day + 2 * 86400]
+    new_year = int(datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp())
+    assert time_range(["2025"], now) == [new_year - 365 * 86400, new_year]
+    assert time_range(["2026-13-45"], now) is None and time_range([], now) is None
 
 
 # --- hard reject reasons ----------------------------------------------------
@@ -260,3 +290,381 @@ def test_recall_high_risk_adds_raw_recommendation(store, tmp_path):
     assert ctx
     assert ctx[0]["RAW_RECOMMENDED"] is True
     assert ctx[0]["suggested_read_command"]
+
+
+def _postings_scan(backend, search_terms, where=None):
+    """The pre-trigram candidate selection: every token, substring-tested."""
+    index = backend.load_index()
+    terms = [t for t in search_terms if t]
+    if not terms:
+        return []
+    ids = set()
+    for token, node_ids in index["postings"].items():
+        if any(t in token for t in terms):
+            ids.update(node_ids)
+    by_id = {e["node_id"]: e for e in index["nodes"]}
+    return [by_id.get(nid) or {"node_id": nid} for nid in sorted(ids)]
+
+
+@pytest.mark.parametrize("index_format", ["json", "binary"])
+def test_trigram_candidates_rank_like_the_postings_scan(tmp_path, monkeypatch, index_format):
+    home = tmp_path / "ralph_home"
+    s = TreeStore(home, index_format=index_format)
+    words = ["rollback", "savepoint", "stdin", "hooks", "pytest", "fixtures", "cache", "tokens",
+             "database", "queries", "scripts/memory/recall_v2.py", "frontend", "where", "deploy"]
+    for i in range(40):
+        picked = [words[(i * k) % len(words)] for k in (1, 3, 5)]
+        s.create_node(_payload("projA", summary=f"rule {i}: " + " ".join(picked), topic_tags=[f"tag{i % 4}"]))
+    s.compact_index("projA")
+    s.create_node(_payload("projA", summary="journaled savepoint rollback note"))
+    queries = ["rollback savepoint", "her", "recall_v2", "test fixtures", "ache", "tag2 deploy", "zzz"]
+
+    backend = s.backend("projA")
+    for query in queries:
+        terms = analyze_query(query)["search_terms"]
+        assert backend.candidate_entries(terms) == _postings_scan(backend, terms), query
+    fast = [recall(q, _ctx("projA"), home, limit=8) for q in queries]
+    monkeypatch.setattr(StorageBackend, "candidate_entries", _postings_scan)
+    monkeypatch.setattr(type(backend), "candidate_entries", _postings_scan)
+    slow = [recall(q, _ctx("projA"), home, limit=8) for q in queries]
+    for a, b in zip(fast, slow):
+        assert a["memory_context"] == b["memory_context"]
+        assert a["MEMORY_TRACE"]["selected_memory_ids"] == b["MEMORY_TRACE"]["selected_memory_ids"]
+
+
+def _detailed_tree(home: Path) -> TreeStore:
+    s = TreeStore(home)
+    for i in range(12):
+        s.create_node(
+            _payload(
+                "projA",
+                summary=f"rollback savepoint rule {i}",
+                detailed_summary=f"Long explanation {i}: " + "wrap writes in a savepoint. " * 20,
+                source_description=f"captured from review {i}",
+            )
+        )
+    return s
+
+
+def test_lean_index_recall_matches_full_node_recall(tmp_path):
+    home = tmp_path / "ralph_home"
+    s = _detailed_tree(home)
+    entry = s.load_index("projA")["nodes"][0]
+    assert "detailed_summary" not in entry and entry["detail_bytes"] > 500
+    queries = ["how to rollback savepoint", "exact rollback command", "savepoint rollback"]
+    lean = [recall(q, _ctx("projA"), home, limit=3) for q in queries]
+    s.index_path("projA").unlink()  # no index: recall scores the node files
+    full = [recall(q, _ctx("projA"), home, limit=3) for q in queries]
+    for a, b in zip(lean, full):
+        assert a["memory_context"] == b["memory_context"]
+    assert lean[0]["memory_context"][0]["detailed_summary"].startswith("Long explanation")
+
+
+def test_detail_tier_is_read_only_for_rendered_nodes(tmp_path, monkeypatch):
+    home = tmp_path / "ralph_home"
+    _detailed_tree(home)
+    loads: list[str] = []
+    original = TreeStore.load_node
+    monkeypatch.setattr(
+        TreeStore, "load_node", lambda self, p, n: loads.append(n) or original(self, p, n)
+    )
+    report = recall("how to rollback savepoint", _ctx("projA"), home, limit=2)
+    assert sorted(loads) == sorted(report["MEMORY_TRACE"]["selected_memory_ids"])
+    tiers = report["MEMORY_TRACE"]["index_tiers"]
+    assert tiers["scored_entries"] == 12 and tiers["detail_reads"] == 2
+    assert tiers["detail_bytes_saved"] > 0 and tiers["parse_ms"] >= 0
+
+    loads.clear()
+    low = recall("savepoint rollback", _ctx("projA"), home, limit=2)
+    assert loads == [] and low["MEMORY_TRACE"]["index_tiers"]["detail_reads"] == 0
+
+
+def _faceted_tree(home: Path) -> TreeStore:
+    s = TreeStore(home)
+    for i, (domain, visibility) in enumerate(
+        [("hooks", "main_promoted"), ("hooks", "conflict"), ("database", "main_promoted"),
+         ("general", "main_promoted")]
+    ):
+        s.create_node(
+            _payload("projA", summary=f"cache rule {i}", domain=domain, visibility=visibility)
+        )
+    return s
+
+
+def test_facet_filters_narrow_candidates_before_scoring(tmp_path):
+    home = tmp_path / "ralph_home"
+    s = _faceted_tree(home)
+    nodes = s.list_nodes("projA")
+    by_domain = {n["domain"]: n["node_id"] for n in nodes if n["visibility"] != "conflict"}
+    report = recall("cache rule", _ctx("projA"), home, facets={"domain": ["hooks", "database"]})
+    assert sorted(report["MEMORY_TRACE"]["selected_memory_ids"]) == sorted(
+        [by_domain["hooks"], by_domain["database"]]
+    )
+    # The conflict node is in no branch's view, so it is not even scored.
+    assert report["MEMORY_TRACE"]["index_tiers"]["scored_entries"] == 2
+    hooks = recall("cache rule", _ctx("projA"), home, facets={"domain": "hooks"},
+                   exclude_facets={"visibility": "conflict"})
+    assert hooks["MEMORY_TRACE"]["index_tiers"]["scored_entries"] == 1
+    s.index_path("projA").unlink()  # the full-scan fallback filters the same way
+    scanned = recall("cache rule", _ctx("projA"), home, facets={"domain": "hooks"},
+                     exclude_facets={"visibility": "conflict"})
+    assert scanned["memory_context"] == hooks["memory_context"]
+
+
+def test_cli_facet_flags(tmp_path, monkeypatch, capsys):
+    home = tmp_path / "ralph_home"
+    _faceted_tree(home)
+    base = ["recall_v2.py", "--ralph-home", str(home), "--project-id", "projA", "--json",
+            "--query", "cache rule"]
+    flags = ["--domain", "hooks", "--exclude", "visibility=conflict"]
+    monkeypatch.setattr(sys, "argv", [*base, *flags])
+    assert main() == 0
+    trace = json.loads(capsys.readouterr().out)["MEMORY_TRACE"]
+    assert trace["index_tiers"]["scored_entries"] == 1
+    monkeypatch.setattr(sys, "argv", [*base, "--exclude", "colour=red"])
+    with pytest.raises(SystemExit):
+        main()
+
+
+def _dated_tree(home: Path) -> dict[str, str]:
+    s = TreeStore(home)
+    ids = {}
+    for stamp in ("2025-03-01", "2026-06-16", "2026-06-17"):
+        at = f"{stamp}T10:00:00+00:00"
+        node = s.create_node(
+            _payload("projA", summary=f"deploy rollback note {stamp}", updated_at=at, created_at=at)
+        )
+        ids[stamp] = node["node_id"]
+    return ids
+
+
+def test_temporal_terms_narrow_candidates_through_the_timeline(tmp_path):
+    home = tmp_path / "ralph_home"
+    ids = _dated_tree(home)
+    report = recall("deploy rollback 2026", _ctx("projA"), home)
+    assert sorted(report["MEMORY_TRACE"]["selected_memory_ids"]) == sorted(
+        [ids["2026-06-16"], ids["2026-06-17"]]
+    )
+    assert report["MEMORY_TRACE"]["time_range"]["since"].startswith("2026-01-01")
+    day = recall("deploy rollback", _ctx("projA"), home, since="2026-06-17", until="2026-06-17")
+    assert day["MEMORY_TRACE"]["selected_memory_ids"] == [ids["2026-06-17"]]
+    assert day["MEMORY_TRACE"]["index_tiers"]["scored_entries"] == 1
+    plain = recall("deploy rollback", _ctx("projA"), home)
+    assert plain["MEMORY_TRACE"]["time_range"] is None
+    assert len(plain["MEMORY_TRACE"]["selected_memory_ids"]) == 3
+
+    TreeStore(home).index_path("projA").unlink()  # no index: same filter on the nodes
+    scanned = recall("deploy rollback", _ctx("projA"), home, since="2026-06-17", until="2026-06-17")
+    assert scanned["memory_context"] == day["memory_context"]
+
+
+def test_recency_reads_the_precomputed_epoch():
+    node = {"summary": "rollback", "updated_at": "2000-01-01T00:00:00Z", "epoch": int(time.time())}
+    assert score_node(node, analyze_query("rollback"))[1]["recency_score"] == 2.0
+    del node["epoch"]  # a node payload: computed from updated_at
+    assert score_node(node, analyze_query("rollback"))[1]["recency_score"] == 0.5
+
+
+def test_scoring_reads_the_precomputed_features(store, tmp_path, monkeypatch):
+    features = {**tree_index.scoring_features({}), "summary_text": "rollback"}
+    node = {"summary": "lint", "features": features}
+    assert score_node(node, analyze_query("rollback"))[1]["summary_score"] == 5.0
+    del node["features"]  # a node payload: computed from its fields
+    assert score_node(node, analyze_query("rollback"))[0] == 0.0
+
+    store.create_node(_payload("projA", summary="Rollback the savepoint on error."))
+    monkeypatch.setattr(tree_index, "scoring_features", lambda node: pytest.fail("recomputed"))
+    report = recall("rollback", _ctx("projA"), tmp_path / "ralph_home")
+    assert len(report["memory_context"]) == 1
+
+
+def test_cli_since_until_flags(tmp_path, monkeypatch, capsys):
+    home = tmp_path / "ralph_home"
+    ids = _dated_tree(home)
+    base = ["recall_v2.py", "--ralph-home", str(home), "--project-id", "projA", "--json",
+            "--query", "deploy rollback"]
+    monkeypatch.setattr(sys, "argv", [*base, "--since", "2026-01-01", "--until", "2026-06-16"])
+    assert main() == 0
+    trace = json.loads(capsys.readouterr().out)["MEMORY_TRACE"]
+    assert trace["selected_memory_ids"] == [ids["2026-06-16"]]
+    monkeypatch.setattr(sys, "argv", [*base, "--since", "last week"])
+    with pytest.raises(SystemExit):
+        main()
+
+
+def _pathed_tree(home: Path) -> dict[str, str]:
+    s = TreeStore(home)
+    paths = {
+        "store": ["scripts/memory/tree_store.py"],
+        "recall": ["scripts/memory/recall_v2.py"],
+        "hook": [".claude/hooks/pre-tool.sh"],
+    }
+    return {
+        name: s.create_node(
+            _payload("projA", summary=f"known rule about {name} edits", source_paths=source)
+        )["node_id"]
+        for name, source in paths.items()
+    }
+
+
+def test_path_like_terms_match_as_substrings_not_scope(tmp_path):
+    home = tmp_path / "ralph_home"
+    ids = _pathed_tree(home)
+    report = recall("known rule scripts/memory/", _ctx("projA"), home)
+    trace = report["MEMORY_TRACE"]
+    assert trace["path_scope"] == []
+    assert trace["selected_memory_ids"][:2] == sorted([ids["store"], ids["recall"]])
+    assert len(trace["selected_memory_ids"]) == 3  # the hook rule still matches "known rule"
+
+    # A node naming the path in its entities (plus another term) outranks
+    # one that only lists it as a source path.
+    named = TreeStore(home).create_node(_payload(
+        "projA",
+        summary="Take the flock before compacting.",
+        entities=["scripts/memory/tree_store.py"],
+        source_paths=["docs/locking.md"],
+    ))["node_id"]
+    pinned = recall("scripts/memory/tree_store.py flock", _ctx("projA"), home)
+    assert pinned["MEMORY_TRACE"]["selected_memory_ids"] == [named, ids["store"]]
+
+    explicit = recall("known rule", _ctx("projA"), home, paths=[".claude/hooks"])
+    assert explicit["MEMORY_TRACE"]["selected_memory_ids"] == [ids["hook"]]
+    TreeStore(home).index_path("projA").unlink()  # no index: same scope on the nodes
+    scanned = recall("known rule", _ctx("projA"), home, paths=[".claude/hooks"])
+    assert scanned["memory_context"] == explicit["memory_context"]
+
+
+def test_cli_path_flag(tmp_path, monkeypatch, capsys):
+    home = tmp_path / "ralph_home"
+    ids = _pathed_tree(home)
+    monkeypatch.setattr(sys, "argv", [
+        "recall_v2.py", "--ralph-home", str(home), "--project-id", "projA", "--json",
+        "--query", "known rule", "--path", "scripts/memory/recall_v2.py",
+    ])
+    assert main() == 0
+    trace = json.loads(capsys.readouterr().out)["MEMORY_TRACE"]
+    assert trace["selected_memory_ids"] == [ids["recall"]]
+
+
+def _ctx_on(branch: str) -> Context:
+    return Context(
+        project_root=Path("."), project_id="projA", workspace_instance_id="ws1", branch=branch
+    )
+
+
+def test_recall_considers_only_the_branch_view(tmp_path):
+    home = tmp_path / "ralph_home"
+    s = TreeStore(home)
+    ids = {
+        name: s.create_node(
+            _payload("projA", summary=f"cache rule {name}", branch=branch, visibility=visibility)
+        )["node_id"]
+        for name, branch, visibility in [
+            ("shared", "main", "main_promoted"),
+            ("mine", "feature/x", "branch_local"),
+            ("pending", "feature/x", "merge_candidate"),
+            ("theirs", "feature/y", "branch_local"),
+        ]
+    }
+    report = recall("cache rule", _ctx_on("feature/x"), home)
+    trace = report["MEMORY_TRACE"]
+    view = [ids["shared"], ids["mine"], ids["pending"]]
+    assert sorted(trace["selected_memory_ids"]) == sorted(view)
+    assert trace["index_tiers"]["scored_entries"] == 3 and trace["branch_view"] == "feature/x"
+
+    s.update_node("projA", ids["theirs"], {"visibility": "main_promoted"})
+    promoted = recall("cache rule", _ctx_on("feature/x"), home)
+    assert ids["theirs"] in promoted["MEMORY_TRACE"]["selected_memory_ids"]
+
+    everything = recall("cache rule", _ctx_on("feature/z"), home, all_branches=True)
+    assert len(everything["MEMORY_TRACE"]["selected_memory_ids"]) == 4
+    unknown = recall("cache rule", _ctx_on("unknown"), home)
+    assert unknown["MEMORY_TRACE"]["branch_view"] is None
+    assert len(unknown["MEMORY_TRACE"]["selected_memory_ids"]) == 4
+
+
+# --- RecallEngine -------------------------------------------------------------
+
+def _stable(report: dict) -> dict:
+    trace = dict(report["MEMORY_TRACE"], latency_ms=0, index_tiers={}, cache=None)
+    return {**report, "MEMORY_TRACE": trace}
+
+
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+def test_engine_matches_recall_and_keeps_node_state(tmp_path, monkeypatch, backend):
+    home = tmp_path / "ralph_home"
+    s = TreeStore(home, backend=backend)
+    for i, summary in enumerate(["cache tokens per hook", "cache sql plans", "lint on save"]):
+        s.create_node(_payload("projA", summary=summary, trigger={"when": f"step {i}"}))
+    engine = RecallEngine("projA", home)
+    queries = ["cache hooks", "sql plans", "lint"]
+    batch = engine.recall_many(queries, _ctx("projA"), limit=2)
+    for query, report in zip(queries, batch):
+        assert _stable(report) == _stable(recall(query, _ctx("projA"), home, limit=2))
+
+    checked: list[str] = []
+    real = recall_v2.static_checks
+    monkeypatch.setattr(
+        recall_v2, "static_checks", lambda node: checked.append(node["node_id"]) or real(node)
+    )
+    assert engine.refresh() is False
+    engine.recall("cache", _ctx("projA"))
+    assert checked == []  # validated once, while the tree is unchanged
+
+    added = s.create_node(_payload("projA", summary="cache warmup on start"))
+    assert engine.refresh() is True
+    report = engine.recall("cache", _ctx("projA"))
+    assert added["node_id"] in report["MEMORY_TRACE"]["selected_memory_ids"]
+    assert len(checked) == 3
+
+
+def test_engine_rejects_a_context_for_another_project(tmp_path):
+    engine = RecallEngine("projA", tmp_path / "ralph_home")
+    assert engine.recall("anything")["memory_context"] == []
+    with pytest.raises(ValueError):
+        engine.recall("anything", _ctx("projB"))
+
+
+class _Exhaustive(RecallEngine):
+    def _rank(self, candidates, analysis, context, include_deprecated, top_k=None):
+        return super()._rank(candidates, analysis, context, include_deprecated)
+
+
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+def test_top_k_pruning_selects_like_the_exhaustive_ranking(tmp_path, backend):
+    rng = random.Random(7)
+    words = ["cache", "hooks", "sql", "plans", "lint", "tokens", "warmup", "stdin", "retry"]
+    home = tmp_path / "ralph_home"
+    s = TreeStore(home, backend=backend)
+    for i in range(40):
+        quality = {
+            "confidence": 0.9,
+            "stale": rng.random() < 0.2,
+            "reason": "seen in review",
+            "validation_evidence": "test run",
+        }
+        if rng.random() < 0.1:
+            quality["deprecated"] = True
+        s.create_node(_payload(
+            "projA",
+            summary=f"{' '.join(rng.sample(words, 2))} rule {i:02d}",
+            trigger={"when": rng.choice(words)} if rng.random() < 0.5 else {},
+            memory_type=rng.choice(["procedural_rule", "negative_rule"]),
+            quality=quality,
+            salience={"recency": rng.choice([0.0, 0.5, 1.0])},
+            visibility="conflict" if rng.random() < 0.1 else "branch_local",
+        ))
+    pruning = RecallEngine("projA", home, cache=False)
+    exhaustive = _Exhaustive("projA", home, cache=False)
+    pruned = 0
+    for query in ["cache hooks", "avoid sql mistake", "lint", "retry stdin tokens", "rule"]:
+        for limit, budget in [(1, 1200), (3, 1200), (5, 1200), (8, 60), (5, 0)]:
+            options = {"limit": limit, "budget_limit": budget, "include_deprecated": limit == 3}
+            got = pruning.recall(query, _ctx("projA"), **options)
+            want = exhaustive.recall(query, _ctx("projA"), **options)
+            assert got["memory_context"] == want["memory_context"]
+            trace, full = got["MEMORY_TRACE"], want["MEMORY_TRACE"]
+            assert trace["selected_memory_ids"] == full["selected_memory_ids"]
+            assert all(item in full["rejected"] for item in trace["rejected"])
+            pruned += trace["index_tiers"]["pruned"]
+    assert pruned > 0
@@ -0,0 +1,143 @@
+"""Tests for the log-structured ``segments`` node layout.
+
+Covers: load/list/update working unchanged on segments, few files for many
+nodes, torn-tail tolerance, compaction dropping superseded versions, offset
+maps surviving another store's compaction, and conversion from ``files``.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import segment_backend  # noqa: E402
+from recall_v2 import Context, recall  # noqa: E402
+from segment_backend import SegmentBackend, encode_record, iter_records  # noqa: E402
+from tree_store import TreeStore  # noqa: E402
+
+
+def _payload(project_id: str, **overrides):
+    payload = {
+        "project_id": project_id,
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "trigger": {"text": "writing SQL"},
+        "topic_tags": ["database", "sql"],
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def store(tmp_path) -> TreeStore:
+    return TreeStore(tmp_path / "ralph_home", backend="segments")
+
+
+def test_record_round_trip_stops_at_torn_frame():
+    frames = encode_record({"op": "put", "node_id": "a", "node": {}}) + encode_record(
+        {"op": "del", "node_id": "a"}
+    )
+    assert [r["op"] for _, _, r in iter_records(frames)] == ["put", "del"]
+    assert [r["op"] for _, _, r in iter_records(frames[:-3])] == ["put"]
+
+
+def test_load_list_update_unchanged(store):
+    written = store.create_node(_payload("projA"))
+    node_id = written["node_id"]
+    assert isinstance(store.backend("projA"), SegmentBackend)
+    assert store.load_node("projA", node_id)["summary"] == written["summary"]
+    store.update_node("projA", node_id, {"summary": "Always bind SQL parameters."})
+    assert store.load_node("projA", node_id)["summary"] == "Always bind SQL parameters."
+    assert [n["node_id"] for n in store.list_nodes("projA")] == [node_id]
+    assert not store.nodes_dir("projA").exists()
+    index = store.load_index("projA")
+    assert [e["summary"] for e in index["nodes"]] == ["Always bind SQL parameters."]
+
+
+def test_many_nodes_share_few_files(store):
+    with store.deferred_index():
+        for i in range(200):
+            store.create_node(_payload("projA", summary=f"Rule number {i} about caching."))
+    backend = store.backend("projA")
+    assert len(backend.segment_numbers()) == 1
+    assert len(TreeStore(store.ralph_home).list_nodes("projA")) == 200
+
+
+def test_torn_tail_is_ignored_then_truncated(store):
+    first = store.create_node(_payload("projA", summary="First rule."))["node_id"]
+    backend = store.backend("projA")
+    segment = backend.segment_path(backend.segment_numbers()[-1])
+    with segment.open("ab") as handle:
+        handle.write(encode_record({"op": "put", "node_id": "x", "node": {}})[:-4])
+    fresh = TreeStore(store.ralph_home)
+    assert [n["node_id"] for n in fresh.list_nodes("projA")] == [first]
+    second = fresh.create_node(_payload("projA", summary="Second rule."))["node_id"]
+    reopened = TreeStore(store.ralph_home)
+    assert sorted(n["node_id"] for n in reopened.list_nodes("projA")) == sorted([first, second])
+
+
+def test_compaction_drops_superseded_versions(store):
+    node_id = store.create_node(_payload("projA"))["node_id"]
+    for i in range(20):
+        store.update_node("projA", node_id, {"summary": f"Revision {i} of the rule."})
+    backend = store.backend("projA")
+    before = backend.segment_stats()
+    assert before["live_bytes"] * 10 < before["total_bytes"]
+    result = backend.compact_storage()
+    assert result["compacted"] is True and result["reclaimed_bytes"] > 0
+    after = backend.segment_stats()
+    assert after["total_bytes"] == after["live_bytes"]
+    assert store.load_node("projA", node_id)["summary"] == "Revision 19 of the rule."
+
+
+def test_opportunistic_compaction_after_write(store, monkeypatch):
+    monkeypatch.setattr(segment_backend, "COMPACT_MIN_BYTES", 1)
+    node_id = store.create_node(_payload("projA"))["node_id"]
+    for i in range(5):
+        store.update_node("projA", node_id, {"summary": f"Revision {i} of the rule."})
+    stats = store.backend("projA").segment_stats()
+    assert stats["live_bytes"] * 2 >= stats["total_bytes"]
+
+
+def test_reader_survives_compaction_by_another_store(store):
+    node_id = store.create_node(_payload("projA"))["node_id"]
+    store.update_node("projA", node_id, {"summary": "Second revision."})
+    reader = TreeStore(store.ralph_home)
+    assert reader.load_node("projA", node_id)["summary"] == "Second revision."
+    TreeStore(store.ralph_home).backend("projA").compact_storage()
+    assert reader.load_node("projA", node_id)["summary"] == "Second revision."
+
+
+def test_convert_files_tree_to_segments(tmp_path):
+    home = tmp_path / "ralph_home"
+    files_store = TreeStore(home)
+    ids = [
+        files_store.create_node(_payload("projA", summary=f"Rule {i} on parameterized SQL."))["node_id"]
+        for i in range(3)
+    ]
+    digest = files_store.save_raw("projA", "plain build log line")["sha256"]
+    events = len(list(files_store.iter_usage("projA")))
+    stats = files_store.convert_backend("projA", "segments")
+    assert stats["nodes"] == 3
+    assert not files_store.nodes_dir("projA").exists()
+    reopened = TreeStore(home)
+    assert reopened.backend("projA").name == "segments"
+    assert sorted(n["node_id"] for n in reopened.list_nodes("projA")) == sorted(ids)
+    assert reopened.read_raw("projA", digest) == "plain build log line"
+    assert len(list(reopened.iter_usage("projA"))) == events
+    ctx = Context(project_root=Path("."), project_id="projA", workspace_instance_id="ws1", branch="main")
+    assert len(recall("parameterized sql", ctx, home)["memory_context"]) == 3
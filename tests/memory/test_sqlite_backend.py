@@ -0,0 +1,192 @@
+"""Tests for the SQLite storage backend and backend conversion.
+
+Covers: node/raw round trips through the sqlite layout, the RED re-check on
+raw reads, candidate lookup matching the index scan, stored term bounds
+read per query term (top-k recall never loading the whole index), recall
+returning the same results on either backend, and files <-> sqlite conversion keeping
+nodes, raw blobs and usage events.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+from memory_node import MemoryNodeValidationError  # noqa: E402
+from recall_v2 import Context, recall  # noqa: E402
+from sqlite_backend import DB_NAME, SqliteBackend  # noqa: E402
+from tree_index import build_bounds, term_bound  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_store import FileBackend, StorageBackend, TreeStore  # noqa: E402
+
+
+def _payload(project_id: str, **overrides):
+    payload = {
+        "project_id": project_id,
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "trigger": {"text": "writing SQL"},
+        "topic_tags": ["database", "sql"],
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+def _ctx(project_id: str) -> Context:
+    return Context(
+        project_root=Path("."),
+        project_id=project_id,
+        workspace_instance_id="ws1",
+        branch="main",
+    )
+
+
+def _seed(store: TreeStore, project_id: str) -> list[str]:
+    ids = []
+    for summary, tags in [
+        ("Use parameterized queries for all database operations.", ["database", "sql"]),
+        ("Hooks read stdin as JSON before acting.", ["hooks", "stdin"]),
+        ("Run pytest with -q for the memory suite.", ["pytest", "testing"]),
+    ]:
+        ids.append(store.create_node(_payload(project_id, summary=summary, topic_tags=tags))["node_id"])
+    return ids
+
+
+@pytest.fixture()
+def store(tmp_path) -> TreeStore:
+    return TreeStore(tmp_path / "ralph_home", backend="sqlite")
+
+
+def test_new_tree_uses_configured_backend(store):
+    store.create_node(_payload("projA"))
+    tree = store.project_tree("projA")
+    assert (tree / DB_NAME).exists()
+    assert json.loads(store.layout_path("projA").read_text())["backend"] == "sqlite"
+    assert not store.nodes_dir("projA").exists()
+    assert store.backend("projA").name == "sqlite"
+
+
+def test_existing_files_tree_keeps_files_backend(tmp_path):
+    home = tmp_path / "ralph_home"
+    TreeStore(home).create_node(_payload("projA"))
+    assert isinstance(TreeStore(home, backend="sqlite").backend("projA"), FileBackend)
+
+
+def test_sqlite_node_round_trip(store):
+    written = store.create_node(_payload("projA"))
+    loaded = store.load_node("projA", written["node_id"])
+    assert loaded is not None and loaded["summary"] == written["summary"]
+    updated = store.update_node("projA", written["node_id"], {"summary": "Always bind SQL params."})
+    assert store.load_node("projA", written["node_id"])["summary"] == updated["summary"]
+    assert [n["node_id"] for n in store.list_nodes("projA")] == [written["node_id"]]
+    index = store.load_index("projA")
+    assert index is not None and index["generation"] == 2
+    assert [e["node_id"] for e in index["nodes"]] == [written["node_id"]]
+
+
+def test_sqlite_raw_rechecks_red_on_read(store):
+    saved = store.save_raw("projA", "plain build log line")
+    assert store.read_raw("projA", saved["sha256"]) == "plain build log line"
+    with pytest.raises(MemoryNodeValidationError):
+        store.save_raw("projA", "export API_KEY=sk-ABCDEF0123456789ABCDEF0123")
+    backend = store.backend("projA")
+    backend.write_raw(saved["sha256"], "token = sk-DEADBEEF0123456789ABCDEF0123")  # tamper below the API
+    assert store.read_raw("projA", saved["sha256"]) is None
+
+
+def test_sqlite_candidates_match_postings_scan(store):
+    _seed(store, "projA")
+    backend = store.backend("projA")
+    for terms in (["database"], ["stdin", "pytest"], ["param"], ["zzz"], []):
+        fast = sorted(e["node_id"] for e in backend.candidate_entries(terms))
+        scanned = sorted(e["node_id"] for e in StorageBackend.candidate_entries(backend, terms))
+        assert fast == scanned, terms
+
+
+def test_sqlite_term_bounds_match_the_index_bounds(store):
+    _seed(store, "projA")
+    backend = store.backend("projA")
+    full = build_bounds(store.load_index("projA")["nodes"])
+    assert backend.term_bounds() == full
+    terms = ["param", "stdin", "zzz"]
+    some = backend.term_bounds(terms)
+    assert len(some) < len(full)
+    assert [term_bound(some, t) for t in terms] == [term_bound(full, t) for t in terms]
+    # A database from before the bounds table has none until it is rebuilt.
+    backend._connect().execute("DELETE FROM meta WHERE key = 'bounds'")
+    assert backend.term_bounds(terms) is None
+    store.reindex("projA")
+    assert backend.term_bounds() == full
+
+
+def test_sqlite_top_k_recall_never_loads_the_whole_index(store, monkeypatch):
+    monkeypatch.setenv("RALPH_RECALL_CACHE", "0")
+    for i in range(6):
+        store.create_node(_payload("projA", summary=f"Database rule {i} for sql queries."))
+    home = store.ralph_home
+    first = recall("database sql", _ctx("projA"), home, limit=2)
+    expected = [n["summary"] for n in first["memory_context"]]
+    monkeypatch.setattr(SqliteBackend, "load_index", lambda self: pytest.fail("load_index"))
+    found = recall("database sql", _ctx("projA"), home, limit=2)  # more candidates than limit
+    assert [n["summary"] for n in found["memory_context"]] == expected
+
+
+def test_recall_matches_across_backends(tmp_path):
+    files_home, sqlite_home = tmp_path / "files", tmp_path / "sqlite"
+    for home, backend in ((files_home, "files"), (sqlite_home, "sqlite")):
+        _seed(TreeStore(home, backend=backend), "projA")
+    for query in ("database parameterized queries", "hooks stdin", "pytest"):
+        a = recall(query, _ctx("projA"), files_home)
+        b = recall(query, _ctx("projA"), sqlite_home)
+        assert [n["summary"] for n in a["memory_context"]] == [
+            n["summary"] for n in b["memory_context"]
+        ]
+
+
+def test_convert_round_trip_keeps_data(tmp_path):
+    home = tmp_path / "ralph_home"
+    store = TreeStore(home)
+    ids = _seed(store, "projA")
+    digest = store.save_raw("projA", "plain build log line")["sha256"]
+    events_before = len(list(store.iter_usage("projA")))
+
+    stats = store.convert_backend("projA", "sqlite")
+    assert (stats["nodes"], stats["raw"], stats["usage_events"]) == (3, 1, events_before)
+    assert store.backend("projA").name == "sqlite"
+    assert not store.nodes_dir("projA").exists()
+    assert sorted(n["node_id"] for n in store.list_nodes("projA")) == sorted(ids)
+    assert store.read_raw("projA", digest) == "plain build log line"
+
+    store.convert_backend("projA", "files")
+    assert not (store.project_tree("projA") / DB_NAME).exists()
+    fresh = TreeStore(home)
+    assert sorted(n["node_id"] for n in fresh.list_nodes("projA")) == sorted(ids)
+    assert fresh.read_raw("projA", digest) == "plain build log line"
+    assert len(list(fresh.iter_usage("projA"))) == events_before
+    assert fresh.load_index("projA")["generation"] >= len(ids)
+
+
+def test_admin_convert_cli(tmp_path, capsys):
+    home = tmp_path / "ralph_home"
+    _seed(TreeStore(home), "projA")
+    code = admin_main(
+        ["--ralph-home", str(home), "--project-id", "projA", "convert", "--to", "sqlite"]
+    )
+    assert code == 0
+    assert json.loads(capsys.readouterr().out)["nodes"] == 3
+    assert TreeStore(home).backend("projA").name == "sqlite"
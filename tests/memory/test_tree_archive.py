@@ -0,0 +1,182 @@
+"""Tests for streaming JSONL export / import of a project tree.
+
+Covers: a full round trip (nodes, multi-chunk raw blobs, usage) into another
+project, ``--since`` incremental exports, per-record checksums rejecting
+tampered records, the RED gate on import, idempotent re-import, truncated
+archives, batched ingestion, and the tree_admin export/import commands.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import raw_store  # noqa: E402
+import tree_archive  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_archive import (  # noqa: E402
+    TreeArchiveError,
+    export_tree,
+    import_tree,
+    record_digest,
+)
+from tree_store import TreeStore  # noqa: E402
+
+RED = "token = sk-DEADBEEF0123456789ABCDEF0123"
+
+
+def _payload(project_id: str, **overrides):
+    payload = {
+        "project_id": project_id,
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def source(tmp_path, monkeypatch) -> TreeStore:
+    monkeypatch.setattr(raw_store, "CHUNK_CHARS", 64)
+    store = TreeStore(tmp_path / "source")
+    raw = store.save_raw("projA", "".join(f"log line {i}\n" for i in range(40)))
+    store.create_node(
+        _payload("projA", summary="Rule with a transcript.", raw_ref={"sha256": raw["sha256"]})
+    )
+    for i in range(3):
+        store.create_node(_payload("projA", summary=f"Rule {i} about caching."))
+    return store
+
+
+def _export(store: TreeStore, **kwargs) -> list[str]:
+    out = io.StringIO()
+    export_tree(store, "projA", out, **kwargs)
+    return out.getvalue().splitlines(keepends=True)
+
+
+def _resealed(line: str, **changes) -> str:
+    record = json.loads(line)
+    record.update(changes)
+    record["sha256"] = record_digest(record)
+    return json.dumps(record) + "\n"
+
+
+def test_round_trip_into_another_project(source, tmp_path):
+    lines = _export(source)
+    kinds = [json.loads(line)["kind"] for line in lines]
+    assert kinds[0] == "header" and kinds[-1] == "footer"
+    assert kinds.count("node") == 4 and kinds.count("raw_end") == 1
+    assert kinds.count("raw") > 1  # streamed chunk by chunk
+
+    dest = TreeStore(tmp_path / "dest")
+    stats = import_tree(dest, "projB", io.StringIO("".join(lines)))
+    assert (stats["created"], stats["raw"], stats["complete"]) == (4, 1, True)
+    assert stats["usage_events"] == len(list(source.iter_usage("projA")))
+    assert sorted(n["node_id"] for n in dest.list_nodes("projB")) == sorted(
+        n["node_id"] for n in source.list_nodes("projA")
+    )
+    assert all(n["project_id"] == "projB" for n in dest.list_nodes("projB"))
+    digest = source.backend("projA").raw_digests()[0]
+    assert dest.read_raw("projB", digest) == source.read_raw("projA", digest)
+
+
+def test_since_exports_only_newer_nodes(source):
+    # Backdate every existing node on disk, then write one new node.
+    for node in source.list_nodes("projA"):
+        path = source.node_path("projA", node["node_id"])
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        payload["updated_at"] = "2020-01-01T00:00:00+00:00"
+        path.write_text(json.dumps(payload), encoding="utf-8")
+    source.reindex("projA")
+    fresh = source.create_node(_payload("projA", summary="A rule written today."))
+    records = [json.loads(line) for line in _export(source, since="2026-01-01")]
+    assert [r["node"]["node_id"] for r in records if r["kind"] == "node"] == [fresh["node_id"]]
+    assert not any(r["kind"] == "raw" for r in records)
+
+
+def test_tampered_records_are_skipped(source, tmp_path):
+    lines = _export(source)
+    node_at = next(i for i, line in enumerate(lines) if '"kind":"node"' in line)
+    raw_at = next(i for i, line in enumerate(lines) if '"kind":"raw"' in line and '"seq":1' in line)
+    lines[node_at] = lines[node_at].replace("Rule", "Tampered rule", 1)
+    lines[raw_at] = lines[raw_at].replace("log line", "LOG LINE", 1)
+    dest = TreeStore(tmp_path / "dest")
+    stats = import_tree(dest, "projA", io.StringIO("".join(lines)))
+    assert stats["corrupt_records"] == 2
+    assert (stats["created"], stats["raw"], stats["rejected_raw"]) == (3, 0, 1)
+    assert dest.backend("projA").raw_digests() == []
+    assert not list((dest.raw_dir("projA") / "chunks").rglob("*.zz"))
+
+
+def test_red_is_rejected_on_import(source, tmp_path):
+    lines = _export(source)
+    node_at = next(i for i, line in enumerate(lines) if '"kind":"node"' in line)
+    node = json.loads(lines[node_at])["node"]
+    lines[node_at] = _resealed(lines[node_at], node={**node, "summary": RED})
+    raw_at = next(i for i, line in enumerate(lines) if '"kind":"raw"' in line)
+    lines[raw_at] = _resealed(lines[raw_at], text=RED)
+    dest = TreeStore(tmp_path / "dest")
+    stats = import_tree(dest, "projA", io.StringIO("".join(lines)))
+    assert (stats["rejected"], stats["rejected_raw"]) == (1, 1)
+    assert dest.load_node("projA", node["node_id"]) is None
+    assert dest.backend("projA").raw_digests() == []
+
+
+def test_reimport_is_idempotent_and_newer_local_wins(source, tmp_path):
+    archive = "".join(_export(source, include_usage=False))
+    dest = TreeStore(tmp_path / "dest")
+    import_tree(dest, "projA", io.StringIO(archive))
+    node_id = dest.list_nodes("projA")[0]["node_id"]
+    dest.update_node("projA", node_id, {"summary": "Edited after the import."})
+    stats = import_tree(dest, "projA", io.StringIO(archive))
+    assert (stats["created"], stats["updated"], stats["unchanged"]) == (0, 0, 4)
+    assert dest.load_node("projA", node_id)["summary"] == "Edited after the import."
+
+
+def test_truncated_archive_is_reported(source, tmp_path):
+    lines = _export(source)
+    stats = import_tree(TreeStore(tmp_path / "dest"), "projA", io.StringIO("".join(lines[:-1])))
+    assert stats["complete"] is False and stats["created"] == 4
+    with pytest.raises(TreeArchiveError):
+        import_tree(TreeStore(tmp_path / "dest"), "projA", io.StringIO('{"kind": "node"}\n'))
+
+
+def test_nodes_are_ingested_in_batches(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(tree_archive, "IMPORT_BATCH", 2)
+    dest = TreeStore(tmp_path / "dest")
+    sizes: list[int] = []
+    real = dest.upsert_nodes
+    monkeypatch.setattr(
+        dest, "upsert_nodes", lambda nodes, **kw: sizes.append(len(nodes)) or real(nodes, **kw)
+    )
+    import_tree(dest, "projA", io.StringIO("".join(_export(source))))
+    assert sizes == [2, 2]
+
+
+def test_admin_export_import_gzip(source, tmp_path, capsys):
+    archive = tmp_path / "tree.jsonl.gz"
+    home = str(source.ralph_home)
+    assert admin_main(
+        ["--ralph-home", home, "--project-id", "projA", "export", "--out", str(archive)]
+    ) == 0
+    assert json.loads(capsys.readouterr().out)["nodes"] == 4
+    dest = tmp_path / "dest"
+    assert admin_main(["--ralph-home", str(dest), "--project-id", "projC", "import", str(archive)]) == 0
+    assert json.loads(capsys.readouterr().out)["created"] == 4
+    assert len(TreeStore(dest).list_nodes("projC")) == 4
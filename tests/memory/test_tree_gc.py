@@ -0,0 +1,208 @@
+"""Tests for the incremental mark-and-sweep garbage collector.
+
+Covers: orphaned raw blobs and their chunks swept once past the grace period,
+referenced and freshly written blobs kept, ``.*.tmp`` debris, long-deprecated
+nodes moved into a restorable cold archive, budgeted runs resuming across
+calls without re-marking (one unit per call still finishing), the
+single-collector lock, ``delete_nodes``, and ``tree_admin gc``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import raw_store  # noqa: E402
+import tree_gc  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_archive import import_tree, open_archive  # noqa: E402
+from tree_gc import collect  # noqa: E402
+from tree_store import TreeStore  # noqa: E402
+
+
+def _payload(**overrides):
+    payload = {
+        "project_id": "projA",
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def store(tmp_path, monkeypatch) -> TreeStore:
+    monkeypatch.setattr(raw_store, "CHUNK_CHARS", 64)
+    return TreeStore(tmp_path / "ralph_home")
+
+
+def _text(tag: str) -> str:
+    return "".join(f"{tag} transcript line {i:03d}\n" for i in range(20))
+
+
+def _chunk_count(store: TreeStore) -> int:
+    return sum(1 for p in (store.raw_dir("projA") / "chunks").rglob("*") if p.is_file())
+
+
+def _backdate(store: TreeStore, node_id: str, updated_at: str) -> None:
+    path = store.node_path("projA", node_id)
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    payload["updated_at"] = updated_at
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    store.reindex("projA")
+
+
+def test_orphaned_raw_and_chunks_are_swept(store):
+    kept = store.save_raw("projA", _text("kept"))["sha256"]
+    store.create_node(_payload(raw_ref={"sha256": kept}))
+    chunks_before = _chunk_count(store)
+    orphan = store.save_raw("projA", _text("orphan"))["sha256"]
+    assert _chunk_count(store) > chunks_before
+
+    stats = collect(store, "projA", grace_seconds=0)
+    assert stats["complete"] is True and stats["raw_removed"] == 1
+    assert stats["chunks_removed"] > 0 and stats["bytes_reclaimed"] > 0
+    assert store.backend("projA").raw_digests() == [kept]
+    assert store.read_raw("projA", orphan) is None
+    assert store.read_raw("projA", kept) == _text("kept")
+    assert _chunk_count(store) == chunks_before
+
+
+def test_recent_orphans_are_kept_within_grace(store):
+    orphan = store.save_raw("projA", _text("fresh"))["sha256"]
+    stats = collect(store, "projA")
+    assert (stats["raw_removed"], stats["chunks_removed"]) == (0, 0)
+    assert store.read_raw("projA", orphan) == _text("fresh")
+
+
+def test_tmp_debris_is_removed(store):
+    store.create_node(_payload())
+    debris = [store.project_tree("projA") / ".index.json.abc.tmp", store.nodes_dir("projA") / ".n.tmp"]
+    for path in debris:
+        path.write_text("partial", encoding="utf-8")
+    stats = collect(store, "projA", grace_seconds=0)
+    assert stats["tmp_removed"] == 2
+    assert not any(path.exists() for path in debris)
+
+
+def test_long_deprecated_nodes_move_to_cold_archive(store, tmp_path):
+    raw = store.save_raw("projA", _text("old"))["sha256"]
+    old = store.create_node(
+        _payload(quality={"confidence": 0.9, "deprecated": True}, raw_ref={"sha256": raw}, summary="Old rule.")
+    )
+    recent = store.create_node(_payload(quality={"confidence": 0.9, "deprecated": True}, summary="Recent rule."))
+    live = store.create_node(_payload(summary="Live rule."))
+    _backdate(store, old["node_id"], "2020-01-01T00:00:00+00:00")
+
+    stats = collect(store, "projA", archive_deprecated_days=90, grace_seconds=0)
+    assert stats["archived_nodes"] == 1 and stats["raw_removed"] == 1
+    assert sorted(n["node_id"] for n in store.list_nodes("projA")) == sorted(
+        [recent["node_id"], live["node_id"]]
+    )
+    assert old["node_id"] not in {e["node_id"] for e in store.load_index("projA")["nodes"]}
+
+    cold = store.project_tree("projA") / tree_gc.COLD_DIR / stats["cold_archives"][0]
+    restored = TreeStore(tmp_path / "restored")
+    with open_archive(cold, "r") as handle:
+        result = import_tree(restored, "projA", handle)
+    assert (result["created"], result["raw"], result["complete"]) == (1, 1, True)
+    assert restored.read_raw("projA", raw) == _text("old")
+
+
+def test_budgeted_runs_resume_until_complete(store, monkeypatch):
+    for tag in ("a", "b", "c"):
+        store.save_raw("projA", _text(tag))
+    kept = store.save_raw("projA", _text("d"))["sha256"]
+    store.create_node(_payload(raw_ref={"sha256": kept}))
+    marks = {"index": 0, "manifests": 0}
+    real_entries = tree_gc._Run.index_entries
+    real_chunks = type(store.backend("projA")).manifest_chunks
+
+    def counting_entries(run):
+        marks["index"] += 1
+        return real_entries(run)
+
+    def counting_chunks(backend, digest):
+        marks["manifests"] += 1
+        return real_chunks(backend, digest)
+
+    monkeypatch.setattr(tree_gc._Run, "index_entries", counting_entries)
+    monkeypatch.setattr(type(store.backend("projA")), "manifest_chunks", counting_chunks)
+
+    first = collect(store, "projA", budget_seconds=0, grace_seconds=0)
+    assert first["complete"] is False and first["resume_phase"] == "raw"
+    state = json.loads((store.project_tree("projA") / tree_gc.STATE_NAME).read_text())
+    # The first call's one unit was the mark, carried over to the sweep.
+    assert state["phase"] == "raw" and state["mark"] == [kept] and first["raw_removed"] == 0
+
+    calls = 0
+    removed = first["raw_removed"]
+    while True:
+        calls += 1
+        stats = collect(store, "projA", budget_seconds=0.0001, grace_seconds=0)
+        removed += stats["raw_removed"]
+        if stats["complete"]:
+            break
+        assert calls < 100
+    assert removed == 3 and store.backend("projA").raw_digests() == [kept]
+    assert _chunk_count(store) == len(real_chunks(store.backend("projA"), kept))
+    assert store.read_raw("projA", kept) == _text("d")
+    # Marking happened once per cycle, not once per call.
+    assert marks == {"index": 1, "manifests": 1}
+
+
+def test_one_unit_per_call_still_completes(store):
+    store.save_raw("projA", _text("a"))
+    (store.project_tree("projA") / ".debris.tmp").write_text("x", encoding="utf-8")
+    for _ in range(100):
+        stats = collect(store, "projA", budget_seconds=0, grace_seconds=0)
+        if stats["complete"]:
+            break
+    assert stats["complete"] is True
+    assert not (store.project_tree("projA") / ".debris.tmp").exists()
+
+
+def test_busy_lock_returns_busy(store):
+    store.create_node(_payload())
+    root = store.project_tree("projA")
+    fd = os.open(root / tree_gc.LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        tree_gc.fcntl.flock(fd, tree_gc.fcntl.LOCK_EX)
+        assert collect(store, "projA")["status"] == "busy"
+    finally:
+        os.close(fd)
+    assert collect(store, "projA")["status"] == "ok"
+
+
+def test_delete_nodes_updates_index_and_usage(store):
+    nodes = [store.create_node(_payload(summary=f"Rule {i} about caching.")) for i in range(3)]
+    removed = store.delete_nodes("projA", [nodes[0]["node_id"], "missing-node", nodes[2]["node_id"]])
+    assert removed == [nodes[0]["node_id"], nodes[2]["node_id"]]
+    assert [e["node_id"] for e in store.load_index("projA")["nodes"]] == [nodes[1]["node_id"]]
+    events = [e for e in store.iter_usage("projA") if e.get("event") == "node_deleted"]
+    assert sorted(e["node_id"] for e in events) == sorted(removed)
+
+
+def test_admin_gc(store, capsys, monkeypatch):
+    monkeypatch.setattr(tree_gc, "GRACE_SECONDS", 0)
+    store.save_raw("projA", _text("orphan"))
+    home = str(store.ralph_home)
+    assert admin_main(["--ralph-home", home, "--project-id", "projA", "gc", "--budget-seconds", "5"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    assert output["complete"] is True and output["raw_removed"] == 1
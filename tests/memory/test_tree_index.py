@@ -0,0 +1,432 @@
+"""Tests for the pure index helpers behind the incremental index.
+
+Covers: posting-list deltas on upsert/delete, idempotent replay, generation
+bumps, the structural corruption check, trigram token matching staying
+identical to a full vocabulary scan while deltas maintain it, lean entries
+leaving the detail tier in the node, facet id lists kept equal to a full
+build and filtered by include/exclude, the epoch timeline and its range
+lookups, the entity index and source-path trie, branch partitions following
+visibility transitions, ``EntryFilter`` answering
+from the index exactly what it matches entry by entry, per-term score bounds
+that never undershoot a node's text score, scoring features precomputed per
+entry, and schema migrations of older indexes.
+"""
+
+from __future__ import annotations
+
+import copy
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+from tree_index import (  # noqa: E402
+    DETAIL_FIELDS,
+    FIELD_WEIGHTS,
+    EntryFilter,
+    INDEX_SCHEMA_VERSION,
+    apply_delta,
+    branch_ids,
+    build_bounds,
+    build_branches,
+    build_entities,
+    build_facets,
+    build_index,
+    build_paths,
+    build_timeline,
+    build_trigrams,
+    check_index,
+    empty_index,
+    facet_ids,
+    index_entry,
+    match_tokens,
+    matches_facets,
+    path_ids,
+    migrate_index,
+    normalize_index,
+    scoring_features,
+    scoring_haystacks,
+    stale_entry,
+    term_bound,
+    window_ids,
+)
+
+_ALPHABET = "abcde./_-"
+
+
+def _scan(tokens, term):
+    return sorted(tok for tok in tokens if term in tok)
+
+
+def _random_words(rng: random.Random, count: int) -> list[str]:
+    return ["".join(rng.choice(_ALPHABET) for _ in range(rng.randint(3, 9))) for _ in range(count)]
+
+
+def _entry(node_id: str, summary: str) -> dict:
+    return {"node_id": node_id, "summary": summary, "trigger": {}, "topic_tags": []}
+
+
+def test_upsert_adds_and_replaces_postings():
+    index = empty_index("projA")
+    apply_delta(index, {"op": "upsert", "entry": _entry("n1", "savepoint rollback")})
+    assert index["postings"]["savepoint"] == ["n1"]
+    apply_delta(index, {"op": "upsert", "entry": _entry("n1", "rollback only")})
+    assert "savepoint" not in index["postings"]
+    assert index["postings"]["rollback"] == ["n1"]
+    assert index["generation"] == 2
+
+
+def test_delete_removes_entry_and_postings():
+    index = build_index("projA", [_entry("n1", "alpha beta"), _entry("n2", "beta gamma")])
+    apply_delta(index, {"op": "delete", "node_id": "n1"})
+    assert [e["node_id"] for e in index["nodes"]] == ["n2"]
+    assert "alpha" not in index["postings"]
+    assert index["postings"]["beta"] == ["n2"]
+
+
+def test_replayed_delta_is_idempotent():
+    index = empty_index("projA")
+    delta = {"op": "upsert", "entry": _entry("n1", "hooks stdin")}
+    apply_delta(index, delta)
+    snapshot = copy.deepcopy((index["nodes"], index["postings"]))
+    apply_delta(index, delta)
+    assert (index["nodes"], index["postings"]) == snapshot
+
+
+def test_deltas_match_full_build():
+    entries = [_entry(f"n{i}", f"token{i % 3} shared") for i in range(9)]
+    index = empty_index("projA")
+    for entry in reversed(entries):
+        apply_delta(index, {"op": "upsert", "entry": entry})
+    full = build_index("projA", entries)
+    assert index["nodes"] == full["nodes"]
+    assert index["postings"] == full["postings"]
+
+
+def test_unknown_op_rejected():
+    with pytest.raises(ValueError):
+        apply_delta(empty_index("projA"), {"op": "truncate"})
+
+
+def test_check_index_flags_structural_damage():
+    assert check_index(empty_index("projA")) == ""
+    assert check_index([]) == "not_an_object"
+    assert check_index({"schema_version": "other"}) == "schema_version"
+    damaged = empty_index("projA")
+    damaged["postings"] = []
+    assert check_index(damaged) == "postings"
+
+
+def test_normalize_sorts_legacy_node_order():
+    legacy = build_index("projA", [_entry("b", "bbb"), _entry("a", "aaa")])
+    legacy["nodes"].reverse()
+    del legacy["generation"]
+    normalize_index(legacy)
+    assert [e["node_id"] for e in legacy["nodes"]] == ["a", "b"]
+    assert legacy["generation"] == 0
+
+
+def test_match_tokens_equals_the_vocabulary_scan():
+    rng = random.Random(14)
+    vocab = set(_random_words(rng, 400))
+    trigrams = build_trigrams(vocab)
+    needles = _random_words(rng, 200) + [tok[1:-1] for tok in list(vocab)[:100]]
+    for needle in needles:
+        if len(needle) < 3:
+            assert match_tokens(trigrams, needle) is None
+        else:
+            assert match_tokens(trigrams, needle) == _scan(vocab, needle), needle
+    # Trigrams that co-occur without the term itself are verified away.
+    assert match_tokens(build_trigrams(["abcxbcd"]), "abcd") == []
+
+
+def test_deltas_keep_trigrams_equal_to_a_full_build():
+    rng = random.Random(7)
+    index = empty_index("projA")
+    entries = {}
+    for _ in range(300):
+        node_id = f"n{rng.randint(0, 30):02d}"
+        if rng.random() < 0.25:
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            entries.pop(node_id, None)
+        else:
+            entries[node_id] = _entry(node_id, " ".join(_random_words(rng, 4)))
+            apply_delta(index, {"op": "upsert", "entry": entries[node_id]})
+    assert index["trigrams"] == build_trigrams(index["postings"])
+    assert index["trigrams"] == build_index("projA", entries.values())["trigrams"]
+
+
+def test_deltas_keep_facets_equal_to_a_full_build():
+    rng = random.Random(11)
+    index = empty_index("projA")
+    entries = {}
+    for _ in range(300):
+        node_id = f"n{rng.randint(0, 30):02d}"
+        if rng.random() < 0.25:
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            entries.pop(node_id, None)
+        else:
+            entries[node_id] = {
+                **_entry(node_id, "x"),
+                "domain": rng.choice(["hooks", "db", ""]),
+                "sensitivity": rng.choice(["GREEN", "YELLOW"]),
+            }
+            apply_delta(index, {"op": "upsert", "entry": entries[node_id]})
+    assert index["facets"] == build_facets(index["nodes"])
+    assert index["facets"] == build_index("projA", entries.values())["facets"]
+
+
+def test_facet_ids_intersect_include_and_subtract_exclude():
+    entries = [
+        {**_entry(f"n{i}", "x"), "domain": d, "sensitivity": s, "visibility": v}
+        for i, (d, s, v) in enumerate([
+            ("hooks", "GREEN", "main_promoted"),
+            ("hooks", "GREEN", "conflict"),
+            ("hooks", "YELLOW", "branch_local"),
+            ("db", "GREEN", "branch_local"),
+        ])
+    ]
+    index = build_index("projA", entries)
+    include = {"domain": ["hooks"], "sensitivity": ["GREEN"]}
+    exclude = {"visibility": ["conflict"]}
+    assert facet_ids(index, include, exclude) == ["n0"]
+    assert facet_ids(index, {"domain": ["hooks", "db"]}) == ["n0", "n1", "n2", "n3"]
+    assert facet_ids(index, exclude={"sensitivity": ["YELLOW"]}, within=["n2", "n3"]) == ["n3"]
+    assert facet_ids(index, {"domain": ["nope"]}) == []
+    expected = [e["node_id"] for e in index["nodes"] if matches_facets(e, include, exclude)]
+    assert expected == ["n0"]
+    with pytest.raises(ValueError):
+        facet_ids(index, {"colour": ["red"]})
+
+
+def test_deltas_keep_the_timeline_equal_to_a_full_build():
+    rng = random.Random(5)
+    index = empty_index("projA")
+    entries = {}
+    for _ in range(300):
+        node_id = f"n{rng.randint(0, 30):02d}"
+        if rng.random() < 0.25:
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            entries.pop(node_id, None)
+        else:
+            day = rng.randint(1, 28)
+            entries[node_id] = index_entry(
+                {"node_id": node_id, "updated_at": f"2026-02-{day:02d}T12:00:00Z"}
+            )
+            apply_delta(index, {"op": "upsert", "entry": entries[node_id]})
+    assert index["timeline"] == build_timeline(index["nodes"])
+    assert index["timeline"] == build_index("projA", entries.values())["timeline"]
+
+
+def test_window_ids_bisect_the_timeline():
+    stamps = {"a": "2026-01-01T00:00:00Z", "b": "2026-01-02T00:00:00+00:00", "c": "2026-03-01"}
+    index = build_index(
+        "projA", [index_entry({"node_id": k, "updated_at": v}) for k, v in stamps.items()]
+    )
+    index["nodes"].append({"node_id": "d", "updated_at": "not a date", "epoch": None})
+    jan2 = index["nodes"][1]["epoch"]
+    assert window_ids(index) == ["a", "b", "c"]
+    assert window_ids(index, since=jan2) == ["b", "c"]
+    assert window_ids(index, until=jan2) == ["a"]
+    assert window_ids(index, since=jan2, until=jan2 + 1) == ["b"]
+    del index["timeline"]  # older index: built on the fly
+    assert window_ids(index, since=jan2) == ["b", "c"]
+
+
+_DIRS = ["scripts/memory", "scripts", ".claude/hooks", "Tests", "docs/a/b"]
+
+
+def _path_entry(rng: random.Random, node_id: str) -> dict:
+    paths = [f"{rng.choice(_DIRS)}/f{rng.randint(0, 3)}.py" for _ in range(rng.randint(0, 3))]
+    return index_entry({
+        "node_id": node_id,
+        "source_paths": paths,
+        "entities": rng.sample(["TreeStore", "recall", "Hooks", "hooks"], rng.randint(0, 2)),
+        "domain": rng.choice(["hooks", "general"]),
+        "updated_at": f"2026-02-{rng.randint(1, 28):02d}T00:00:00Z",
+        "branch": rng.choice(["main", "feature/x", "feature/y"]),
+        "visibility": rng.choice(
+            ["branch_local", "merge_candidate", "main_promoted", "conflict", "deprecated_on_merge"]
+        ),
+    })
+
+
+def test_deltas_keep_entities_and_paths_equal_to_a_full_build():
+    rng = random.Random(17)
+    index = empty_index("projA")
+    entries = {}
+    for _ in range(300):
+        node_id = f"n{rng.randint(0, 30):02d}"
+        if rng.random() < 0.25:
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            entries.pop(node_id, None)
+        else:
+            entries[node_id] = _path_entry(rng, node_id)
+            apply_delta(index, {"op": "upsert", "entry": entries[node_id]})
+    full = build_index("projA", entries.values())
+    assert index["entities"] == build_entities(index["nodes"]) == full["entities"]
+    assert index["paths"] == build_paths(index["nodes"]) == full["paths"]
+    assert index["branches"] == build_branches(index["nodes"]) == full["branches"]
+
+
+def test_term_bounds_never_undershoot_a_text_score():
+    rng = random.Random(29)
+    index = empty_index("projA")
+    entries = {}
+    for _ in range(200):
+        node_id = f"n{rng.randint(0, 20):02d}"
+        if rng.random() < 0.2:
+            apply_delta(index, {"op": "delete", "node_id": node_id})
+            entries.pop(node_id, None)
+            continue
+        entry = entries[node_id] = index_entry({
+            **_path_entry(rng, node_id),
+            "summary": " ".join(_random_words(rng, 3)),
+            "trigger": {"when": rng.choice(_random_words(rng, 2))},
+        })
+        apply_delta(index, {"op": "upsert", "entry": entry})
+    full = build_bounds(entries.values())
+    loose = index["bounds"]  # deltas only ever add bits
+    assert all(loose.get(token, 0) & bits == bits for token, bits in full.items())
+    terms = _random_words(rng, 60) + ["abc", "entities", "src/hooks", "treestore", "ab"]
+    for term in terms:
+        actual = max(
+            sum(FIELD_WEIGHTS[name] for name, text in scoring_haystacks(e).items() if term in text)
+            for e in entries.values()
+        )
+        assert actual <= term_bound(full, term) <= term_bound(loose, term)
+    assert term_bound({}, "ab") == sum(FIELD_WEIGHTS.values())  # below a token's length
+
+
+def test_path_ids_walk_files_and_directories_by_segment():
+    entries = [
+        {"node_id": "a", "source_paths": ["./scripts/memory/tree_store.py"]},
+        {"node_id": "b", "source_paths": ["scripts/memory/recall_v2.py", ".claude/hooks/x.sh"]},
+        {"node_id": "c", "source_paths": ["scripts/memory-old/tree_store.py"]},
+        {"node_id": "d", "source_paths": []},
+    ]
+    index = build_index("projA", entries)
+    assert path_ids(index, ["scripts/memory/tree_store.py"]) == ["a"]
+    assert path_ids(index, ["scripts/memory/"]) == ["a", "b"]
+    assert path_ids(index, ["Scripts"]) == ["a", "b", "c"]
+    assert path_ids(index, [".claude/hooks", "scripts/memory-old"]) == ["b", "c"]
+    assert path_ids(index, ["scripts/mem", "", "nope/x.py"]) == []
+
+
+def test_entry_filter_ids_match_the_entry_by_entry_check():
+    rng = random.Random(23)
+    index = build_index("projA", [_path_entry(rng, f"n{i:02d}") for i in range(40)])
+    epochs = sorted(e["epoch"] for e in index["nodes"])
+    filters = [
+        EntryFilter(paths=("scripts",)),
+        EntryFilter(paths=("scripts/memory/f1.py", ".claude/hooks/")),
+        EntryFilter(entities=("hooks",), include={"domain": ["hooks"]}),
+        EntryFilter(since=epochs[10], until=epochs[30], exclude={"domain": ["general"]}),
+        EntryFilter(paths=("docs/a",), entities=("treestore", "recall"), since=epochs[5]),
+        EntryFilter(branch="feature/x"),
+        EntryFilter(branch="feature/y", include={"domain": ["hooks"]}),
+        EntryFilter(),
+    ]
+    for where in filters:
+        expected = [e["node_id"] for e in index["nodes"] if where.matches(e)]
+        assert where.ids(index) == expected, where
+        assert where.ids(index, within=expected[::2]) == expected[::2]
+    assert not EntryFilter() and EntryFilter(since=0)
+    assert EntryFilter(paths=("a",)).structures() == ["paths"]
+    with pytest.raises(ValueError):
+        EntryFilter(include={"colour": ["red"]})
+
+
+def test_branch_view_follows_visibility_transitions():
+    def entry(node_id, branch, visibility):
+        return {"node_id": node_id, "branch": branch, "visibility": visibility}
+
+    index = build_index("projA", [
+        entry("a", "main", "main_promoted"),
+        entry("b", "feature/x", "branch_local"),
+        entry("c", "feature/x", "merge_candidate"),
+        entry("d", "feature/y", "branch_local"),
+        entry("e", "feature/x", "conflict"),
+        {"node_id": "f"},  # thin entry: placed once its node is read
+    ])
+    assert branch_ids(index, "feature/x") == ["a", "b", "c", "f"]
+    assert branch_ids(index, "feature/y") == ["a", "d", "f"]
+    apply_delta(index, {"op": "upsert", "entry": entry("d", "feature/y", "main_promoted")})
+    apply_delta(index, {"op": "upsert", "entry": entry("b", "feature/x", "deprecated_on_merge")})
+    assert branch_ids(index, "feature/x") == ["a", "c", "d", "f"]
+    assert index["branches"] == build_branches(index["nodes"])
+
+
+def test_normalize_builds_trigrams_for_older_indexes():
+    legacy = build_index("projA", [_entry("a", "savepoint rollback")])
+    del legacy["trigrams"]
+    assert check_index(legacy) == ""
+    normalize_index(legacy)
+    assert match_tokens(legacy["trigrams"], "back") == ["rollback"]
+    legacy["trigrams"] = []
+    assert check_index(legacy) == "trigrams"
+
+
+def test_index_entry_leaves_detail_fields_in_the_node():
+    node = {
+        "node_id": "n1",
+        "summary": "short",
+        "detailed_summary": "x" * 400,
+        "source_description": "from a review",
+        "source_paths": ["scripts/memory/recall_v2.py"],
+    }
+    entry = index_entry(node)
+    assert not set(DETAIL_FIELDS) & set(entry)
+    assert entry["detail_bytes"] > 400
+    # Without paths the description is the provenance and stays in the entry.
+    assert index_entry({**node, "source_paths": []})["source_description"] == "from a review"
+
+
+def test_migrate_index_rebuilds_thin_entries_from_nodes():
+    nodes = {
+        "a": {"node_id": "a", "summary": "savepoint rollback", "authority": "non_authoritative"},
+        "b": {"node_id": "b", "summary": "hooks stdin", "detailed_summary": "long"},
+    }
+    old = {
+        "schema_version": "ralph_memory_tree_index_v1",
+        "project_id": "projA",
+        "generation": 3,
+        "nodes": [{"node_id": "a"}, {**nodes["b"], "authority": "x"}, {"node_id": "gone"}],
+        "postings": {},
+    }
+    assert check_index(old) == ""
+    normalize_index(old)
+    assert [stale_entry(e) for e in old["nodes"]] == [True, True, True]
+    steps = migrate_index(old, nodes.get)
+    assert steps[-1] == INDEX_SCHEMA_VERSION
+    assert steps[:2] == ["ralph_memory_tree_index_v2", "ralph_memory_tree_index_v3"]
+    assert old["schema_version"] == INDEX_SCHEMA_VERSION
+    assert [stale_entry(e) for e in old["nodes"]] == [False, False, True]
+    assert old["postings"]["savepoint"] == ["a"] and match_tokens(old["trigrams"], "stdi") == ["stdin"]
+    assert migrate_index(old, nodes.get) == []
+    with pytest.raises(ValueError):
+        migrate_index({**old, "schema_version": "ralph_memory_tree_index_v0"}, nodes.get)
+
+
+def test_migrating_v7_precomputes_entry_features():
+    entries = [
+        index_entry({"node_id": "a", "summary": "Savepoint  ROLLBACK", "links": ["b", "c"]}),
+        index_entry({"node_id": "b", "memory_type": "negative_rule", "salience": {"x": 0.5}}),
+    ]
+    assert entries[0]["features"]["summary_text"] == "savepoint rollback"
+    assert entries[0]["features"]["link_count"] == 2
+    assert entries[1]["features"] == scoring_features(entries[1])
+    features = entries[1]["features"]
+    assert features["negative_rule"] is True and features["salience_total"] == 0.5
+    old = build_index("projA", copy.deepcopy(entries))
+    old["schema_version"] = "ralph_memory_tree_index_v7"
+    old["nodes"].append({"node_id": "thin"})
+    for entry in old["nodes"]:
+        entry.pop("features", None)
+    assert all(stale_entry(e) for e in old["nodes"])
+    assert migrate_index(old, lambda _node_id: None) == [INDEX_SCHEMA_VERSION]
+    assert old["nodes"][:2] == entries and "features" not in old["nodes"][2]
@@ -0,0 +1,186 @@
+"""Tests for copy-on-write branch / commit snapshots of a project tree.
+
+Covers: a view staying frozen while the live tree changes, hard links sharing
+the node file, O(changed) re-snapshots, frozen index generations, commit vs
+branch ref semantics, non-file backends, tree_gc reclaiming superseded views
+while keeping raw blobs a view still references, and ``tree_admin snapshot``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import tree_snapshot  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_gc import collect  # noqa: E402
+from tree_store import FileBackend, TreeStore, TreeStoreError  # noqa: E402
+
+
+def _payload(**overrides):
+    payload = {
+        "project_id": "projA",
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def store(tmp_path) -> TreeStore:
+    store = TreeStore(tmp_path / "ralph_home")
+    for i in range(5):
+        store.create_node(_payload(summary=f"Rule {i} about caching."))
+    return store
+
+
+def _ids(store: TreeStore) -> list[str]:
+    return sorted(n["node_id"] for n in store.list_nodes("projA"))
+
+
+def test_view_stays_frozen_while_the_tree_changes(store):
+    node_id, gone = _ids(store)[:2]
+    before = store.load_node("projA", node_id)["summary"]
+    meta = store.snapshot("projA", branch="feature/login")
+    assert (meta["created"], meta["nodes"], meta["changed"]) == (True, 5, 5)
+
+    store.update_node("projA", node_id, {"summary": "Rewritten on main."})
+    store.delete_nodes("projA", [gone])
+    store.create_node(_payload(summary="Added after the snapshot."))
+
+    view = store.open_snapshot("projA", branch="feature/login")
+    assert view.load_node(node_id)["summary"] == before
+    assert view.load_node(gone) is not None
+    assert len(view.node_ids()) == 5 and len(view.list_nodes()) == 5
+    assert {e["node_id"] for e in view.load_index()["nodes"]} == set(view.node_ids())
+    assert store.load_node("projA", node_id)["summary"] == "Rewritten on main."
+
+
+def test_objects_are_hard_links_of_node_files(store):
+    node_id = _ids(store)[0]
+    inode = store.node_path("projA", node_id).stat().st_ino
+    store.snapshot("projA", commit="c0ffee")
+    objects = list((tree_snapshot.snapshots_root(store, "projA") / "objects").rglob("*.json"))
+    assert len(objects) == 5
+    assert inode in {path.stat().st_ino for path in objects}
+
+
+def test_resnapshot_captures_only_changed_nodes(store, monkeypatch):
+    ids = _ids(store)
+    store.snapshot("projA", branch="main")
+    store.update_node("projA", ids[0], {"summary": "Changed once."})
+    store.delete_nodes("projA", [ids[1]])
+    added = store.create_node(_payload(summary="Brand new rule."))
+
+    linked: list[str] = []
+    real = FileBackend.link_node
+    monkeypatch.setattr(
+        FileBackend, "link_node", lambda self, nid, dest: linked.append(nid) or real(self, nid, dest)
+    )
+    meta = store.snapshot("projA", branch="main")
+    assert sorted(linked) == sorted([ids[0], added["node_id"]])
+    assert (meta["changed"], meta["deleted"], meta["nodes"]) == (2, 1, 5)
+    view = store.open_snapshot("projA", branch="main")
+    assert view.load_node(ids[0])["summary"] == "Changed once."
+    assert view.load_node(ids[1]) is None
+
+
+def test_view_keeps_its_index_generation(store):
+    live = store.load_index("projA")["generation"]
+    meta = store.snapshot("projA", branch="main")
+    view = store.open_snapshot("projA", branch="main")
+    store.create_node(_payload(summary="Another rule."))
+    assert meta["generation"] == view.generation == live
+    assert view.load_index()["generation"] == live
+    assert store.load_index("projA")["generation"] > live
+
+
+def test_commit_refs_are_immutable_branch_refs_move(store):
+    first = store.snapshot("projA", commit="abc123")
+    store.create_node(_payload(summary="Later rule."))
+    again = store.snapshot("projA", commit="abc123")
+    assert again["created"] is False and again["view"] == first["view"]
+    assert len(store.open_snapshot("projA", commit="abc123").node_ids()) == 5
+
+    old = store.snapshot("projA", branch="main")
+    store.create_node(_payload(summary="Yet another rule."))
+    new = store.snapshot("projA", branch="main")
+    assert new["view"] != old["view"] and new["parent"] == old["view"]
+    assert len(store.open_snapshot("projA", branch="main").node_ids()) == 7
+    assert [(r["kind"], r["name"]) for r in tree_snapshot.list_snapshots(store, "projA")] == [
+        ("branch", "main"),
+        ("commit", "abc123"),
+    ]
+    assert store.open_snapshot("projA", branch="missing") is None
+
+
+def test_ref_must_name_exactly_one_of_branch_or_commit(store):
+    with pytest.raises(TreeStoreError):
+        store.snapshot("projA")
+    with pytest.raises(TreeStoreError):
+        store.snapshot("projA", branch="main", commit="abc")
+    with pytest.raises(TreeStoreError):
+        store.snapshot("projA", branch="")
+
+
+def test_sqlite_backend_copies_node_bodies(tmp_path):
+    store = TreeStore(tmp_path / "home", backend="sqlite")
+    node = store.create_node(_payload())
+    store.snapshot("projA", branch="main")
+    store.update_node("projA", node["node_id"], {"summary": "Changed in sqlite."})
+    view = store.open_snapshot("projA", branch="main")
+    assert view.load_node(node["node_id"])["summary"] == _payload()["summary"]
+
+
+def test_gc_reclaims_superseded_views_and_keeps_their_raw_until_then(store):
+    raw = store.save_raw("projA", "transcript only a snapshot still needs\n")["sha256"]
+    node = store.create_node(_payload(raw_ref={"sha256": raw}, summary="Rule with raw."))
+    store.snapshot("projA", branch="main")
+    store.delete_nodes("projA", [node["node_id"]])
+
+    stats = collect(store, "projA", grace_seconds=0)
+    assert stats["raw_removed"] == 0 and store.read_raw("projA", raw) is not None
+
+    store.snapshot("projA", branch="main")  # moves the ref; the old view is superseded
+    stats = collect(store, "projA", grace_seconds=0)
+    assert stats["snapshot_views_removed"] == 1 and stats["snapshot_objects_removed"] == 1
+    assert stats["raw_removed"] == 1
+    view = store.open_snapshot("projA", branch="main")
+    assert all(view.load_node(node_id) is not None for node_id in view.node_ids())
+
+
+def test_gc_keeps_recently_superseded_views(store):
+    store.snapshot("projA", branch="main")
+    store.create_node(_payload(summary="One more rule."))
+    store.snapshot("projA", branch="main")
+    assert collect(store, "projA")["snapshot_views_removed"] == 0
+
+
+def test_admin_snapshot(store, capsys):
+    home = str(store.ralph_home)
+    base = ["--ralph-home", home, "--project-id", "projA", "snapshot"]
+    assert admin_main([*base, "--branch", "feature/x"]) == 0
+    assert json.loads(capsys.readouterr().out)["nodes"] == 5
+    assert admin_main([*base, "--list"]) == 0
+    assert [r["name"] for r in json.loads(capsys.readouterr().out)["snapshots"]] == ["feature/x"]
+    assert admin_main([*base, "--branch", "feature/x", "--delete"]) == 0
+    assert json.loads(capsys.readouterr().out)["deleted"] is True
+    assert store.open_snapshot("projA", branch="feature/x") is None
+    assert os.path.isdir(tree_snapshot.snapshots_root(store, "projA") / "views")
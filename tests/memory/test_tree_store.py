@@ -2,11 +2,15 @@
 
 Covers: per-project isolation, path-traversal rejection, RED never reaching
 raw storage, corrupt-file tolerance (load_node -> None), raw read re-checking
-RED, and listings never carrying raw bodies.
+RED, listings never carrying raw bodies, the incremental index, bulk
+create/upsert ingestion, the sharded fan-out layout with online
+resharding, upgrading thin entries / older index schemas, and backends that
+miss a required method failing at construction.
 """
 
 from __future__ import annotations
 
+import json
 import sys
 from pathlib import Path
 
@@ -15,13 +19,21 @@ import pytest
 _MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
 sys.path.insert(0, str(_MEMORY_DIR))
 
-from memory_node import MemoryNodeValidationError  # noqa: E402
+from memory_node import MemoryNodeValidationError, sha256_text  # noqa: E402
+from recall_v2 import Context, recall  # noqa: E402
+from tree_admin import main as admin_main  # noqa: E402
+from tree_index import INDEX_SCHEMA_VERSION, stale_entry  # noqa: E402
 from tree_store import (  # noqa: E402
+    UPGRADE_NAME,
     TreeStore,
+    StorageBackend,
+    TreeStoreError,
     TreeStorePathError,
     compute_project_id,
     ensure_within,
+    entry_filter,
     safe_segment,
+    shard_dirs,
 )
 
 
@@ -92,6 +104,17 @@ def test_update_node(store):
 
 # --- per-project isolation --------------------------------------------------
 
+def test_incomplete_backend_fails_at_construction(store):
+    methods = {
+        name: lambda self, *args: None
+        for name in StorageBackend.__abstractmethods__
+        if name != "delete_raw"
+    }
+    NoRawDelete = type("NoRawDelete", (StorageBackend,), methods)
+    with pytest.raises(TypeError, match="delete_raw"):
+        NoRawDelete(store, "projA")
+
+
 def test_project_isolation(store):
     a = store.create_node(_payload("projA", summary="Project A rule about hooks stdin."))
     b = store.create_node(_payload("projB", summary="Project B rule about pytest fixtures."))
@@ -161,11 +184,12 @@ def test_save_and_read_raw_green(store):
 
 
 def test_read_raw_rechecks_red(store):
-    # Write a safe raw blob, then tamper the on-disk file with RED material.
-    ref = store.save_raw("projA", "safe content placeholder", "GREEN")
-    raw_file = store.raw_path("projA", ref["sha256"])
-    raw_file.write_text("token = sk-DEADBEEF0123456789ABCDEF0123", encoding="utf-8")
-    assert store.read_raw("projA", ref["sha256"]) is None
+    # Plant a legacy whole-file blob holding RED material under its own
+    # (matching) digest: only the read-time RED re-check can refuse it.
+    red = "token = sk-DEADBEEF0123456789ABCDEF0123"
+    store.ensure_layout("projA")
+    store.raw_path("projA", sha256_text(red), legacy=True).write_text(red, encoding="utf-8")
+    assert store.read_raw("projA", sha256_text(red)) is None
 
 
 # --- corrupt file tolerance -------------------------------------------------
@@ -210,3 +234,307 @@ def test_list_nodes_has_no_raw_bodies(store):
             assert set(raw_ref.keys()) == {"sha256"}
         flat = str(entry)
         assert "raw body content here" not in flat
+
+
+# --- incremental index ------------------------------------------------------
+
+def test_write_does_not_reload_other_nodes(store, monkeypatch):
+    for i in range(5):
+        store.create_node(_payload("projA", summary=f"database rule number {i}"))
+    calls = []
+    original = store.load_node
+    monkeypatch.setattr(
+        store, "load_node", lambda p, n: calls.append(n) or original(p, n)
+    )
+    store.create_node(_payload("projA", summary="one more database rule"))
+    # only the duplicate check touches a node file; the index is patched
+    assert len(calls) == 1
+
+
+def test_incremental_index_matches_full_rebuild(store):
+    a = store.create_node(_payload("projA", summary="hooks read stdin json"))
+    store.create_node(_payload("projA", summary="pytest fixtures isolate state"))
+    store.update_node("projA", a["node_id"], {"summary": "hooks emit json on stdout"})
+    incremental = store.load_index("projA")
+    assert incremental is not None
+    rebuilt = store.reindex("projA")
+    assert incremental["nodes"] == rebuilt["nodes"]
+    assert incremental["postings"] == rebuilt["postings"]
+    assert incremental["trigrams"] == rebuilt["trigrams"]
+    assert "stdin" not in rebuilt["postings"]
+
+
+def test_generation_increases_per_write(store):
+    store.create_node(_payload("projA", summary="first rule about sql"))
+    first = store.load_index("projA")["generation"]
+    store.create_node(_payload("projA", summary="second rule about sql"))
+    assert store.load_index("projA")["generation"] == first + 1
+
+
+def test_journal_compacts_past_threshold(store, monkeypatch):
+    import tree_store
+
+    monkeypatch.setattr(tree_store, "INDEX_JOURNAL_MAX_BYTES", 1)
+    written = store.create_node(_payload("projA"))
+    assert store.index_journal_path("projA").read_text(encoding="utf-8") == ""
+    base = json.loads(store.index_path("projA").read_text(encoding="utf-8"))
+    assert [n["node_id"] for n in base["nodes"]] == [written["node_id"]]
+
+
+def test_torn_journal_triggers_reindex(store):
+    first = store.create_node(_payload("projA", summary="first rule about sql"))
+    with store.index_journal_path("projA").open("a", encoding="utf-8") as fh:
+        fh.write('{"op": "upsert", "entry": {"node_')
+    assert store.load_index("projA") is None
+    second = store.create_node(_payload("projA", summary="second rule about sql"))
+    index = store.load_index("projA")
+    assert index is not None
+    assert {n["node_id"] for n in index["nodes"]} == {
+        first["node_id"],
+        second["node_id"],
+    }
+
+
+def test_deferred_index_flushes_once(store):
+    with store.deferred_index():
+        store.create_node(_payload("projA", summary="deferred rule about sql"))
+        assert store.load_index("projA")["nodes"] == []
+    assert len(store.load_index("projA")["nodes"]) == 1
+
+
+# --- bulk ingest ---------------------------------------------------------------
+
+def test_upsert_nodes_reports_per_item_outcomes(store):
+    existing = store.create_node(_payload("projA", summary="first rule about sql"))
+    outcomes = store.upsert_nodes(
+        [
+            _payload("projA", node_id=existing["node_id"], summary="revised rule about sql"),
+            _payload("projA", summary="brand new rule about caching"),
+            _payload("projA", summary=""),
+            _payload("projB", summary="another project's rule"),
+        ]
+    )
+    assert [o["status"] for o in outcomes] == ["updated", "created", "rejected", "created"]
+    assert [o["index"] for o in outcomes] == [0, 1, 2, 3]
+    assert outcomes[2]["error"]
+    updated = store.load_node("projA", existing["node_id"])
+    assert updated["summary"] == "revised rule about sql"
+    assert updated["created_at"] == existing["created_at"]
+    assert {e["node_id"] for e in store.load_index("projA")["nodes"]} == {
+        existing["node_id"],
+        outcomes[1]["node_id"],
+    }
+    assert len(store.list_nodes("projB")) == 1
+
+
+def test_create_nodes_rejects_existing_and_in_batch_duplicates(store):
+    existing = store.create_node(_payload("projA", summary="first rule about sql"))
+    outcomes = store.create_nodes(
+        [
+            _payload("projA", node_id=existing["node_id"], summary="clobber attempt"),
+            _payload("projA", node_id="node_bulk_1", summary="bulk rule one"),
+            _payload("projA", node_id="node_bulk_1", summary="bulk rule one again"),
+        ]
+    )
+    assert [o["status"] for o in outcomes] == ["rejected", "created", "rejected"]
+    assert store.load_node("projA", existing["node_id"])["summary"] == "first rule about sql"
+    assert store.load_node("projA", "node_bulk_1")["summary"] == "bulk rule one"
+
+
+def test_bulk_ingest_flushes_index_and_usage_once(store, monkeypatch):
+    store.create_node(_payload("projA", summary="seed rule about sql"))
+    backend = store.backend("projA")
+    calls = {"load_node": 0, "deltas": 0, "usage": 0}
+    monkeypatch.setattr(
+        store, "load_node", lambda *a: calls.__setitem__("load_node", calls["load_node"] + 1)
+    )
+    real_deltas, real_usage = backend.append_index_deltas, backend.append_usage_many
+    monkeypatch.setattr(
+        backend,
+        "append_index_deltas",
+        lambda d: calls.__setitem__("deltas", calls["deltas"] + 1) or real_deltas(d),
+    )
+    monkeypatch.setattr(
+        backend,
+        "append_usage_many",
+        lambda e: calls.__setitem__("usage", calls["usage"] + 1) or real_usage(e),
+    )
+    outcomes = store.upsert_nodes(
+        _payload("projA", summary=f"bulk rule {i} about caching") for i in range(25)
+    )
+    assert all(o["status"] == "created" for o in outcomes)
+    assert calls == {"load_node": 0, "deltas": 1, "usage": 1}
+    assert len(store.load_index("projA")["nodes"]) == 26
+    assert len(list(store.iter_usage("projA"))) == 26
+
+
+# --- sharded layout -----------------------------------------------------------
+
+def test_sharded_store_fans_out_nodes_and_raw(tmp_path):
+    store = TreeStore(tmp_path / "ralph_home", shard=True)
+    written = store.create_node(_payload("projA"))
+    node_file = store.node_path("projA", written["node_id"])
+    assert node_file.exists()
+    assert node_file.relative_to(store.nodes_dir("projA")).parts[:2] == tuple(
+        shard_dirs(sha256_text(written["node_id"]), 2)
+    )
+    ref = store.save_raw("projA", "a perfectly safe note about testing", "GREEN")
+    raw_file = store.raw_path("projA", ref["sha256"])
+    assert raw_file.parent.name == ref["sha256"][:2] and raw_file.exists()
+    reopened = TreeStore(store.ralph_home)
+    assert [n["node_id"] for n in reopened.list_nodes("projA")] == [written["node_id"]]
+    assert reopened.read_raw("projA", ref["sha256"]) == "a perfectly safe note about testing"
+    with pytest.raises(TreeStorePathError):
+        reopened.node_path("projA", "../../escape")
+
+
+def test_reshard_round_trip_in_place(store):
+    ids = sorted(
+        store.create_node(_payload("projA", summary=f"Rule {i} about sql."))["node_id"]
+        for i in range(5)
+    )
+    digest = store.save_raw("projA", "safe raw body", "GREEN")["sha256"]
+
+    stats = store.reshard("projA")
+    assert (stats["nodes"], stats["raw"]) == (5, 1)
+    assert list(store.nodes_dir("projA").glob("*.json")) == []
+    assert list(store.raw_dir("projA").glob("*.manifest")) == []
+    reopened = TreeStore(store.ralph_home)
+    assert reopened.is_sharded("projA")
+    assert [n["node_id"] for n in reopened.list_nodes("projA")] == ids
+    assert reopened.read_raw("projA", digest) == "safe raw body"
+
+    reopened.reshard("projA", shard=False)
+    assert sorted(p.stem for p in store.nodes_dir("projA").iterdir()) == ids
+    assert sorted(p.name for p in store.raw_dir("projA").iterdir()) == sorted(["chunks", f"{digest}.manifest"])
+
+
+def test_writer_with_stale_layout_stays_visible(store):
+    node_id = store.create_node(_payload("projA"))["node_id"]
+    assert not store.is_sharded("projA")  # this store keeps the flat layout cached
+    TreeStore(store.ralph_home).reshard("projA")
+    store.update_node("projA", node_id, {"summary": "Written through the old layout."})
+    reader = TreeStore(store.ralph_home)
+    assert reader.load_node("projA", node_id)["summary"] == "Written through the old layout."
+    assert [n["node_id"] for n in reader.list_nodes("projA")] == [node_id]
+
+
+# --- thin entries / index schema upgrades ------------------------------------
+
+def _thin_tree(store: TreeStore, count: int = 4) -> list[str]:
+    """A tree whose index.json was written by an older build: v1 schema and
+    entries carrying only node_id + summary."""
+    ids = [
+        store.create_node(_payload("projA", summary=f"Rule {i} about sql."))["node_id"]
+        for i in range(count)
+    ]
+    _downgrade_index(store)
+    return ids
+
+
+def _downgrade_index(store: TreeStore) -> None:
+    index = store.reindex("projA")
+    index["schema_version"] = "ralph_memory_tree_index_v1"
+    index["nodes"] = [{"node_id": e["node_id"], "summary": e["summary"]} for e in index["nodes"]]
+    del index["trigrams"]
+    store.index_path("projA").write_text(json.dumps(index, indent=2) + "\n", encoding="utf-8")
+
+
+def _ctx() -> Context:
+    return Context(project_root=Path("."), project_id="projA", workspace_instance_id="ws1", branch="main")
+
+
+def test_recall_notes_thin_entries_and_the_next_write_upgrades_them(store, monkeypatch):
+    ids = _thin_tree(store)
+    before = recall("sql rule", _ctx(), store.ralph_home)
+    noted = json.loads((store.project_tree("projA") / UPGRADE_NAME).read_text())["node_ids"]
+    assert noted == sorted(ids)
+
+    store.create_node(_payload("projA", summary="A fresh rule about sql."))
+    assert not (store.project_tree("projA") / UPGRADE_NAME).exists()
+    assert not any(stale_entry(e) for e in store.load_index("projA")["nodes"])
+
+    loads: list[str] = []
+    original = TreeStore.load_node
+    monkeypatch.setattr(TreeStore, "load_node", lambda self, p, n: loads.append(n) or original(self, p, n))
+    after = recall("sql rule", _ctx(), store.ralph_home, limit=10)
+    assert loads == []
+    selected = set(after["MEMORY_TRACE"]["selected_memory_ids"])
+    assert set(before["MEMORY_TRACE"]["selected_memory_ids"]) <= selected
+
+
+def test_upgrade_batches_are_bounded(store, monkeypatch):
+    import tree_store
+
+    monkeypatch.setattr(tree_store, "UPGRADE_BATCH", 2)
+    ids = _thin_tree(store, count=5)
+    store.note_stale_entries("projA", ids)
+    store.create_node(_payload("projA", summary="Another sql rule."))
+    stale = [e["node_id"] for e in store.load_index("projA")["nodes"] if stale_entry(e)]
+    assert len(stale) == 3
+    assert json.loads((store.project_tree("projA") / UPGRADE_NAME).read_text())["node_ids"] == sorted(stale)
+
+
+def test_compaction_and_upgrade_index_migrate_the_schema(store, capsys):
+    _thin_tree(store)
+    generation = store.load_index("projA")["generation"]
+    compacted = store.compact_index("projA")
+    assert compacted["schema_version"] == INDEX_SCHEMA_VERSION
+    assert compacted["generation"] == generation + 1
+    assert not any(stale_entry(e) for e in compacted["nodes"])
+
+    _downgrade_index(store)
+    home = str(store.ralph_home)
+    assert admin_main(["--ralph-home", home, "--project-id", "projA", "upgrade-index"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["from_version"] == "ralph_memory_tree_index_v1"
+    assert (stats["schema_version"], stats["upgraded"], stats["stale"]) == (INDEX_SCHEMA_VERSION, 4, 0)
+    assert store.upgrade_index("projA")["upgraded"] == 0
+
+
+@pytest.mark.parametrize("backend", ["files", "sqlite"])
+def test_query_filters_by_facet_before_scoring(tmp_path, backend):
+    store = TreeStore(tmp_path / "home", backend=backend)
+    made = [
+        store.create_node(_payload("projA", summary=f"Rule {i}.", domain=d, sensitivity=s))
+        for i, (d, s) in enumerate([("hooks", "GREEN"), ("hooks", "YELLOW"), ("database", "GREEN")])
+    ]
+    store.update_node("projA", made[0]["node_id"], {"visibility": "conflict"})
+    hooks = store.query("projA", domain="hooks")
+    assert sorted(e["node_id"] for e in hooks) == sorted(n["node_id"] for n in made[:2])
+    green = store.query_ids("projA", sensitivity="GREEN", exclude={"visibility": "conflict"})
+    assert green == [made[2]["node_id"]]
+    yellow = store.query("projA", domain=["hooks", "database"], sensitivity="YELLOW")
+    assert [e["node_id"] for e in yellow] == [made[1]["node_id"]]
+    with pytest.raises(TreeStoreError):
+        store.query("projA", colour="red")
+
+
+@pytest.mark.parametrize(
+    "backend,index_format", [("files", "json"), ("files", "binary"), ("sqlite", "json")]
+)
+def test_query_by_source_path_prefix_and_entity(tmp_path, backend, index_format):
+    store = TreeStore(tmp_path / "home", backend=backend, index_format=index_format)
+    hook = store.create_node(
+        _payload(
+            "projA",
+            summary="Hook rule.",
+            source_paths=[".claude/hooks/pre.sh"],
+            entities=["PreToolUse"],
+        )
+    )
+    tree = store.create_node(
+        _payload("projA", summary="Store rule.", source_paths=["scripts/memory/tree_store.py"])
+    )
+    store.compact_index("projA")
+    late = store.create_node(  # still in the journal for the file layouts
+        _payload("projA", summary="Recall rule.", source_paths=["scripts/memory/recall_v2.py"])
+    )
+    assert store.query_ids("projA", path="scripts/memory/tree_store.py") == [tree["node_id"]]
+    under = store.query_ids("projA", path="scripts/memory/")
+    assert under == sorted([tree["node_id"], late["node_id"]])
+    assert [e["node_id"] for e in store.query("projA", path=".claude/hooks")] == [hook["node_id"]]
+    assert store.query_ids("projA", entity="pretooluse") == [hook["node_id"]]
+    assert store.query_ids("projA", path="scripts", entity="PreToolUse") == []
+    found = store.candidate_entries("projA", ["rule"], where=entry_filter(path="scripts/memory"))
+    assert sorted(e["node_id"] for e in found) == sorted([tree["node_id"], late["node_id"]])
@@ -0,0 +1,138 @@
+"""Multi-writer stress test for the shared memory tree.
+
+Runs several ``learn_capture`` processes against ONE ``RALPH_MEMORY_HOME`` at
+the same time -- the codex/claude agents, worktrees and teammates sharing a
+tree -- with a tiny journal threshold so journal appends and compactions
+interleave. No index entry may be lost: the index must list exactly the
+nodes that exist on disk. Writers updating one node concurrently must leave
+its index entry at the version its file holds.
+"""
+
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+from tree_store import TreeStore  # noqa: E402
+
+WRITERS = 6
+CAPTURES_PER_WRITER = 8
+
+# Each worker captures its lessons in-process (one interpreter start per
+# worker) with compaction forced on nearly every append.
+_WORKER = textwrap.dedent(
+    """
+    import json, sys
+    sys.path.insert(0, sys.argv[1])
+    import tree_store
+    tree_store.INDEX_JOURNAL_MAX_BYTES = 2048
+    import learn_capture
+    home, worker, count = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+    for i in range(count):
+        result = learn_capture.capture(
+            f"Decision: worker {worker} lesson {i} uses bcrypt cost 12.\\nValidated: passed.",
+            project_id="projShared",
+            project_root=".",
+            branch="main",
+            session_id=f"sess-{worker}",
+            ralph_home=tree_store.Path(home),
+        )
+        print(json.dumps(result))
+    """
+)
+
+
+_UPDATER = textwrap.dedent(
+    """
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import tree_store
+    store = tree_store.TreeStore(tree_store.Path(sys.argv[2]))
+    worker, count = int(sys.argv[4]), int(sys.argv[5])
+    for i in range(count):
+        store.update_node("projShared", sys.argv[3], {"summary": f"Worker {worker} edit {i}."})
+    """
+)
+
+
+def test_concurrent_learn_capture_loses_no_index_entries(tmp_path):
+    home = tmp_path / "ralph_home"
+    procs = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                _WORKER,
+                str(_MEMORY_DIR),
+                str(home),
+                str(worker),
+                str(CAPTURES_PER_WRITER),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for worker in range(WRITERS)
+    ]
+    created: set[str] = set()
+    for proc in procs:
+        out, err = proc.communicate(timeout=120)
+        assert proc.returncode == 0, err
+        for line in out.splitlines():
+            result = json.loads(line)
+            assert result["status"] == "created", result
+            created.add(result["node_id"])
+
+    assert len(created) == WRITERS * CAPTURES_PER_WRITER
+    store = TreeStore(home)
+    on_disk = {node["node_id"] for node in store.list_nodes("projShared")}
+    index = store.load_index("projShared")
+    assert index is not None
+    indexed = {entry["node_id"] for entry in index["nodes"]}
+    assert on_disk == created
+    assert indexed == created
+    for token_ids in index["postings"].values():
+        assert set(token_ids) <= created
+
+
+def test_concurrent_updates_keep_node_and_index_in_step(tmp_path):
+    home = tmp_path / "ralph_home"
+    store = TreeStore(home)
+    node_id = store.create_node(
+        {
+            "project_id": "projShared",
+            "workspace_instance_id": "ws1",
+            "repo_remote_hash": "abc123",
+            "branch": "main",
+            "commit": "deadbeef",
+            "session_id": "sess-1",
+            "memory_type": "procedural_rule",
+            "sensitivity": "GREEN",
+            "authority": "non_authoritative",
+            "summary": "Initial summary.",
+            "source_description": "concurrency test",
+            "quality": {"confidence": 0.9},
+        }
+    )["node_id"]
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-c", _UPDATER, str(_MEMORY_DIR), str(home), node_id,
+             str(worker), str(CAPTURES_PER_WRITER)],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for worker in range(WRITERS)
+    ]
+    for proc in procs:
+        _, err = proc.communicate(timeout=120)
+        assert proc.returncode == 0, err
+
+    node = TreeStore(home).load_node("projShared", node_id)
+    [entry] = TreeStore(home).load_index("projShared")["nodes"]
+    assert (entry["summary"], entry["updated_at"]) == (node["summary"], node["updated_at"])
@@ -0,0 +1,111 @@
+"""Tests for the append-only, segment-rotated usage log.
+
+Covers: appends extend the file in place (no rewrite), size- and age-based
+rotation into numbered segments (the segment start read once, not per
+append), optional gzip of closed segments, streaming reads across segments
+in order without reading an interrupted compression twice, and tolerance of
+a torn final line, including appends made after it.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+from tree_store import TreeStore  # noqa: E402
+from usage_log import UsageLog  # noqa: E402
+
+
+def _event(i: int, at: str = "2026-10-01T00:00:00+00:00") -> dict:
+    return {"event": "node_written", "node_id": f"n{i}", "at": at}
+
+
+def test_append_extends_file_in_place(tmp_path):
+    log = UsageLog(tmp_path)
+    log.append(_event(1))
+    inode = log.active_path.stat().st_ino
+    log.append(_event(2))
+    assert log.active_path.stat().st_ino == inode
+    lines = log.active_path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["node_id"] for line in lines] == ["n1", "n2"]
+
+
+def test_size_rotation_compresses_closed_segments(tmp_path):
+    log = UsageLog(tmp_path, max_bytes=1)
+    for i in range(3):
+        log.append(_event(i))
+    assert [p.name for p in log.segments()] == [
+        "usage-000001.jsonl.gz",
+        "usage-000002.jsonl.gz",
+    ]
+    assert [e["node_id"] for e in log.iter_events()] == ["n0", "n1", "n2"]
+
+
+def test_age_rotation_without_compression(tmp_path):
+    log = UsageLog(tmp_path, max_age_seconds=3600, compress=False)
+    log.append(_event(1, at="2020-01-01T00:00:00+00:00"))
+    log.append(_event(2))
+    assert [p.name for p in log.segments()] == ["usage-000001.jsonl"]
+    assert [e["node_id"] for e in log.iter_events()] == ["n1", "n2"]
+
+
+def test_age_check_reads_each_segment_start_once(tmp_path, monkeypatch):
+    reads = []
+    original = UsageLog._first_event_time
+    monkeypatch.setattr(
+        UsageLog, "_first_event_time", lambda self: reads.append(1) or original(self)
+    )
+    for i in range(5):
+        UsageLog(tmp_path).append(_event(i))  # a fresh instance per append, as the store does
+    assert len(reads) == 1
+    UsageLog(tmp_path).rotate()
+    for i in range(2):
+        UsageLog(tmp_path).append(_event(i))
+    assert len(reads) == 2
+
+
+def test_interrupted_compression_is_not_read_twice(tmp_path):
+    log = UsageLog(tmp_path, max_bytes=1)
+    log.append(_event(1))
+    log.append(_event(2))
+    [segment] = log.segments()
+    # Crash after the .gz landed but before the plain copy was unlinked.
+    plain = segment.with_name(segment.name[: -len(".gz")])
+    plain.write_text(json.dumps(_event(1)) + "\n", encoding="utf-8")
+    assert log.segments() == [segment]
+    assert [e["node_id"] for e in log.iter_events()] == ["n1", "n2"]
+    log.append(_event(3))  # the next rotation finishes the unlink
+    assert not plain.exists()
+    assert [e["node_id"] for e in log.iter_events()] == ["n1", "n2", "n3"]
+
+
+def test_reader_skips_torn_tail(tmp_path):
+    log = UsageLog(tmp_path)
+    log.append(_event(1))
+    with log.active_path.open("a", encoding="utf-8") as fh:
+        fh.write('{"event": "node_wri')
+    assert [e["node_id"] for e in log.iter_events()] == ["n1"]
+
+
+def test_append_after_torn_tail_keeps_the_new_event(tmp_path):
+    log = UsageLog(tmp_path)
+    log.append(_event(1))
+    with log.active_path.open("a", encoding="utf-8") as fh:
+        fh.write('{"event": "node_wri')
+    log.append(_event(2))
+    log.append(_event(3))
+    assert [e["node_id"] for e in log.iter_events()] == ["n1", "n2", "n3"]
+
+
+def test_store_streams_usage_across_rotation(tmp_path):
+    store = TreeStore(tmp_path / "ralph_home")
+    store.ensure_layout("projA")
+    log = store.usage_log("projA")
+    log.append(_event(1))
+    log.rotate()
+    log.append(_event(2))
+    assert [e["node_id"] for e in store.iter_usage("projA")] == ["n1", "n2"]
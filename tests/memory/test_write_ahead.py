@@ -0,0 +1,211 @@
+"""Tests for TreeStore durability modes and the write-ahead log.
+
+Covers: strict mode fsyncing every write, batched mode sharing one fsync per
+group, relaxed mode never fsyncing, ungrouped writes checkpointed at exit,
+replay of a dead writer's committed-but-unflushed writes by the next writer
+(never by a reader, never of a live writer's log, never clobbering a newer
+node), torn log tails, and migrate --apply running in batched mode.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+_MEMORY_DIR = Path(__file__).resolve().parents[2] / "scripts" / "memory"
+sys.path.insert(0, str(_MEMORY_DIR))
+
+import migrate_rules_to_nodes  # noqa: E402
+from tree_store import TreeStore, TreeStoreError  # noqa: E402
+from write_ahead import WriteAheadLog  # noqa: E402
+
+
+def _payload(project_id: str, **overrides):
+    payload = {
+        "project_id": project_id,
+        "workspace_instance_id": "ws1",
+        "repo_remote_hash": "abc123",
+        "branch": "main",
+        "commit": "deadbeef",
+        "session_id": "sess-1",
+        "memory_type": "procedural_rule",
+        "sensitivity": "GREEN",
+        "authority": "non_authoritative",
+        "summary": "Use parameterized queries for all database operations.",
+        "source_description": "migrated from rules.json",
+        "quality": {"confidence": 0.9},
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture()
+def fsyncs(monkeypatch):
+    calls = {"fsync": 0, "sync": 0}
+    real_fsync = os.fsync
+
+    def counting_fsync(fd):
+        calls["fsync"] += 1
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", counting_fsync)
+    monkeypatch.setattr(os, "sync", lambda: calls.__setitem__("sync", calls["sync"] + 1))
+    return calls
+
+
+def _write_many(store: TreeStore, count: int) -> list[str]:
+    return [
+        store.create_node(_payload("projA", summary=f"Rule {i} about caching."))["node_id"]
+        for i in range(count)
+    ]
+
+
+_WRITER_SCRIPT = """
+import json, os, sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+from tree_store import TreeStore
+store = TreeStore(Path(sys.argv[2]), durability="batched")
+print(json.dumps([store.create_node(p)["node_id"] for p in json.load(sys.stdin)]), flush=True)
+if sys.argv[3] == "crash":
+    os._exit(0)  # die without the exit-time checkpoint
+"""
+
+
+def _batched_writer(home: Path, count: int, *, crash: bool) -> list[str]:
+    """Write *count* ungrouped nodes in a child process and return their ids."""
+    payloads = [_payload("projA", summary=f"Rule {i} about caching.") for i in range(count)]
+    done = subprocess.run(
+        [sys.executable, "-c", _WRITER_SCRIPT, str(_MEMORY_DIR), str(home),
+         "crash" if crash else "exit"],
+        input=json.dumps(payloads), capture_output=True, text=True, check=True,
+    )
+    return json.loads(done.stdout)
+
+
+def test_unknown_durability_rejected(tmp_path):
+    with pytest.raises(TreeStoreError):
+        TreeStore(tmp_path, durability="sometimes")
+
+
+def test_strict_fsyncs_every_write(tmp_path, fsyncs):
+    _write_many(TreeStore(tmp_path, durability="strict"), 5)
+    assert fsyncs["fsync"] >= 5 * 3
+
+
+def test_batched_group_shares_one_fsync(tmp_path, fsyncs):
+    store = TreeStore(tmp_path, durability="batched")
+    with store.group_commit():
+        ids = _write_many(store, 20)
+    assert fsyncs["fsync"] == 1  # one write-ahead commit
+    assert fsyncs["sync"] == 1  # one checkpoint
+    assert not WriteAheadLog(store.project_tree("projA")).has_records()
+    assert len(TreeStore(tmp_path).list_nodes("projA")) == len(ids)
+
+
+def test_relaxed_never_fsyncs(tmp_path, fsyncs):
+    store = TreeStore(tmp_path, durability="relaxed")
+    with store.group_commit():
+        _write_many(store, 5)
+    assert fsyncs == {"fsync": 0, "sync": 0}
+    assert not (store.project_tree("projA") / "write-ahead.jsonl").exists()
+
+
+def test_env_selects_durability(tmp_path, monkeypatch):
+    monkeypatch.setenv("RALPH_MEMORY_DURABILITY", "relaxed")
+    assert TreeStore(tmp_path).durability == "relaxed"
+
+
+def test_ungrouped_writes_checkpoint_at_exit(tmp_path, fsyncs):
+    store = TreeStore(tmp_path, durability="batched")
+    _write_many(store, 3)  # committed, checkpoint deferred
+    log = WriteAheadLog(store.project_tree("projA"))
+    assert log.has_records() and fsyncs["sync"] == 0
+    assert log.replay(lambda records: None) == 0  # the writer is alive
+
+    _batched_writer(tmp_path / "child", 3, crash=False)
+    assert not WriteAheadLog(TreeStore(tmp_path / "child").project_tree("projA")).has_records()
+
+
+def test_readers_never_replay(tmp_path, fsyncs):
+    node_ids = _batched_writer(tmp_path, 3, crash=True)
+    reader = TreeStore(tmp_path)
+    assert sorted(e["node_id"] for e in reader.load_index("projA")["nodes"]) == sorted(node_ids)
+    assert reader.load_node("projA", node_ids[0]) is not None
+    assert fsyncs["sync"] == 0
+    assert WriteAheadLog(reader.project_tree("projA")).has_records()
+
+
+def test_crashed_writer_is_replayed_by_the_next_writer(tmp_path):
+    node_id = _batched_writer(tmp_path, 1, crash=True)[0]
+    store = TreeStore(tmp_path)
+    assert WriteAheadLog(store.project_tree("projA")).has_records()
+    # Simulate the unflushed data files being lost in the crash.
+    store.node_path("projA", node_id).unlink()
+    store.index_path("projA").write_text("{}\n", encoding="utf-8")
+    store.index_journal_path("projA").write_text("", encoding="utf-8")
+
+    other = store.create_node(_payload("projA", summary="A later rule."))["node_id"]
+    assert store.load_node("projA", node_id) is not None
+    assert {e["node_id"] for e in store.load_index("projA")["nodes"]} == {node_id, other}
+    assert not WriteAheadLog(store.project_tree("projA")).has_records()
+
+
+def test_replay_keeps_newer_node(tmp_path):
+    node_id = _batched_writer(tmp_path, 1, crash=True)[0]
+    store = TreeStore(tmp_path)
+    node_path = store.node_path("projA", node_id)
+    newer = json.loads(node_path.read_text(encoding="utf-8"))
+    newer["summary"] = "A later strict-mode revision."
+    newer["updated_at"] = "2999-01-01T00:00:00+00:00"
+    node_path.write_text(json.dumps(newer), encoding="utf-8")
+    store.ensure_layout("projA")
+    assert not WriteAheadLog(store.project_tree("projA")).has_records()
+    assert store.load_node("projA", node_id)["summary"] == "A later strict-mode revision."
+
+
+def test_torn_write_ahead_tail_is_ignored(tmp_path):
+    log = WriteAheadLog(tmp_path)
+    log.record({"op": "raw", "digest": "x", "content": ""})
+    log.commit()
+    with log.path.open("a", encoding="utf-8") as handle:
+        handle.write('{"op": "node", "no')
+    assert [r["op"] for r in log.iter_records()] == ["raw"]
+    seen: list[dict] = []
+    assert log.replay(seen.extend) == 1
+    assert not log.has_records()
+
+
+def test_migrate_apply_defaults_to_batched(tmp_path, fsyncs):
+    rules = tmp_path / "rules.json"
+    rules.write_text(
+        json.dumps(
+            {
+                "rules": [
+                    {"rule_id": f"rule-{i}", "behavior": f"Prefer small functions {i}."}
+                    for i in range(10)
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    home = tmp_path / "home"
+    code = migrate_rules_to_nodes.main(
+        [
+            "--rules", str(rules),
+            "--rejects", str(tmp_path / "rejects.jsonl"),
+            "--ralph-home", str(home),
+            "--repo-root", str(tmp_path),
+            "--apply",
+        ]
+    )
+    assert code == 0
+    assert fsyncs["sync"] == 1
+    assert fsyncs["fsync"] == 1
+    project_id = migrate_rules_to_nodes.compute_project_id(tmp_path)
+    assert len(TreeStore(home).list_nodes(project_id)) == 10